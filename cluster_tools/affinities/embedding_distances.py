@@ -18,7 +18,7 @@ from affogato.affinities import compute_embedding_distances
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
 from cluster_tools.utils.task_utils import DummyTask
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -122,6 +122,13 @@ class EmbeddingDistancesLocal(EmbeddingDistancesBase, LocalTask):
     pass
 
 
+class EmbeddingDistancesLocalPool(EmbeddingDistancesBase, LocalPoolTask):
+    """
+    EmbeddingDistances on local machine with persistent worker pool
+    """
+    pass
+
+
 class EmbeddingDistancesSlurm(EmbeddingDistancesBase, SlurmTask):
     """
     EmbeddingDistances on slurm cluster
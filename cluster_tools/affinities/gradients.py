@@ -12,7 +12,7 @@ import nifty.tools as nt
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
 from cluster_tools.utils.task_utils import DummyTask
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -106,6 +106,13 @@ class GradientsLocal(GradientsBase, LocalTask):
     pass
 
 
+class GradientsLocalPool(GradientsBase, LocalPoolTask):
+    """
+    Gradients on local machine with persistent worker pool
+    """
+    pass
+
+
 class GradientsSlurm(GradientsBase, SlurmTask):
     """
     Gradients on slurm cluster
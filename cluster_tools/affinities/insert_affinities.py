@@ -19,7 +19,7 @@ from elf.wrapper.resized_volume import ResizedVolume
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
 from cluster_tools.utils.task_utils import DummyTask
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -102,6 +102,13 @@ class InsertAffinitiesLocal(InsertAffinitiesBase, LocalTask):
     pass
 
 
+class InsertAffinitiesLocalPool(InsertAffinitiesBase, LocalPoolTask):
+    """
+    InsertAffinities on local machine with persistent worker pool
+    """
+    pass
+
+
 class InsertAffinitiesSlurm(InsertAffinitiesBase, SlurmTask):
     """
     InsertAffinities on slurm cluster
@@ -10,7 +10,7 @@ from elf.segmentation.clustering import mala_clustering
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 #
 # Agglomerative Clusteing Tasks
@@ -75,6 +75,12 @@ class AgglomerativeClusteringLocal(AgglomerativeClusteringBase, LocalTask):
     pass
 
 
+class AgglomerativeClusteringLocalPool(AgglomerativeClusteringBase, LocalPoolTask):
+    """ AgglomerativeClustering on local machine with persistent worker pool
+    """
+    pass
+
+
 class AgglomerativeClusteringSlurm(AgglomerativeClusteringBase, SlurmTask):
     """ AgglomerativeClustering on slurm cluster
     """
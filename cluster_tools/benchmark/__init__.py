@@ -0,0 +1,5 @@
+from .synthetic import (synthetic_labels, oversegmentation, boundary_map, affinities,
+                        synthetic_mask, write_synthetic_data)
+from .kernels import run_kernel_benchmarks, KERNELS
+from .workflows import run_workflow_benchmarks, WORKFLOWS
+from .results import save_results, load_results, compare_results, format_comparison
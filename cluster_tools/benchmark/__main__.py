@@ -0,0 +1,48 @@
+import argparse
+import sys
+
+from .kernels import run_kernel_benchmarks, KERNELS
+from .workflows import run_workflow_benchmarks, WORKFLOWS
+from .results import save_results, load_results, compare_results, format_comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the cluster_tools benchmarks on synthetic data.")
+    parser.add_argument('output', help="json file for the results")
+    parser.add_argument('--kernels', nargs='*', default=None, choices=list(KERNELS),
+                        help="kernels to benchmark (default: all)")
+    parser.add_argument('--workflows', nargs='*', default=None, choices=list(WORKFLOWS),
+                        help="workflows to benchmark (default: all)")
+    parser.add_argument('--skip_kernels', action='store_true')
+    parser.add_argument('--skip_workflows', action='store_true')
+    parser.add_argument('--folder', default='./benchmark_tmp',
+                        help="folder for the data of the workflow benchmarks")
+    parser.add_argument('--shape', type=int, nargs=3, default=[128, 512, 512])
+    parser.add_argument('--block_shape', type=int, nargs=3, default=[32, 256, 256])
+    parser.add_argument('--max_jobs', type=int, default=4)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=None,
+                        help="results of a previous run to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="relative slow-down that is reported as regression")
+    args = parser.parse_args()
+
+    results = []
+    if not args.skip_kernels:
+        results.extend(run_kernel_benchmarks(args.kernels, repeats=args.repeats, seed=args.seed))
+    if not args.skip_workflows:
+        results.extend(run_workflow_benchmarks(args.folder, args.shape, args.block_shape,
+                                               workflows=args.workflows, max_jobs=args.max_jobs,
+                                               seed=args.seed))
+    current = save_results(args.output, results)
+
+    if args.baseline is not None:
+        comparison = compare_results(load_results(args.baseline), current, args.tolerance)
+        print(format_comparison(comparison))
+        if any(comp['regression'] for comp in comparison):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+import os
+import time
+from contextlib import redirect_stdout
+from functools import partial
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import nifty.tools as nt
+
+import cluster_tools.utils.volume_utils as vu
+import cluster_tools.utils.graph_utils as gu
+from .synthetic import synthetic_labels, oversegmentation, boundary_map, synthetic_mask
+
+#
+# Microbenchmarks for the blockwise kernels of the tasks.
+#
+# The kernels are run on in-memory synthetic data, so that the timings don't depend
+# on the file system. Each benchmark returns a result dict with the timings of the repeats
+# and the throughput in voxels / s (computed from the fastest repeat).
+#
+
+
+def time_repeats(func, repeats=5, warmup=1):
+    """ Time the function, the log output of the kernels is discarded.
+
+    Returns:
+        list[float] - the times of the repeats in seconds
+    """
+    times = []
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        for _ in range(warmup):
+            func()
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - t0)
+    return times
+
+
+def _result(name, times, n_voxels, params):
+    best = min(times)
+    return {'name': name, 'params': params, 'times': times,
+            'min': best, 'median': float(np.median(times)), 'n_voxels': int(n_voxels),
+            'voxels_per_s': n_voxels / best if best > 0 else None}
+
+
+def _block_ids(shape, block_shape):
+    blocking = nt.blocking([0] * len(shape), list(shape), list(block_shape))
+    return blocking, list(range(blocking.numberOfBlocks))
+
+
+def benchmark_watershed(shape=(32, 256, 256), repeats=5, seed=0, apply_2d=True, with_mask=False,
+                        n_threads=1):
+    """ Benchmark `watershed._apply_watershed` for a block of the given shape.
+    """
+    from cluster_tools.watershed.watershed import WatershedBase, _apply_dt, _apply_watershed
+    config = WatershedBase.default_task_config()
+    config.update({'apply_ws_2d': apply_2d, 'apply_dt_2d': apply_2d})
+
+    labels = synthetic_labels(shape, seed=seed)
+    input_ = boundary_map(labels, seed=seed)
+    mask = synthetic_mask(shape, seed=seed).astype('bool') if with_mask else None
+    dt = _apply_dt(input_, config)
+
+    times = time_repeats(lambda: _apply_watershed(input_, dt, config, mask, n_threads), repeats)
+    return _result('apply_watershed', times, input_.size,
+                   {'shape': list(shape), 'apply_2d': apply_2d, 'with_mask': with_mask,
+                    'n_threads': n_threads})
+
+
+def benchmark_write(shape=(64, 256, 256), block_shape=(32, 128, 128), repeats=5, seed=0,
+                    assignments='array'):
+    """ Benchmark `write._write_block` for all blocks of a volume.
+
+    The assignments are either a dense lookup table ('array') or a sparse assignment table ('table')
+    for ids with gaps, which use different code paths.
+    """
+    from cluster_tools.write.write import _write_block, _sorted_assignments
+    assert assignments in ('array', 'table'), assignments
+    seg = oversegmentation(synthetic_labels(shape, seed=seed), seed=seed)
+    n_ids = int(seg.max()) + 1
+    rng = np.random.RandomState(seed)
+    node_labels = rng.randint(0, n_ids, size=n_ids).astype('uint64')
+    if assignments == 'table':
+        # ids with random gaps, as for the fragments of a large volume
+        ids = np.cumsum(rng.randint(1, 1000, size=n_ids)).astype('uint64')
+        seg = ids[seg]
+        order = rng.permutation(n_ids)
+        node_labels = _sorted_assignments(ids[order], node_labels[order])
+    out = np.zeros_like(seg)
+    blocking, block_ids = _block_ids(shape, block_shape)
+
+    def _write_blocks():
+        for block_id in block_ids:
+            _write_block(seg, out, blocking, block_id, node_labels, False)
+
+    times = time_repeats(_write_blocks, repeats)
+    return _result('write_block', times, seg.size,
+                   {'shape': list(shape), 'block_shape': list(block_shape),
+                    'assignments': assignments, 'n_ids': n_ids})
+
+
+def _downscale(data, scale_factor):
+    # mean downscaling, as in `DownscalingWorkflow`
+    shape = tuple(sh // sf * sf for sh, sf in zip(data.shape, scale_factor))
+    data = data[tuple(slice(0, sh) for sh in shape)]
+    blocked_shape = sum(((sh // sf, sf) for sh, sf in zip(shape, scale_factor)), ())
+    return data.reshape(blocked_shape).mean(axis=tuple(range(1, 2 * data.ndim, 2))).astype(data.dtype)
+
+
+def _segmentation_scores(seg, gt):
+    from elf.evaluation import rand_index, variation_of_information
+    vi_split, vi_merge = variation_of_information(seg, gt)
+    return {'rand_error': float(rand_index(seg, gt)[0]),
+            'vi_split': float(vi_split), 'vi_merge': float(vi_merge)}
+
+
+def benchmark_watershed_multires(shape=(32, 256, 256), repeats=5, seed=0, scale_factor=(1, 2, 2),
+                                 apply_2d=True):
+    """ Benchmark the watershed with seeds computed from the downscaled input against the full resolution.
+
+    Both timings include the distance transform and the seeds. The result contains the timing
+    and the segmentation scores w.r.t. the ground-truth of both modes, the full resolution ones under
+    'full_resolution'.
+    """
+    from cluster_tools.watershed.watershed import (WatershedBase, _apply_dt, _apply_watershed,
+                                                   _downscaled_bb, _downscaled_seeds)
+    config = WatershedBase.default_task_config()
+    config.update({'apply_ws_2d': apply_2d, 'apply_dt_2d': apply_2d})
+
+    labels = synthetic_labels(shape, seed=seed)
+    input_ = boundary_map(labels, seed=seed)
+    low_input = _downscale(input_, scale_factor)
+    bb = tuple(slice(0, sh) for sh in shape)
+    scale = [float(lsh) / sh for lsh, sh in zip(low_input.shape, shape)]
+    low_bb = _downscaled_bb(bb, scale, low_input.shape)
+
+    def _full_resolution():
+        return _apply_watershed(input_, _apply_dt(input_, config), config)
+
+    def _multires():
+        seeds, dt = _downscaled_seeds(low_input[low_bb], bb, low_bb, scale, config)
+        return _apply_watershed(input_, dt, config, seeds=seeds)
+
+    full_times = time_repeats(_full_resolution, repeats)
+    times = time_repeats(_multires, repeats)
+    result = _result('apply_watershed_multires', times, input_.size,
+                     {'shape': list(shape), 'scale_factor': list(scale_factor), 'apply_2d': apply_2d})
+    result.update(_segmentation_scores(_multires(), labels))
+    result['full_resolution'] = _result('apply_watershed', full_times, input_.size, result['params'])
+    result['full_resolution'].update(_segmentation_scores(_full_resolution(), labels))
+    return result
+
+
+def benchmark_accumulate_filter(shape=(32, 128, 128), repeats=5, seed=0,
+                                filter_name='gaussianSmoothing', sigma=1.6, apply_in_2d=False):
+    """ Benchmark `block_edge_features._accumulate_filter` for a block of the given shape.
+    """
+    import nifty.distributed as ndist
+    from cluster_tools.features.block_edge_features import _accumulate_filter
+    gt = synthetic_labels(shape, seed=seed)
+    labels = oversegmentation(gt, seed=seed)
+    input_ = boundary_map(gt, seed=seed)
+    graph = ndist.Graph(gu.region_edges(labels, ignore_label=False))
+
+    times = time_repeats(lambda: _accumulate_filter(input_, graph, labels, np.s_[:],
+                                                    filter_name, sigma, False, True, apply_in_2d),
+                         repeats)
+    return _result('accumulate_filter', times, input_.size,
+                   {'shape': list(shape), 'filter_name': filter_name, 'sigma': sigma,
+                    'apply_in_2d': apply_in_2d, 'n_edges': int(graph.numberOfEdges)})
+
+
+def benchmark_uniques(shape=(64, 256, 256), block_shape=(32, 128, 128), repeats=5, seed=0,
+                      return_counts=True, sparsity=0.):
+    """ Benchmark `find_uniques.uniques_in_block` for all blocks of a volume.
+    """
+    from cluster_tools.relabel.find_uniques import uniques_in_block
+    labels = oversegmentation(synthetic_labels(shape, sparsity=sparsity, seed=seed), seed=seed)
+    blocking, block_ids = _block_ids(shape, block_shape)
+
+    def _uniques():
+        for block_id in block_ids:
+            uniques_in_block(block_id, blocking, labels, return_counts)
+
+    times = time_repeats(_uniques, repeats)
+    return _result('uniques_in_block', times, labels.size,
+                   {'shape': list(shape), 'block_shape': list(block_shape),
+                    'return_counts': return_counts, 'sparsity': sparsity})
+
+
+class _ChunkStore:
+    """ In-memory replacement for a varlen dataset, see `solve_subproblems`.
+    """
+    def __init__(self):
+        self.chunks = {}
+
+    def read_chunk(self, chunk_id):
+        return self.chunks.get(tuple(chunk_id), None)
+
+    def write_chunk(self, chunk_id, data, varlen=True):
+        self.chunks[tuple(chunk_id)] = data
+
+
+def benchmark_solve_subproblems(shape=(64, 256, 256), block_shape=(32, 128, 128), repeats=5, seed=0,
+                                n_threads=4, use_processes=False, agglomerator='kernighan-lin'):
+    """ Benchmark `solve_subproblems.solve_block_problems` on the region graph of an over-segmentation.
+
+    The costs are attractive for edges inside of the ground-truth segments and repulsive otherwise,
+    with additive gaussian noise. Compare the thread and process mode via `use_processes`.
+    """
+    import nifty.distributed as ndist
+    from cluster_tools.multicut.solve_subproblems import solve_block_problems
+    gt = synthetic_labels(shape, seed=seed)
+    labels = oversegmentation(gt, seed=seed)
+    uv_ids = gu.region_edges(labels, ignore_label=False)
+    graph = ndist.Graph(uv_ids)
+
+    # the ground-truth label of the nodes, each node is contained in a single segment
+    node_gt = np.zeros(int(labels.max()) + 1, dtype='uint64')
+    node_gt[labels.ravel()] = gt.ravel()
+    costs = np.where(node_gt[uv_ids[:, 0]] == node_gt[uv_ids[:, 1]], 1., -1.)
+    costs = (costs + np.random.RandomState(seed).normal(0., 1., size=len(costs))).astype('float32')
+
+    blocking, block_ids = _block_ids(shape, block_shape)
+    ds_nodes = _ChunkStore()
+    for block_id in block_ids:
+        block = blocking.getBlock(block_id)
+        bb = tuple(slice(beg, end) for beg, end in zip(block.begin, block.end))
+        ds_nodes.write_chunk(blocking.blockGridPosition(block_id), np.unique(labels[bb]))
+
+    def _solve():
+        out = {'cut_edge_ids': _ChunkStore(), 'node_result': _ChunkStore()}
+        solve_block_problems(block_ids, graph, uv_ids, costs, ds_nodes, False, blocking, out,
+                             agglomerator, None, n_threads, use_processes)
+
+    times = time_repeats(_solve, repeats)
+    return _result('solve_subproblems', times, labels.size,
+                   {'shape': list(shape), 'block_shape': list(block_shape), 'n_threads': n_threads,
+                    'use_processes': use_processes, 'agglomerator': agglomerator,
+                    'n_edges': int(len(uv_ids))})
+
+
+def benchmark_initial_sub_graphs(shape=(64, 256, 256), block_shape=(16, 64, 64), repeats=5, seed=0,
+                                 n_threads=4, blocks_per_batch=(2, 4, 4)):
+    """ Benchmark the sub-graph extraction of `initial_sub_graphs` on an over-segmentation.
+
+    The sub-graphs are extracted with `n_threads` threads and batches of `blocks_per_batch` blocks;
+    the timing of the sequential loop over the blocks is in the result under 'sequential'.
+    In contrast to the other kernels, the over-segmentation and the sub-graphs are stored in a
+    temporary n5 container, because `ndist.computeMergeableRegionGraph` operates on files.
+    """
+    from cluster_tools.graph.initial_sub_graphs import _graph_block, _graph_batch, batch_blocks
+    labels = oversegmentation(synthetic_labels(shape, seed=seed), seed=seed)
+    blocking, block_ids = _block_ids(shape, block_shape)
+    blocks_per_batch = list(blocks_per_batch)
+    batches = batch_blocks(blocking, block_ids, blocks_per_batch)
+
+    with TemporaryDirectory() as tmp_folder:
+        path = os.path.join(tmp_folder, 'data.n5')
+        with vu.file_reader(path) as f:
+            ds = f.create_dataset('labels', shape=shape, chunks=tuple(block_shape),
+                                  compression='gzip', dtype='uint64')
+            ds[:] = labels
+            g = f.require_group('s0/sub_graphs')
+            for name in ('nodes', 'edges'):
+                g.require_dataset(name, shape=shape, chunks=tuple(block_shape),
+                                  compression='gzip', dtype='uint64')
+
+        def _sequential():
+            for block_id in block_ids:
+                _graph_block(blocking, block_id, path, 'labels', path, True)
+
+        with vu.file_reader(path) as f:
+            ds, g = f['labels'], f['s0/sub_graphs']
+            func = partial(_graph_batch, blocking, ds=ds, ds_nodes=g['nodes'], ds_edges=g['edges'],
+                           ignore_label=True)
+            times = time_repeats(lambda: vu.map_blocks(func, batches, n_threads), repeats)
+        sequential_times = time_repeats(_sequential, repeats)
+
+    params = {'shape': list(shape), 'block_shape': list(block_shape), 'n_threads': n_threads,
+              'blocks_per_batch': blocks_per_batch, 'n_blocks': len(block_ids)}
+    result = _result('initial_sub_graphs', times, labels.size, params)
+    result['sequential'] = _result('initial_sub_graphs', sequential_times, labels.size,
+                                   dict(params, n_threads=1, blocks_per_batch=[1, 1, 1]))
+    return result
+
+
+KERNELS = {'apply_watershed': benchmark_watershed,
+           'apply_watershed_multires': benchmark_watershed_multires,
+           'write_block': benchmark_write,
+           'accumulate_filter': benchmark_accumulate_filter,
+           'uniques_in_block': benchmark_uniques,
+           'solve_subproblems': benchmark_solve_subproblems,
+           'initial_sub_graphs': benchmark_initial_sub_graphs}
+
+
+def run_kernel_benchmarks(kernels=None, repeats=5, seed=0, **kwargs):
+    """ Run the kernel benchmarks.
+
+    Arguments:
+        kernels [list[str]] - names of the kernels, see `KERNELS` (default: all kernels)
+        repeats [int] - number of timed repeats (default: 5)
+        seed [int] - random seed for the synthetic data (default: 0)
+        kwargs - mapping of kernel names to additional keyword arguments
+    """
+    kernels = list(KERNELS) if kernels is None else kernels
+    return [KERNELS[name](repeats=repeats, seed=seed, **kwargs.get(name, {})) for name in kernels]
@@ -0,0 +1,87 @@
+import os
+import json
+import time
+import platform
+import subprocess
+import multiprocessing
+
+#
+# Machine-readable benchmark results, to compare the performance across commits.
+#
+# A result file contains the git commit, the machine info and the list of benchmark results.
+# Results are matched by their name and parameters, the comparison uses the fastest repeat.
+#
+
+
+def git_commit(path=None):
+    """ Get the commit of the git repository at path (default: the repository of cluster_tools).
+    """
+    path = os.path.split(os.path.abspath(__file__))[0] if path is None else path
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=path,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                        cwd=path, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def machine_info():
+    return {'hostname': platform.node(), 'platform': platform.platform(),
+            'processor': platform.processor(), 'n_cpus': multiprocessing.cpu_count(),
+            'python': platform.python_version()}
+
+
+def save_results(path, results, **metadata):
+    """ Save the benchmark results together with the commit and machine info.
+    """
+    out = {'commit': git_commit(), 'time': time.time(), 'machine': machine_info(),
+           'results': results}
+    out.update(metadata)
+    with open(path, 'w') as f:
+        json.dump(out, f, indent=2, sort_keys=True)
+    return out
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _result_id(result):
+    return result['name'], json.dumps(result['params'], sort_keys=True)
+
+
+def compare_results(baseline, current, tolerance=0.1):
+    """ Compare the results of two benchmark runs.
+
+    Arguments:
+        baseline [dict] - results of the baseline run, see `save_results`
+        current [dict] - results of the current run
+        tolerance [float] - relative slow-down that is considered a regression (default: 0.1)
+    Returns:
+        list[dict] - comparison for all benchmarks that are in both runs,
+            with the ratio of the current and the baseline time and whether this is a regression
+    """
+    baseline_results = {_result_id(res): res for res in baseline['results']}
+    comparison = []
+    for res in current['results']:
+        base = baseline_results.get(_result_id(res), None)
+        if base is None or not base['min'] or not res.get('success', True):
+            continue
+        ratio = res['min'] / base['min']
+        comparison.append({'name': res['name'], 'params': res['params'],
+                           'baseline': base['min'], 'current': res['min'], 'ratio': ratio,
+                           'regression': ratio > 1. + tolerance})
+    return comparison
+
+
+def format_comparison(comparison):
+    lines = []
+    for comp in comparison:
+        flag = 'REGRESSION' if comp['regression'] else ''
+        lines.append("%-20s %10.3f s -> %10.3f s (x %.2f) %s" % (comp['name'], comp['baseline'],
+                                                                  comp['current'], comp['ratio'],
+                                                                  flag))
+    return '\n'.join(lines)
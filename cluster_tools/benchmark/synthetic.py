@@ -0,0 +1,220 @@
+import numpy as np
+
+import cluster_tools.utils.volume_utils as vu
+
+#
+# Generators for synthetic volumes that mimic the inputs of the segmentation workflows:
+# label volumes (voronoi tesselations), boundary maps and affinities derived from them,
+# and masks. All generators only depend on numpy and are deterministic for a given seed.
+#
+
+DEFAULT_OFFSETS = [[-1, 0, 0], [0, -1, 0], [0, 0, -1]]
+
+
+def _as_tuple(value, ndim):
+    return tuple(value) if isinstance(value, (list, tuple)) else (value,) * ndim
+
+
+def voronoi_labels(shape, mean_size=(8, 32, 32), seed=0):
+    """ Voronoi tesselation with seeds on a jittered grid.
+
+    The seeds are placed at random positions in the cells of a grid with spacing `mean_size`
+    and each voxel is assigned to the closest seed in its 3 ** ndim neighboring cells.
+
+    Arguments:
+        shape [tuple] - shape of the volume
+        mean_size [int or tuple] - mean extent of the segments per axis (default: (8, 32, 32))
+        seed [int] - random seed (default: 0)
+    Returns:
+        np.ndarray - labels, starting at 1
+    """
+    ndim = len(shape)
+    spacing = tuple(max(int(sp), 1) for sp in _as_tuple(mean_size, ndim))
+    grid_shape = tuple(sh // sp + int(sh % sp != 0) for sh, sp in zip(shape, spacing))
+    rng = np.random.RandomState(seed)
+
+    # seed positions and ids for each grid cell, padded by one cell so that we don't need
+    # to special case the border; the padding has no seeds
+    padded_shape = tuple(gs + 2 for gs in grid_shape)
+    cell_pos = np.indices(padded_shape, dtype='float32') - 1
+    seeds = [sp * (pos + rng.rand(*padded_shape).astype('float32'))
+             for pos, sp in zip(cell_pos, spacing)]
+    inner = tuple(slice(1, -1) for _ in range(ndim))
+    seed_ids = np.zeros(padded_shape, dtype='uint64')
+    seed_ids[inner] = np.arange(1, int(np.prod(grid_shape)) + 1, dtype='uint64').reshape(grid_shape)
+
+    # we compute the distances for the volume in the shape (grid_0, spacing_0, grid_1, ...),
+    # so that the values of a cell broadcast to all its voxels
+    blocked_shape = sum(((gs, sp) for gs, sp in zip(grid_shape, spacing)), ())
+    cell_shape = sum(((gs, 1) for gs in grid_shape), ())
+    coords = [np.arange(gs * sp, dtype='float32').reshape((1, 1) * d + (gs, sp) + (1, 1) * (ndim - d - 1))
+              for d, (gs, sp) in enumerate(zip(grid_shape, spacing))]
+
+    best = np.full(blocked_shape, np.inf, dtype='float32')
+    labels = np.zeros(blocked_shape, dtype='uint64')
+    for offset in np.ndindex(*((3,) * ndim)):
+        cells = tuple(slice(o, o + gs) for o, gs in zip(offset, grid_shape))
+        ids = seed_ids[cells]
+        # the padding cells have no seeds
+        dist = sum((coord - pos[cells].reshape(cell_shape)) ** 2 for coord, pos in zip(coords, seeds))
+        dist = np.where((ids == 0).reshape(cell_shape), np.inf, dist)
+        closer = dist < best
+        best[closer] = dist[closer]
+        labels[closer] = np.broadcast_to(ids.reshape(cell_shape), blocked_shape)[closer]
+
+    labels = labels.reshape(tuple(gs * sp for gs, sp in zip(grid_shape, spacing)))
+    return labels[tuple(slice(0, sh) for sh in shape)]
+
+
+def _relabel_consecutive(labels):
+    # map the ids to consecutive ids, keeping 0 as background
+    if labels.max() < 4 * labels.size:
+        present = np.bincount(labels.ravel()) > 0
+        present[0] = False
+        lut = np.cumsum(present).astype('uint64')
+        return lut[labels]
+    ids, inverse = np.unique(labels, return_inverse=True)
+    return inverse.reshape(labels.shape).astype('uint64') + int(ids[0] != 0)
+
+
+def synthetic_labels(shape, mean_size=(8, 32, 32), sparsity=0., seed=0):
+    """ Synthetic label volume with consecutive ids.
+
+    Arguments:
+        shape [tuple] - shape of the volume
+        mean_size [int or tuple] - mean extent of the segments per axis (default: (8, 32, 32))
+        sparsity [float] - fraction of segments that are set to background (0) (default: 0.)
+        seed [int] - random seed (default: 0)
+    """
+    labels = _relabel_consecutive(voronoi_labels(shape, mean_size, seed))
+    if sparsity > 0:
+        rng = np.random.RandomState(seed + 1)
+        n_ids = int(labels.max())
+        background = np.zeros(n_ids + 1, dtype='bool')
+        background[1 + rng.choice(n_ids, int(round(sparsity * n_ids)), replace=False)] = True
+        labels[background[labels]] = 0
+        labels = _relabel_consecutive(labels)
+    return labels
+
+
+def oversegmentation(labels, mean_size=(4, 16, 16), seed=0):
+    """ Over-segmentation of a label volume, i.e. a synthetic watershed.
+
+    The segments are intersections of the labels with a finer voronoi tesselation,
+    so they respect the boundaries of the labels. The background (0) is preserved.
+    """
+    fine = voronoi_labels(labels.shape, mean_size, seed + 2)
+    ws = labels * (fine.max() + 1) + fine
+    ws[labels == 0] = 0
+    return _relabel_consecutive(ws)
+
+
+def _smooth(data, n_iter=1):
+    # cheap approximation of a gaussian: repeated averaging with the direct neighbors
+    for _ in range(n_iter):
+        smoothed = data.copy()
+        for axis in range(data.ndim):
+            smoothed += np.roll(data, 1, axis=axis) + np.roll(data, -1, axis=axis)
+        data = smoothed / (1 + 2 * data.ndim)
+    return data
+
+
+def _boundaries(labels, offset):
+    shifted = labels
+    for axis, off in enumerate(offset):
+        if off != 0:
+            shifted = np.roll(shifted, -off, axis=axis)
+    bd = labels != shifted
+    # no boundaries across the volume border
+    for axis, off in enumerate(offset):
+        if off > 0:
+            bd[(slice(None),) * axis + (slice(-off, None),)] = False
+        elif off < 0:
+            bd[(slice(None),) * axis + (slice(None, -off),)] = False
+    return bd
+
+
+def boundary_map(labels, noise=0.1, smoothing=1, seed=0):
+    """ Synthetic boundary map for a label volume, high values correspond to boundaries.
+
+    Arguments:
+        labels [np.ndarray] - label volume
+        noise [float] - standard deviation of the additive gaussian noise (default: 0.1)
+        smoothing [int] - number of smoothing iterations (default: 1)
+        seed [int] - random seed (default: 0)
+    Returns:
+        np.ndarray - boundary map in [0, 1] (float32)
+    """
+    bd = np.zeros(labels.shape, dtype='bool')
+    for axis in range(labels.ndim):
+        offset = [0] * labels.ndim
+        offset[axis] = -1
+        bd |= _boundaries(labels, offset)
+        offset[axis] = 1
+        bd |= _boundaries(labels, offset)
+    bd = _smooth(bd.astype('float32'), smoothing)
+    bd /= max(float(bd.max()), 1e-6)
+    if noise > 0:
+        bd += np.random.RandomState(seed).normal(0., noise, size=bd.shape).astype('float32')
+    return np.clip(bd, 0., 1.).astype('float32')
+
+
+def affinities(labels, offsets=DEFAULT_OFFSETS, noise=0.1, seed=0):
+    """ Synthetic affinities for a label volume.
+
+    High values correspond to boundaries, like for the affinity inputs of the watershed.
+
+    Arguments:
+        labels [np.ndarray] - label volume
+        offsets [list[list[int]]] - affinity offsets (default: direct neighbors)
+        noise [float] - standard deviation of the additive gaussian noise (default: 0.1)
+        seed [int] - random seed (default: 0)
+    Returns:
+        np.ndarray - affinities in [0, 1] with channels first (float32)
+    """
+    affs = np.stack([_boundaries(labels, offset) for offset in offsets]).astype('float32')
+    if noise > 0:
+        affs += np.random.RandomState(seed).normal(0., noise, size=affs.shape).astype('float32')
+    return np.clip(affs, 0., 1.).astype('float32')
+
+
+def synthetic_mask(shape, sparsity=0.25, mean_size=(16, 64, 64), seed=0):
+    """ Synthetic mask that excludes approximately a fraction `sparsity` of the volume.
+
+    The excluded region consists of large voronoi cells.
+    """
+    cells = voronoi_labels(shape, mean_size, seed + 3)
+    ids, counts = np.unique(cells, return_counts=True)
+    order = np.random.RandomState(seed).permutation(len(ids))
+    n_excluded = np.searchsorted(np.cumsum(counts[order]), sparsity * cells.size)
+    excluded = ids[order[:n_excluded]]
+    return np.logical_not(np.isin(cells, excluded)).astype('uint8')
+
+
+def write_synthetic_data(path, shape, chunks, mean_size=(8, 32, 32), ws_size=(4, 16, 16),
+                         sparsity=0., mask_sparsity=0.25, noise=0.1, seed=0):
+    """ Write a synthetic dataset for the segmentation workflows to a n5 or zarr container.
+
+    Writes the datasets 'labels' (ground-truth), 'watershed' (over-segmentation of the labels),
+    'boundaries', 'affinities' and 'mask'; the label datasets have the attribute 'maxId'.
+
+    Returns:
+        dict - names of the datasets mapped to their keys
+    """
+    labels = synthetic_labels(shape, mean_size, sparsity, seed)
+    ws = oversegmentation(labels, ws_size, seed)
+    data = {'labels': labels, 'watershed': ws,
+            'boundaries': boundary_map(labels, noise, seed=seed),
+            'affinities': affinities(labels, noise=noise, seed=seed),
+            'mask': synthetic_mask(shape, mask_sparsity, seed=seed)}
+    keys = {}
+    with vu.file_reader(path) as f:
+        for name, vol in data.items():
+            ds_chunks = tuple(chunks) if vol.ndim == len(shape) else (1,) + tuple(chunks)
+            ds = f.require_dataset(name, shape=vol.shape, chunks=ds_chunks,
+                                   compression='gzip', dtype=vol.dtype)
+            ds[:] = vol
+            if name in ('labels', 'watershed'):
+                ds.attrs['maxId'] = int(vol.max())
+            keys[name] = name
+    return keys
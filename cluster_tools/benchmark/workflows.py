@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import time
+from shutil import rmtree
+
+import luigi
+import numpy as np
+
+import cluster_tools.utils.volume_utils as vu
+from ..cluster_tasks import BaseClusterTask
+from ..utils.parse_utils import profile_report
+from .synthetic import write_synthetic_data
+
+#
+# End-to-end benchmarks of the workflows on synthetic data.
+#
+# Each workflow runs in its own tmp folder with block profiling enabled, so the results
+# contain the profile summaries of the tasks (see `parse_utils.profile_report`) in addition
+# to the wall-clock time. Workflows that need the results of another workflow (e.g. the edge
+# features need the graph) run it first, its time is not included in the measurement.
+#
+
+
+def _graph(ctx, name):
+    from ..graph import GraphWorkflow
+    return GraphWorkflow(input_path=ctx['data_path'], input_key=ctx['keys']['watershed'],
+                         graph_path=os.path.join(ctx['folder'], name, 'problem.n5'),
+                         output_key='graph', n_scales=1, **ctx['task_kwargs'](name))
+
+
+def _watershed(ctx, name):
+    from ..watershed import WatershedWorkflow
+    return WatershedWorkflow(input_path=ctx['data_path'], input_key=ctx['keys']['boundaries'],
+                             mask_path=ctx['data_path'], mask_key=ctx['keys']['mask'],
+                             output_path=os.path.join(ctx['folder'], name, 'data.n5'),
+                             output_key='watershed', **ctx['task_kwargs'](name))
+
+
+def _features(ctx, name):
+    from ..features import EdgeFeaturesWorkflow
+    graph_path = os.path.join(ctx['folder'], name, 'problem.n5')
+    dep = _graph(ctx, name)
+    return EdgeFeaturesWorkflow(input_path=ctx['data_path'], input_key=ctx['keys']['boundaries'],
+                                labels_path=ctx['data_path'], labels_key=ctx['keys']['watershed'],
+                                graph_path=graph_path, graph_key='graph',
+                                output_path=graph_path, output_key='features',
+                                dependency=dep, **ctx['task_kwargs'](name)), [dep]
+
+
+def _multicut(ctx, name):
+    from ..workflows import MulticutSegmentationWorkflow
+    out_path = os.path.join(ctx['folder'], name, 'data.n5')
+    return MulticutSegmentationWorkflow(input_path=ctx['data_path'], input_key=ctx['keys']['boundaries'],
+                                        ws_path=ctx['data_path'], ws_key=ctx['keys']['watershed'],
+                                        problem_path=os.path.join(ctx['folder'], name, 'problem.n5'),
+                                        node_labels_key='node_labels',
+                                        output_path=out_path, output_key='multicut',
+                                        n_scales=1, skip_ws=True, **ctx['task_kwargs'](name))
+
+
+def _write_assignments(ctx, name):
+    # random assignments for the watershed ids
+    path = os.path.join(ctx['folder'], name, 'data.n5')
+    with vu.file_reader(ctx['data_path'], 'r') as f:
+        n_ids = f[ctx['keys']['watershed']].attrs['maxId'] + 1
+    assignments = np.random.RandomState(ctx['seed']).randint(0, n_ids, size=n_ids).astype('uint64')
+    with vu.file_reader(path) as f:
+        ds = f.require_dataset('assignments', shape=assignments.shape, chunks=assignments.shape,
+                               compression='gzip', dtype='uint64')
+        ds[:] = assignments
+    return path
+
+
+def _write(ctx, name):
+    from .. import write as write_tasks
+    path = _write_assignments(ctx, name)
+    task = getattr(write_tasks, 'Write%s' % ctx['target_name'])
+    kwargs = ctx['task_kwargs'](name)
+    kwargs.pop('target')
+    return task(input_path=ctx['data_path'], input_key=ctx['keys']['watershed'],
+                output_path=path, output_key='segmentation',
+                assignment_path=path, assignment_key='assignments',
+                identifier='benchmark', **kwargs)
+
+
+def _relabel(ctx, name):
+    from ..relabel import RelabelWorkflow
+    path = os.path.join(ctx['folder'], name, 'data.n5')
+    return RelabelWorkflow(input_path=ctx['data_path'], input_key=ctx['keys']['labels'],
+                           assignment_path=path, assignment_key='assignments',
+                           output_path=path, output_key='relabeled',
+                           **ctx['task_kwargs'](name))
+
+
+def _downscaling(ctx, name):
+    from ..downscaling import DownscalingWorkflow
+    return DownscalingWorkflow(input_path=ctx['data_path'], input_key=ctx['keys']['boundaries'],
+                               output_path=os.path.join(ctx['folder'], name, 'data.n5'),
+                               scale_factors=[[1, 2, 2], [2, 2, 2]], halos=[[0, 0, 0], [0, 0, 0]],
+                               metadata_format='bdv.n5', **ctx['task_kwargs'](name))
+
+
+# the workflow factories return the task to be benchmarked and optionally
+# the tasks it depends on, which are run before the measurement
+WORKFLOWS = {'watershed': _watershed,
+             'graph': _graph,
+             'features': _features,
+             'multicut': _multicut,
+             'write': _write,
+             'relabel': _relabel,
+             'downscaling': _downscaling}
+
+
+def _write_configs(config_dir, block_shape, task_configs):
+    os.makedirs(config_dir, exist_ok=True)
+    config = BaseClusterTask.default_global_config()
+    config.update({'shebang': '#! %s' % sys.executable, 'block_shape': list(block_shape),
+                   'profile': True})
+    with open(os.path.join(config_dir, 'global.config'), 'w') as f:
+        json.dump(config, f)
+    for name, task_config in task_configs.items():
+        with open(os.path.join(config_dir, '%s.config' % name), 'w') as f:
+            json.dump(task_config, f)
+
+
+def run_workflow_benchmarks(folder, shape=(128, 512, 512), block_shape=(32, 256, 256),
+                            workflows=None, max_jobs=4, target='local', seed=0,
+                            task_configs=None, clean_up=True):
+    """ Run end-to-end benchmarks of the workflows on synthetic data.
+
+    Arguments:
+        folder [str] - folder for the data and the tmp folders of the workflows
+        shape [tuple] - shape of the synthetic volume (default: (128, 512, 512))
+        block_shape [tuple] - block shape of the workflows (default: (32, 256, 256))
+        workflows [list[str]] - names of the workflows, see `WORKFLOWS` (default: all workflows)
+        max_jobs [int] - maximal number of jobs (default: 4)
+        target [str] - computation target (default: 'local')
+        seed [int] - random seed for the synthetic data (default: 0)
+        task_configs [dict] - task configs that are written to the config folders (default: None)
+        clean_up [bool] - remove the folder after the benchmarks (default: True)
+    """
+    workflows = list(WORKFLOWS) if workflows is None else workflows
+    os.makedirs(folder, exist_ok=True)
+    data_path = os.path.join(folder, 'data.n5')
+    keys = write_synthetic_data(data_path, shape, block_shape, seed=seed)
+    n_voxels = int(np.prod(shape))
+    target_name = {'local': 'Local', 'slurm': 'Slurm', 'lsf': 'LSF'}[target]
+
+    def task_kwargs(name):
+        return {'tmp_folder': os.path.join(folder, name, 'tmp'),
+                'config_dir': os.path.join(folder, name, 'configs'),
+                'max_jobs': max_jobs, 'target': target}
+
+    ctx = {'folder': folder, 'data_path': data_path, 'keys': keys, 'seed': seed,
+           'target_name': target_name, 'task_kwargs': task_kwargs}
+
+    results = []
+    try:
+        for name in workflows:
+            kwargs = task_kwargs(name)
+            _write_configs(kwargs['config_dir'], block_shape, task_configs or {})
+            task = WORKFLOWS[name](ctx, name)
+            task, deps = task if isinstance(task, tuple) else (task, [])
+            if deps:
+                assert luigi.build(deps, local_scheduler=True), "Dependencies of %s failed" % name
+            # the profiles of the dependencies are not part of the measurement
+            dep_jobs = set(profile_report(kwargs['tmp_folder']))
+
+            t0 = time.perf_counter()
+            success = luigi.build([task], local_scheduler=True)
+            wall_time = time.perf_counter() - t0
+
+            profiles = {job_name: summary
+                        for job_name, summary in profile_report(kwargs['tmp_folder']).items()
+                        if job_name not in dep_jobs}
+            results.append({'name': name, 'success': bool(success),
+                            'params': {'shape': list(shape), 'block_shape': list(block_shape),
+                                       'max_jobs': max_jobs, 'target': target},
+                            'times': [wall_time], 'min': wall_time, 'median': wall_time,
+                            'n_voxels': n_voxels, 'voxels_per_s': n_voxels / wall_time,
+                            'profiles': profiles})
+    finally:
+        if clean_up:
+            rmtree(folder, ignore_errors=True)
+    return results
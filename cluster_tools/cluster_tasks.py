@@ -4,9 +4,15 @@ import stat
 import json
 import time
 import fileinput
+import importlib
+import importlib.util
 import sys
+import traceback
+import uuid
+from contextlib import redirect_stdout, redirect_stderr
 from copy import deepcopy
 from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
 from subprocess import call, check_output, CalledProcessError, STDOUT
 from datetime import datetime, timedelta
 from multiprocessing import cpu_count
@@ -14,10 +20,22 @@ from multiprocessing import cpu_count
 import numpy as np
 import luigi
 
-from .utils.parse_utils import parse_blocks_task, parse_job, parse_job_lsf
+from .utils import function_utils as fu
+from .utils.parse_utils import parse_blocks_task, parse_job, parse_job_lsf, profile_report
+from .utils.queue_utils import write_block_queue
+from .utils.partition_utils import load_block_weights, partition_blocks
+from .utils.cache_utils import zorder_blocks, cache_hit_rate
+from .utils import incremental_utils as iu
+from .utils import coschedule_utils as csu
+from .utils import resource_utils as ru
 from .utils.task_utils import DummyTask
 
 
+# submission time of the scheduler jobs (arrays and co-scheduling runners) submitted from this process,
+# the jobs might not be listed by the scheduler accounting right after submission
+_submit_times = {}
+
+
 class FailedJobsError(Exception):
     """ Custom exception for failed jobs
     """
@@ -69,6 +87,16 @@ class BaseClusterTask(luigi.Task):
     allow_retry = True
     # number of retries already done
     n_retries = 0
+    # allow distributing the blocks via a queue that the jobs pull blocks from,
+    # set to true in deriving class if the jobs get their blocks via `vu.job_blocks`
+    allow_block_queue = False
+    # allow reading the inputs through the chunk cache (see `utils.cache_utils`),
+    # set to true in deriving class if the jobs open their inputs with `cu.make_chunk_cache`
+    allow_chunk_cache = False
+    # allow skipping blocks whose inputs and config did not change if 'incremental' is set
+    # in the global config (see `utils.incremental_utils`), set to true in deriving class
+    # if the blocks only depend on the datasets returned by `incremental_datasets`
+    allow_incremental = False
 
     #
     # API
@@ -77,6 +105,10 @@ class BaseClusterTask(luigi.Task):
     def run(self):
         self.make_dirs()
         self._write_log("Start task %s" % self.task_name)
+        start_time = time.time()
+        # whether this run changed any outputs, which is only known for incremental blockwise tasks
+        self._incremental_changed = None
+        iu.clear_stamp_cache()
         try:
             self.run_impl()
         # if a failed jobs error was raised, one or more jobs failed
@@ -93,8 +125,22 @@ class BaseClusterTask(luigi.Task):
             self._write_log("move log from %s to %s" % (out_path, fail_path))
             shutil.move(out_path, fail_path)
             raise e
+        self._write_incremental_record(start_time)
         self._write_log("Done task %s" % self.task_name)
 
+    def complete(self):
+        """ Check if the task is complete.
+
+        In incremental mode, the task also needs to rerun if its config or inputs
+        changed or if any of its dependencies was rerun after it.
+        """
+        if not super().complete():
+            return False
+        global_config_path = os.path.join(self.config_dir, 'global.config')
+        if not _incremental_mode(global_config_path):
+            return True
+        return self._incremental_up_to_date()
+
     def init(self, shebang):
         """ Init tmp dir and python scripts.
 
@@ -121,6 +167,9 @@ class BaseClusterTask(luigi.Task):
 
         if len(success_list) == n_jobs:
             self._write_log("%s finished successfully" % self.task_name)
+            self._report_cache_stats(n_jobs, job_prefix)
+            self._update_incremental_manifest(job_prefix)
+            self._record_resources(n_jobs, job_prefix)
         else:
             failed_jobs = set(range(n_jobs)) - set(success_list)
             self._write_log("%s failed for jobs:" % self.task_name)
@@ -164,15 +213,21 @@ class BaseClusterTask(luigi.Task):
         job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
                                                                         job_prefix)
         # for the jobs that have completely passed, we can add the block list from the config
+        # (unless the blocks were pulled from a queue)
         passed_blocks = []
-        for job_id in passed_blocks:
+        complete_jobs = []
+        for job_id in passed_jobs:
             config_path = self._config_path(job_id, job_prefix)
             with open(config_path, 'r') as f:
-                passed_blocks.extend(json.load(f)['block_list'])
+                job_config = json.load(f)
+            if 'block_queue' in job_config:
+                continue
+            passed_blocks.extend(job_config['block_list'])
+            complete_jobs.append(job_id)
 
-        # for the failed jobs, we parse the output logs
+        # for the other jobs, we parse the ledgers (or output logs)
         log_prefix = os.path.join(self.tmp_folder, 'logs', '%s_' % job_name)
-        passed_blocks.extend(parse_blocks_task(log_prefix, n_jobs, passed_jobs))
+        passed_blocks.extend(parse_blocks_task(log_prefix, n_jobs, complete_jobs))
 
         # return the list of failed blocks
         return list(set(self.block_list) - set(passed_blocks))
@@ -231,7 +286,33 @@ class BaseClusterTask(luigi.Task):
                 "max_num_retries": 0,
                 "block_list_path": None,
                 "easybuild": True,
-                "qos": "normal"}
+                "qos": "normal",
+                "block_queue": False,
+                "block_queue_batch_size": 1,
+                "job_balancing": None,
+                "block_weights_path": None,
+                "profile": False,
+                "occupancy_index": False,
+                "prefetch_blocks": 0,
+                "write_behind": 0,
+                "chunk_cache_mb": 0,
+                "chunk_cache_shared_dir": None,
+                "chunk_cache_shared_mb": 4096,
+                "incremental": None,
+                "coschedule": False,
+                "coschedule_threads": 8,
+                "coschedule_mem_limit": 16,
+                "coschedule_time_limit": 240,
+                "coschedule_idle_timeout": 300,
+                "accounting_grace_period": 60,
+                "resource_store": None,
+                "resource_safety_factor": 1.5,
+                "resource_max_time_limit": None,
+                "resource_max_threads": 16,
+                "max_array_size": 1000,
+                "poll_interval": 10,
+                "max_poll_interval": 120,
+                "poll_backoff": 1.5}
 
     def global_config_values(self, with_block_list_path=False):
         """ Load the global config values that are needed
@@ -253,6 +334,32 @@ class BaseClusterTask(luigi.Task):
         """
         pass
 
+    def use_occupancy_index(self):
+        """ Check if the tasks should maintain and use the occupancy indices
+        of the datasets to skip empty blocks (see `utils.occupancy_utils`).
+        """
+        return self.get_global_config().get('occupancy_index', False)
+
+    def skip_empty_in(self, path, key):
+        """ Get the dataset whose empty blocks can be skipped for `vu.blocks_in_volume`,
+        None if the occupancy indices are not used.
+        """
+        return (path, key) if self.use_occupancy_index() else None
+
+    def get_block_weights(self, block_list):
+        """ Get the cost estimates for the blocks in block_list, used to balance the jobs
+        if `job_balancing` is set in the global config.
+
+        The base implementation loads the weights from `block_weights_path` in the global config
+        and returns None if it is not given. Over-ride in deriving classes to estimate the
+        weights from the data if no weights were given.
+        """
+        weights_path = self.get_global_config().get('block_weights_path', None)
+        if weights_path is None:
+            return None
+        self._write_log("loading block weights from %s" % weights_path)
+        return load_block_weights(weights_path, block_list)
+
     # part of the luigi API
     def output(self):
         return luigi.LocalTarget(os.path.join(self.tmp_folder, self.task_name + '.log'))
@@ -291,6 +398,11 @@ class BaseClusterTask(luigi.Task):
         os.makedirs(self.tmp_folder, exist_ok=True)
         os.makedirs(os.path.join(self.tmp_folder, 'logs'), exist_ok=True)
         os.makedirs(os.path.join(self.tmp_folder, 'error_logs'), exist_ok=True)
+        os.makedirs(os.path.join(self.tmp_folder, 'job_status'), exist_ok=True)
+        os.makedirs(os.path.join(self.tmp_folder, 'ledgers'), exist_ok=True)
+        os.makedirs(os.path.join(self.tmp_folder, 'profiles'), exist_ok=True)
+        os.makedirs(os.path.join(self.tmp_folder, 'cache_stats'), exist_ok=True)
+        os.makedirs(os.path.join(self.tmp_folder, 'incremental'), exist_ok=True)
         self._write_log('created tmp-folder and log dirs @ %s' % self.tmp_folder)
 
     def _write_single_job_config(self, config, job_prefix):
@@ -298,9 +410,115 @@ class BaseClusterTask(luigi.Task):
         with open(config_path, 'w') as f:
             json.dump(config, f)
 
+    def _queue_path(self, job_prefix=None):
+        job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
+                                                                        job_prefix)
+        return os.path.join(self.tmp_folder, '%s.queue' % job_name)
+
+    def _write_queue_job_configs(self, n_jobs, block_list, config, job_prefix, batch_size):
+        # all blocks go to the queue, the jobs claim batches of blocks from it until it is empty
+        queue_path = self._queue_path(job_prefix)
+        write_block_queue(queue_path, block_list)
+        job_config = {'block_list': [], 'block_queue': queue_path,
+                      'block_queue_batch_size': batch_size, **config}
+        for job_id in range(n_jobs):
+            config_path = self._config_path(job_id, job_prefix)
+            with open(config_path, 'w') as f:
+                json.dump(job_config, f)
+        self._write_log('written %i blocks to queue @ %s' % (len(block_list), queue_path))
+
+    def _chunk_cache_config(self, job_prefix=None):
+        """ Get the chunk cache settings for the job configs, None if the cache is not used.
+        """
+        global_config = self.get_global_config()
+        cache_mb = global_config.get('chunk_cache_mb', 0)
+        if not self.allow_chunk_cache or not cache_mb:
+            return None
+        job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
+                                                                        job_prefix)
+        cache_config = {'max_bytes': int(cache_mb * 1e6),
+                        'stats_prefix': os.path.join(self.tmp_folder, 'cache_stats', '%s_' % job_name)}
+        shared_dir = global_config.get('chunk_cache_shared_dir', None)
+        if shared_dir is not None:
+            # use a new namespace for each run, so that we never read chunks of outdated data
+            cache_config.update({'shared_dir': shared_dir,
+                                 'shared_max_bytes': int(global_config.get('chunk_cache_shared_mb',
+                                                                           4096) * 1e6),
+                                 'namespace': '%s_%s' % (job_name, uuid.uuid4().hex)})
+        return cache_config
+
+    def _zorder_blocks(self, block_list, config):
+        """ Sort the blocks in Z-order, so that consecutive blocks of a job share many chunks.
+        """
+        block_shape = config.get('block_shape', self.get_global_config()['block_shape'])
+        try:
+            from .utils.volume_utils import get_shape
+            shape = get_shape(config['input_path'], config['input_key'])[-len(block_shape):]
+        except Exception:
+            self._write_log("could not determine the volume shape, cannot sort blocks in z-order")
+            return None
+        return zorder_blocks(shape, block_shape, block_list)
+
+    def _report_cache_stats(self, n_jobs, job_prefix=None):
+        job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
+                                                                        job_prefix)
+        stats = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'evictions': 0}
+        have_stats = False
+        for job_id in range(n_jobs):
+            path = self._cache_stats_path(job_id, job_prefix)
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                job_stats = json.load(f)
+            stats = {k: v + job_stats.get(k, 0) for k, v in stats.items()}
+            have_stats = True
+        if have_stats:
+            self._write_log("%s chunk cache hit rate: %f (%i hits, %i shared hits, %i misses, %i evictions)"
+                            % (job_name, cache_hit_rate(stats), stats['hits'], stats['shared_hits'],
+                               stats['misses'], stats['evictions']))
+
     def _write_multiple_job_configs(self, n_jobs, block_list, config, job_prefix,
                                     consecutive_blocks):
 
+        global_config = self.get_global_config()
+        # settings for asynchronous reading and writing of blocks (see `vu.prefetch_blocks`
+        # and `vu.BlockWriter`), they can be over-ridden in the task config
+        config = {'prefetch_blocks': global_config.get('prefetch_blocks', 0),
+                  'write_behind': global_config.get('write_behind', 0), **config}
+
+        # settings for the chunk cache; if it is used, we process the blocks in z-order
+        # and assign contiguous runs of blocks to the jobs to maximize the cache hits
+        cache_config = self._chunk_cache_config(job_prefix)
+        zorder_list = None
+        if cache_config is not None:
+            config = {'chunk_cache': cache_config, **config}
+            if not consecutive_blocks:
+                zorder_list = self._zorder_blocks(block_list, config)
+                block_list = block_list if zorder_list is None else zorder_list
+
+        # use the block queue if it is enabled and supported by this task
+        # (consecutive blocks need a static assignment)
+        if self.allow_block_queue and not consecutive_blocks and global_config.get('block_queue', False):
+            self._write_queue_job_configs(n_jobs, block_list, config, job_prefix,
+                                          global_config.get('block_queue_batch_size', 1))
+            return
+
+        # balance the jobs according to the block weights if specified
+        # (this is not possible for consecutive blocks either)
+        balancing = global_config.get('job_balancing', None)
+        balanced_blocks = None
+        if balancing is not None and not consecutive_blocks:
+            weights = self.get_block_weights(block_list)
+            if weights is None:
+                self._write_log("no block weights available, cannot balance jobs")
+            else:
+                balanced_blocks = partition_blocks(block_list, weights, n_jobs, balancing)
+                block_weights = dict(zip(block_list, weights))
+                job_loads = [sum(block_weights[block_id] for block_id in blocks)
+                             for blocks in balanced_blocks]
+                self._write_log("balanced jobs with %s, max / mean load: %f" % (balancing,
+                                                                               max(job_loads) / np.mean(job_loads)))
+
         # TODO there must be a more elegant way of doing this
         if consecutive_blocks:
             # distribute blocks to jobs as equal as possible
@@ -327,6 +545,10 @@ class BaseClusterTask(luigi.Task):
             # block_jobs consecutive
             if consecutive_blocks:
                 block_jobs = prepartiion[job_id]
+            elif balanced_blocks is not None:
+                block_jobs = balanced_blocks[job_id]
+            elif zorder_list is not None:
+                block_jobs = [int(block_id) for block_id in np.array_split(zorder_list, n_jobs)[job_id]]
             else:
                 block_jobs = block_list[job_id::n_jobs]
             job_config = {'block_list': block_jobs, **config}
@@ -336,6 +558,8 @@ class BaseClusterTask(luigi.Task):
 
     def _write_job_config(self, n_jobs, block_list, config,
                           job_prefix=None, consecutive_blocks=False):
+        # estimate the resources of the jobs from previous runs, if available
+        config = self._estimate_resources(n_jobs, block_list, config, job_prefix)
         # check f we have a reduce style block, that is
         # not distributed over blocks
         if block_list is None:
@@ -343,6 +567,9 @@ class BaseClusterTask(luigi.Task):
             self._write_single_job_config(config, job_prefix)
         # otherwise, we have multiple jobs distributed over blocks
         else:
+            # in incremental mode, we only schedule the blocks that changed since the last run
+            if not consecutive_blocks:
+                block_list = self._incremental_blocks(block_list, config, job_prefix)
             # we add the block list to this class to know all the blocks
             # that were scheduled if we need to rerun this task
             self.block_list = block_list
@@ -350,6 +577,395 @@ class BaseClusterTask(luigi.Task):
                                              job_prefix, consecutive_blocks)
         self._write_log('written config for %i jobs' % n_jobs)
 
+    #
+    # Helper functions for incremental execution
+    #
+
+    def incremental_datasets(self, config):
+        """ Get the input and output datasets of the blocks, used to determine if a block
+        needs to be recomputed in incremental mode.
+
+        The base implementation uses the input, mask and output paths and keys of the job config.
+        Over-ride in deriving classes with different inputs or outputs.
+        Returns:
+            list[tuple] - paths and keys of the input datasets
+            list[tuple] - paths and keys of the output datasets
+        """
+        inputs = [(config[path_key], config[key_key])
+                  for path_key, key_key in (('input_path', 'input_key'), ('mask_path', 'mask_key'))
+                  if config.get(path_key, '')]
+        outputs = [(config['output_path'], config['output_key'])] if 'output_path' in config else []
+        return inputs, outputs
+
+    def incremental_halo(self, config):
+        """ Get the halo the blocks read from the inputs, used in incremental mode.
+        """
+        return config.get('halo', None)
+
+    def _incremental_path(self, job_prefix=None):
+        job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
+                                                                        job_prefix)
+        return os.path.join(self.tmp_folder, 'incremental', '%s.json' % job_name)
+
+    def _task_config_hash(self):
+        # we read the configs without logging, because this is also called from `complete`
+        configs = []
+        for name in ('global', self.task_name):
+            config_path = os.path.join(self.config_dir, '%s.config' % name)
+            if os.path.exists(config_path):
+                with open(config_path) as f:
+                    configs.append(json.load(f))
+            else:
+                configs.append({})
+        return iu.config_hash(*configs, dict(self.to_str_params(only_significant=True)))
+
+    def _load_incremental_record(self):
+        path = self._incremental_path()
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_incremental_record(self, start_time):
+        if not _incremental_mode(os.path.join(self.config_dir, 'global.config')):
+            return
+        # the stamp is the time of the last run that changed any output, the downstream
+        # tasks only need to rerun if it is newer than their last run
+        record = self._load_incremental_record()
+        changed = record is None or self._incremental_changed is None or self._incremental_changed
+        stamp = start_time if changed else record['stamp']
+        with open(self._incremental_path(), 'w') as f:
+            json.dump({'config_hash': self._task_config_hash(),
+                       'time': start_time, 'stamp': stamp}, f)
+
+    def _incremental_up_to_date(self):
+        record = self._load_incremental_record()
+        if record is None or record['config_hash'] != self._task_config_hash():
+            return False
+        for dep in luigi.task.flatten(self.requires()):
+            if not dep.complete() or _incremental_stamp(dep) > record['time']:
+                return False
+        # check the input datasets for changes, in case they were not produced by a dependency
+        for path_param, key_param in (('input_path', 'input_key'), ('mask_path', 'mask_key')):
+            path, key = getattr(self, path_param, ''), getattr(self, key_param, '')
+            if path and key and iu.dataset_stamp(path, key) > record['time']:
+                return False
+        return True
+
+    def _incremental_blocks(self, block_list, config, job_prefix=None):
+        """ Filter the blocks that need to be recomputed in incremental mode.
+        """
+        mode = self.get_global_config().get('incremental', None)
+        if not mode or not self.allow_incremental:
+            self._incremental_changed = True
+            return block_list
+        assert mode in iu.INCREMENTAL_MODES, "Invalid incremental mode %s" % mode
+
+        inputs, outputs = self.incremental_datasets(config)
+        block_shape = config.get('block_shape', self.get_global_config()['block_shape'])
+        layout = iu.DatasetLayout(*(inputs + outputs)[0])
+        if layout.shape is None:
+            from .utils.volume_utils import get_shape
+            shape = get_shape(*(inputs + outputs)[0])
+        else:
+            shape = layout.shape
+        shape = tuple(shape)[-len(block_shape):]
+
+        config_hash = iu.config_hash(config, exclude=iu.SCHEDULING_KEYS | iu.BLOCK_KEYS)
+        signatures = iu.block_signatures(inputs, shape, block_shape, block_list, config_hash,
+                                         mode, halo=self.incremental_halo(config))
+        out_signatures = iu.output_signatures(outputs, shape, block_shape, block_list, mode)
+        manifest_path = self._incremental_path(job_prefix)[:-5] + '.blocks.json'
+        dirty = iu.dirty_blocks(iu.load_manifest(manifest_path), block_list,
+                                signatures, out_signatures)
+        self._write_log("incremental: %i / %i blocks need to be recomputed" % (len(dirty),
+                                                                              len(block_list)))
+        dirty_path = self._incremental_path(job_prefix)[:-5] + '.dirty.json'
+        with open(dirty_path, 'w') as f:
+            json.dump(dirty, f)
+
+        self._incremental_changed = bool(getattr(self, '_incremental_changed', None)) or len(dirty) > 0
+        if not hasattr(self, '_incremental_pending'):
+            self._incremental_pending = {}
+        self._incremental_pending[job_prefix] = (manifest_path, {block_id: signatures[block_id]
+                                                                 for block_id in dirty},
+                                                 outputs, shape, block_shape, mode)
+        return dirty
+
+    def _update_incremental_manifest(self, job_prefix=None):
+        pending = getattr(self, '_incremental_pending', {}).pop(job_prefix, None)
+        if pending is None:
+            return
+        manifest_path, signatures, outputs, shape, block_shape, mode = pending
+        block_list = list(signatures.keys())
+        out_signatures = iu.output_signatures(outputs, shape, block_shape, block_list, mode)
+        manifest = iu.load_manifest(manifest_path)
+        manifest.update({block_id: (signatures[block_id], out_signatures[block_id])
+                         for block_id in block_list})
+        iu.save_manifest(manifest_path, manifest)
+
+    #
+    # Helper functions for resource estimation (see `utils.resource_utils`)
+    #
+
+    def get_job_resources(self, job_prefix=None):
+        """ Get the number of threads, time limit (in minutes) and memory limit (in GB) of the jobs.
+
+        These are the values estimated from previous runs if 'resource_store' is set in the global config
+        and observations for this task exist, otherwise the values from the task config.
+        """
+        resources = getattr(self, '_job_resources', {}).get(job_prefix, None)
+        if resources is None:
+            task_config = self.get_task_config()
+            resources = {'threads_per_job': task_config.get('threads_per_job', 1),
+                         'time_limit': task_config.get('time_limit', 60),
+                         'mem_limit': task_config.get('mem_limit', 2)}
+        return resources['threads_per_job'], resources['time_limit'], resources['mem_limit']
+
+    def _input_dtype(self, config):
+        if 'input_path' not in config or 'input_key' not in config:
+            return None
+        return ru.dataset_dtype(config['input_path'], config['input_key'])
+
+    def _estimate_resources(self, n_jobs, block_list, config, job_prefix=None):
+        global_config = self.get_global_config()
+        store = global_config.get('resource_store', None)
+        if store is None or block_list is None:
+            return config
+        observations = ru.load_observations(store, self.task_name, self._input_dtype(config))
+        if not observations:
+            self._write_log("no resource observations for %s, using the task config" % self.task_name)
+            return config
+
+        block_shape = config.get('block_shape', global_config['block_shape'])
+        resources = ru.estimate_resources(observations, int(np.prod(block_shape)),
+                                          n_blocks=int(np.ceil(len(block_list) / n_jobs)),
+                                          threads=config.get('threads_per_job', 1),
+                                          safety_factor=global_config.get('resource_safety_factor', 1.5),
+                                          max_time_limit=global_config.get('resource_max_time_limit', None),
+                                          max_threads=global_config.get('resource_max_threads', None))
+        self._write_log("estimated resources from %i observations: %s" % (len(observations),
+                                                                          json.dumps(resources)))
+        if not hasattr(self, '_job_resources'):
+            self._job_resources = {}
+        self._job_resources[job_prefix] = resources
+        return {**config, 'threads_per_job': resources['threads_per_job']}
+
+    def _record_resources(self, n_jobs, job_prefix=None):
+        global_config = self.get_global_config()
+        store = global_config.get('resource_store', None)
+        if store is None:
+            return
+        threads = self.get_job_resources(job_prefix)[0]
+        config_path = self._config_path(0, job_prefix)
+        dtype = None
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                dtype = self._input_dtype(json.load(f))
+        observations = [ru.summarize_job(self._profile_path(job_id, job_prefix), threads, dtype)
+                        for job_id in range(n_jobs)]
+        observations = [obs for obs in observations if obs is not None]
+        if observations:
+            ru.record_observations(store, self.task_name, observations)
+            self._write_log("recorded %i resource observations in %s" % (len(observations), store))
+
+    #
+    # Helper functions for job status and job arrays
+    #
+
+    def _job_status_path(self, job_id, job_prefix=None):
+        job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
+                                                                        job_prefix)
+        return os.path.join(self.tmp_folder, 'job_status', '%s_%s.done' % (job_name, str(job_id)))
+
+    # must be consistent with `parse_utils.ledger_path`
+    def _ledger_path(self, job_id, job_prefix=None):
+        job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
+                                                                        job_prefix)
+        return os.path.join(self.tmp_folder, 'ledgers', '%s_%s.ledger' % (job_name, str(job_id)))
+
+    # must be consistent with `parse_utils.profile_report`
+    def _profile_path(self, job_id, job_prefix=None):
+        job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
+                                                                        job_prefix)
+        return os.path.join(self.tmp_folder, 'profiles', '%s_%s.profile' % (job_name, str(job_id)))
+
+    def _cache_stats_path(self, job_id, job_prefix=None):
+        job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
+                                                                        job_prefix)
+        return os.path.join(self.tmp_folder, 'cache_stats', '%s_%s.json' % (job_name, str(job_id)))
+
+    def _job_env(self, job_id, job_prefix=None):
+        """ Environment variables that need to be set for a job.
+        """
+        env = {fu.LEDGER_ENV_VAR: self._ledger_path(job_id, job_prefix)}
+        # the block profiles are also needed to record the resources
+        global_config = self.get_global_config()
+        if global_config.get('profile', False) or global_config.get('resource_store', None) is not None:
+            env[fu.PROFILE_ENV_VAR] = self._profile_path(job_id, job_prefix)
+        return env
+
+    def _job_array_commands(self, job_prefix=None):
+        """ Shell commands to run the job with id `JOB_ID` from an array job script.
+
+        The job output is redirected to the usual log files and a sentinel file
+        is written once the job has exited, independent of its success.
+        """
+        job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
+                                                                        job_prefix)
+        trgt_file = os.path.join(self.tmp_folder, self.task_name + '.py')
+        config_file = self._config_path('${JOB_ID}', job_prefix)
+        log_file = os.path.join(self.tmp_folder, 'logs', '%s_${JOB_ID}.log' % job_name)
+        err_file = os.path.join(self.tmp_folder, 'error_logs', '%s_${JOB_ID}.err' % job_name)
+        status_file = self._job_status_path('${JOB_ID}', job_prefix)
+        exports = ''.join("export %s=%s\n" % (var, val)
+                          for var, val in self._job_env('${JOB_ID}', job_prefix).items())
+        return exports + ("%s %s > %s 2> %s\n"
+                          "touch %s\n") % (trgt_file, config_file, log_file, err_file, status_file)
+
+    def _job_array_chunks(self, n_jobs):
+        """ Split the jobs into arrays that do not exceed the maximal array size of the scheduler.
+
+        Returns list of (offset, size) for the individual arrays.
+        """
+        max_array_size = self.get_global_config().get('max_array_size', 1000)
+        return [(offset, min(max_array_size, n_jobs - offset))
+                for offset in range(0, n_jobs, max_array_size)]
+
+    def _clean_job_status(self, n_jobs, job_prefix=None):
+        # remove the sentinels, ledgers, profiles and cache stats of previous runs, e.g. before a retry
+        for job_id in range(n_jobs):
+            for path in (self._job_status_path(job_id, job_prefix),
+                         self._ledger_path(job_id, job_prefix),
+                         self._profile_path(job_id, job_prefix),
+                         self._cache_stats_path(job_id, job_prefix)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    #
+    # Co-scheduling of single-job tasks in a shared allocation (see `utils.coschedule_utils`)
+    #
+
+    def _use_coschedule(self, n_jobs):
+        """ Check if the job should be run by the co-scheduling runner.
+
+        This is the case for single-job tasks if 'coschedule' is enabled in the global config
+        and the job fits into the resources of the runner.
+        """
+        global_config = self.get_global_config()
+        if n_jobs != 1 or not global_config.get('coschedule', False):
+            return False
+        task_config = self.get_task_config()
+        return (task_config.get('threads_per_job', 1) <= global_config.get('coschedule_threads', 8) and
+                task_config.get('mem_limit', 2) <= global_config.get('coschedule_mem_limit', 16) and
+                task_config.get('time_limit', 60) <= global_config.get('coschedule_time_limit', 240))
+
+    def _start_runner(self):
+        global_config = self.get_global_config()
+        folder = os.path.join(self.tmp_folder, 'coschedule')
+        name = 'runner_%i' % time.time_ns()
+        spool_dir = os.path.join(folder, name)
+        os.makedirs(spool_dir)
+
+        script_path = os.path.join(folder, '%s.sh' % name)
+        with open(script_path, 'w') as f:
+            f.write(csu.runner_script(spool_dir, global_config.get('coschedule_idle_timeout', 300),
+                                      self._runner_preamble()))
+        self._make_executable(script_path)
+
+        time_limit = global_config.get('coschedule_time_limit', 240)
+        runner_id = self._submit_runner(script_path, global_config.get('coschedule_threads', 8),
+                                        global_config.get('coschedule_mem_limit', 16), time_limit)
+        _submit_times[runner_id] = time.time()
+        runner = {'id': runner_id, 'spool': spool_dir, 'time_limit': time_limit}
+        csu.save_runner(folder, runner)
+        self._write_log("started co-scheduling runner %s with spool %s" % (str(runner_id), spool_dir))
+        return runner
+
+    def _get_runner(self, time_limit):
+        # reuse the current runner if it is still accepting jobs and has enough time left
+        runner = csu.load_runner(os.path.join(self.tmp_folder, 'coschedule'))
+        if runner is not None and not csu.is_closed(runner) and\
+                csu.remaining_time(runner) >= 60 * time_limit and self._ids_active([runner['id']]):
+            return runner
+        return self._start_runner()
+
+    def _coschedule_job(self, job_prefix=None):
+        """ Run the (single) job of this task with the co-scheduling runner.
+
+        Returns the scheduler id of the runner.
+        """
+        job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
+                                                                        job_prefix)
+        time_limit = self.get_task_config().get('time_limit', 60)
+        commands = "JOB_ID=0\n" + self._job_array_commands(job_prefix)
+        while True:
+            runner = self._get_runner(time_limit)
+            script_path = csu.drop_script(runner['spool'], job_name, commands)
+            # if the runner has closed its spool, it might not have claimed the script,
+            # in this case we take it back and start a new runner
+            if csu.is_closed(runner) and csu.reclaim_script(script_path):
+                continue
+            break
+        self._write_log("submitted job to co-scheduling runner %s" % str(runner['id']))
+        return runner['id']
+
+    def _runner_preamble(self):
+        """ Shell commands to set up the environment of the co-scheduling runner.
+        """
+        return ''
+
+    def _submit_runner(self, script_path, n_threads, mem_limit, time_limit):
+        raise NotImplementedError("%s does not support co-scheduling" % type(self).__name__)
+
+    def _ids_states(self, job_ids):
+        """ Get the states of the (array) jobs listed by the scheduler, as dict from job id to states.
+        """
+        raise NotImplementedError("%s does not support co-scheduling" % type(self).__name__)
+
+    def _ids_active(self, job_ids):
+        """ Check if any of the jobs is active.
+
+        Jobs that were submitted recently, but are not listed by the scheduler yet,
+        are considered active for `accounting_grace_period` seconds after submission.
+        """
+        states = self._ids_states(job_ids)
+        if any(state in self.active_states for job_states in states.values() for state in job_states):
+            return True
+        grace_period = self.get_global_config().get('accounting_grace_period', 60)
+        # forget the jobs that were listed, they don't need the grace period anymore
+        for job_id in states:
+            _submit_times.pop(job_id, None)
+        unseen = [job_id for job_id in job_ids if job_id in _submit_times]
+        return any(time.time() - _submit_times[job_id] < grace_period for job_id in unseen)
+
+    def _jobs_done(self, n_jobs, job_prefix=None):
+        status_folder = os.path.join(self.tmp_folder, 'job_status')
+        done = set(os.listdir(status_folder))
+        return all(os.path.split(self._job_status_path(job_id, job_prefix))[1] in done
+                   for job_id in range(n_jobs))
+
+    def _wait_for_array_jobs(self, n_jobs, jobs_running, job_prefix=None):
+        """ Wait until all jobs have written their sentinel or the scheduler
+        does not list any of them as active anymore.
+
+        The polling interval starts at `poll_interval` seconds and is increased
+        by `poll_backoff` up to `max_poll_interval` seconds.
+        """
+        global_config = self.get_global_config()
+        wait_time = global_config.get('poll_interval', 10)
+        max_wait_time = global_config.get('max_poll_interval', 120)
+        backoff = global_config.get('poll_backoff', 1.5)
+        while True:
+            time.sleep(wait_time)
+            # checking the sentinels is cheap, so we do this first and only ask the scheduler
+            # if some sentinels are missing (the job might have been killed)
+            if self._jobs_done(n_jobs, job_prefix):
+                break
+            if not jobs_running():
+                break
+            wait_time = min(wait_time * backoff, max_wait_time)
+
     # copy the python script to the temp folder and replace the shebang
     def _write_script_file(self, shebang):
         assert os.path.exists(self.src_file), self.src_file
@@ -402,10 +1018,15 @@ class SlurmTask(BaseClusterTask):
     def _parse_mem_limit(mem_limit):
         """ Converts mem limit in GB to slurm format
         """
-        if mem_limit > 1:
+        if mem_limit > 1 and float(mem_limit).is_integer():
             return "%iG" % mem_limit
         else:
-            return "%iM" % int(mem_limit * 1000)
+            # round up, so that fractional (e.g. estimated) limits are not truncated
+            return "%iM" % int(np.ceil(mem_limit * 1000))
+
+    # slurm job states that mean the job has not finished yet
+    active_states = ('PENDING', 'RUNNING', 'REQUEUED', 'RESIZING', 'SUSPENDED',
+                     'CONFIGURING', 'COMPLETING', 'STAGE_OUT', 'SIGNALING', 'REQUEUE_HOLD')
 
     def _write_slurm_file(self, job_prefix=None):
         global_config = self.get_global_config()
@@ -415,9 +1036,9 @@ class SlurmTask(BaseClusterTask):
 
         # read and parse the relevant task config
         task_config = self.get_task_config()
-        n_threads = task_config.get("threads_per_job", 1)
-        time_limit = self._parse_time_limit(task_config.get("time_limit", 60))
-        mem_limit = self._parse_mem_limit(task_config.get("mem_limit", 2))
+        n_threads, time_limit, mem_limit = self.get_job_resources(job_prefix)
+        time_limit = self._parse_time_limit(time_limit)
+        mem_limit = self._parse_mem_limit(mem_limit)
 
         # TODO we should be able to set a global qos
         # and a local qos that overrides the global one
@@ -426,9 +1047,6 @@ class SlurmTask(BaseClusterTask):
         # additional job requirements
         requirements = task_config.get("slurm_requirements", [])
 
-        # get file paths
-        trgt_file = os.path.join(self.tmp_folder, self.task_name + '.py')
-        config_tmpl = self._config_path('$1', job_prefix)
         job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
                                                                         job_prefix)
         slurm_template = ("#!/bin/bash\n"
@@ -452,7 +1070,9 @@ class SlurmTask(BaseClusterTask):
         if easybuild:
             slurm_template += "module purge\n"
             slurm_template += "module load GCC\n"
-        slurm_template += ("%s %s") % (trgt_file, config_tmpl)
+        # the job id is given by the array index and the offset of this array
+        slurm_template += "JOB_ID=$((SLURM_ARRAY_TASK_ID + $1))\n"
+        slurm_template += self._job_array_commands(job_prefix)
 
         script_path = os.path.join(self.tmp_folder, 'slurm_%s.sh' % job_name)
         with open(script_path, 'w') as f:
@@ -469,46 +1089,76 @@ class SlurmTask(BaseClusterTask):
         job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
                                                                         job_prefix)
         script_path = os.path.join(self.tmp_folder, 'slurm_%s.sh' % job_name)
+        # the output of slurm itself (e.g. time limit or oom messages) goes here,
+        # the output of the jobs is redirected to the log files in the script
+        slurm_out = os.path.join(self.tmp_folder, 'error_logs', '%s_slurm_%%A_%%a.out' % job_name)
+        self._clean_job_status(n_jobs, job_prefix)
+
+        # single jobs can be run by the co-scheduling runner instead
+        if self._use_coschedule(n_jobs):
+            runner_id = self._coschedule_job(job_prefix)
+            self.slurm_array_ids = [runner_id]
+            self.slurm_ids = [str(runner_id)]
+            self.n_submitted_jobs = n_jobs
+            return
+
+        # submit the jobs as array(s), we keep the slurm ids of
+        # the individual jobs to report them if the jobs fail
+        self.slurm_array_ids = []
         self.slurm_ids = []
-        for job_id in range(n_jobs):
-            out_file = os.path.join(self.tmp_folder, 'logs', '%s_%i.log' % (job_name, job_id))
-            err_file = os.path.join(self.tmp_folder, 'error_logs', '%s_%i.err' % (job_name,
-                                                                                  job_id))
-            command = ['sbatch', '-o', out_file, '-e', err_file, '-J',
-                       '%s_%i' % (job_name, job_id), script_path, str(job_id)]
-            # call(command)
+        for offset, array_size in self._job_array_chunks(n_jobs):
+            command = ['sbatch', '--array=0-%i' % (array_size - 1),
+                       '-o', slurm_out, '-J', job_name, script_path, str(offset)]
             outp = check_output(command).decode().rstrip()
             # get the slurm job-id
             slurm_id = int(outp.split()[-1])
-            self.slurm_ids.append(slurm_id)
+            _submit_times[slurm_id] = time.time()
+            self.slurm_array_ids.append(slurm_id)
+            self.slurm_ids.extend(['%i_%i' % (slurm_id, array_id) for array_id in range(array_size)])
             # print slurm message
             print(outp)
+        self.n_submitted_jobs = n_jobs
+
+    def _ids_states(self, job_ids):
+        outp = check_output(['sacct', '-n', '-X', '-P', '-o', 'JobID,State',
+                             '-j', ','.join(map(str, job_ids))]).decode()
+        states = {}
+        for line in outp.split('\n'):
+            if line.strip() == '':
+                continue
+            # array jobs are listed as '<job_id>_<array_id>' or '<job_id>_[<array_ids>]',
+            # states can have a suffix, e.g. 'CANCELLED by 123'
+            job_id, state = line.split('|')[:2]
+            states.setdefault(int(job_id.split('_')[0]), []).append(state.split()[0])
+        return states
+
+    def _jobs_running(self):
+        # only query the accounting for the arrays of this task
+        return self._ids_active(self.slurm_array_ids)
+
+    def _runner_preamble(self):
+        if self.get_global_config().get("easybuild", True):
+            return "module purge\nmodule load GCC\n"
+        return ''
+
+    def _submit_runner(self, script_path, n_threads, mem_limit, time_limit):
+        global_config = self.get_global_config()
+        runner_out = os.path.join(self.tmp_folder, 'error_logs', 'coschedule_runner_%j.out')
+        command = ['sbatch', '-N', '1', '-c', str(n_threads),
+                   '--mem', self._parse_mem_limit(mem_limit),
+                   '-t', self._parse_time_limit(time_limit),
+                   '--qos=%s' % global_config.get('qos', 'normal'),
+                   '-o', runner_out, '-J', 'coschedule_runner']
+        if global_config.get('groupname', None) is not None:
+            command.extend(['-A', global_config['groupname']])
+        if global_config.get('partition', None) is not None:
+            command.extend(['-p', global_config['partition']])
+        outp = check_output(command + [script_path]).decode().rstrip()
+        print(outp)
+        return int(outp.split()[-1])
 
     def wait_for_jobs(self, job_prefix=None):
-        # TODO move to some config
-        wait_time = 10
-        while True:
-            time.sleep(wait_time)
-
-            try:
-                outp = check_output(['squeue -u $USER | grep $USER'], shell=True).decode()
-            except CalledProcessError as e:
-                # handle error for empty queue
-                outp = e.output.decode().rstrip()
-                if outp == '':
-                    break
-                else:
-                    raise e
-
-            outp = [out for out in outp.split('\n') if out != '']
-            # check how many jobs there are in total, if none, stop waiting
-            n_running = len(outp)
-            if n_running == 0:
-                break
-            # if we have jobs, check how many belong to this task
-            n_running = sum([int(out.split()[0]) in self.slurm_ids for out in outp])
-            if n_running == 0:
-                break
+        self._wait_for_array_jobs(self.n_submitted_jobs, self._jobs_running, job_prefix)
 
 
 class LocalTask(BaseClusterTask):
@@ -537,14 +1187,17 @@ class LocalTask(BaseClusterTask):
                                 '%s_%i.log' % (job_name, job_id))
         err_file = os.path.join(self.tmp_folder, 'error_logs',
                                 '%s_%i.err' % (job_name, job_id))
+        env = dict(os.environ)
+        env.update(self._job_env(job_id, job_prefix))
         with open(log_file, 'w') as f_out, open(err_file, 'w') as f_err:
             assert os.path.exists(script_path), script_path
-            call([script_path, config_file], stdout=f_out, stderr=f_err)
+            call([script_path, config_file], stdout=f_out, stderr=f_err, env=env)
 
     def submit_jobs(self, n_jobs, job_prefix=None):
         assert n_jobs <= self.max_local_jobs,\
             "Trying to submit %i local jobs but limit is %i. Did you forget to set the target to slurm or lsf?" %\
             (n_jobs, self.max_local_jobs)
+        self._clean_job_status(n_jobs, job_prefix)
         with futures.ProcessPoolExecutor(n_jobs) as pp:
             tasks = [pp.submit(self._submit, job_id, job_prefix) for job_id in range(n_jobs)]
             [t.result() for t in tasks]
@@ -554,6 +1207,127 @@ class LocalTask(BaseClusterTask):
         pass
 
 
+#
+# Persistent worker pool for local execution
+#
+
+# the pool is shared by all tasks run from this process, so that the workers
+# import the task modules (and vigra, nifty, z5py, elf ...) only once.
+# it is restarted if a task needs a different number of workers
+_local_pool = None
+_local_pool_size = None
+
+
+def _get_local_pool(n_workers):
+    global _local_pool, _local_pool_size
+    if _local_pool is not None and _local_pool_size != n_workers:
+        _local_pool.shutdown(wait=True)
+        _local_pool = None
+    if _local_pool is None:
+        # the workers reset their peak memory for each job, so that the block profiles
+        # record the peak memory of the job; if this is not supported, we use a new
+        # worker per job instead
+        max_tasks = None if fu.can_reset_peak_rss() else 1
+        _local_pool = futures.ProcessPoolExecutor(n_workers, max_tasks_per_child=max_tasks)
+        _local_pool_size = n_workers
+    return _local_pool
+
+
+def _reset_local_pool():
+    global _local_pool, _local_pool_size
+    if _local_pool is not None:
+        _local_pool.shutdown(wait=False)
+    _local_pool = None
+    _local_pool_size = None
+
+
+# task modules that were already imported by this worker
+_task_modules = {}
+
+
+def _import_task_module(module_name, src_file):
+    module = _task_modules.get(src_file, None)
+    if module is not None:
+        return module
+    # tasks defined in a script cannot be imported by their module name,
+    # so we load them from the source file instead
+    if module_name == '__main__':
+        name = '_cluster_tools_task_%s' % os.path.splitext(os.path.split(src_file)[1])[0]
+        spec = importlib.util.spec_from_file_location(name, src_file)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(module_name)
+    _task_modules[src_file] = module
+    return module
+
+
+def _run_pooled_job(module_name, src_file, function_name,
+                    job_id, config_file, log_file, err_file, job_env):
+    """ Run a single job in a pool worker.
+
+    Stdout and stderr are redirected to the same log files and the same ledger is used
+    as for `LocalTask`, so that the job can be checked with `check_jobs`.
+    """
+    with open(log_file, 'w') as f_out, open(err_file, 'w') as f_err:
+        with redirect_stdout(f_out), redirect_stderr(f_err):
+            fu.reset_peak_rss()
+            fu.set_ledger(job_env[fu.LEDGER_ENV_VAR])
+            fu.set_profile(job_env.get(fu.PROFILE_ENV_VAR, None))
+            try:
+                module = _import_task_module(module_name, src_file)
+                getattr(module, function_name)(job_id, config_file)
+            # the job failed and we only log the traceback,
+            # the failure is detected by `check_jobs`.
+            # we also catch SystemExit, so that jobs calling sys.exit don't break the pool
+            except (Exception, SystemExit):
+                traceback.print_exc()
+            finally:
+                fu.set_ledger(None)
+                fu.set_profile(None)
+
+
+class LocalPoolTask(LocalTask):
+    """
+    Task for running tasks locally in a pool of persistent worker processes.
+
+    The workers import the task module once and then call
+    `<task_name>(job_id, config_path)` directly for each job,
+    instead of starting a new python interpreter per job.
+    """
+
+    def _submit_to_pool(self, pool, job_id, job_prefix):
+        config_file = self._config_path(job_id, job_prefix)
+        assert os.path.exists(config_file), config_file
+
+        job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
+                                                                        job_prefix)
+        log_file = os.path.join(self.tmp_folder, 'logs',
+                                '%s_%i.log' % (job_name, job_id))
+        err_file = os.path.join(self.tmp_folder, 'error_logs',
+                                '%s_%i.err' % (job_name, job_id))
+        return pool.submit(_run_pooled_job, self.__module__, self.src_file, self.task_name,
+                           job_id, config_file, log_file, err_file, self._job_env(job_id, job_prefix))
+
+    def submit_jobs(self, n_jobs, job_prefix=None):
+        assert n_jobs <= self.max_local_jobs,\
+            "Trying to submit %i local jobs but limit is %i. Did you forget to set the target to slurm or lsf?" %\
+            (n_jobs, self.max_local_jobs)
+        self._clean_job_status(n_jobs, job_prefix)
+        # run as many jobs in parallel as the task allows and the job threads fit on the machine
+        threads_per_job = self.get_task_config().get('threads_per_job', 1)
+        n_workers = max(1, min(self.max_jobs, cpu_count() // threads_per_job))
+        pool = _get_local_pool(n_workers)
+        tasks = [self._submit_to_pool(pool, job_id, job_prefix) for job_id in range(n_jobs)]
+        try:
+            [t.result() for t in tasks]
+        # if a worker died (e.g. segfault or oom-kill), the pool cannot be used anymore;
+        # the affected jobs have not logged success and will be caught by `check_jobs`
+        except BrokenProcessPool:
+            self._write_log("local worker pool broke down, restarting it for the next submission")
+            _reset_local_pool()
+
+
 class LSFTask(BaseClusterTask):
     """
     Task for cluster with LSF scheduling system
@@ -564,64 +1338,110 @@ class LSFTask(BaseClusterTask):
         # write the job configs
         self._write_job_config(n_jobs, block_list, config, job_prefix, consecutive_blocks)
 
-    def submit_jobs(self, n_jobs, job_prefix=None):
-        # read the task config to get number of threads and time limit
-        task_config = self.get_task_config()
-        n_threads = task_config.get("threads_per_job", 1)
-        time_limit = task_config.get("time_limit", 60)
-        #
-        script_path = os.path.join(self.tmp_folder, self.task_name + '.py')
-        assert os.path.exists(script_path), script_path
+    @staticmethod
+    def _parse_mem_limit(mem_limit):
+        """ Converts mem limit in GB to lsf format
+        """
+        # round up, so that fractional (e.g. estimated) limits are not truncated
+        return "%iMB" % int(np.ceil(mem_limit * 1000))
 
-        self.bsub_ids = []
+    def _mem_options(self, mem_limit):
+        # limit and reserve the memory of the jobs
+        mem_limit = self._parse_mem_limit(mem_limit)
+        return '-M %s -R "rusage[mem=%s]"' % (mem_limit, mem_limit)
+
+    # lsf job states that mean the job has not finished yet
+    active_states = ('PEND', 'PROV', 'RUN', 'PSUSP', 'USUSP', 'SSUSP', 'WAIT')
+
+    def _write_lsf_file(self, job_prefix=None):
         job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
                                                                         job_prefix)
+        # lsf array indices start at 1, so we need to subtract 1 to get the job id
+        lsf_template = ("#!/bin/bash\n"
+                        "JOB_ID=$((LSB_JOBINDEX - 1 + $1))\n")
+        lsf_template += self._job_array_commands(job_prefix)
 
-        for job_id in range(n_jobs):
-            config_file = self._config_path(job_id, job_prefix)
-            command = '%s %s' % (script_path, config_file)
-            log_file = os.path.join(self.tmp_folder, 'logs',
-                                    '%s_%i.log' % (job_name, job_id))
-            err_file = os.path.join(self.tmp_folder, 'error_logs',
-                                    '%s_%i.err' % (job_name, job_id))
-            bsub_command = 'bsub -n %i -J %s_%i -We %i -o %s -e %s \'%s\'' % (n_threads,
-                                                                              self.task_name,
-                                                                              job_id, time_limit,
-                                                                              log_file, err_file,
-                                                                              command)
-            # call([bsub_command], shell=True)
+        script_path = os.path.join(self.tmp_folder, 'lsf_%s.sh' % job_name)
+        with open(script_path, 'w') as f:
+            f.write(lsf_template)
+        self._make_executable(script_path)
+
+    def prepare_jobs(self, n_jobs, block_list, config,
+                     job_prefix=None, consecutive_blocks=False):
+        # write the job configs
+        self._write_job_config(n_jobs, block_list, config, job_prefix, consecutive_blocks)
+        # write the lsf script file
+        self._write_lsf_file(job_prefix)
+
+    def submit_jobs(self, n_jobs, job_prefix=None):
+        # get number of threads, time limit and memory limit
+        n_threads, time_limit, mem_limit = self.get_job_resources(job_prefix)
+
+        job_name = self.task_name if job_prefix is None else '%s_%s' % (self.task_name,
+                                                                        job_prefix)
+        script_path = os.path.join(self.tmp_folder, 'lsf_%s.sh' % job_name)
+        assert os.path.exists(script_path), script_path
+        # the output of lsf itself goes here,
+        # the output of the jobs is redirected to the log files in the script
+        lsf_out = os.path.join(self.tmp_folder, 'error_logs', '%s_lsf_%%J_%%I.out' % job_name)
+        self._clean_job_status(n_jobs, job_prefix)
+
+        # single jobs can be run by the co-scheduling runner instead
+        if self._use_coschedule(n_jobs):
+            self.bsub_ids = [self._coschedule_job(job_prefix)]
+            self.n_submitted_jobs = n_jobs
+            return
+
+        # submit the jobs as array(s)
+        self.bsub_ids = []
+        for offset, array_size in self._job_array_chunks(n_jobs):
+            bsub_command = 'bsub -n %i %s -J "%s[1-%i]" -We %i -o %s \'%s %i\'' % (n_threads,
+                                                                                  self._mem_options(mem_limit),
+                                                                                  job_name, array_size,
+                                                                                  time_limit, lsf_out,
+                                                                                  script_path, offset)
             # submit job and get the bsub job id from its output
             outp = check_output([bsub_command], shell=True).decode().rstrip()
             bsub_id = int(outp.split()[1].lstrip('<').rstrip('>'))
+            _submit_times[bsub_id] = time.time()
             self.bsub_ids.append(bsub_id)
             print(outp)
+        self.n_submitted_jobs = n_jobs
+
+    def _submit_runner(self, script_path, n_threads, mem_limit, time_limit):
+        runner_out = os.path.join(self.tmp_folder, 'error_logs', 'coschedule_runner_%J.out')
+        bsub_command = 'bsub -n %i %s -J coschedule_runner -We %i -o %s \'%s\'' % (n_threads,
+                                                                                 self._mem_options(mem_limit),
+                                                                                 time_limit, runner_out,
+                                                                                 script_path)
+        outp = check_output([bsub_command], shell=True).decode().rstrip()
+        print(outp)
+        return int(outp.split()[1].lstrip('<').rstrip('>'))
+
+    def _ids_states(self, job_ids):
+        command = ['bjobs -noheader -o "jobid stat" %s' % ' '.join(map(str, job_ids))]
+        try:
+            outp = check_output(command, shell=True, stderr=STDOUT).decode()
+        # bjobs fails if (some of) the jobs are not known (anymore or yet)
+        except CalledProcessError as e:
+            outp = e.output.decode()
+            if 'is not found' not in outp:
+                raise e
+        states = {}
+        for line in outp.split('\n'):
+            fields = line.split()
+            # skip the messages for jobs that are not found
+            if len(fields) != 2 or not fields[0].isdigit():
+                continue
+            states.setdefault(int(fields[0]), []).append(fields[1])
+        return states
+
+    def _jobs_running(self):
+        # only query the arrays of this task
+        return self._ids_active(self.bsub_ids)
 
     def wait_for_jobs(self, job_prefix=None):
-        # TODO move to some config
-        wait_time = 10
-        while True:
-            time.sleep(wait_time)
-            # parse the output from bjobs
-            try:
-                outp = check_output(['bjobs | grep $USER'], shell=True, stderr=STDOUT).decode()
-            # check if no jobs are in queue (throws an error we need to capture)
-            except CalledProcessError as e:
-                outp = e.output.decode().rstrip()
-                if outp == 'No unfinished job found':
-                    break
-                else:
-                    raise e
-
-            outp = outp.split('\n')
-            outp = [out for out in outp if out != '']
-            # check how many jobs there are in total, if none, stop waiting
-            n_running = len(outp)
-            if n_running == 0:
-                break
-            # if we have jobs, check how many belong to this task
-            n_running = sum([int(out.split()[0]) in self.bsub_ids for out in outp])
-            if n_running == 0:
-                break
+        self._wait_for_array_jobs(self.n_submitted_jobs, self._jobs_running, job_prefix)
 
     # need to override this for lsf
     @staticmethod
@@ -641,6 +1461,23 @@ class LSFTask(BaseClusterTask):
         pass
 
 
+def _incremental_mode(global_config_path):
+    if not os.path.exists(global_config_path):
+        return None
+    with open(global_config_path) as f:
+        return json.load(f).get('incremental', None)
+
+
+def _incremental_stamp(task):
+    """ Time of the last run of the task or any of its dependencies that changed outputs.
+    """
+    if isinstance(task, BaseClusterTask):
+        record = task._load_incremental_record()
+        return np.inf if record is None else record['stamp']
+    deps = luigi.task.flatten(task.requires())
+    return max((_incremental_stamp(dep) for dep in deps), default=0.)
+
+
 class WorkflowBase(luigi.Task):
     """
     Base class for a workflow task, that just chains together
@@ -652,13 +1489,13 @@ class WorkflowBase(luigi.Task):
     max_jobs = luigi.IntParameter()
     # path for the global configuration
     config_dir = luigi.Parameter()
-    # target can be local, slurm, lsf (case insensitive)
+    # target can be local, local_pool, slurm, lsf (case insensitive)
     target = luigi.Parameter()
     # the workflow can have dependencies; per default we
     # set to be a dummy task that is always successfull
     dependency = luigi.TaskParameter(default=DummyTask())
 
-    _target_dict = {'lsf': 'LSF', 'slurm': 'Slurm', 'local': 'Local'}
+    _target_dict = {'lsf': 'LSF', 'slurm': 'Slurm', 'local': 'Local', 'local_pool': 'LocalPool'}
 
     def _get_task_name(self, task_base_name):
         target_postfix = self._target_dict[self.target.lower()]
@@ -668,6 +1505,27 @@ class WorkflowBase(luigi.Task):
         # we just mirror the target of the last task
         return luigi.LocalTarget(self.input().path)
 
+    def complete(self):
+        # in incremental mode, we need to check the tasks of the workflow
+        # because they might need to rerun even though the last task has finished
+        if not super().complete():
+            return False
+        if not _incremental_mode(os.path.join(self.config_dir, 'global.config')):
+            return True
+        return all(dep.complete() for dep in luigi.task.flatten(self.requires()))
+
+    def profile_report(self, save_path=None, n_slowest=5):
+        """ Summarize the block profiles of all tasks run in tmp_folder.
+
+        Profiles are only recorded if 'profile' is enabled in the global config.
+        Returns the report indexed by the job names and saves it as json if save_path is given.
+        """
+        report = profile_report(self.tmp_folder, n_slowest)
+        if save_path is not None:
+            with open(save_path, 'w') as f:
+                json.dump(report, f, indent=2)
+        return report
+
     @staticmethod
     def get_config():
         """ Return all default configs and their save_path indexed by the task name
@@ -3,7 +3,6 @@
 import os
 import sys
 import json
-from concurrent import futures
 
 import numpy as np
 import luigi
@@ -12,7 +11,7 @@ from elf.io.label_multiset_wrapper import LabelMultisetWrapper
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 from cluster_tools.utils.task_utils import DummyTask
 
 
@@ -26,6 +25,7 @@ class CopyVolumeBase(luigi.Task):
 
     task_name = 'copy_volume'
     src_file = os.path.abspath(__file__)
+    allow_block_queue = True
 
     # input and output volumes
     input_path = luigi.Parameter()
@@ -113,8 +113,11 @@ class CopyVolumeBase(luigi.Task):
         # require output dataset
         with vu.file_reader(self.output_path) as f:
             chunks = tuple(min(ch, sh) for ch, sh in zip(chunks, out_shape))
+            new_output = self.output_key not in f
             f.require_dataset(self.output_key, shape=out_shape, chunks=chunks,
                               compression=compression, dtype=dtype)
+        if new_output and self.use_occupancy_index():
+            vu.init_occupancy(self.output_path, self.output_key)
 
         # update the config with input and output paths and keys
         # as well as block shape
@@ -126,7 +129,9 @@ class CopyVolumeBase(luigi.Task):
             shape = shape[1:]
 
         if self.n_retries == 0:
-            block_list = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end)
+            block_list = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end,
+                                             skip_empty_in=self.skip_empty_in(self.input_path,
+                                                                              self.input_key))
         else:
             block_list = self.block_list
             self.clean_up_for_retry(block_list)
@@ -153,6 +158,13 @@ class CopyVolumeLocal(CopyVolumeBase, LocalTask):
     pass
 
 
+class CopyVolumeLocalPool(CopyVolumeBase, LocalPoolTask):
+    """
+    copy_volume local machine with persistent worker pool
+    """
+    pass
+
+
 class CopyVolumeSlurm(CopyVolumeBase, SlurmTask):
     """
     copy on slurm cluster
@@ -185,7 +197,8 @@ def cast_type(data, dtype):
 
 
 def _copy_blocks(ds_in, ds_out, blocking, block_list, roi_begin, reduce_function, n_threads,
-                 map_uniform_blocks_to_background, value_list, offset, insert_mode):
+                 map_uniform_blocks_to_background, value_list, offset, insert_mode,
+                 output_path, output_key):
     dtype = ds_out.dtype
 
     def _copy_block(block_id):
@@ -238,15 +251,11 @@ def _copy_blocks(ds_in, ds_out, blocking, block_list, roi_begin, reduce_function
             insert_mask = data == 0
             data[insert_mask] = prev_data[insert_mask]
 
+        vu.mark_occupied(output_path, output_key, bb)
         ds_out[bb] = cast_type(data, dtype)
         fu.log_block_success(block_id)
 
-    if n_threads > 1:
-        with futures.ThreadPoolExecutor(n_threads) as tp:
-            tasks = [tp.submit(_copy_block, block_id) for block_id in block_list]
-            [t.result() for t in tasks]
-    else:
-        [_copy_block(block_id) for block_id in block_list]
+    vu.map_blocks(_copy_block, block_list, n_threads)
 
 
 def copy_volume(job_id, config_path):
@@ -260,7 +269,7 @@ def copy_volume(job_id, config_path):
     input_key = config['input_key']
 
     block_shape = list(config['block_shape'])
-    block_list = config['block_list']
+    block_list = vu.job_blocks(config)
 
     # read the output config
     output_path = config['output_path']
@@ -299,7 +308,7 @@ def copy_volume(job_id, config_path):
         blocking = nt.blocking([0, 0, 0], shape, block_shape)
         _copy_blocks(ds_in, ds_out, blocking, block_list, roi_begin,
                      reduce_function, n_threads, map_uniform_blocks_to_background,
-                     value_list, offset, insert_mode)
+                     value_list, offset, insert_mode, output_path, output_key)
 
         # copy the attributes with job 0
         if job_id == 0 and hasattr(ds_in, 'attrs') and hasattr(ds_out, 'attrs'):
@@ -12,7 +12,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 # TODO enable retry with consecutive edges
@@ -89,6 +89,12 @@ class PredictLocal(PredictBase, LocalTask):
     pass
 
 
+class PredictLocalPool(PredictBase, LocalPoolTask):
+    """ Predict on local machine with persistent worker pool
+    """
+    pass
+
+
 class PredictSlurm(PredictBase, SlurmTask):
     """ Predict on slurm cluster
     """
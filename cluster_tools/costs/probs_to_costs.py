@@ -10,7 +10,7 @@ from elf.segmentation.multicut import transform_probabilities_to_costs
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 # NOTE we don't exclude the ignore label here, but ignore
@@ -97,6 +97,12 @@ class ProbsToCostsLocal(ProbsToCostsBase, LocalTask):
     pass
 
 
+class ProbsToCostsLocalPool(ProbsToCostsBase, LocalPoolTask):
+    """ ProbsToCosts on local machine with persistent worker pool
+    """
+    pass
+
+
 class ProbsToCostsSlurm(ProbsToCostsBase, SlurmTask):
     """ ProbsToCosts on slurm cluster
     """
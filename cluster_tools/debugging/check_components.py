@@ -13,7 +13,7 @@ import nifty.distributed as ndist
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class CheckComponentsBase(luigi.Task):
@@ -63,6 +63,13 @@ class CheckComponentsLocal(CheckComponentsBase, LocalTask):
     pass
 
 
+class CheckComponentsLocalPool(CheckComponentsBase, LocalPoolTask):
+    """
+    CheckComponents on local machine with persistent worker pool
+    """
+    pass
+
+
 class CheckComponentsSlurm(CheckComponentsBase, SlurmTask):
     """
     CheckComponents on slurm cluster
@@ -10,7 +10,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class CheckSubGraphsBase(luigi.Task):
@@ -60,6 +60,13 @@ class CheckSubGraphsLocal(CheckSubGraphsBase, LocalTask):
     pass
 
 
+class CheckSubGraphsLocalPool(CheckSubGraphsBase, LocalPoolTask):
+    """
+    CheckSubGraphs on local machine with persistent worker pool
+    """
+    pass
+
+
 class CheckSubGraphsSlurm(CheckSubGraphsBase, SlurmTask):
     """
     CheckSubGraphs on slurm cluster
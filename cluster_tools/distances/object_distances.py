@@ -17,7 +17,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -87,6 +87,13 @@ class ObjectDistancesLocal(ObjectDistancesBase, LocalTask):
     pass
 
 
+class ObjectDistancesLocalPool(ObjectDistancesBase, LocalPoolTask):
+    """
+    ObjectDistances on local machine with persistent worker pool
+    """
+    pass
+
+
 class ObjectDistancesSlurm(ObjectDistancesBase, SlurmTask):
     """
     ObjectDistances on slurm cluster
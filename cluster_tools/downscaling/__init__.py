@@ -1,3 +1,3 @@
 from . downscaling_workflow import DownscalingWorkflow, PainteraToBdvWorkflow
-from . upscaling import UpscalingLocal, UpscalingSlurm, UpscalingLSF
-from . downscaling import DownscalingLocal, DownscalingSlurm, DownscalingLSF
+from . upscaling import UpscalingLocal, UpscalingLocalPool, UpscalingSlurm, UpscalingLSF
+from . downscaling import DownscalingLocal, DownscalingLocalPool, DownscalingSlurm, DownscalingLSF
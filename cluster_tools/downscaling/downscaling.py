@@ -20,7 +20,7 @@ from elf.util import downscale_shape as _downsample_shape
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 from cluster_tools.utils.task_utils import DummyTask
 
 
@@ -139,8 +139,11 @@ class DownscalingBase(luigi.Task):
         compression = task_config.pop('compression', 'gzip')
         # require output dataset
         with vu.file_reader(self.output_path) as f:
+            new_output = self.output_key not in f
             f.require_dataset(self.output_key, shape=out_shape, chunks=out_chunks,
                               compression=compression, dtype=dtype)
+        if new_output and self.use_occupancy_index():
+            vu.init_occupancy(self.output_path, self.output_key)
 
         # update the config with input and output paths and keys
         # as well as block shape
@@ -167,8 +170,16 @@ class DownscalingBase(luigi.Task):
             self._write_log("ROI after scaling: %s to %s" % (str(roi_begin), str(roi_end)))
 
         if self.n_retries == 0:
-            block_list = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end,
-                                             block_list_path)
+            block_list, blocking = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end,
+                                                       block_list_path, return_blocking=True)
+            # skip the blocks that are empty in the input, including the halo
+            if self.use_occupancy_index():
+                halo_ds = None
+                if self.halo:
+                    halo_ds = [ha // scale_factor for ha in self.halo] if isinstance(scale_factor, int) else\
+                        [ha // sf for sf, ha in zip(scale_factor, self.halo)]
+                block_list = vu.filter_empty_blocks(self.input_path, self.input_key, blocking, block_list,
+                                                    halo=halo_ds, scale_factor=scale_factor)
             self._write_log("scheduled %i blocks to run" % len(block_list))
         else:
             block_list = self.block_list
@@ -195,6 +206,13 @@ class DownscalingLocal(DownscalingBase, LocalTask):
     pass
 
 
+class DownscalingLocalPool(DownscalingBase, LocalPoolTask):
+    """
+    downscaling on local machine with persistent worker pool
+    """
+    pass
+
+
 class DownscalingSlurm(DownscalingBase, SlurmTask):
     """
     downscaling on slurm cluster
@@ -224,7 +242,8 @@ def _ds_vol(x, out_shape, sampler, scale_factor, dtype):
     return out.astype(dtype)
 
 
-def _ds_block(blocking, block_id, ds_in, ds_out, scale_factor, halo, sampler):
+def _ds_block(blocking, block_id, ds_in, ds_out, scale_factor, halo, sampler,
+              output_path, output_key):
     fu.log("start processing block %i" % block_id)
 
     # load the block (output dataset / downsampled) coordinates
@@ -280,6 +299,7 @@ def _ds_block(blocking, block_id, ds_in, ds_out, scale_factor, halo, sampler):
     else:
         out = _ds_vol(x, out_shape, sampler, scale_factor, dtype)
 
+    vu.mark_occupied(output_path, output_key, out_bb)
     try:
         ds_out[out_bb] = out[local_bb]
     except IndexError:
@@ -307,7 +327,8 @@ def _ds_skimage(inp, output_shape, sample_2d, block_size, func):
 
 def _submit_blocks(ds_in, ds_out, block_shape, block_list,
                    scale_factor, halo, library,
-                   library_kwargs, n_threads):
+                   library_kwargs, n_threads,
+                   output_path, output_key):
 
     # get the blocking
     shape = ds_out.shape
@@ -327,11 +348,13 @@ def _submit_blocks(ds_in, ds_out, block_shape, block_list,
     if n_threads <= 1:
         for block_id in block_list:
             _ds_block(blocking, block_id, ds_in, ds_out,
-                      scale_factor, halo, sampler)
+                      scale_factor, halo, sampler,
+                      output_path, output_key)
     else:
         with futures.ThreadPoolExecutor(n_threads) as tp:
             tasks = [tp.submit(_ds_block, blocking, block_id, ds_in, ds_out,
-                               scale_factor, halo, sampler) for block_id in block_list]
+                               scale_factor, halo, sampler,
+                               output_path, output_key) for block_id in block_list]
             [t.result() for t in tasks]
 
 
@@ -368,14 +391,16 @@ def downscaling(job_id, config_path):
             ds_in = f[input_key]
             ds_out = f[output_key]
             _submit_blocks(ds_in, ds_out, block_shape, block_list, scale_factor, halo,
-                           library, library_kwargs, n_threads)
+                           library, library_kwargs, n_threads,
+                           output_path, output_key)
 
     else:
         with vu.file_reader(input_path, 'r') as f_in, vu.file_reader(output_path) as f_out:
             ds_in = f_in[input_key]
             ds_out = f_out[output_key]
             _submit_blocks(ds_in, ds_out, block_shape, block_list, scale_factor, halo,
-                           library, library_kwargs, n_threads)
+                           library, library_kwargs, n_threads,
+                           output_path, output_key)
 
     # log success
     fu.log_job_success(job_id)
@@ -16,7 +16,7 @@ from elf.wrapper.resized_volume import ResizedVolume
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 from cluster_tools.utils.task_utils import DummyTask
 
 
@@ -117,6 +117,13 @@ class ScaleToBoundariesLocal(ScaleToBoundariesBase, LocalTask):
     pass
 
 
+class ScaleToBoundariesLocalPool(ScaleToBoundariesBase, LocalPoolTask):
+    """
+    scale_to_boundaries on local machine with persistent worker pool
+    """
+    pass
+
+
 class ScaleToBoundariesSlurm(ScaleToBoundariesBase, SlurmTask):
     """
     scale_to_boundaries on slurm cluster
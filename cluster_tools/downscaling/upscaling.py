@@ -19,7 +19,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 from cluster_tools.utils.task_utils import DummyTask
 
 
@@ -129,8 +129,11 @@ class UpscalingBase(luigi.Task):
         # require output dataset
         self._write_log("requiring output dataset @ %s:%s" % (self.output_path, self.output_key))
         with vu.file_reader(self.output_path) as f:
+            new_output = self.output_key not in f
             f.require_dataset(self.output_key, shape=shape, chunks=chunks,
                               compression=compression, dtype=dtype)
+        if new_output and self.use_occupancy_index():
+            vu.init_occupancy(self.output_path, self.output_key)
 
         # update the config with input and output paths and keys
         # as well as block shape
@@ -157,7 +160,14 @@ class UpscalingBase(luigi.Task):
             self._write_log("ROI after scaling: %s to %s" % (str(roi_begin), str(roi_end)))
 
         if self.n_retries == 0:
-            block_list = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end)
+            block_list, blocking = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end,
+                                                       return_blocking=True)
+            # skip the blocks that are empty in the input
+            if self.use_occupancy_index():
+                inv_scale = 1. / scale_factor if isinstance(scale_factor, int) else\
+                    [1. / sf for sf in scale_factor]
+                block_list = vu.filter_empty_blocks(self.input_path, self.input_key, blocking, block_list,
+                                                    scale_factor=inv_scale)
         else:
             block_list = self.block_list
             self.clean_up_for_retry(block_list)
@@ -184,6 +194,13 @@ class UpscalingLocal(UpscalingBase, LocalTask):
     pass
 
 
+class UpscalingLocalPool(UpscalingBase, LocalPoolTask):
+    """
+    downscaling on local machine with persistent worker pool
+    """
+    pass
+
+
 class UpscalingSlurm(UpscalingBase, SlurmTask):
     """
     downscaling on slurm cluster
@@ -203,7 +220,8 @@ class UpscalingLSF(UpscalingBase, LSFTask):
 #
 
 
-def _upsample_block(blocking, block_id, ds_in, ds_out, scale_factor, sampler):
+def _upsample_block(blocking, block_id, ds_in, ds_out, scale_factor, sampler,
+                    output_path, output_key):
     fu.log("start processing block %i" % block_id)
 
     # load the block (output dataset / upscaled) coordinates
@@ -246,6 +264,7 @@ def _upsample_block(blocking, block_id, ds_in, ds_out, scale_factor, sampler):
         np.clip(out, 0, max_val, out=out)
         np.round(out, out=out)
 
+    vu.mark_occupied(output_path, output_key, out_bb)
     try:
         ds_out[out_bb] = out[local_bb].astype(dtype)
     except IndexError:
@@ -257,7 +276,8 @@ def _upsample_block(blocking, block_id, ds_in, ds_out, scale_factor, sampler):
 
 def _submit_blocks(ds_in, ds_out, block_shape, block_list,
                    scale_factor, library,
-                   library_kwargs, n_threads):
+                   library_kwargs, n_threads,
+                   output_path, output_key):
 
     # get the blocking
     shape = ds_out.shape
@@ -268,11 +288,13 @@ def _submit_blocks(ds_in, ds_out, block_shape, block_list,
     if n_threads <= 1:
         for block_id in block_list:
             _upsample_block(blocking, block_id, ds_in, ds_out,
-                            scale_factor, sampler)
+                            scale_factor, sampler,
+                            output_path, output_key)
     else:
         with futures.ThreadPoolExecutor(n_threads) as tp:
             tasks = [tp.submit(_upsample_block, blocking, block_id, ds_in, ds_out,
-                               scale_factor, sampler) for block_id in block_list]
+                               scale_factor, sampler,
+                               output_path, output_key) for block_id in block_list]
             [t.result() for t in tasks]
 
 
@@ -308,14 +330,16 @@ def upscaling(job_id, config_path):
             ds_in = f[input_key]
             ds_out = f[output_key]
             _submit_blocks(ds_in, ds_out, block_shape, block_list, scale_factor,
-                           library, library_kwargs, n_threads)
+                           library, library_kwargs, n_threads,
+                           output_path, output_key)
 
     else:
         with vu.file_reader(input_path, 'r') as f_in, vu.file_reader(output_path) as f_out:
             ds_in = f_in[input_key]
             ds_out = f_out[output_key]
             _submit_blocks(ds_in, ds_out, block_shape, block_list, scale_factor,
-                           library, library_kwargs, n_threads)
+                           library, library_kwargs, n_threads,
+                           output_path, output_key)
 
     # log success
     fu.log_job_success(job_id)
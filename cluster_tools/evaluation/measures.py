@@ -13,7 +13,7 @@ from elf.evaluation.variation_of_information import compute_vi_scores
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -62,6 +62,12 @@ class MeasuresLocal(MeasuresBase, LocalTask):
     pass
 
 
+class MeasuresLocalPool(MeasuresBase, LocalPoolTask):
+    """ Measures on local machine with persistent worker pool
+    """
+    pass
+
+
 class MeasuresSlurm(MeasuresBase, SlurmTask):
     """ Measures on slurm cluster
     """
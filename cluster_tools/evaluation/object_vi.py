@@ -10,7 +10,7 @@ from elf.evaluation.variation_of_information import compute_object_vi_scores
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 from cluster_tools.evaluation.measures import contigency_table_from_overlaps, load_overlaps
 
@@ -61,6 +61,12 @@ class ObjectViLocal(ObjectViBase, LocalTask):
     pass
 
 
+class ObjectViLocalPool(ObjectViBase, LocalPoolTask):
+    """ ObjectVi on local machine with persistent worker pool
+    """
+    pass
+
+
 class ObjectViSlurm(ObjectViBase, SlurmTask):
     """ ObjectVi on slurm cluster
     """
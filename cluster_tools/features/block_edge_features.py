@@ -11,7 +11,7 @@ import nifty.distributed as ndist
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class BlockEdgeFeaturesBase(luigi.Task):
@@ -20,6 +20,7 @@ class BlockEdgeFeaturesBase(luigi.Task):
 
     task_name = 'block_edge_features'
     src_file = os.path.abspath(__file__)
+    allow_incremental = True
 
     # input and output volumes
     input_path = luigi.Parameter()
@@ -33,6 +34,16 @@ class BlockEdgeFeaturesBase(luigi.Task):
     def requires(self):
         return self.dependency
 
+    def incremental_datasets(self, config):
+        inputs = [(config['input_path'], config['input_key']),
+                  (config['labels_path'], config['labels_key'])]
+        outputs = [(config['output_path'], config['output_key'])]
+        return inputs, outputs
+
+    def incremental_halo(self, config):
+        # the labels are read with a halo of one pixel in addition to the filter halo
+        return [ha + 1 for ha in config.get('halo', [0, 0, 0])]
+
     @staticmethod
     def default_task_config():
         # we use this to get also get the common default config
@@ -45,6 +56,22 @@ class BlockEdgeFeaturesBase(luigi.Task):
         super().clean_up_for_retry(block_list)
         # TODO remove any output of failed blocks because it might be corrupted
 
+    def get_block_weights(self, block_list):
+        # estimate the block cost from the number of edges in the sub-graphs
+        weights = super().get_block_weights(block_list)
+        if weights is not None:
+            return weights
+        block_shape = self.global_config_values()[1]
+        with vu.file_reader(self.graph_path, 'r') as f:
+            ds_edges = f['s0/sub_graphs/edges']
+            blocking = nt.blocking([0] * ds_edges.ndim, list(ds_edges.shape), list(block_shape))
+            n_edges = []
+            for block_id in block_list:
+                edges = ds_edges.read_chunk(blocking.blockGridPosition(block_id))
+                n_edges.append(0 if edges is None else edges.size // 2)
+        # blocks without edges still need to be loaded
+        return [n + 1 for n in n_edges]
+
     def run_impl(self):
         # get the global config and init configs
         shebang, block_shape, roi_begin, roi_end = self.global_config_values()
@@ -93,6 +120,12 @@ class BlockEdgeFeaturesLocal(BlockEdgeFeaturesBase, LocalTask):
     pass
 
 
+class BlockEdgeFeaturesLocalPool(BlockEdgeFeaturesBase, LocalPoolTask):
+    """ BlockEdgeFeatures on local machine with persistent worker pool
+    """
+    pass
+
+
 class BlockEdgeFeaturesSlurm(BlockEdgeFeaturesBase, SlurmTask):
     """ BlockEdgeFeatures on slurm cluster
     """
@@ -151,8 +184,14 @@ def _accumulate(input_path, input_key,
 def _accumulate_filter(input_, graph, labels, bb_local,
                        filter_name, sigma, ignore_label,
                        with_size, apply_in_2d):
-    response = vu.apply_filter(input_, filter_name, sigma,
-                               apply_in_2d=apply_in_2d)[bb_local]
+    with fu.profile_section('filter'):
+        response = vu.apply_filter(input_, filter_name, sigma,
+                                   apply_in_2d=apply_in_2d)[bb_local]
+    with fu.profile_section('accumulate'):
+        return _accumulate_response(graph, response, labels, ignore_label, with_size)
+
+
+def _accumulate_response(graph, response, labels, ignore_label, with_size):
     if response.ndim == 4:
         n_chan = response.shape[-1]
         assert response.shape[:-1] == labels.shape
@@ -178,7 +217,8 @@ def _accumulate_block(block_id, blocking,
     chunk_pos = blocking.blockGridPosition(block_id)
 
     # load edges and construct the graph if this block has edges
-    edges = ds_edges.read_chunk(chunk_pos)
+    with fu.profile_section('read_graph'):
+        edges = ds_edges.read_chunk(chunk_pos)
     if edges is None:
         fu.log("block %i has no edges" % block_id)
         fu.log_block_success(block_id)
@@ -214,13 +254,13 @@ def _accumulate_block(block_id, blocking,
     if input_dim == 4:
         bb_in = (slice(0, 3),) + bb_in
 
-    input_ = vu.normalize(ds_in[bb_in])
+    input_ = vu.normalize(fu.profiled_read(ds_in, bb_in))
     if input_dim == 4:
         assert channel_agglomeration is not None
         input_ = getattr(np, channel_agglomeration)(input_, axis=0)
 
     # load labels
-    labels = ds_labels[bb]
+    labels = fu.profiled_read(ds_labels, bb, 'read_labels')
 
     # TODO pre-smoothing ?!
     # accumulate the edge features
@@ -233,7 +273,9 @@ def _accumulate_block(block_id, blocking,
 
     # save the features
     fu.log("saving feature result of shape %s" % str(edge_features.shape))
-    ds_out.write_chunk(chunk_pos, edge_features.flatten(), True)
+    with fu.profile_section('write'):
+        ds_out.write_chunk(chunk_pos, edge_features.flatten(), True)
+    fu.profile_bytes('write', edge_features.nbytes)
     fu.log_block_success(block_id)
     return edge_features.shape[1]
 
@@ -264,10 +306,12 @@ def _accumulate_with_filters(input_path, input_key,
 
         blocking = nt.blocking([0, 0, 0], shape, block_shape)
         for block_id in block_list:
-            n_feats = _accumulate_block(block_id, blocking,
-                                        ds_in, ds_labels, ds_edges, ds_out,
-                                        filters, sigmas, halo, ignore_label,
-                                        apply_in_2d, channel_agglomeration)
+            n_voxels = int(np.prod(blocking.getBlock(block_id).shape))
+            with fu.profile_block(block_id, n_voxels):
+                n_feats = _accumulate_block(block_id, blocking,
+                                            ds_in, ds_labels, ds_edges, ds_out,
+                                            filters, sigmas, halo, ignore_label,
+                                            apply_in_2d, channel_agglomeration)
 
     return n_feats
 
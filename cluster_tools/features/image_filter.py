@@ -13,7 +13,8 @@ import nifty.distributed as ndist
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+import cluster_tools.utils.cache_utils as cu
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 # TODO support multi-channel filter
@@ -23,6 +24,9 @@ class ImageFilterBase(luigi.Task):
 
     task_name = 'image_filter'
     src_file = os.path.abspath(__file__)
+    allow_block_queue = True
+    allow_chunk_cache = True
+    allow_incremental = True
 
     # input and output volumes
     input_path = luigi.Parameter()
@@ -85,6 +89,12 @@ class ImageFilterLocal(ImageFilterBase, LocalTask):
     pass
 
 
+class ImageFilterLocalPool(ImageFilterBase, LocalPoolTask):
+    """ ImageFilter on local machine with persistent worker pool
+    """
+    pass
+
+
 class ImageFilterSlurm(ImageFilterBase, SlurmTask):
     """ ImageFilter on slurm cluster
     """
@@ -124,7 +134,7 @@ def image_filter(job_id, config_path):
     with open(config_path, 'r') as f:
         config = json.load(f)
 
-    block_list = config['block_list']
+    block_list = vu.job_blocks(config)
     input_path = config['input_path']
     input_key = config['input_key']
     output_path = config['output_path']
@@ -136,8 +146,11 @@ def image_filter(job_id, config_path):
     halo = config['halo']
     apply_in_2d = config.get('apply_in_2d', False)
 
+    # the halos of neighboring blocks overlap, so we read the input through the chunk cache if enabled
+    cache = cu.make_chunk_cache(config)
+
     # iterate over blocks and apply filter
-    with vu.file_reader(input_path, 'r') as f_in,\
+    with vu.file_reader(input_path, 'r', cache=cache) as f_in,\
         vu.file_reader(output_path) as f_out:
 
         ds_in = f_in[input_key]
@@ -150,6 +163,7 @@ def image_filter(job_id, config_path):
             _apply_filter(blocking, block_id, ds_in, ds_out,
                           halo, filter_name, sigma, apply_in_2d)
 
+    cu.save_cache_stats(cache, config, job_id)
     fu.log_job_success(job_id)
 
 
@@ -3,6 +3,7 @@
 import os
 import sys
 import json
+from shutil import rmtree
 
 import numpy as np
 import luigi
@@ -11,11 +12,22 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+import cluster_tools.utils.graph_utils as gu
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
+
+# the merged features of the levels of the merge tree, stored next to the output features
+MERGE_TREE_KEY = '%s_merge_tree'
 
 
 class MergeEdgeFeaturesBase(luigi.Task):
     """ Merge edge feature base class
+
+    If `merge_fan_in` is set, the block features are merged in a tree: each level merges
+    the features of up to `merge_fan_in` blocks per axis of the previous level into feature tables
+    for the blocks of the level, in parallel jobs. The edge ranges of the output are then merged
+    from the tables of the last level instead of all blocks.
+    The result is the same as merging all blocks at once, up to floating point rounding.
+    This is only supported for the default edge features (`N_EDGE_FEATURES` features per edge).
     """
 
     task_name = 'merge_edge_features'
@@ -32,6 +44,48 @@ class MergeEdgeFeaturesBase(luigi.Task):
     def requires(self):
         return self.dependency
 
+    @staticmethod
+    def default_task_config():
+        # we use this to get also get the common default config
+        config = LocalTask.default_task_config()
+        # number of blocks per axis merged in one level of the merge tree,
+        # if None, all blocks are merged at once
+        config.update({'merge_fan_in': None})
+        return config
+
+    def _merge_tree(self, config, shape, block_shape, level_block_shapes, roi_begin, roi_end):
+        input_key = None
+        # remove the levels of a previous merge tree, they might have different block shapes
+        tree_key = MERGE_TREE_KEY % self.output_key
+        rmtree(os.path.join(self.output_path, tree_key), ignore_errors=True)
+        for level, level_block_shape in enumerate(level_block_shapes, 1):
+            level_key = os.path.join(tree_key, 'level_%i' % level)
+            with vu.file_reader(self.output_path) as f:
+                g = f.require_group(level_key)
+                g.require_dataset('edge_ids', shape=shape, chunks=tuple(level_block_shape),
+                                  compression='gzip', dtype='uint64')
+                g.require_dataset('features', shape=shape, chunks=tuple(level_block_shape),
+                                  compression='gzip', dtype='float64')
+
+            block_list = vu.blocks_in_volume(shape, level_block_shape, roi_begin, roi_end)
+            level_config = dict(config, tree_input_key=input_key, tree_output_key=level_key,
+                                tree_input_block_shape=list(block_shape),
+                                tree_block_shape=level_block_shape,
+                                roi_begin=roi_begin, roi_end=roi_end)
+
+            n_jobs = min(len(block_list), self.max_jobs)
+            prefix = 'level_%i' % level
+            self.prepare_jobs(n_jobs, block_list, level_config, prefix)
+            self.submit_jobs(n_jobs, prefix)
+            self.wait_for_jobs(prefix)
+            self.check_jobs(n_jobs, prefix)
+            self._write_log("merged %i blocks in level %i of the merge tree" % (len(block_list), level))
+            input_key, block_shape = level_key, level_block_shape
+
+        # the edge ranges are merged from the blocks of the last level
+        block_ids = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end)
+        return input_key, block_shape, block_ids
+
     def run_impl(self):
         # get the global config and init configs
         shebang, block_shape, roi_begin, roi_end = self.global_config_values()
@@ -71,6 +125,17 @@ class MergeEdgeFeaturesBase(luigi.Task):
                        'edge_chunk_size': chunk_size, 'block_ids': block_ids,
                        'n_edges': n_edges})
 
+        fan_in = config.get('merge_fan_in', None)
+        level_block_shapes = [] if fan_in is None else vu.merge_tree_block_shapes(shape, block_shape, fan_in)
+        if level_block_shapes:
+            assert n_features == gu.N_EDGE_FEATURES,\
+                "Merge tree is only supported for %i features, got %i" % (gu.N_EDGE_FEATURES, n_features)
+            tree_key, tree_block_shape, block_ids = self._merge_tree(config, shape, block_shape,
+                                                                     level_block_shapes,
+                                                                     roi_begin, roi_end)
+            config.update({'merge_tree_key': tree_key, 'block_ids': block_ids,
+                           'tree_block_shape': tree_block_shape})
+
         edge_block_list = vu.blocks_in_volume([n_edges], [chunk_size])
 
         n_jobs = min(len(edge_block_list), self.max_jobs)
@@ -83,6 +148,10 @@ class MergeEdgeFeaturesBase(luigi.Task):
         self.wait_for_jobs()
         self.check_jobs(n_jobs)
 
+        # the levels of the merge tree are not needed anymore after the features were merged
+        if level_block_shapes:
+            rmtree(os.path.join(self.output_path, MERGE_TREE_KEY % self.output_key), ignore_errors=True)
+
 
 class MergeEdgeFeaturesLocal(MergeEdgeFeaturesBase, LocalTask):
     """ MergeEdgeFeatures on local machine
@@ -90,6 +159,12 @@ class MergeEdgeFeaturesLocal(MergeEdgeFeaturesBase, LocalTask):
     pass
 
 
+class MergeEdgeFeaturesLocalPool(MergeEdgeFeaturesBase, LocalPoolTask):
+    """ MergeEdgeFeatures on local machine with persistent worker pool
+    """
+    pass
+
+
 class MergeEdgeFeaturesSlurm(MergeEdgeFeaturesBase, SlurmTask):
     """ MergeEdgeFeatures on slurm cluster
     """
@@ -107,6 +182,90 @@ class MergeEdgeFeaturesLSF(MergeEdgeFeaturesBase, LSFTask):
 #
 
 
+def _read_block_features(ds_ids, ds_feats, chunk_pos, n_features):
+    edge_ids = ds_ids.read_chunk(chunk_pos)
+    if edge_ids is None:
+        return None, None
+    features = ds_feats.read_chunk(chunk_pos)
+    return edge_ids, features.reshape((len(edge_ids), n_features))
+
+
+def _merge_tree_level(config, n_features):
+    input_key, output_key = config['tree_input_key'], config['tree_output_key']
+    with vu.file_reader(config['graph_path'], 'r') as f:
+        shape = f[config['subgraph_key']].attrs['shape']
+    blocking = nt.blocking([0, 0, 0], list(shape), config['tree_block_shape'])
+    previous_blocking = nt.blocking([0, 0, 0], list(shape), config['tree_input_block_shape'])
+    # only merge the blocks of the previous level that were processed (in the roi)
+    previous_blocks = set(vu.blocks_in_volume(shape, config['tree_input_block_shape'],
+                                              config['roi_begin'], config['roi_end']))
+
+    with vu.file_reader(config['graph_path'], 'r') as f_graph, vu.file_reader(config['in_path']) as f:
+        # the first level merges the block features, the next levels the features of the previous level
+        if input_key is None:
+            ds_ids = f_graph[config['subgraph_key']]['edge_ids']
+            ds_feats = f[config['subfeat_key']]
+        else:
+            ds_ids, ds_feats = f[input_key]['edge_ids'], f[input_key]['features']
+        ds_ids_out, ds_feats_out = f[output_key]['edge_ids'], f[output_key]['features']
+
+        for block_id in config['block_list']:
+            fu.log("start processing block %i" % block_id)
+            edge_ids, features = [], []
+            for sub_block_id in vu.sub_blocks_in_block(blocking, previous_blocking, block_id, previous_blocks):
+                chunk_pos = previous_blocking.blockGridPosition(sub_block_id)
+                sub_edge_ids, sub_features = _read_block_features(ds_ids, ds_feats, chunk_pos, n_features)
+                if sub_edge_ids is not None:
+                    edge_ids.append(sub_edge_ids)
+                    features.append(sub_features)
+
+            if edge_ids:
+                edge_ids, features = gu.merge_edge_id_features(np.concatenate(edge_ids),
+                                                               np.concatenate(features, axis=0))
+                chunk_pos = blocking.blockGridPosition(block_id)
+                ds_ids_out.write_chunk(chunk_pos, edge_ids.astype('uint64'), True)
+                ds_feats_out.write_chunk(chunk_pos, features.flatten(), True)
+            fu.log_block_success(block_id)
+
+
+def merge_edge_range(edge_tables, edge_begin, edge_end, n_features):
+    """ Merge the features of the edges in the range from the (edge_ids, features) tables.
+
+    The features of edges that are not contained in any table are zero.
+    """
+    edge_ids, features = [], []
+    for table_ids, table_features in edge_tables:
+        in_range = np.logical_and(table_ids >= edge_begin, table_ids < edge_end)
+        edge_ids.append(table_ids[in_range])
+        features.append(table_features[in_range])
+
+    out = np.zeros((edge_end - edge_begin, n_features), dtype='float64')
+    if edge_ids:
+        edge_ids, features = gu.merge_edge_id_features(np.concatenate(edge_ids),
+                                                       np.concatenate(features, axis=0))
+        out[edge_ids.astype('int64') - edge_begin] = features
+    return out
+
+
+def _merge_from_tree(config, edge_begin, edge_end, n_features):
+    tree_key = config['merge_tree_key']
+    with vu.file_reader(config['graph_path'], 'r') as f:
+        shape = f[config['subgraph_key']].attrs['shape']
+    blocking = nt.blocking([0, 0, 0], list(shape), config['tree_block_shape'])
+
+    with vu.file_reader(config['in_path'], 'r') as f:
+        ds_ids, ds_feats = f[tree_key]['edge_ids'], f[tree_key]['features']
+        edge_tables = [_read_block_features(ds_ids, ds_feats, blocking.blockGridPosition(block_id), n_features)
+                       for block_id in config['block_ids']]
+    edge_tables = [table for table in edge_tables if table[0] is not None]
+    features = merge_edge_range(edge_tables, edge_begin, edge_end, n_features)
+
+    with vu.file_reader(config['output_path']) as f:
+        ds = f[config['output_key']]
+        ds.n_threads = config['threads_per_job']
+        ds[edge_begin:edge_end, :] = features
+
+
 def merge_edge_features(job_id, config_path):
     fu.log("start processing job %i" % job_id)
     fu.log("reading config from %s" % config_path)
@@ -114,6 +273,12 @@ def merge_edge_features(job_id, config_path):
     # get the config
     with open(config_path, 'r') as f:
         config = json.load(f)
+
+    if 'tree_output_key' in config:
+        _merge_tree_level(config, gu.N_EDGE_FEATURES)
+        fu.log_job_success(job_id)
+        return
+
     graph_path = config['graph_path']
     subgraph_key = config['subgraph_key']
 
@@ -135,6 +300,12 @@ def merge_edge_features(job_id, config_path):
     edge_begin = edge_blocking.getBlock(edge_block_list[0]).begin[0]
     edge_end = edge_blocking.getBlock(edge_block_list[-1]).end[0]
 
+    if 'merge_tree_key' in config:
+        fu.log("merging edges %i to %i from the last level of the merge tree" % (edge_begin, edge_end))
+        _merge_from_tree(config, edge_begin, edge_end, gu.N_EDGE_FEATURES)
+        fu.log_job_success(job_id)
+        return
+
     # the block list might either be the number of blocks or a list of blocks
     block_ids = list(range(block_ids)) if isinstance(block_ids, int) else block_ids
 
@@ -10,7 +10,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class MergeRegionFeaturesBase(luigi.Task):
@@ -75,6 +75,12 @@ class MergeRegionFeaturesLocal(MergeRegionFeaturesBase, LocalTask):
     pass
 
 
+class MergeRegionFeaturesLocalPool(MergeRegionFeaturesBase, LocalPoolTask):
+    """ MergeRegionFeatures on local machine with persistent worker pool
+    """
+    pass
+
+
 class MergeRegionFeaturesSlurm(MergeRegionFeaturesBase, SlurmTask):
     """ MergeRegionFeatures on slurm cluster
     """
@@ -15,7 +15,7 @@ import vigra
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class RegionFeaturesBase(luigi.Task):
@@ -105,6 +105,12 @@ class RegionFeaturesLocal(RegionFeaturesBase, LocalTask):
     pass
 
 
+class RegionFeaturesLocalPool(RegionFeaturesBase, LocalPoolTask):
+    """ RegionFeatures on local machine with persistent worker pool
+    """
+    pass
+
+
 class RegionFeaturesSlurm(RegionFeaturesBase, SlurmTask):
     """ RegionFeatures on slurm cluster
     """
@@ -0,0 +1,272 @@
+#! /bin/python
+
+import os
+import sys
+import json
+
+import numpy as np
+import luigi
+import nifty.tools as nt
+
+import cluster_tools.utils.volume_utils as vu
+import cluster_tools.utils.function_utils as fu
+import cluster_tools.utils.graph_utils as gu
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
+from cluster_tools.watershed.fused_watershed import feature_values
+
+
+#
+# Graph Tasks
+#
+
+
+class FaceSubGraphsBase(luigi.Task):
+    """ FaceSubGraphs base class
+
+    Completes the inner sub-graphs and features computed by `FusedWatershed`:
+    maps them to the relabeled watershed ids and adds the edges across the upper block faces,
+    which are computed from the face slices of the watershed and boundary map.
+    The results are written to 's0/sub_graphs' and 's0/sub_features', in the format expected
+    by `MergeSubGraphs`, `MapEdgeIds` and `MergeEdgeFeatures`.
+    """
+
+    task_name = 'face_sub_graphs'
+    src_file = os.path.abspath(__file__)
+    allow_block_queue = True
+
+    # boundary map, (relabeled) watershed and graph
+    input_path = luigi.Parameter()
+    input_key = luigi.Parameter()
+    ws_path = luigi.Parameter()
+    ws_key = luigi.Parameter()
+    graph_path = luigi.Parameter()
+    # the assignments used for relabeling the watershed
+    assignment_path = luigi.Parameter()
+    assignment_key = luigi.Parameter()
+    #
+    dependency = luigi.TaskParameter()
+
+    # hard-coded keys
+    inner_subgraph_key = 's0/inner_sub_graphs'
+    inner_subfeat_key = 's0/inner_sub_features'
+    subgraph_key = 's0/sub_graphs'
+    subfeat_key = 's0/sub_features'
+
+    def requires(self):
+        return self.dependency
+
+    def clean_up_for_retry(self, block_list):
+        super().clean_up_for_retry(block_list)
+        # TODO remove any output of failed blocks because it might be corrupted
+
+    def run_impl(self):
+        # get the global config and init configs
+        shebang, block_shape, roi_begin, roi_end, block_list_path = self.global_config_values(True)
+        block_shape = tuple(block_shape)
+        self.init(shebang)
+
+        # load the task config
+        config = self.get_task_config()
+
+        shape = vu.get_shape(self.ws_path, self.ws_key)
+        with vu.file_reader(self.graph_path) as f:
+            ignore_label = f[self.inner_subgraph_key].attrs['ignore_label']
+
+            # make sub-graph dataset for nodes and edges
+            g = f.require_group(self.subgraph_key)
+            g.attrs['shape'] = tuple(shape)
+            g.attrs['ignore_label'] = ignore_label
+            g.require_dataset('nodes', shape=shape, chunks=block_shape,
+                              compression='gzip', dtype='uint64')
+            g.require_dataset('edges', shape=shape, chunks=block_shape,
+                              compression='gzip', dtype='uint64')
+
+            ds = f.require_dataset(self.subfeat_key, shape=shape, chunks=block_shape,
+                                   compression='gzip', dtype='float64')
+            ds.attrs['n_features'] = gu.N_EDGE_FEATURES
+
+        # update the config with input and graph paths and keys
+        # as well as block shape
+        config.update({'input_path': self.input_path, 'input_key': self.input_key,
+                       'ws_path': self.ws_path, 'ws_key': self.ws_key,
+                       'graph_path': self.graph_path, 'block_shape': block_shape,
+                       'assignment_path': self.assignment_path,
+                       'assignment_key': self.assignment_key,
+                       'inner_subgraph_key': self.inner_subgraph_key,
+                       'inner_subfeat_key': self.inner_subfeat_key,
+                       'subgraph_key': self.subgraph_key,
+                       'subfeat_key': self.subfeat_key,
+                       'ignore_label': ignore_label})
+
+        if self.n_retries == 0:
+            block_list = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end,
+                                             block_list_path=block_list_path)
+        else:
+            block_list = self.block_list
+            self.clean_up_for_retry(block_list)
+
+        n_jobs = min(len(block_list), self.max_jobs)
+        # prime and run the jobs
+        self.prepare_jobs(n_jobs, block_list, config)
+        self.submit_jobs(n_jobs)
+
+        # wait till jobs finish and check for job success
+        self.wait_for_jobs()
+        self.check_jobs(n_jobs)
+
+
+class FaceSubGraphsLocal(FaceSubGraphsBase, LocalTask):
+    """ FaceSubGraphs on local machine
+    """
+    pass
+
+
+class FaceSubGraphsLocalPool(FaceSubGraphsBase, LocalPoolTask):
+    """ FaceSubGraphs on local machine with persistent worker pool
+    """
+    pass
+
+
+class FaceSubGraphsSlurm(FaceSubGraphsBase, SlurmTask):
+    """ FaceSubGraphs on slurm cluster
+    """
+    pass
+
+
+class FaceSubGraphsLSF(FaceSubGraphsBase, LSFTask):
+    """ FaceSubGraphs on lsf cluster
+    """
+    pass
+
+
+#
+# Implementation
+#
+
+
+def _relabel(ids, assignments):
+    # the assignments are sorted by the old ids
+    if ids.size == 0:
+        return ids
+    return assignments[np.searchsorted(assignments[:, 0], ids), 1]
+
+
+def _face_edges(ds_ws, ds_in, block, axis, ignore_label):
+    # the face slices of this block and the next block along the axis
+    bb = tuple(slice(end - 1, end + 1) if dim == axis else slice(beg, end)
+               for dim, (beg, end) in enumerate(zip(block.begin, block.end)))
+    labels = fu.profiled_read(ds_ws, bb, 'read_labels')
+    values = feature_values(fu.profiled_read(ds_in, bb))
+    lower = tuple(0 if dim == axis else slice(None) for dim in range(3))
+    upper = tuple(1 if dim == axis else slice(None) for dim in range(3))
+
+    edges, features = gu.edge_features(*gu.face_pairs(labels[lower], labels[upper],
+                                                      values[lower], values[upper],
+                                                      ignore_label))
+    # the sub-graph also contains the nodes of the adjacent face
+    nodes = np.unique(labels[upper])
+    return nodes, edges, features
+
+
+def _face_block(block_id, blocking, shape, assignments,
+                ds_ws, ds_in, inner_graph, ds_inner_feats,
+                ds_nodes, ds_edges, ds_feats, ignore_label):
+    fu.log("start processing block %i" % block_id)
+    block = blocking.getBlock(block_id)
+    chunk_pos = blocking.blockGridPosition(block_id)
+    n_feats = gu.N_EDGE_FEATURES
+
+    # load the inner sub-graph and map it to the relabeled ids
+    with fu.profile_section('read_graph'):
+        nodes = inner_graph['nodes'].read_chunk(chunk_pos)
+        edges = inner_graph['edges'].read_chunk(chunk_pos)
+        features = None if edges is None else ds_inner_feats.read_chunk(chunk_pos)
+    nodes = np.zeros(0, dtype='uint64') if nodes is None else _relabel(nodes, assignments)
+    if edges is None:
+        edges = np.zeros((0, 2), dtype='uint64')
+        features = np.zeros((0, n_feats), dtype='float64')
+    else:
+        edges = _relabel(edges, assignments).reshape((edges.size // 2, 2))
+        features = features.reshape((features.size // n_feats, n_feats))
+    nodes, edges, features = [nodes], [edges], [features]
+
+    # add the edges across the upper faces
+    with fu.profile_section('faces'):
+        for axis in range(3):
+            if block.end[axis] == shape[axis]:
+                continue
+            face_nodes, face_edges, face_features = _face_edges(ds_ws, ds_in, block,
+                                                                axis, ignore_label)
+            nodes.append(face_nodes)
+            edges.append(face_edges)
+            features.append(face_features)
+
+    nodes = np.unique(np.concatenate(nodes))
+    if ignore_label and nodes.size > 0 and nodes[0] == 0:
+        nodes = nodes[1:]
+    edges = np.concatenate(edges, axis=0)
+    features = np.concatenate(features, axis=0)
+
+    with fu.profile_section('write_graph'):
+        ds_nodes.write_chunk(chunk_pos, nodes.astype('uint64'), True)
+        if edges.size > 0:
+            # the face edges are disjoint from the inner edges unless the ignore label
+            # is not set, but we merge in any case to keep the edges sorted
+            edges, features = gu.merge_edge_features(edges, features)
+            ds_edges.write_chunk(chunk_pos, edges.astype('uint64').flatten(), True)
+            ds_feats.write_chunk(chunk_pos, features.flatten(), True)
+    fu.log_block_success(block_id)
+
+
+def face_sub_graphs(job_id, config_path):
+
+    fu.log("start processing job %i" % job_id)
+    fu.log("reading config from %s" % config_path)
+
+    # get the config
+    with open(config_path) as f:
+        config = json.load(f)
+    input_path = config['input_path']
+    input_key = config['input_key']
+    ws_path = config['ws_path']
+    ws_key = config['ws_key']
+    graph_path = config['graph_path']
+    block_shape = config['block_shape']
+    block_list = vu.job_blocks(config)
+    ignore_label = config['ignore_label']
+
+    shape = vu.get_shape(ws_path, ws_key)
+    blocking = nt.blocking(roiBegin=[0, 0, 0],
+                           roiEnd=list(shape),
+                           blockShape=list(block_shape))
+
+    with vu.file_reader(config['assignment_path'], 'r') as f:
+        ds = f[config['assignment_key']]
+        ds.n_threads = config.get('threads_per_job', 1)
+        assignments = ds[:]
+
+    with vu.file_reader(input_path, 'r') as f_in, vu.file_reader(ws_path, 'r') as f_ws,\
+            vu.file_reader(graph_path) as f_graph:
+        ds_in = f_in[input_key]
+        ds_ws = f_ws[ws_key]
+
+        inner_graph = f_graph[config['inner_subgraph_key']]
+        ds_inner_feats = f_graph[config['inner_subfeat_key']]
+        ds_nodes = f_graph[config['subgraph_key']]['nodes']
+        ds_edges = f_graph[config['subgraph_key']]['edges']
+        ds_feats = f_graph[config['subfeat_key']]
+
+        for block_id in block_list:
+            n_voxels = int(np.prod(blocking.getBlock(block_id).shape))
+            with fu.profile_block(block_id, n_voxels):
+                _face_block(block_id, blocking, shape, assignments,
+                            ds_ws, ds_in, inner_graph, ds_inner_feats,
+                            ds_nodes, ds_edges, ds_feats, ignore_label)
+    fu.log_job_success(job_id)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1]
+    assert os.path.exists(path), path
+    job_id = int(os.path.split(path)[1].split('.')[0].split('_')[-1])
+    face_sub_graphs(job_id, path)
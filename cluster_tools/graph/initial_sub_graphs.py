@@ -3,14 +3,18 @@
 import os
 import sys
 import json
+from functools import partial
 
+import numpy as np
 import luigi
 import nifty.tools as nt
 import nifty.distributed as ndist
+from elf.io.label_multiset_wrapper import LabelMultisetWrapper
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+import cluster_tools.utils.graph_utils as gu
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -20,10 +24,17 @@ from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
 
 class InitialSubGraphsBase(luigi.Task):
     """ InitialSubGraph base class
+
+    The blocks of a job are processed with `threads_per_job` threads.
+    If `blocks_per_batch` is larger than one, neighboring blocks are grouped into batches
+    of up to `blocks_per_batch` blocks per axis; the labels of a batch are read at once
+    and the sub-graphs of its blocks are extracted in memory.
+    This is faster than one `ndist.computeMergeableRegionGraph` call per block for small blocks.
     """
 
     task_name = 'initial_sub_graphs'
     src_file = os.path.abspath(__file__)
+    allow_incremental = True
 
     # input volumes and graph
     input_path = luigi.Parameter()
@@ -39,9 +50,19 @@ class InitialSubGraphsBase(luigi.Task):
     def default_task_config():
         # we use this to get also get the common default config
         config = LocalTask.default_task_config()
-        config.update({'ignore_label': True})
+        config.update({'ignore_label': True, 'blocks_per_batch': 1})
         return config
 
+    def incremental_datasets(self, config):
+        inputs = [(config['input_path'], config['input_key'])]
+        outputs = [(config['graph_path'], 's0/sub_graphs/nodes'),
+                   (config['graph_path'], 's0/sub_graphs/edges')]
+        return inputs, outputs
+
+    def incremental_halo(self, config):
+        # the blocks are read with a halo of one pixel in the upper direction
+        return [1, 1, 1]
+
     def clean_up_for_retry(self, block_list):
         super().clean_up_for_retry(block_list)
         # TODO remove any output of failed blocks because it might be corrupted
@@ -96,6 +117,12 @@ class InitialSubGraphsLocal(InitialSubGraphsBase, LocalTask):
     pass
 
 
+class InitialSubGraphsLocalPool(InitialSubGraphsBase, LocalPoolTask):
+    """ InitialSubGraphs on local machine with persistent worker pool
+    """
+    pass
+
+
 class InitialSubGraphsSlurm(InitialSubGraphsBase, SlurmTask):
     """ InitialSubGraphs on slurm cluster
     """
@@ -113,7 +140,7 @@ class InitialSubGraphsLSF(InitialSubGraphsBase, LSFTask):
 #
 
 
-def _graph_block(block_id, blocking, input_path, input_key, graph_path,
+def _graph_block(blocking, block_id, input_path, input_key, graph_path,
                  ignore_label):
     fu.log("start processing block %i" % block_id)
     block = blocking.getBlock(block_id)
@@ -131,6 +158,50 @@ def _graph_block(block_id, blocking, input_path, input_key, graph_path,
     fu.log_block_success(block_id)
 
 
+def batch_blocks(blocking, block_list, blocks_per_batch):
+    """ Group the blocks into batches of neighboring blocks.
+
+    A batch contains the blocks of the list that are in the same cell of a grid
+    with `blocks_per_batch` blocks per axis.
+    """
+    batches = {}
+    for block_id in block_list:
+        grid_pos = blocking.blockGridPosition(block_id)
+        batch_pos = tuple(pos // bpb for pos, bpb in zip(grid_pos, blocks_per_batch))
+        batches.setdefault(batch_pos, []).append(block_id)
+    return list(batches.values())
+
+
+def _graph_batch(blocking, block_ids, ds, ds_nodes, ds_edges, ignore_label):
+    fu.log("start processing batch of blocks %s" % str(block_ids))
+    blocks = [blocking.getBlock(block_id) for block_id in block_ids]
+    # read the bounding box of the blocks, with the same halo into the upper direction
+    # that `computeMergeableRegionGraph` uses
+    shape = blocking.roiEnd
+    batch_begin = [min(block.begin[d] for block in blocks) for d in range(3)]
+    batch_end = [min(max(block.end[d] for block in blocks) + 1, shape[d]) for d in range(3)]
+    labels = ds[tuple(slice(beg, end) for beg, end in zip(batch_begin, batch_end))]
+
+    for block_id, block in zip(block_ids, blocks):
+        # the nodes are the labels in the block, the edges also
+        # contain the edges to the upper neighboring blocks
+        inner_bb = tuple(slice(beg - bb_beg, end - bb_beg)
+                         for beg, end, bb_beg in zip(block.begin, block.end, batch_begin))
+        outer_bb = tuple(slice(beg - bb_beg, min(end + 1, sh) - bb_beg)
+                         for beg, end, bb_beg, sh in zip(block.begin, block.end, batch_begin, shape))
+        nodes = np.unique(labels[inner_bb]).astype('uint64')
+        if ignore_label and nodes.size > 0 and nodes[0] == 0:
+            nodes = nodes[1:]
+        edges = gu.region_edges(labels[outer_bb], ignore_label)
+
+        chunk_pos = blocking.blockGridPosition(block_id)
+        if nodes.size > 0:
+            ds_nodes.write_chunk(chunk_pos, nodes, True)
+        if edges.size > 0:
+            ds_edges.write_chunk(chunk_pos, edges.flatten(), True)
+        fu.log_block_success(block_id)
+
+
 def initial_sub_graphs(job_id, config_path):
 
     fu.log("start processing job %i" % job_id)
@@ -145,15 +216,34 @@ def initial_sub_graphs(job_id, config_path):
     block_list = config['block_list']
     graph_path = config['graph_path']
     ignore_label = config.get('ignore_label', True)
+    n_threads = config.get('threads_per_job', 1)
+    blocks_per_batch = config.get('blocks_per_batch', 1)
+    if isinstance(blocks_per_batch, int):
+        blocks_per_batch = [blocks_per_batch] * 3
 
     shape = vu.get_shape(input_path, input_key)
     blocking = nt.blocking(roiBegin=[0, 0, 0],
                            roiEnd=list(shape),
                            blockShape=list(block_shape))
 
-    for block_id in block_list:
-        _graph_block(block_id, blocking, input_path, input_key, graph_path,
-                     ignore_label)
+    if all(bpb == 1 for bpb in blocks_per_batch):
+        vu.map_blocks(partial(_graph_block, blocking, input_path=input_path, input_key=input_key,
+                              graph_path=graph_path, ignore_label=ignore_label),
+                      block_list, n_threads)
+        fu.log_job_success(job_id)
+        return
+
+    batches = batch_blocks(blocking, block_list, blocks_per_batch)
+    fu.log("processing %i blocks in %i batches" % (len(block_list), len(batches)))
+    with vu.file_reader(input_path, 'r') as f_in, vu.file_reader(graph_path) as f_graph:
+        ds = f_in[input_key]
+        if ds.attrs.get('isLabelMultiset', False):
+            ds = LabelMultisetWrapper(ds)
+        ds_nodes = f_graph['s0/sub_graphs/nodes']
+        ds_edges = f_graph['s0/sub_graphs/edges']
+        vu.map_blocks(partial(_graph_batch, blocking, ds=ds, ds_nodes=ds_nodes, ds_edges=ds_edges,
+                              ignore_label=ignore_label),
+                      batches, n_threads)
     fu.log_job_success(job_id)
 
 
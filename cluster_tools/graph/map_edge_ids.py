@@ -9,7 +9,7 @@ import nifty.distributed as ndist
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -81,6 +81,12 @@ class MapEdgeIdsLocal(MapEdgeIdsBase, LocalTask):
     pass
 
 
+class MapEdgeIdsLocalPool(MapEdgeIdsBase, LocalPoolTask):
+    """ MapEdgeIds on local machine with persistent worker pool
+    """
+    pass
+
+
 class MapEdgeIdsSlurm(MapEdgeIdsBase, SlurmTask):
     """ MapEdgeIds on slurm cluster
     """
@@ -3,6 +3,7 @@
 import os
 import sys
 import json
+from shutil import rmtree
 
 import luigi
 import nifty.tools as nt
@@ -10,15 +11,24 @@ import nifty.distributed as ndist
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
 # Graph Tasks
 #
 
+# the sub-graphs of the levels of the merge tree, stored next to the output graph
+MERGE_TREE_KEY = '%s_merge_tree'
+
+
 class MergeSubGraphsBase(luigi.Task):
     """ MergeSubGraph base class
+
+    If `merge_fan_in` is set, the complete graph is merged in a tree: each level merges
+    the sub-graphs of up to `merge_fan_in` blocks per axis of the previous level in parallel jobs,
+    until the blocks of the last level are few enough to be merged into the complete graph.
+    The result is the same as merging all blocks at once.
     """
 
     task_name = 'merge_sub_graphs'
@@ -35,13 +45,22 @@ class MergeSubGraphsBase(luigi.Task):
     def requires(self):
         return self.dependency
 
+    @staticmethod
+    def default_task_config():
+        # we use this to get also get the common default config
+        config = LocalTask.default_task_config()
+        # number of blocks per axis merged in one level of the merge tree,
+        # if None, all blocks are merged at once
+        config.update({'merge_fan_in': None})
+        return config
+
     def clean_up_for_retry(self, block_list):
         super().clean_up_for_retry(block_list)
         # TODO remove any output of failed blocks because it might be corrupted
 
-    def _initialize_datasets(self, shape, block_shape):
+    def _initialize_datasets(self, shape, block_shape, output_key=None):
         f = vu.file_reader(self.graph_path)
-        output_key = 's%i/sub_graphs' % self.scale
+        output_key = 's%i/sub_graphs' % self.scale if output_key is None else output_key
         node_key = os.path.join(output_key, 'nodes')
         f.require_dataset(node_key, shape=shape, chunks=block_shape,
                           compression='gzip', dtype='uint64')
@@ -49,6 +68,41 @@ class MergeSubGraphsBase(luigi.Task):
         f.require_dataset(edge_key, shape=shape, chunks=block_shape,
                           compression='gzip', dtype='uint64')
 
+    def _merge_tree(self, config, shape, block_shape, roi_begin, roi_end, ignore_label):
+        # the levels depend on each other, so we don't retry failed jobs
+        self.allow_retry = False
+        input_key = 's%i/sub_graphs' % self.scale
+        # remove the levels of a previous merge tree, they might have different block shapes
+        tree_key = MERGE_TREE_KEY % self.output_key
+        rmtree(os.path.join(self.graph_path, tree_key), ignore_errors=True)
+        level_block_shapes = vu.merge_tree_block_shapes(shape, block_shape, config['merge_fan_in'])
+        for level, level_block_shape in enumerate(level_block_shapes, 1):
+            level_key = os.path.join(tree_key, 'level_%i' % level)
+            with vu.file_reader(self.graph_path) as f:
+                g = f.require_group(level_key)
+                g.attrs['ignore_label'] = ignore_label
+                g.attrs['shape'] = shape
+            self._initialize_datasets(shape, tuple(level_block_shape), level_key)
+
+            block_list = vu.blocks_in_volume(shape, level_block_shape, roi_begin, roi_end)
+            level_config = dict(config, tree_input_key=input_key, tree_output_key=level_key,
+                                tree_input_block_shape=list(block_shape),
+                                tree_block_shape=level_block_shape,
+                                roi_begin=roi_begin, roi_end=roi_end)
+
+            n_jobs = min(len(block_list), self.max_jobs)
+            prefix = 'level_%i' % level
+            self.prepare_jobs(n_jobs, block_list, level_config, prefix)
+            self.submit_jobs(n_jobs, prefix)
+            self.wait_for_jobs(prefix)
+            self.check_jobs(n_jobs, prefix)
+            self._write_log("merged %i blocks in level %i of the merge tree" % (len(block_list), level))
+            input_key, block_shape = level_key, level_block_shape
+
+        # the blocks of the last level are merged into the complete graph
+        block_list = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end)
+        return input_key, block_list
+
     def run_impl(self):
         # get the global config and init configs
         shebang, block_shape, roi_begin, roi_end = self.global_config_values()
@@ -75,7 +129,12 @@ class MergeSubGraphsBase(luigi.Task):
 
         factor = 2**self.scale
         block_shape = tuple(sh * factor for sh in block_shape)
-        if self.n_retries == 0:
+        use_merge_tree = self.merge_complete_graph and config.get('merge_fan_in', None) is not None
+        if use_merge_tree:
+            subgraph_key, block_list = self._merge_tree(config, shape, block_shape,
+                                                        roi_begin, roi_end, ignore_label)
+            config['subgraph_key'] = subgraph_key
+        elif self.n_retries == 0:
             block_list = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end)
         else:
             block_list = self.block_list
@@ -95,6 +154,10 @@ class MergeSubGraphsBase(luigi.Task):
         self.wait_for_jobs()
         self.check_jobs(n_jobs)
 
+        # the levels of the merge tree are not needed anymore after the complete graph was merged
+        if use_merge_tree:
+            rmtree(os.path.join(self.graph_path, MERGE_TREE_KEY % self.output_key), ignore_errors=True)
+
     # part of the luigi API
     def output(self):
         return luigi.LocalTarget(os.path.join(self.tmp_folder,
@@ -107,6 +170,12 @@ class MergeSubGraphsLocal(MergeSubGraphsBase, LocalTask):
     pass
 
 
+class MergeSubGraphsLocalPool(MergeSubGraphsBase, LocalPoolTask):
+    """ MergeSubGraphs on local machine with persistent worker pool
+    """
+    pass
+
+
 class MergeSubGraphsSlurm(MergeSubGraphsBase, SlurmTask):
     """ MergeSubGraphs on slurm cluster
     """
@@ -124,9 +193,8 @@ class MergeSubGraphsLSF(MergeSubGraphsBase, LSFTask):
 #
 
 
-def _merge_graph(graph_path, output_key, scale,
-                 block_list, blocking, shape, n_threads):
-    subgraph_key = 's%i/sub_graphs' % scale
+def _merge_graph(graph_path, output_key, subgraph_key,
+                 block_list, shape, n_threads):
     ndist.mergeSubgraphs(graph_path,
                          subgraphKey=subgraph_key,
                          blockIds=block_list,
@@ -137,21 +205,36 @@ def _merge_graph(graph_path, output_key, scale,
         f[output_key].attrs['shape'] = shape
 
 
-def _merge_subblocks(block_id, blocking, previous_blocking, graph_path, output_key, scale):
+def _merge_subblocks(block_id, blocking, previous_blocking, graph_path, input_key, output_key,
+                     previous_blocks=None):
     fu.log("start processing block %i" % block_id)
-    block = blocking.getBlock(block_id)
-    input_key = 's%i/sub_graphs' % (scale - 1,)
-    block_list = previous_blocking.getBlockIdsInBoundingBox(roiBegin=block.begin,
-                                                            roiEnd=block.end,
-                                                            blockHalo=[0, 0, 0])
-    ndist.mergeSubgraphs(graph_path,
-                         subgraphKey=input_key,
-                         blockIds=block_list.tolist(),
-                         outKey=output_key, serializeToVarlen=True)
+    block_list = vu.sub_blocks_in_block(blocking, previous_blocking, block_id, previous_blocks)
+    if block_list:
+        ndist.mergeSubgraphs(graph_path,
+                             subgraphKey=input_key,
+                             blockIds=block_list,
+                             outKey=output_key, serializeToVarlen=True)
     # log block success
     fu.log_block_success(block_id)
 
 
+def _merge_tree_level(config, graph_path, shape, block_list):
+    input_key, output_key = config['tree_input_key'], config['tree_output_key']
+    fu.log("merging subgraphs from %s to %s" % (input_key, output_key))
+    blocking = nt.blocking(roiBegin=[0, 0, 0],
+                           roiEnd=list(shape),
+                           blockShape=config['tree_block_shape'])
+    previous_blocking = nt.blocking(roiBegin=[0, 0, 0],
+                                    roiEnd=list(shape),
+                                    blockShape=config['tree_input_block_shape'])
+    # only merge the blocks of the previous level that were processed (in the roi)
+    previous_blocks = set(vu.blocks_in_volume(shape, config['tree_input_block_shape'],
+                                              config['roi_begin'], config['roi_end']))
+    for block_id in block_list:
+        _merge_subblocks(block_id, blocking, previous_blocking,
+                         graph_path, input_key, output_key, previous_blocks)
+
+
 def merge_sub_graphs(job_id, config_path):
 
     fu.log("start processing job %i" % job_id)
@@ -175,11 +258,15 @@ def merge_sub_graphs(job_id, config_path):
                            roiEnd=list(shape),
                            blockShape=block_shape)
 
-    if merge_complete_graph:
+    if 'tree_output_key' in config:
+        _merge_tree_level(config, graph_path, shape, block_list)
+
+    elif merge_complete_graph:
         fu.log("merge complete graph at scale %i" % scale)
         n_threads = config['threads_per_job']
-        _merge_graph(graph_path, output_key, scale,
-                     block_list, blocking, shape, n_threads)
+        subgraph_key = config.get('subgraph_key', 's%i/sub_graphs' % scale)
+        _merge_graph(graph_path, output_key, subgraph_key,
+                     block_list, shape, n_threads)
 
     else:
         fu.log("merging subgraphs at scale %i" % scale)
@@ -188,9 +275,10 @@ def merge_sub_graphs(job_id, config_path):
         previous_blocking = nt.blocking(roiBegin=[0, 0, 0],
                                         roiEnd=list(shape),
                                         blockShape=previous_block_shape)
+        input_key = 's%i/sub_graphs' % (scale - 1,)
         for block_id in block_list:
             _merge_subblocks(block_id, blocking, previous_blocking,
-                             graph_path, output_key, scale)
+                             graph_path, input_key, output_key)
 
     fu.log_job_success(job_id)
 
@@ -12,7 +12,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class MergePredictionsBase(luigi.Task):
@@ -76,6 +76,12 @@ class MergePredictionsLocal(MergePredictionsBase, LocalTask):
     pass
 
 
+class MergePredictionsLocalPool(MergePredictionsBase, LocalPoolTask):
+    """ MergePredictions on local machine with persistent worker pool
+    """
+    pass
+
+
 class MergePredictionsSlurm(MergePredictionsBase, SlurmTask):
     """ MergePredictions on slurm cluster
     """
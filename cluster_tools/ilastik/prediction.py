@@ -11,7 +11,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class PredictionBase(luigi.Task):
@@ -89,6 +89,12 @@ class PredictionLocal(PredictionBase, LocalTask):
     pass
 
 
+class PredictionLocalPool(PredictionBase, LocalPoolTask):
+    """ Prediction on local machine with persistent worker pool
+    """
+    pass
+
+
 class PredictionSlurm(PredictionBase, SlurmTask):
     """ Prediction on slurm cluster
     """
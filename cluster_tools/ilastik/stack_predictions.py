@@ -13,7 +13,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class StackPredictionsBase(luigi.Task):
@@ -81,6 +81,12 @@ class StackPredictionsLocal(StackPredictionsBase, LocalTask):
     pass
 
 
+class StackPredictionsLocalPool(StackPredictionsBase, LocalPoolTask):
+    """ StackPredictions on local machine with persistent worker pool
+    """
+    pass
+
+
 class StackPredictionsSlurm(StackPredictionsBase, SlurmTask):
     """ StackPredictions on slurm cluster
     """
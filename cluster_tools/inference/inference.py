@@ -13,7 +13,7 @@ import nifty.tools as nt
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
 from cluster_tools.utils.task_utils import DummyTask
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 from cluster_tools.inference.frameworks import get_predictor, get_preprocessor
 from cluster_tools.inference.prep_model import get_prep_model
 
@@ -61,6 +61,16 @@ class InferenceBase(luigi.Task):
         super().clean_up_for_retry(block_list)
         # TODO remove any output of failed blocks because it might be corrupted
 
+    def get_block_weights(self, block_list):
+        # estimate the block cost from the mask if we don't have weights
+        weights = super().get_block_weights(block_list)
+        if weights is None and self.mask_path != '':
+            shape = vu.get_shape(self.input_path, self.input_key)
+            block_shape = self.global_config_values()[1]
+            weights = vu.mask_block_weights(self.mask_path, self.mask_key,
+                                            shape, block_shape, block_list)
+        return weights
+
     def run_impl(self):
         # TODO support more frameworks
         # assert self.framework in ('pytorch', 'tensorflow', 'caffe', 'inferno')
@@ -142,6 +152,12 @@ class InferenceLocal(InferenceBase, LocalTask):
     pass
 
 
+class InferenceLocalPool(InferenceBase, LocalPoolTask):
+    """ Inference on local machine with persistent worker pool
+    """
+    pass
+
+
 class InferenceSlurm(InferenceBase, SlurmTask):
     """ Inference on slurm cluster
     """
@@ -223,30 +239,41 @@ def _run_inference(blocking, block_list, halo, ds_in, ds_out, mask,
     dtype = dtypes[0]
     assert all(dtp == dtype for dtp in dtypes)
 
+    # the stages of a block can run in different threads,
+    # so we keep the block profiles here instead of using `fu.profile_block`
+    profiles = {}
+
     @dask.delayed
     def log1(block_id):
         fu.log("start processing block %i" % block_id)
+        n_voxels = int(np.prod(blocking.getBlock(block_id).shape))
+        profiles[block_id] = fu.start_block_profile(block_id, n_voxels)
         return block_id
 
     @dask.delayed
     def load_input(block_id):
         block = blocking.getBlock(block_id)
+        record = profiles[block_id]
 
         # if we have a mask, check if this block is in mask
         if mask is not None:
             bb = vu.block_to_bb(block)
-            bb_mask = mask[bb].astype('bool')
+            bb_mask = fu.profiled_read(mask, bb, 'read_mask', record).astype('bool')
             if np.sum(bb_mask) == 0:
                 return block_id, None
 
-        return block_id, _load_input(ds_in, block.begin, block_shape, halo)
+        with fu.profile_section('read', record):
+            data = _load_input(ds_in, block.begin, block_shape, halo)
+        fu.profile_bytes('read', data.nbytes, record)
+        return block_id, data
 
     @dask.delayed
     def preprocess_impl(inputs):
         block_id, data = inputs
         if data is None:
             return block_id, None
-        data = preprocess(data)
+        with fu.profile_section('preprocess', profiles[block_id]):
+            data = preprocess(data)
         return block_id, data
 
     @dask.delayed
@@ -254,7 +281,8 @@ def _run_inference(blocking, block_list, halo, ds_in, ds_out, mask,
         block_id, data = inputs
         if data is None:
             return block_id, None
-        data = predict(data)
+        with fu.profile_section('predict', profiles[block_id]):
+            data = predict(data)
         return block_id, data
 
     # TODO de-spagehttify
@@ -306,12 +334,13 @@ def _run_inference(blocking, block_list, halo, ds_in, ds_out, mask,
             if dtype == 'uint8':
                 channel_output = _to_uint8(channel_output)
 
-            dso[out_bb] = channel_output
+            fu.profiled_write(dso, out_bb, channel_output, record=profiles[block_id])
 
         return block_id
 
     @dask.delayed
     def log2(block_id):
+        fu.finish_block_profile(profiles.pop(block_id))
         fu.log_block_success(block_id)
         return 1
 
@@ -14,7 +14,7 @@ import nifty.tools as nt
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
 from cluster_tools.utils.task_utils import DummyTask
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 from cluster_tools.inference.frameworks import get_predictor, get_preprocessor
 from cluster_tools.inference.inference import get_prep_model, _to_uint8
 
@@ -164,6 +164,12 @@ class MultiscaleInferenceLocal(MultiscaleInferenceBase, LocalTask):
     pass
 
 
+class MultiscaleInferenceLocalPool(MultiscaleInferenceBase, LocalPoolTask):
+    """ Inference on local machine with persistent worker pool
+    """
+    pass
+
+
 class MultiscaleInferenceSlurm(MultiscaleInferenceBase, SlurmTask):
     """ Inference on slurm cluster
     """
@@ -9,7 +9,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 # this is a task called by multiple processes,
 # so we need to restrict the number of threads used by numpy
@@ -85,6 +85,13 @@ class CreateMultisetLocal(CreateMultisetBase, LocalTask):
     pass
 
 
+class CreateMultisetLocalPool(CreateMultisetBase, LocalPoolTask):
+    """
+    CreateMultiset on local machine with persistent worker pool
+    """
+    pass
+
+
 class CreateMultisetSlurm(CreateMultisetBase, SlurmTask):
     """
     CreateMultiset on slurm cluster
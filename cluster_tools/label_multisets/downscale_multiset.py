@@ -10,7 +10,7 @@ from elf.util import chunks_overlapping_roi, downscale_shape
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 # this is a task called by multiple processes,
 # so we need to restrict the number of threads used by numpy
@@ -107,6 +107,13 @@ class DownscaleMultisetLocal(DownscaleMultisetBase, LocalTask):
     pass
 
 
+class DownscaleMultisetLocalPool(DownscaleMultisetBase, LocalPoolTask):
+    """
+    DownscaleMultiset on local machine with persistent worker pool
+    """
+    pass
+
+
 class DownscaleMultisetSlurm(DownscaleMultisetBase, SlurmTask):
     """
     DownscaleMultiset on slurm cluster
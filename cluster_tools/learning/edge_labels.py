@@ -9,7 +9,7 @@ import luigi
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class EdgeLabelsBase(luigi.Task):
@@ -68,6 +68,12 @@ class EdgeLabelsLocal(EdgeLabelsBase, LocalTask):
     pass
 
 
+class EdgeLabelsLocalPool(EdgeLabelsBase, LocalPoolTask):
+    """ EdgeLabels on local machine with persistent worker pool
+    """
+    pass
+
+
 class EdgeLabelsSlurm(EdgeLabelsBase, SlurmTask):
     """ EdgeLabels on slurm cluster
     """
@@ -11,7 +11,7 @@ from sklearn.ensemble import RandomForestClassifier
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -72,6 +72,12 @@ class LearnRFLocal(LearnRFBase, LocalTask):
     pass
 
 
+class LearnRFLocalPool(LearnRFBase, LocalPoolTask):
+    """ LearnRF on local machine with persistent worker pool
+    """
+    pass
+
+
 class LearnRFSlurm(LearnRFBase, SlurmTask):
     """ LearnRF on slurm cluster
     """
@@ -7,7 +7,7 @@ import luigi
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 #
 # Clear Labels Tasks
@@ -63,6 +63,12 @@ class ClearLiftedEdgesFromLabelsLocal(ClearLiftedEdgesFromLabelsBase, LocalTask)
     pass
 
 
+class ClearLiftedEdgesFromLabelsLocalPool(ClearLiftedEdgesFromLabelsBase, LocalPoolTask):
+    """ ClearLiftedEdgesFromLabels on local machine with persistent worker pool
+    """
+    pass
+
+
 class ClearLiftedEdgesFromLabelsSlurm(ClearLiftedEdgesFromLabelsBase, SlurmTask):
     """ ClearLiftedEdgesFromLabels on slurm cluster
     """
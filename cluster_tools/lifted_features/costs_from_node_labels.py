@@ -11,7 +11,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -99,6 +99,12 @@ class CostsFromNodeLabelsLocal(CostsFromNodeLabelsBase, LocalTask):
     pass
 
 
+class CostsFromNodeLabelsLocalPool(CostsFromNodeLabelsBase, LocalPoolTask):
+    """ CostsFromNodeLabels on local machine with persistent worker pool
+    """
+    pass
+
+
 class CostsFromNodeLabelsSlurm(CostsFromNodeLabelsBase, SlurmTask):
     """ CostsFromNodeLabels on slurm cluster
     """
@@ -9,7 +9,7 @@ import z5py
 import luigi
 
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -66,6 +66,12 @@ class MergeLiftedProblemsLocal(MergeLiftedProblemsBase, LocalTask):
     pass
 
 
+class MergeLiftedProblemsLocalPool(MergeLiftedProblemsBase, LocalPoolTask):
+    """ MergeLiftedProblems on local machine with persistent worker pool
+    """
+    pass
+
+
 class MergeLiftedProblemsSlurm(MergeLiftedProblemsBase, SlurmTask):
     """ MergeLiftedProblems on slurm cluster
     """
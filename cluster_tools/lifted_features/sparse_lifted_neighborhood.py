@@ -9,7 +9,7 @@ import nifty.distributed as ndist
 
 import cluster_tools.utils.function_utils as fu
 import cluster_tools.utils.volume_utils as vu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 from cluster_tools.utils.task_utils import DummyTask
 
 
@@ -88,6 +88,12 @@ class SparseLiftedNeighborhoodLocal(SparseLiftedNeighborhoodBase, LocalTask):
     pass
 
 
+class SparseLiftedNeighborhoodLocalPool(SparseLiftedNeighborhoodBase, LocalPoolTask):
+    """ SparseLiftedNeighborhood on local machine with persistent worker pool
+    """
+    pass
+
+
 class SparseLiftedNeighborhoodSlurm(SparseLiftedNeighborhoodBase, SlurmTask):
     """ SparseLiftedNeighborhood on slurm cluster
     """
@@ -16,7 +16,7 @@ from vigra.analysis import relabelConsecutive
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 #
 # Lifted Multicut Tasks
@@ -108,6 +108,12 @@ class ReduceLiftedProblemLocal(ReduceLiftedProblemBase, LocalTask):
     pass
 
 
+class ReduceLiftedProblemLocalPool(ReduceLiftedProblemBase, LocalPoolTask):
+    """ ReduceLiftedProblem on local machine with persistent worker pool
+    """
+    pass
+
+
 class ReduceLiftedProblemSlurm(ReduceLiftedProblemBase, SlurmTask):
     """ ReduceLiftedProblem on slurm cluster
     """
@@ -11,7 +11,7 @@ from elf.segmentation.lifted_multicut import get_lifted_multicut_solver
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 #
 # Lifted Multicut Tasks
@@ -81,6 +81,12 @@ class SolveLiftedGlobalLocal(SolveLiftedGlobalBase, LocalTask):
     pass
 
 
+class SolveLiftedGlobalLocalPool(SolveLiftedGlobalBase, LocalPoolTask):
+    """ SolveLiftedGlobal on local machine with persistent worker pool
+    """
+    pass
+
+
 class SolveLiftedGlobalSlurm(SolveLiftedGlobalBase, SlurmTask):
     """ SolveLiftedGlobal on slurm cluster
     """
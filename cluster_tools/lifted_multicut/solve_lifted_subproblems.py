@@ -17,7 +17,7 @@ from elf.segmentation.multicut import get_multicut_solver
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -113,6 +113,12 @@ class SolveLiftedSubproblemsLocal(SolveLiftedSubproblemsBase, LocalTask):
     pass
 
 
+class SolveLiftedSubproblemsLocalPool(SolveLiftedSubproblemsBase, LocalPoolTask):
+    """ SolveLiftedSubproblems on local machine with persistent worker pool
+    """
+    pass
+
+
 class SolveLiftedSubproblemsSlurm(SolveLiftedSubproblemsBase, SlurmTask):
     """ SolveLiftedSubproblems on slurm cluster
     """
@@ -12,7 +12,7 @@ from elf.wrapper.resized_volume import ResizedVolume
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class BlocksFromMaskBase(luigi.Task):
@@ -61,6 +61,12 @@ class BlocksFromMaskLocal(BlocksFromMaskBase, LocalTask):
     pass
 
 
+class BlocksFromMaskLocalPool(BlocksFromMaskBase, LocalPoolTask):
+    """ BlocksFromMask on local machine with persistent worker pool
+    """
+    pass
+
+
 class BlocksFromMaskSlurm(BlocksFromMaskBase, SlurmTask):
     """ BlocksFromMask on slurm cluster
     """
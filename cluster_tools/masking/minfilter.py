@@ -10,7 +10,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -90,6 +90,12 @@ class MinfilterLocal(MinfilterBase, LocalTask):
     pass
 
 
+class MinfilterLocalPool(MinfilterBase, LocalPoolTask):
+    """ Minfilter on local machine with persistent worker pool
+    """
+    pass
+
+
 class MinfilterSlurm(MinfilterBase, SlurmTask):
     """ Minfilter on slurm cluster
     """
@@ -13,7 +13,7 @@ from elf.mesh import marching_cubes
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 from cluster_tools.utils.task_utils import DummyTask
 
 
@@ -97,6 +97,13 @@ class ComputeMeshesLocal(ComputeMeshesBase, LocalTask):
     pass
 
 
+class ComputeMeshesLocalPool(ComputeMeshesBase, LocalPoolTask):
+    """
+    compute_meshes on local machine with persistent worker pool
+    """
+    pass
+
+
 class ComputeMeshesSlurm(ComputeMeshesBase, SlurmTask):
     """
     compute_meshes on slurm cluster
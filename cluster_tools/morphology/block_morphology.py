@@ -10,7 +10,7 @@ import nifty.distributed as ndist
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -65,7 +65,9 @@ class BlockMorphologyBase(luigi.Task):
 
         if self.n_retries == 0:
             block_list = vu.blocks_in_volume(shape, block_shape,
-                                             roi_begin, roi_end)
+                                             roi_begin, roi_end,
+                                             skip_empty_in=self.skip_empty_in(self.input_path,
+                                                                              self.input_key))
         else:
             block_list = self.block_list
             self.clean_up_for_retry(block_list)
@@ -92,6 +94,12 @@ class BlockMorphologyLocal(BlockMorphologyBase, LocalTask):
     pass
 
 
+class BlockMorphologyLocalPool(BlockMorphologyBase, LocalPoolTask):
+    """ BlockMorphology on local machine with persistent worker pool
+    """
+    pass
+
+
 class BlockMorphologySlurm(BlockMorphologyBase, SlurmTask):
     """ BlockMorphology on slurm cluster
     """
@@ -108,13 +116,10 @@ class BlockMorphologyLSF(BlockMorphologyBase, LSFTask):
 # Implementation
 #
 
-def _morphology_for_block(block_id, blocking, ds_in,
+def _morphology_for_block(block_id, blocking, seg,
                           output_path, output_key):
     fu.log("start processing block %i" % block_id)
-    # read labels and input in this block
     block = blocking.getBlock(block_id)
-    bb = vu.block_to_bb(block)
-    seg = ds_in[bb]
 
     # check if segmentation block is empty
     if seg.sum() == 0:
@@ -163,9 +168,15 @@ def block_morphology(job_id, config_path):
 
     with vu.file_reader(input_path, 'r') as f_in:
         ds_in = f_in[input_key]
-        [_morphology_for_block(block_id, blocking, ds_in,
-                               output_path, output_key)
-         for block_id in block_list]
+
+        # read the labels in this block, the next blocks are read in the background if enabled
+        def _load(block_id):
+            return ds_in[vu.block_to_bb(blocking.getBlock(block_id))]
+
+        for block_id, get_seg in vu.prefetch_blocks(_load, block_list,
+                                                    config.get('prefetch_blocks', 0)):
+            _morphology_for_block(block_id, blocking, get_seg(),
+                                  output_path, output_key)
     fu.log_job_success(job_id)
 
 
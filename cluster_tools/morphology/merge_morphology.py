@@ -10,7 +10,7 @@ import nifty.distributed as ndist
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -85,6 +85,12 @@ class MergeMorphologyLocal(MergeMorphologyBase, LocalTask):
     pass
 
 
+class MergeMorphologyLocalPool(MergeMorphologyBase, LocalPoolTask):
+    """ MergeMorphology on local machine with persistent worker pool
+    """
+    pass
+
+
 class MergeMorphologySlurm(MergeMorphologyBase, SlurmTask):
     """ MergeMorphology on slurm cluster
     """
@@ -15,7 +15,7 @@ from scipy.ndimage.morphology import distance_transform_edt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -86,6 +86,12 @@ class RegionCentersLocal(RegionCentersBase, LocalTask):
     pass
 
 
+class RegionCentersLocalPool(RegionCentersBase, LocalPoolTask):
+    """ RegionCenters on local machine with persistent worker pool
+    """
+    pass
+
+
 class RegionCentersSlurm(RegionCentersBase, SlurmTask):
     """ RegionCenters on slurm cluster
     """
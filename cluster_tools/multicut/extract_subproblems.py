@@ -0,0 +1,232 @@
+#! /bin/python
+
+import os
+import sys
+import json
+from concurrent import futures
+
+import numpy as np
+import luigi
+import z5py
+import nifty.tools as nt
+import nifty.distributed as ndist
+
+import cluster_tools.utils.volume_utils as vu
+import cluster_tools.utils.function_utils as fu
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
+
+#
+# Multicut Tasks
+#
+
+# the datasets of the serialized block problems in 's<scale>/sub_graphs',
+# each chunk holds the problem of the corresponding block
+SUBPROBLEM_KEYS = ('inner_edge_ids', 'outer_edge_ids', 'inner_uv_ids', 'inner_costs')
+
+
+class ExtractSubproblemsBase(luigi.Task):
+    """ ExtractSubproblems base class
+
+    Serialize the sub-problems of the blocks at the given scale,
+    so that `SolveSubproblems` does not need to load the complete graph and costs.
+    For the following scales, the sub-problems are serialized by `ReduceProblem`.
+    """
+
+    task_name = 'extract_subproblems'
+    src_file = os.path.abspath(__file__)
+    allow_retry = False
+
+    # input volumes and graph
+    problem_path = luigi.Parameter()
+    scale = luigi.IntParameter()
+    #
+    dependency = luigi.TaskParameter()
+
+    def requires(self):
+        return self.dependency
+
+    def run_impl(self):
+        # get the global config and init configs
+        shebang, block_shape, roi_begin, roi_end = self.global_config_values()
+        self.init(shebang)
+
+        with vu.file_reader(self.problem_path, 'r') as f:
+            shape = tuple(f['s0/graph'].attrs['shape'])
+
+        factor = 2**self.scale
+        block_shape = tuple(bs * factor for bs in block_shape)
+
+        config = self.get_task_config()
+        config.update({'problem_path': self.problem_path, 'scale': self.scale,
+                       'block_shape': block_shape})
+
+        # prime and run the job
+        prefix = 's%i' % self.scale
+        block_list = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end)
+        self.prepare_jobs(1, block_list, config, prefix)
+        self.submit_jobs(1, prefix)
+
+        # wait till jobs finish and check for job success
+        self.wait_for_jobs()
+        self.check_jobs(1, prefix)
+
+    # part of the luigi API
+    def output(self):
+        return luigi.LocalTarget(os.path.join(self.tmp_folder,
+                                              self.task_name + '_s%i.log' % self.scale))
+
+
+class ExtractSubproblemsLocal(ExtractSubproblemsBase, LocalTask):
+    """ ExtractSubproblems on local machine
+    """
+    pass
+
+
+class ExtractSubproblemsLocalPool(ExtractSubproblemsBase, LocalPoolTask):
+    """ ExtractSubproblems on local machine with persistent worker pool
+    """
+    pass
+
+
+class ExtractSubproblemsSlurm(ExtractSubproblemsBase, SlurmTask):
+    """ ExtractSubproblems on slurm cluster
+    """
+    pass
+
+
+class ExtractSubproblemsLSF(ExtractSubproblemsBase, LSFTask):
+    """ ExtractSubproblems on lsf cluster
+    """
+    pass
+
+
+#
+# Implementation
+#
+
+
+def read_block_nodes(ds_nodes, blocking, block_id, ignore_label):
+    """ Read the nodes of the block.
+
+    If we have an ignore label, it is removed from the nodes.
+    Returns the nodes and whether the ignore label was removed, or None if the block has no nodes.
+    """
+    chunk_id = blocking.blockGridPosition(block_id)
+    nodes = ds_nodes.read_chunk(chunk_id)
+    if nodes is None:
+        return None
+
+    # if we have an ignore label, remove zero from the nodes
+    # (nodes are sorted, so it will always be at pos 0)
+    if ignore_label and nodes[0] == 0:
+        nodes = nodes[1:]
+        if len(nodes) == 0:
+            return None
+        return nodes, True
+    return nodes, False
+
+
+def require_subproblem_datasets(group):
+    """ Require the datasets for the block problems in the sub-graph group.
+    """
+    ds_nodes = group['nodes']
+    shape, chunks = ds_nodes.shape, ds_nodes.chunks
+    for key in SUBPROBLEM_KEYS:
+        dtype = 'float32' if key == 'inner_costs' else 'uint64'
+        group.require_dataset(key, shape=shape, chunks=chunks, dtype=dtype, compression='gzip')
+
+
+def write_block_problem(group, blocking, block_id, graph, uv_ids, costs, ignore_label):
+    """ Extract the problem of the block from the graph and serialize it.
+
+    The chunks are written for all blocks, also if they are empty,
+    so that no problems of a previous run are left over.
+    """
+    nodes = read_block_nodes(group['nodes'], blocking, block_id, ignore_label)
+    if nodes is None:
+        inner_edges = outer_edges = np.zeros(0, dtype='uint64')
+    else:
+        # we allow for invalid nodes here,
+        # which can occur for un-connected graphs resulting from bad masks ...
+        inner_edges, outer_edges = graph.extractSubgraphFromNodes(nodes[0], allowInvalidNodes=True)
+    chunk_id = blocking.blockGridPosition(block_id)
+    group['inner_edge_ids'].write_chunk(chunk_id, inner_edges.astype('uint64'), True)
+    group['inner_uv_ids'].write_chunk(chunk_id, uv_ids[inner_edges].flatten().astype('uint64'), True)
+    group['inner_costs'].write_chunk(chunk_id, costs[inner_edges].astype('float32'), True)
+    group['outer_edge_ids'].write_chunk(chunk_id, outer_edges.astype('uint64'), True)
+
+
+def read_block_problem(group, blocking, block_id):
+    """ Read the serialized problem of the block.
+
+    Returns the inner edge ids, outer edge ids, uv-ids and costs of the inner edges.
+    """
+    chunk_id = blocking.blockGridPosition(block_id)
+
+    def _read(key, dtype):
+        data = group[key].read_chunk(chunk_id)
+        return np.zeros(0, dtype=dtype) if data is None else data
+
+    inner_edges = _read('inner_edge_ids', 'uint64')
+    outer_edges = _read('outer_edge_ids', 'uint64')
+    sub_uvs = _read('inner_uv_ids', 'uint64').reshape((-1, 2))
+    sub_costs = _read('inner_costs', 'float32')
+    assert len(inner_edges) == len(sub_uvs) == len(sub_costs)
+    return inner_edges, outer_edges, sub_uvs, sub_costs
+
+
+def serialize_block_problems(problem_path, scale, graph, uv_ids, costs, ignore_label,
+                             blocking, block_list, n_threads):
+    """ Serialize the problems of the blocks at the given scale.
+    """
+    group = z5py.File(problem_path)['s%i/sub_graphs' % scale]
+    require_subproblem_datasets(group)
+    with futures.ThreadPoolExecutor(n_threads) as tp:
+        tasks = [tp.submit(write_block_problem, group, blocking, block_id,
+                           graph, uv_ids, costs, ignore_label)
+                 for block_id in block_list]
+        [t.result() for t in tasks]
+
+
+def extract_subproblems(job_id, config_path):
+
+    fu.log("start processing job %i" % job_id)
+    fu.log("reading config from %s" % config_path)
+
+    # get the config
+    with open(config_path) as f:
+        config = json.load(f)
+    problem_path = config['problem_path']
+    scale = config['scale']
+    block_shape = config['block_shape']
+    block_list = config['block_list']
+    n_threads = config['threads_per_job']
+
+    fu.log("reading problem from %s" % problem_path)
+    problem = z5py.N5File(problem_path)
+    shape = problem['s0/graph'].attrs['shape']
+
+    costs_key = 's%i/costs' % scale
+    fu.log("reading costs from path in problem: %s" % costs_key)
+    ds = problem[costs_key]
+    ds.n_threads = n_threads
+    costs = ds[:]
+
+    graph_key = 's%i/graph' % scale
+    fu.log("reading graph from path in problem: %s" % graph_key)
+    graph = ndist.Graph(problem_path, graph_key, numberOfThreads=n_threads)
+    uv_ids = graph.uvIds()
+    ignore_label = problem[graph_key].attrs['ignore_label']
+
+    blocking = nt.blocking([0, 0, 0], shape, list(block_shape))
+    fu.log("serializing the problems of %i blocks" % len(block_list))
+    serialize_block_problems(problem_path, scale, graph, uv_ids, costs, ignore_label,
+                             blocking, block_list, n_threads)
+    fu.log_job_success(job_id)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1]
+    assert os.path.exists(path), path
+    job_id = int(os.path.split(path)[1].split('.')[0].split('_')[-1])
+    extract_subproblems(job_id, path)
@@ -2,8 +2,14 @@ import luigi
 
 from ..cluster_tasks import WorkflowBase
 from .. import write as write_tasks
+from . import extract_subproblems as extract_tasks
 from . import solve_subproblems as subproblem_tasks
 from . import reduce_problem as reduce_tasks
+from . import reduce_cut_edges as reduce_cut_tasks
+from . import reduce_merge_nodes as reduce_merge_tasks
+from . import reduce_node_labeling as reduce_labeling_tasks
+from . import reduce_contract_edges as reduce_contract_tasks
+from . import reduce_serialize_problem as reduce_serialize_tasks
 from . import solve_global as solve_tasks
 from . import sub_solutions as sub_tasks
 
@@ -11,45 +17,106 @@ from . import sub_solutions as sub_tasks
 class MulticutWorkflowBase(WorkflowBase):
     problem_path = luigi.Parameter()
     n_scales = luigi.IntParameter()
+    # serialize the block problems, so that the sub-problem jobs don't need to load the complete graph
+    local_subproblems = luigi.BoolParameter(default=False)
+    # reduce the problems with the blockwise reduce tasks instead of a single `ReduceProblem` job;
+    # the node merging and the serialization of the block problems still run in a single job,
+    # see `reduce_cut_edges.py`
+    blockwise_reduce = luigi.BoolParameter(default=False)
+
+    # tasks for the problem reduction
+    def _reduce_tasks(self, dependency, scale, serialize_subproblems):
+        if not self.blockwise_reduce:
+            reduce_task = getattr(reduce_tasks,
+                                  self._get_task_name('ReduceProblem'))
+            return reduce_task(tmp_folder=self.tmp_folder,
+                               max_jobs=self.max_jobs,
+                               config_dir=self.config_dir,
+                               problem_path=self.problem_path,
+                               scale=scale,
+                               serialize_subproblems=serialize_subproblems,
+                               dependency=dependency)
 
-    # tasks for the hierarchical solver solutions
-    def _hierarchical_tasks(self, dependency, n_scales):
+        dep = dependency
+        for module, name in ((reduce_cut_tasks, 'ReduceCutEdges'),
+                             (reduce_merge_tasks, 'ReduceMergeNodes'),
+                             (reduce_labeling_tasks, 'ReduceNodeLabeling'),
+                             (reduce_contract_tasks, 'ReduceContractEdges')):
+            task = getattr(module, self._get_task_name(name))
+            dep = task(tmp_folder=self.tmp_folder,
+                       max_jobs=self.max_jobs,
+                       config_dir=self.config_dir,
+                       problem_path=self.problem_path,
+                       scale=scale,
+                       dependency=dep)
+        serialize_task = getattr(reduce_serialize_tasks,
+                                 self._get_task_name('ReduceSerializeProblem'))
+        return serialize_task(tmp_folder=self.tmp_folder,
+                              max_jobs=self.max_jobs,
+                              config_dir=self.config_dir,
+                              problem_path=self.problem_path,
+                              scale=scale,
+                              serialize_subproblems=serialize_subproblems,
+                              dependency=dep)
+
+    # tasks for the hierarchical solver solutions,
+    # if `solve_last_scale` is set, the sub-problems of the last scale are solved as well
+    def _hierarchical_tasks(self, dependency, n_scales, solve_last_scale=False):
         subproblem_task = getattr(subproblem_tasks,
                                   self._get_task_name('SolveSubproblems'))
-        reduce_task = getattr(reduce_tasks,
-                              self._get_task_name('ReduceProblem'))
+        n_solved_scales = n_scales + 1 if solve_last_scale else n_scales
         dep = dependency
-        for scale in range(n_scales):
+        # the block problems of the first scale are extracted from the graph,
+        # the ones for the following scales are serialized when reducing the problem
+        if self.local_subproblems and n_solved_scales > 0:
+            extract_task = getattr(extract_tasks,
+                                   self._get_task_name('ExtractSubproblems'))
+            dep = extract_task(tmp_folder=self.tmp_folder,
+                               max_jobs=self.max_jobs,
+                               config_dir=self.config_dir,
+                               problem_path=self.problem_path,
+                               scale=0,
+                               dependency=dep)
+        for scale in range(n_solved_scales):
             dep = subproblem_task(tmp_folder=self.tmp_folder,
                                   max_jobs=self.max_jobs,
                                   config_dir=self.config_dir,
                                   problem_path=self.problem_path,
                                   scale=scale,
+                                  local_subproblems=self.local_subproblems,
                                   dependency=dep)
-            dep = reduce_task(tmp_folder=self.tmp_folder,
-                              max_jobs=self.max_jobs,
-                              config_dir=self.config_dir,
-                              problem_path=self.problem_path,
-                              scale=scale,
-                              dependency=dep)
+            if scale < n_scales:
+                dep = self._reduce_tasks(dep, scale,
+                                         serialize_subproblems=self.local_subproblems and
+                                         scale + 1 < n_solved_scales)
         return dep
 
     @staticmethod
     def get_config():
         configs = super(MulticutWorkflowBase, MulticutWorkflowBase).get_config()
-        configs.update({'solve_subproblems': subproblem_tasks.SolveSubproblemsLocal.default_task_config(),
-                        'reduce_problem': reduce_tasks.ReduceProblemLocal.default_task_config()})
+        configs.update({'extract_subproblems': extract_tasks.ExtractSubproblemsLocal.default_task_config(),
+                        'solve_subproblems': subproblem_tasks.SolveSubproblemsLocal.default_task_config(),
+                        'reduce_problem': reduce_tasks.ReduceProblemLocal.default_task_config(),
+                        'reduce_cut_edges': reduce_cut_tasks.ReduceCutEdgesLocal.default_task_config(),
+                        'reduce_merge_nodes': reduce_merge_tasks.ReduceMergeNodesLocal.default_task_config(),
+                        'reduce_node_labeling': reduce_labeling_tasks.ReduceNodeLabelingLocal.default_task_config(),
+                        'reduce_contract_edges': reduce_contract_tasks.ReduceContractEdgesLocal.default_task_config(),
+                        'reduce_serialize_problem':
+                        reduce_serialize_tasks.ReduceSerializeProblemLocal.default_task_config()})
         return configs
 
 
 class MulticutWorkflow(MulticutWorkflowBase):
     assignment_path = luigi.Parameter()
     assignment_key = luigi.Parameter()
+    # solve the sub-problems of the last scale and start the global solver from their solution
+    warmstart_global = luigi.BoolParameter(default=False)
 
     def requires(self):
         solve_task = getattr(solve_tasks,
                              self._get_task_name('SolveGlobal'))
-        dep = self._hierarchical_tasks(self.dependency, self.n_scales)
+        dep = self._hierarchical_tasks(self.dependency, self.n_scales,
+                                       solve_last_scale=self.warmstart_global)
         dep = solve_task(tmp_folder=self.tmp_folder,
                          max_jobs=self.max_jobs,
                          config_dir=self.config_dir,
@@ -57,6 +124,7 @@ class MulticutWorkflow(MulticutWorkflowBase):
                          assignment_path=self.assignment_path,
                          assignment_key=self.assignment_key,
                          scale=self.n_scales,
+                         warmstart=self.warmstart_global,
                          dependency=dep)
         return dep
 
@@ -0,0 +1,200 @@
+#! /bin/python
+
+import os
+import sys
+import json
+
+import numpy as np
+import luigi
+import z5py
+
+import cluster_tools.utils.volume_utils as vu
+import cluster_tools.utils.function_utils as fu
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
+from cluster_tools.multicut.reduce_cut_edges import REDUCE_KEY, require_job_dataset
+from cluster_tools.multicut.reduce_merge_nodes import edge_shards, edge_range
+
+#
+# Multicut Tasks
+#
+
+# the accumulation methods for the costs of the merged edges,
+# 'mean' is accumulated as sum and divided by the edge counts in the end
+ACCUMULATORS = {'sum': np.add, 'mean': np.add, 'max': np.maximum, 'min': np.minimum}
+
+
+class ReduceContractEdgesBase(luigi.Task):
+    """ ReduceContractEdges base class
+
+    Map the edges in ranges of edges to the new nodes and accumulate the costs of the new edges.
+    The new edges of each job are split by their first node into as many buckets as there
+    are jobs, which are merged by `ReduceSerializeProblem`.
+    """
+
+    task_name = 'reduce_contract_edges'
+    src_file = os.path.abspath(__file__)
+    allow_retry = False
+
+    # input volumes and graph
+    problem_path = luigi.Parameter()
+    scale = luigi.IntParameter()
+    #
+    dependency = luigi.TaskParameter()
+
+    def requires(self):
+        return self.dependency
+
+    @staticmethod
+    def default_task_config():
+        # we use this to get also get the common default config
+        config = LocalTask.default_task_config()
+        config.update({'accumulation_method': 'sum'})
+        return config
+
+    def run_impl(self):
+        # get the global config and init configs
+        shebang = self.global_config_values()[0]
+        self.init(shebang)
+
+        with vu.file_reader(self.problem_path, 'r') as f:
+            n_edges = f['s%i/graph' % self.scale].attrs['numberOfEdges']
+
+        config = self.get_task_config()
+        assert config['accumulation_method'] in ACCUMULATORS, config['accumulation_method']
+        edge_chunk_size, edge_block_list = edge_shards(n_edges)
+        config.update({'problem_path': self.problem_path, 'scale': self.scale,
+                       'n_edges': n_edges, 'edge_chunk_size': edge_chunk_size})
+
+        n_jobs = min(len(edge_block_list), self.max_jobs)
+        shape = (len(edge_block_list),) * 2
+        group_key = REDUCE_KEY % self.scale
+        require_job_dataset(self.problem_path, group_key, 'edges', shape, n_jobs)
+        require_job_dataset(self.problem_path, group_key, 'edge_values', shape, n_jobs, dtype='float64')
+        # the accumulation method is needed to merge the results of the jobs in `ReduceSerializeProblem`
+        with vu.file_reader(self.problem_path) as f:
+            f[group_key].attrs['accumulation_method'] = config['accumulation_method']
+
+        # prime and run the jobs
+        prefix = 's%i' % self.scale
+        self.prepare_jobs(n_jobs, edge_block_list, config, prefix, consecutive_blocks=True)
+        self.submit_jobs(n_jobs, prefix)
+
+        # wait till jobs finish and check for job success
+        self.wait_for_jobs()
+        self.check_jobs(n_jobs, prefix)
+
+    # part of the luigi API
+    def output(self):
+        return luigi.LocalTarget(os.path.join(self.tmp_folder,
+                                              self.task_name + '_s%i.log' % self.scale))
+
+
+class ReduceContractEdgesLocal(ReduceContractEdgesBase, LocalTask):
+    """ ReduceContractEdges on local machine
+    """
+    pass
+
+
+class ReduceContractEdgesLocalPool(ReduceContractEdgesBase, LocalPoolTask):
+    """ ReduceContractEdges on local machine with persistent worker pool
+    """
+    pass
+
+
+class ReduceContractEdgesSlurm(ReduceContractEdgesBase, SlurmTask):
+    """ ReduceContractEdges on slurm cluster
+    """
+    pass
+
+
+class ReduceContractEdgesLSF(ReduceContractEdgesBase, LSFTask):
+    """ ReduceContractEdges on lsf cluster
+    """
+    pass
+
+
+#
+# Implementation
+#
+
+
+def accumulate_edges(uv_ids, values, counts, accumulation_method):
+    """ Accumulate the values and counts of duplicate edges.
+
+    Returns the unique edges in lexicographical order and their values and counts.
+    """
+    if len(uv_ids) == 0:
+        return uv_ids, values, counts
+    order = np.lexsort((uv_ids[:, 1], uv_ids[:, 0]))
+    uv_ids, values, counts = uv_ids[order], values[order], counts[order]
+    starts = np.concatenate([[0], np.where((uv_ids[1:] != uv_ids[:-1]).any(axis=1))[0] + 1])
+    accumulator = ACCUMULATORS[accumulation_method]
+    return uv_ids[starts], accumulator.reduceat(values, starts), np.add.reduceat(counts, starts)
+
+
+def contract_edge_range(uv_ids, costs, node_labeling, accumulation_method):
+    """ Map the edges to the new nodes and accumulate the costs of the new edges.
+
+    Returns the new edges and their partially accumulated costs and edge counts.
+    """
+    new_uv_ids = np.sort(node_labeling[uv_ids], axis=1)
+    # merged edges are not part of the new problem
+    keep_edges = new_uv_ids[:, 0] != new_uv_ids[:, 1]
+    return accumulate_edges(new_uv_ids[keep_edges], costs[keep_edges].astype('float64'),
+                            np.ones(int(keep_edges.sum()), dtype='float64'), accumulation_method)
+
+
+def reduce_contract_edges(job_id, config_path):
+
+    fu.log("start processing job %i" % job_id)
+    fu.log("reading config from %s" % config_path)
+
+    # get the config
+    with open(config_path) as f:
+        config = json.load(f)
+    problem_path = config['problem_path']
+    scale = config['scale']
+    n_threads = config['threads_per_job']
+    accumulation_method = config.get('accumulation_method', 'sum')
+    edge_begin, edge_end = edge_range(config)
+
+    problem = z5py.File(problem_path)
+    ds = problem['s%i/graph/edges' % scale]
+    ds.n_threads = n_threads
+    uv_ids = ds[edge_begin:edge_end]
+
+    ds = problem['s%i/costs' % scale]
+    ds.n_threads = n_threads
+    costs = ds[edge_begin:edge_end]
+
+    reduce_group = problem[REDUCE_KEY % scale]
+    ds = reduce_group['node_labeling']
+    ds.n_threads = n_threads
+    node_labeling = ds[:]
+    n_new_nodes = reduce_group.attrs['numberOfNodes']
+
+    new_uv_ids, values, counts = contract_edge_range(uv_ids, costs, node_labeling, accumulation_method)
+    fu.log("contracted %i edges in range %i to %i to %i new edges" % (len(uv_ids), edge_begin,
+                                                                      edge_end, len(new_uv_ids)))
+
+    # split the new edges into buckets according to their first node
+    ds_edges, ds_values = reduce_group['edges'], reduce_group['edge_values']
+    n_buckets = ds_edges.attrs['n_jobs']
+    buckets = (new_uv_ids[:, 0] * n_buckets) // n_new_nodes
+    bucket_bounds = np.searchsorted(buckets, np.arange(n_buckets + 1))
+    for bucket_id in range(n_buckets):
+        begin, end = bucket_bounds[bucket_id], bucket_bounds[bucket_id + 1]
+        if begin == end:
+            continue
+        ds_edges.write_chunk((job_id, bucket_id), new_uv_ids[begin:end].flatten(), True)
+        ds_values.write_chunk((job_id, bucket_id),
+                              np.stack([values[begin:end], counts[begin:end]], axis=1).flatten(), True)
+
+    fu.log_job_success(job_id)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1]
+    assert os.path.exists(path), path
+    job_id = int(os.path.split(path)[1].split('.')[0].split('_')[-1])
+    reduce_contract_edges(job_id, path)
@@ -0,0 +1,183 @@
+#! /bin/python
+
+import os
+import sys
+import json
+from concurrent import futures
+from shutil import rmtree
+
+import numpy as np
+import luigi
+import z5py
+import nifty.tools as nt
+
+import cluster_tools.utils.volume_utils as vu
+import cluster_tools.utils.function_utils as fu
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
+
+#
+# Multicut Tasks
+#
+
+# The blockwise problem reduction is the distributed version of `ReduceProblem`.
+# It consists of the following tasks, which exchange their results via the
+# datasets in 's<scale>/reduce' of the problem container:
+# - ReduceCutEdges: collect the cut edges of the sub-problems (blockwise)
+# - ReduceMergeNodes: find the node merges for edge ranges (sharded over the edges)
+# - ReduceNodeLabeling: merge the nodes and serialize the new node labeling (single job),
+#   then serialize the new sub-graphs (blockwise)
+# - ReduceContractEdges: map the edges to the new nodes and accumulate their costs (sharded over the edges)
+# - ReduceSerializeProblem: merge the new edges and costs (sharded over the node buckets),
+#   then serialize the reduced problem (sharded over the new edges)
+# The node merging in ReduceNodeLabeling and the serialization of the block problems
+# for the next scale in ReduceSerializeProblem still run in a single job; they need memory
+# proportional to the number of nodes, respectively to the reduced graph.
+REDUCE_KEY = 's%i/reduce'
+
+
+class ReduceCutEdgesBase(luigi.Task):
+    """ ReduceCutEdges base class
+
+    Collect the cut edges of the sub-problems; each job writes the cut edges
+    of its blocks to one chunk of 's<scale>/reduce/cut_edge_ids'.
+    """
+
+    task_name = 'reduce_cut_edges'
+    src_file = os.path.abspath(__file__)
+    allow_retry = False
+
+    # input volumes and graph
+    problem_path = luigi.Parameter()
+    scale = luigi.IntParameter()
+    #
+    dependency = luigi.TaskParameter()
+
+    def requires(self):
+        return self.dependency
+
+    def run_impl(self):
+        # get the global config and init configs
+        shebang, block_shape, roi_begin, roi_end = self.global_config_values()
+        self.init(shebang)
+
+        with vu.file_reader(self.problem_path, 'r') as f:
+            shape = tuple(f['s0/graph'].attrs['shape'])
+
+        factor = 2**self.scale
+        block_shape = tuple(bs * factor for bs in block_shape)
+
+        config = self.get_task_config()
+        config.update({'problem_path': self.problem_path, 'scale': self.scale,
+                       'block_shape': block_shape})
+
+        # remove the results of a previous reduction
+        rmtree(os.path.join(self.problem_path, REDUCE_KEY % self.scale), ignore_errors=True)
+
+        block_list = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end)
+        n_jobs = min(len(block_list), self.max_jobs)
+        require_job_dataset(self.problem_path, REDUCE_KEY % self.scale, 'cut_edge_ids',
+                            (len(block_list),), n_jobs)
+
+        # prime and run the jobs
+        prefix = 's%i' % self.scale
+        self.prepare_jobs(n_jobs, block_list, config, prefix)
+        self.submit_jobs(n_jobs, prefix)
+
+        # wait till jobs finish and check for job success
+        self.wait_for_jobs()
+        self.check_jobs(n_jobs, prefix)
+
+    # part of the luigi API
+    def output(self):
+        return luigi.LocalTarget(os.path.join(self.tmp_folder,
+                                              self.task_name + '_s%i.log' % self.scale))
+
+
+class ReduceCutEdgesLocal(ReduceCutEdgesBase, LocalTask):
+    """ ReduceCutEdges on local machine
+    """
+    pass
+
+
+class ReduceCutEdgesLocalPool(ReduceCutEdgesBase, LocalPoolTask):
+    """ ReduceCutEdges on local machine with persistent worker pool
+    """
+    pass
+
+
+class ReduceCutEdgesSlurm(ReduceCutEdgesBase, SlurmTask):
+    """ ReduceCutEdges on slurm cluster
+    """
+    pass
+
+
+class ReduceCutEdgesLSF(ReduceCutEdgesBase, LSFTask):
+    """ ReduceCutEdges on lsf cluster
+    """
+    pass
+
+
+#
+# Implementation
+#
+
+
+def require_job_dataset(path, group_key, name, shape, n_jobs, dtype='uint64'):
+    """ Require the varlen dataset for the results of the jobs of a reduce task.
+
+    The shape does not depend on the number of jobs, so that the dataset can be re-used
+    for different numbers of jobs; the number of jobs of the last run is stored in the attributes.
+    """
+    with vu.file_reader(path) as f:
+        ds = f.require_group(group_key).require_dataset(name, shape=shape, chunks=(1,) * len(shape),
+                                                        compression='gzip', dtype=dtype)
+        ds.attrs['n_jobs'] = n_jobs
+
+
+def read_job_chunks(ds, index=()):
+    """ Read the results of all jobs from the dataset, missing results are skipped.
+    """
+    chunks = [ds.read_chunk((job_id,) + index) for job_id in range(ds.attrs['n_jobs'])]
+    return [chunk for chunk in chunks if chunk is not None]
+
+
+def reduce_cut_edges(job_id, config_path):
+
+    fu.log("start processing job %i" % job_id)
+    fu.log("reading config from %s" % config_path)
+
+    # get the config
+    with open(config_path) as f:
+        config = json.load(f)
+    problem_path = config['problem_path']
+    scale = config['scale']
+    block_shape = config['block_shape']
+    block_list = config['block_list']
+    n_threads = config['threads_per_job']
+
+    problem = z5py.File(problem_path)
+    shape = problem['s0/graph'].attrs['shape']
+    blocking = nt.blocking([0, 0, 0], shape, list(block_shape))
+
+    ds = problem['s%i/sub_results/cut_edge_ids' % scale]
+
+    def _load_block_res(block_id):
+        return ds.read_chunk(blocking.blockGridPosition(block_id))
+
+    with futures.ThreadPoolExecutor(n_threads) as tp:
+        cut_edge_ids = list(tp.map(_load_block_res, block_list))
+    cut_edge_ids = [ids for ids in cut_edge_ids if ids is not None]
+
+    if cut_edge_ids:
+        cut_edge_ids = np.unique(np.concatenate(cut_edge_ids))
+        fu.log("serializing %i cut edges" % len(cut_edge_ids))
+        problem[REDUCE_KEY % scale]['cut_edge_ids'].write_chunk((job_id,), cut_edge_ids, True)
+
+    fu.log_job_success(job_id)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1]
+    assert os.path.exists(path), path
+    job_id = int(os.path.split(path)[1].split('.')[0].split('_')[-1])
+    reduce_cut_edges(job_id, path)
@@ -0,0 +1,185 @@
+#! /bin/python
+
+import os
+import sys
+import json
+
+import numpy as np
+import luigi
+import z5py
+import nifty.tools as nt
+import nifty.ufd as nufd
+
+import cluster_tools.utils.volume_utils as vu
+import cluster_tools.utils.function_utils as fu
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
+from cluster_tools.multicut.reduce_cut_edges import REDUCE_KEY, require_job_dataset, read_job_chunks
+
+#
+# Multicut Tasks
+#
+
+
+class ReduceMergeNodesBase(luigi.Task):
+    """ ReduceMergeNodes base class
+
+    Find the node merges for ranges of edges; each job merges the edges in its range
+    that were not cut in any sub-problem and writes the resulting pairs of nodes and
+    representatives to one chunk of 's<scale>/reduce/node_merges'.
+    """
+
+    task_name = 'reduce_merge_nodes'
+    src_file = os.path.abspath(__file__)
+    allow_retry = False
+
+    # input volumes and graph
+    problem_path = luigi.Parameter()
+    scale = luigi.IntParameter()
+    #
+    dependency = luigi.TaskParameter()
+
+    def requires(self):
+        return self.dependency
+
+    def run_impl(self):
+        # get the global config and init configs
+        shebang = self.global_config_values()[0]
+        self.init(shebang)
+
+        with vu.file_reader(self.problem_path, 'r') as f:
+            n_edges = f['s%i/graph' % self.scale].attrs['numberOfEdges']
+
+        config = self.get_task_config()
+        edge_chunk_size, edge_block_list = edge_shards(n_edges)
+        config.update({'problem_path': self.problem_path, 'scale': self.scale,
+                       'n_edges': n_edges, 'edge_chunk_size': edge_chunk_size})
+
+        n_jobs = min(len(edge_block_list), self.max_jobs)
+        require_job_dataset(self.problem_path, REDUCE_KEY % self.scale, 'node_merges',
+                            (len(edge_block_list),), n_jobs)
+
+        # prime and run the jobs
+        prefix = 's%i' % self.scale
+        self.prepare_jobs(n_jobs, edge_block_list, config, prefix, consecutive_blocks=True)
+        self.submit_jobs(n_jobs, prefix)
+
+        # wait till jobs finish and check for job success
+        self.wait_for_jobs()
+        self.check_jobs(n_jobs, prefix)
+
+    # part of the luigi API
+    def output(self):
+        return luigi.LocalTarget(os.path.join(self.tmp_folder,
+                                              self.task_name + '_s%i.log' % self.scale))
+
+
+class ReduceMergeNodesLocal(ReduceMergeNodesBase, LocalTask):
+    """ ReduceMergeNodes on local machine
+    """
+    pass
+
+
+class ReduceMergeNodesLocalPool(ReduceMergeNodesBase, LocalPoolTask):
+    """ ReduceMergeNodes on local machine with persistent worker pool
+    """
+    pass
+
+
+class ReduceMergeNodesSlurm(ReduceMergeNodesBase, SlurmTask):
+    """ ReduceMergeNodes on slurm cluster
+    """
+    pass
+
+
+class ReduceMergeNodesLSF(ReduceMergeNodesBase, LSFTask):
+    """ ReduceMergeNodes on lsf cluster
+    """
+    pass
+
+
+#
+# Implementation
+#
+
+
+def edge_shards(n_edges):
+    """ Get the chunk size and the blocks for processing the edges in consecutive ranges.
+    """
+    edge_chunk_size = min(262144, n_edges)  # chunk size = 64**3
+    return edge_chunk_size, vu.blocks_in_volume([n_edges], [edge_chunk_size])
+
+
+def edge_range(config):
+    """ Get the range of edges of the job, the edge blocks of a job are consecutive.
+    """
+    edge_block_list = config['block_list']
+    assert (np.diff(edge_block_list) == 1).all()
+    edge_blocking = nt.blocking([0], [config['n_edges']], [config['edge_chunk_size']])
+    return (edge_blocking.getBlock(edge_block_list[0]).begin[0],
+            edge_blocking.getBlock(edge_block_list[-1]).end[0])
+
+
+def _load_cut_edges(ds, edge_begin, edge_end):
+    # the cut edges of the jobs of `ReduceCutEdges` are sorted
+    cut_edge_ids = []
+    for ids in read_job_chunks(ds):
+        begin, end = np.searchsorted(ids, [edge_begin, edge_end])
+        cut_edge_ids.append(ids[begin:end])
+    return np.concatenate(cut_edge_ids) if cut_edge_ids else np.zeros(0, dtype='uint64')
+
+
+def merge_edge_range(uv_ids, cut_edge_ids, edge_begin):
+    """ Merge the nodes of the edges in the range that are not cut.
+
+    Returns the merged nodes and their representatives as (n, 2) array.
+    """
+    merge_edges = np.ones(len(uv_ids), dtype='bool')
+    merge_edges[cut_edge_ids.astype('int64') - edge_begin] = False
+    merge_uvs = uv_ids[merge_edges]
+    if len(merge_uvs) == 0:
+        return np.zeros((0, 2), dtype='uint64')
+
+    nodes = np.unique(merge_uvs)
+    ufd = nufd.boost_ufd(nodes)
+    ufd.merge(merge_uvs)
+    representatives = ufd.find(nodes)
+    merged = nodes != representatives
+    return np.stack([nodes[merged], representatives[merged]], axis=1).astype('uint64')
+
+
+def reduce_merge_nodes(job_id, config_path):
+
+    fu.log("start processing job %i" % job_id)
+    fu.log("reading config from %s" % config_path)
+
+    # get the config
+    with open(config_path) as f:
+        config = json.load(f)
+    problem_path = config['problem_path']
+    scale = config['scale']
+    n_threads = config['threads_per_job']
+    edge_begin, edge_end = edge_range(config)
+
+    problem = z5py.File(problem_path)
+    ds = problem['s%i/graph/edges' % scale]
+    ds.n_threads = n_threads
+    uv_ids = ds[edge_begin:edge_end]
+
+    reduce_group = problem[REDUCE_KEY % scale]
+    cut_edge_ids = _load_cut_edges(reduce_group['cut_edge_ids'], edge_begin, edge_end)
+    fu.log("merging %i / %i edges in range %i to %i" % (len(uv_ids) - len(cut_edge_ids), len(uv_ids),
+                                                        edge_begin, edge_end))
+
+    node_merges = merge_edge_range(uv_ids, cut_edge_ids, edge_begin)
+    if len(node_merges) > 0:
+        fu.log("serializing %i node merges" % len(node_merges))
+        reduce_group['node_merges'].write_chunk((job_id,), node_merges.flatten(), True)
+
+    fu.log_job_success(job_id)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1]
+    assert os.path.exists(path), path
+    job_id = int(os.path.split(path)[1].split('.')[0].split('_')[-1])
+    reduce_merge_nodes(job_id, path)
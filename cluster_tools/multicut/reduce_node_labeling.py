@@ -0,0 +1,237 @@
+#! /bin/python
+
+import os
+import sys
+import json
+from concurrent import futures
+
+import numpy as np
+import luigi
+import z5py
+import nifty.tools as nt
+import nifty.ufd as nufd
+from vigra.analysis import relabelConsecutive
+
+import cluster_tools.utils.volume_utils as vu
+import cluster_tools.utils.function_utils as fu
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
+from cluster_tools.multicut.reduce_cut_edges import REDUCE_KEY, read_job_chunks
+from cluster_tools.multicut.reduce_problem import serialize_array
+
+#
+# Multicut Tasks
+#
+
+
+class ReduceNodeLabelingBase(luigi.Task):
+    """ ReduceNodeLabeling base class
+
+    Merge the nodes according to the node merges of `ReduceMergeNodes` and serialize
+    the node labeling and the sub-graph nodes of the next scale.
+    The nodes are merged with a union find over all nodes in a single job ('labeling' pass),
+    so its memory is proportional to the number of nodes; the sub-graph nodes
+    are serialized blockwise ('sub_graphs' pass).
+    """
+
+    task_name = 'reduce_node_labeling'
+    src_file = os.path.abspath(__file__)
+    allow_retry = False
+
+    # input volumes and graph
+    problem_path = luigi.Parameter()
+    scale = luigi.IntParameter()
+    #
+    dependency = luigi.TaskParameter()
+
+    def requires(self):
+        return self.dependency
+
+    def _run_pass(self, n_jobs, block_list, config, prefix):
+        self.prepare_jobs(n_jobs, block_list, config, prefix)
+        self.submit_jobs(n_jobs, prefix)
+        self.wait_for_jobs(prefix)
+        self.check_jobs(n_jobs, prefix)
+
+    def run_impl(self):
+        # get the global config and init configs
+        shebang, block_shape, roi_begin, roi_end = self.global_config_values()
+        self.init(shebang)
+
+        config = self.get_task_config()
+        config.update({'problem_path': self.problem_path, 'scale': self.scale,
+                       'block_shape': block_shape})
+
+        # merge the nodes in a single job
+        prefix = 's%i_labeling' % self.scale
+        self._run_pass(1, None, dict(config, labeling_pass='labeling'), prefix)
+
+        # serialize the nodes of the new sub-graphs blockwise
+        with vu.file_reader(self.problem_path) as f:
+            shape = f['s%i/graph' % self.scale].attrs['shape']
+            new_block_shape = [2**(self.scale + 1) * bs for bs in block_shape]
+            f.require_group('s%i/sub_graphs' % (self.scale + 1,)).require_dataset('nodes', shape=shape,
+                                                                                 chunks=new_block_shape,
+                                                                                 compression='gzip',
+                                                                                 dtype='uint64')
+        block_list = vu.blocks_in_volume(shape, new_block_shape, roi_begin, roi_end)
+        n_jobs = min(len(block_list), self.max_jobs)
+        prefix = 's%i_sub_graphs' % self.scale
+        self._run_pass(n_jobs, block_list, dict(config, labeling_pass='sub_graphs'), prefix)
+
+    # part of the luigi API
+    def output(self):
+        return luigi.LocalTarget(os.path.join(self.tmp_folder,
+                                              self.task_name + '_s%i.log' % self.scale))
+
+
+class ReduceNodeLabelingLocal(ReduceNodeLabelingBase, LocalTask):
+    """ ReduceNodeLabeling on local machine
+    """
+    pass
+
+
+class ReduceNodeLabelingLocalPool(ReduceNodeLabelingBase, LocalPoolTask):
+    """ ReduceNodeLabeling on local machine with persistent worker pool
+    """
+    pass
+
+
+class ReduceNodeLabelingSlurm(ReduceNodeLabelingBase, SlurmTask):
+    """ ReduceNodeLabeling on slurm cluster
+    """
+    pass
+
+
+class ReduceNodeLabelingLSF(ReduceNodeLabelingBase, LSFTask):
+    """ ReduceNodeLabeling on lsf cluster
+    """
+    pass
+
+
+#
+# Implementation
+#
+
+
+def _merge_nodes(nodes, ds_merges, initial_node_labeling):
+    # merge the node pairs of all edge ranges with ufd
+    ufd = nufd.boost_ufd(nodes)
+    for node_merges in read_job_chunks(ds_merges):
+        ufd.merge(node_merges.reshape((-1, 2)))
+
+    # get the node results and label them consecutively,
+    # this results in the same labeling as `ReduceProblem`
+    node_labeling = ufd.find(nodes)
+    node_labeling, max_new_id, _ = relabelConsecutive(node_labeling, start_label=0,
+                                                      keep_zeros=False)
+    assert node_labeling[0] == 0
+    n_new_nodes = max_new_id + 1
+    fu.log("have %i nodes in new node labeling" % n_new_nodes)
+
+    # get the labeling of initial nodes
+    if initial_node_labeling is None:
+        # in the first scale, the graph nodes might not be consecutive / not start at zero,
+        # see `reduce_problem._merge_nodes`
+        node_max_id = int(nodes.max())
+        if node_max_id + 1 != len(nodes):
+            fu.log("nodes are not consecutve and/or don't start at zero")
+            fu.log("inflating node labels accordingly")
+            node_labeling = nt.inflateLabeling(nodes, node_labeling, node_max_id)
+        new_initial_node_labeling = node_labeling
+    else:
+        fu.log("mapping new node labeling to labeling of inital (= scale 0) nodes")
+        new_initial_node_labeling = node_labeling[initial_node_labeling]
+        assert len(new_initial_node_labeling) == len(initial_node_labeling)
+
+    return n_new_nodes, node_labeling, new_initial_node_labeling
+
+
+def _serialize_new_sub_graphs(problem, node_labeling, shape, scale, initial_block_shape,
+                              block_ids, n_threads):
+    # the nodes of the new blocks are the merged nodes of the blocks they contain
+    block_shape = [2**scale * bs for bs in initial_block_shape]
+    new_block_shape = [2**(scale + 1) * bs for bs in initial_block_shape]
+    blocking = nt.blocking([0, 0, 0], list(shape), block_shape)
+    new_blocking = nt.blocking([0, 0, 0], list(shape), new_block_shape)
+
+    ds_nodes = problem['s%i/sub_graphs/nodes' % scale]
+    ds_out = problem['s%i/sub_graphs/nodes' % (scale + 1,)]
+
+    def _serialize_block(block_id):
+        block = new_blocking.getBlock(block_id)
+        block_list = blocking.getBlockIdsInBoundingBox(roiBegin=block.begin, roiEnd=block.end,
+                                                       blockHalo=[0, 0, 0])
+        nodes = [ds_nodes.read_chunk(blocking.blockGridPosition(sub_block_id))
+                 for sub_block_id in block_list]
+        nodes = [block_nodes for block_nodes in nodes if block_nodes is not None]
+        if not nodes:
+            return
+        new_nodes = np.unique(node_labeling[np.concatenate(nodes)])
+        ds_out.write_chunk(new_blocking.blockGridPosition(block_id), new_nodes, True)
+
+    with futures.ThreadPoolExecutor(n_threads) as tp:
+        tasks = [tp.submit(_serialize_block, block_id) for block_id in block_ids]
+        [t.result() for t in tasks]
+
+
+def _serialize_node_labeling(problem, problem_path, scale, n_threads):
+    group = problem['s%i/graph' % scale]
+
+    # we only need to load the nodes for scale 0
+    # otherwise, we already know that they are consecutive
+    if scale == 0:
+        ds = group['nodes']
+        ds.n_threads = n_threads
+        nodes = ds[:]
+        initial_node_labeling = None
+    else:
+        nodes = np.arange(group.attrs['numberOfNodes'], dtype='uint64')
+        ds = problem['s%i/node_labeling' % scale]
+        ds.n_threads = n_threads
+        initial_node_labeling = ds[:]
+
+    fu.log("merge nodes")
+    reduce_group = problem[REDUCE_KEY % scale]
+    n_new_nodes, node_labeling, new_initial_node_labeling = _merge_nodes(nodes, reduce_group['node_merges'],
+                                                                         initial_node_labeling)
+
+    # serialize the node labelings, the one for this scale is needed by `ReduceContractEdges`
+    # and for the new sub-graphs
+    fu.log("serialize new node labeling to %s/s%i" % (problem_path, scale + 1))
+    serialize_array(reduce_group, 'node_labeling', node_labeling, n_threads)
+    reduce_group.attrs['numberOfNodes'] = n_new_nodes
+    serialize_array(problem.require_group('s%i' % (scale + 1,)), 'node_labeling',
+                    new_initial_node_labeling, n_threads)
+
+
+def reduce_node_labeling(job_id, config_path):
+
+    fu.log("start processing job %i" % job_id)
+    fu.log("reading config from %s" % config_path)
+
+    # get the config
+    with open(config_path) as f:
+        config = json.load(f)
+    problem_path = config['problem_path']
+    scale = config['scale']
+    n_threads = config['threads_per_job']
+
+    problem = z5py.File(problem_path)
+    if config['labeling_pass'] == 'labeling':
+        _serialize_node_labeling(problem, problem_path, scale, n_threads)
+    else:
+        fu.log("serialize new sub-graphs")
+        ds = problem[REDUCE_KEY % scale]['node_labeling']
+        ds.n_threads = n_threads
+        node_labeling = ds[:]
+        shape = problem['s%i/graph' % scale].attrs['shape']
+        _serialize_new_sub_graphs(problem, node_labeling, shape, scale, config['block_shape'],
+                                  config['block_list'], n_threads)
+    fu.log_job_success(job_id)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1]
+    assert os.path.exists(path), path
+    job_id = int(os.path.split(path)[1].split('.')[0].split('_')[-1])
+    reduce_node_labeling(job_id, path)
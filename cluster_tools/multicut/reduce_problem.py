@@ -16,7 +16,8 @@ from vigra.analysis import relabelConsecutive
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
+from cluster_tools.multicut.extract_subproblems import serialize_block_problems
 
 #
 # Multicut Tasks
@@ -34,6 +35,8 @@ class ReduceProblemBase(luigi.Task):
     # input volumes and graph
     problem_path = luigi.Parameter()
     scale = luigi.IntParameter()
+    # serialize the block problems of the next scale for `SolveSubproblems`
+    serialize_subproblems = luigi.BoolParameter(default=False)
     #
     dependency = luigi.TaskParameter()
 
@@ -69,7 +72,7 @@ class ReduceProblemBase(luigi.Task):
         # update the config with input and graph paths and keys
         # as well as block shape
         config.update({'problem_path': self.problem_path, 'scale': self.scale,
-                       'block_shape': block_shape})
+                       'block_shape': block_shape, 'serialize_subproblems': self.serialize_subproblems})
         if roi_begin is not None:
             assert roi_end is not None
             config.update({'roi_begin': roi_begin,
@@ -106,6 +109,12 @@ class ReduceProblemLocal(ReduceProblemBase, LocalTask):
     pass
 
 
+class ReduceProblemLocalPool(ReduceProblemBase, LocalPoolTask):
+    """ ReduceProblem on local machine with persistent worker pool
+    """
+    pass
+
+
 class ReduceProblemSlurm(ReduceProblemBase, SlurmTask):
     """ ReduceProblem on slurm cluster
     """
@@ -217,6 +226,17 @@ def _get_new_edges(uv_ids, node_labeling, costs, accumulation_method, n_threads)
     return new_uv_ids, edge_labeling, new_costs
 
 
+def serialize_array(out_group, name, data, n_threads, dtype='uint64'):
+    """ Serialize the node or edge array to the dataset `name` in the group.
+    """
+    ser_chunks = (min(data.shape[0], 262144), 2) if data.ndim == 2 else\
+        (min(data.shape[0], 262144),)
+    ds_ser = out_group.require_dataset(name, dtype=dtype, shape=data.shape,
+                                       chunks=ser_chunks, compression='gzip')
+    ds_ser.n_threads = n_threads
+    ds_ser[:] = data
+
+
 def _serialize_new_problem(problem_path,
                            n_new_nodes, new_uv_ids,
                            node_labeling, edge_labeling,
@@ -238,9 +258,8 @@ def _serialize_new_problem(problem_path,
     new_factor = 2**(scale + 1)
     new_block_shape = [new_factor * bs for bs in initial_block_shape]
 
-    # NOTE we do not need to serialize the sub-edges in the current implementation
-    # of the blockwise multicut workflow, because we always load the full graph
-    # in 'solve_subproblems'
+    # NOTE we do not need to serialize the sub-edges, because 'solve_subproblems'
+    # either loads the full graph or the block problems serialized by `serialize_reduced_subproblems`
 
     # serialize the new sub-graphs
     block_ids = vu.blocks_in_volume(shape, new_block_shape, roi_begin, roi_end)
@@ -270,26 +289,33 @@ def _serialize_new_problem(problem_path,
     graph_out.attrs['numberOfEdges'] = n_new_edges
     graph_out.attrs['shape'] = shape
 
-    def _serialize(out_group, name, data, dtype='uint64'):
-        ser_chunks = (min(data.shape[0], 262144), 2) if data.ndim == 2 else\
-            (min(data.shape[0], 262144),)
-        ds_ser = out_group.require_dataset(name, dtype=dtype, shape=data.shape,
-                                           chunks=ser_chunks, compression='gzip')
-        ds_ser.n_threads = n_threads
-        ds_ser[:] = data
-
     # NOTE we don not need to serialize the nodes cause they are
     # consecutive anyway
     # _serialize('nodes', np.arange(n_new_nodes).astype('uint64'))
 
     # serialize the new graph, the node labeling and the new costs
-    _serialize(graph_out, 'edges', new_uv_ids)
-    _serialize(g_out, 'node_labeling', new_initial_node_labeling)
-    _serialize(g_out, 'costs', new_costs, dtype='float32')
+    serialize_array(graph_out, 'edges', new_uv_ids, n_threads)
+    serialize_array(g_out, 'node_labeling', new_initial_node_labeling, n_threads)
+    serialize_array(g_out, 'costs', new_costs, n_threads, dtype='float32')
 
     return n_new_edges
 
 
+def serialize_reduced_subproblems(problem_path, new_uv_ids, new_costs, shape, scale,
+                                  initial_block_shape, n_threads, roi_begin, roi_end):
+    next_scale = scale + 1
+    with vu.file_reader(problem_path, 'r') as f:
+        ignore_label = f['s%i/graph' % scale].attrs['ignore_label']
+
+    new_block_shape = [2**next_scale * bs for bs in initial_block_shape]
+    blocking = nt.blocking([0, 0, 0], list(shape), new_block_shape)
+    block_ids = vu.blocks_in_volume(shape, new_block_shape, roi_begin, roi_end)
+
+    graph = ndist.Graph(new_uv_ids)
+    serialize_block_problems(problem_path, next_scale, graph, new_uv_ids, new_costs, ignore_label,
+                             blocking, block_ids, n_threads)
+
+
 def reduce_problem(job_id, config_path):
 
     fu.log("start processing job %i" % job_id)
@@ -306,6 +332,7 @@ def reduce_problem(job_id, config_path):
     n_threads = config['threads_per_job']
     roi_begin = config.get('roi_begin', None)
     roi_end = config.get('roi_end', None)
+    serialize_subproblems = config.get('serialize_subproblems', False)
 
     # get the number of nodes and uv-ids at this scale level
     # as well as the initial node labeling
@@ -370,6 +397,10 @@ def reduce_problem(job_id, config_path):
                                          new_costs, new_initial_node_labeling,
                                          shape, scale, initial_block_shape,
                                          n_threads, roi_begin, roi_end)
+    if serialize_subproblems:
+        fu.log("serialize the block problems for scale %i" % (scale + 1,))
+        serialize_reduced_subproblems(problem_path, new_uv_ids, new_costs, shape, scale,
+                                      initial_block_shape, n_threads, roi_begin, roi_end)
 
     fu.log("Reduced graph from %i to %i nodes; %i to %i edges." % (n_nodes, n_new_nodes,
                                                                    n_edges, n_new_edges))
@@ -0,0 +1,257 @@
+#! /bin/python
+
+import os
+import sys
+import json
+
+import numpy as np
+import luigi
+import z5py
+
+import cluster_tools.utils.volume_utils as vu
+import cluster_tools.utils.function_utils as fu
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
+from cluster_tools.multicut.reduce_cut_edges import REDUCE_KEY, read_job_chunks, require_job_dataset
+from cluster_tools.multicut.reduce_merge_nodes import edge_shards, edge_range
+from cluster_tools.multicut.reduce_contract_edges import accumulate_edges
+from cluster_tools.multicut.reduce_problem import serialize_reduced_subproblems
+
+#
+# Multicut Tasks
+#
+
+
+class ReduceSerializeProblemBase(luigi.Task):
+    """ ReduceSerializeProblem base class
+
+    Merge the new edges and costs of `ReduceContractEdges` and serialize the
+    reduced problem for the next scale, in the same layout as `ReduceProblem`.
+    The edge buckets are merged in parallel jobs ('merge' pass); then the merged edges
+    are written to the ranges of the new edges given by the bucket offsets ('write' pass).
+    The block problems of the next scale (`serialize_subproblems`) are extracted
+    from the complete reduced graph in a single job.
+    """
+
+    task_name = 'reduce_serialize_problem'
+    src_file = os.path.abspath(__file__)
+    allow_retry = False
+
+    # input volumes and graph
+    problem_path = luigi.Parameter()
+    scale = luigi.IntParameter()
+    # serialize the block problems of the next scale for `SolveSubproblems`
+    serialize_subproblems = luigi.BoolParameter(default=False)
+    #
+    dependency = luigi.TaskParameter()
+
+    def requires(self):
+        return self.dependency
+
+    def _log_reduction(self):
+        key1 = 's%i/graph' % self.scale
+        key2 = 's%i/graph' % (self.scale + 1,)
+        with vu.file_reader(self.problem_path, 'r') as f:
+            n_nodes = f[key1].attrs['numberOfNodes']
+            n_edges = f[key1].attrs['numberOfEdges']
+            n_new_nodes = f[key2].attrs['numberOfNodes']
+            n_new_edges = f[key2].attrs['numberOfEdges']
+        self._write_log("Reduced graph from %i to %i nodes; %i to %i edges." % (n_nodes, n_new_nodes,
+                                                                                n_edges, n_new_edges))
+
+    def _run_pass(self, n_jobs, block_list, config, prefix, consecutive_blocks=False):
+        self.prepare_jobs(n_jobs, block_list, config, prefix, consecutive_blocks=consecutive_blocks)
+        self.submit_jobs(n_jobs, prefix)
+        self.wait_for_jobs(prefix)
+        self.check_jobs(n_jobs, prefix)
+
+    def _require_problem(self, n_new_nodes, n_new_edges):
+        with vu.file_reader(self.problem_path) as f:
+            graph_attrs = f['s%i/graph' % self.scale].attrs
+            g_out = f.require_group('s%i' % (self.scale + 1,))
+            graph_out = g_out.require_group('graph')
+            graph_out.attrs['ignore_label'] = graph_attrs['ignore_label']
+            graph_out.attrs['numberOfNodes'] = n_new_nodes
+            graph_out.attrs['numberOfEdges'] = n_new_edges
+            graph_out.attrs['shape'] = graph_attrs['shape']
+            # same chunks as `serialize_array`
+            chunk_size = max(1, min(n_new_edges, 262144))
+            graph_out.require_dataset('edges', dtype='uint64', shape=(n_new_edges, 2),
+                                      chunks=(chunk_size, 2), compression='gzip')
+            g_out.require_dataset('costs', dtype='float32', shape=(n_new_edges,),
+                                  chunks=(chunk_size,), compression='gzip')
+
+    def run_impl(self):
+        # get the global config and init configs
+        shebang, block_shape, roi_begin, roi_end = self.global_config_values()
+        self.init(shebang)
+
+        config = self.get_task_config()
+        config.update({'problem_path': self.problem_path, 'scale': self.scale,
+                       'block_shape': block_shape, 'roi_begin': roi_begin, 'roi_end': roi_end})
+
+        group_key = REDUCE_KEY % self.scale
+        with vu.file_reader(self.problem_path, 'r') as f:
+            group = f[group_key]
+            n_buckets = group['edges'].attrs['n_jobs']
+            n_new_nodes = group.attrs['numberOfNodes']
+
+        # merge the edges of the buckets, the results are stored per bucket
+        for name, dtype in (('merged_edges', 'uint64'), ('merged_costs', 'float32'),
+                            ('merged_counts', 'uint64')):
+            require_job_dataset(self.problem_path, group_key, name, (n_buckets,), n_buckets, dtype=dtype)
+        prefix = 's%i_merge' % self.scale
+        self._run_pass(min(n_buckets, self.max_jobs), list(range(n_buckets)),
+                       dict(config, serialize_pass='merge'), prefix)
+
+        # the merged edges of the buckets are consecutive in the new edges
+        with vu.file_reader(self.problem_path, 'r') as f:
+            ds_counts = f[group_key]['merged_counts']
+            counts = [ds_counts.read_chunk((bucket_id,)) for bucket_id in range(n_buckets)]
+        counts = [0 if count is None else int(count[0]) for count in counts]
+        bucket_offsets = np.cumsum([0] + counts).tolist()
+        n_new_edges = bucket_offsets[-1]
+        self._require_problem(n_new_nodes, n_new_edges)
+
+        # write the merged edges and costs to the new problem
+        if n_new_edges > 0:
+            edge_chunk_size, edge_block_list = edge_shards(n_new_edges)
+            write_config = dict(config, serialize_pass='write', n_edges=n_new_edges,
+                                edge_chunk_size=edge_chunk_size, bucket_offsets=bucket_offsets)
+            prefix = 's%i_write' % self.scale
+            self._run_pass(min(len(edge_block_list), self.max_jobs), edge_block_list,
+                           write_config, prefix, consecutive_blocks=True)
+
+        if self.serialize_subproblems:
+            prefix = 's%i_subproblems' % self.scale
+            self._run_pass(1, None, dict(config, serialize_pass='subproblems'), prefix)
+
+        # log the problem reduction
+        self._log_reduction()
+
+    # part of the luigi API
+    def output(self):
+        return luigi.LocalTarget(os.path.join(self.tmp_folder,
+                                              self.task_name + '_s%i.log' % self.scale))
+
+
+class ReduceSerializeProblemLocal(ReduceSerializeProblemBase, LocalTask):
+    """ ReduceSerializeProblem on local machine
+    """
+    pass
+
+
+class ReduceSerializeProblemLocalPool(ReduceSerializeProblemBase, LocalPoolTask):
+    """ ReduceSerializeProblem on local machine with persistent worker pool
+    """
+    pass
+
+
+class ReduceSerializeProblemSlurm(ReduceSerializeProblemBase, SlurmTask):
+    """ ReduceSerializeProblem on slurm cluster
+    """
+    pass
+
+
+class ReduceSerializeProblemLSF(ReduceSerializeProblemBase, LSFTask):
+    """ ReduceSerializeProblem on lsf cluster
+    """
+    pass
+
+
+#
+# Implementation
+#
+
+
+def merge_edge_bucket(ds_edges, ds_values, bucket_id, accumulation_method):
+    """ Merge the new edges and costs of all jobs of `ReduceContractEdges` for one bucket.
+
+    The buckets hold consecutive ranges of first nodes, so the merged buckets
+    in order are the lexicographically sorted new edges.
+    """
+    uv_ids = read_job_chunks(ds_edges, (bucket_id,))
+    if not uv_ids:
+        return np.zeros((0, 2), dtype='uint64'), np.zeros(0, dtype='float32')
+    values = np.concatenate(read_job_chunks(ds_values, (bucket_id,))).reshape((-1, 2))
+    uv_ids, costs, counts = accumulate_edges(np.concatenate(uv_ids).reshape((-1, 2)),
+                                             values[:, 0], values[:, 1], accumulation_method)
+    if accumulation_method == 'mean':
+        costs = costs / counts
+    return uv_ids, costs.astype('float32')
+
+
+def _merge_buckets(reduce_group, bucket_ids):
+    accumulation_method = reduce_group.attrs['accumulation_method']
+    ds_edges, ds_values = reduce_group['edges'], reduce_group['edge_values']
+    ds_merged_edges, ds_merged_costs = reduce_group['merged_edges'], reduce_group['merged_costs']
+    ds_counts = reduce_group['merged_counts']
+    for bucket_id in bucket_ids:
+        uv_ids, costs = merge_edge_bucket(ds_edges, ds_values, bucket_id, accumulation_method)
+        # write all chunks, so that no results of a previous run are read back
+        ds_merged_edges.write_chunk((bucket_id,), uv_ids.flatten(), True)
+        ds_merged_costs.write_chunk((bucket_id,), costs, True)
+        ds_counts.write_chunk((bucket_id,), np.array([len(uv_ids)], dtype='uint64'), True)
+        fu.log("merged %i edges in bucket %i" % (len(uv_ids), bucket_id))
+
+
+def _write_edge_range(problem, reduce_group, scale, edge_begin, edge_end, bucket_offsets):
+    ds_merged_edges, ds_merged_costs = reduce_group['merged_edges'], reduce_group['merged_costs']
+    uv_ids, costs = [], []
+    # read the parts of the buckets that overlap with the edge range
+    for bucket_id, (offset, next_offset) in enumerate(zip(bucket_offsets[:-1], bucket_offsets[1:])):
+        if next_offset <= edge_begin or offset >= edge_end:
+            continue
+        begin, end = max(edge_begin, offset) - offset, min(edge_end, next_offset) - offset
+        uv_ids.append(ds_merged_edges.read_chunk((bucket_id,)).reshape((-1, 2))[begin:end])
+        costs.append(ds_merged_costs.read_chunk((bucket_id,))[begin:end])
+    problem['s%i/graph/edges' % (scale + 1,)][edge_begin:edge_end] = np.concatenate(uv_ids)
+    problem['s%i/costs' % (scale + 1,)][edge_begin:edge_end] = np.concatenate(costs)
+    fu.log("wrote new edges %i to %i" % (edge_begin, edge_end))
+
+
+def reduce_serialize_problem(job_id, config_path):
+
+    fu.log("start processing job %i" % job_id)
+    fu.log("reading config from %s" % config_path)
+
+    # get the config
+    with open(config_path) as f:
+        config = json.load(f)
+    problem_path = config['problem_path']
+    scale = config['scale']
+    serialize_pass = config['serialize_pass']
+
+    problem = z5py.File(problem_path)
+    reduce_group = problem[REDUCE_KEY % scale]
+
+    if serialize_pass == 'merge':
+        fu.log("merge new edges")
+        _merge_buckets(reduce_group, config['block_list'])
+
+    elif serialize_pass == 'write':
+        edge_begin, edge_end = edge_range(config)
+        _write_edge_range(problem, reduce_group, scale, edge_begin, edge_end, config['bucket_offsets'])
+
+    else:
+        # the block problems are extracted from the complete reduced graph
+        fu.log("serialize the block problems for scale %i" % (scale + 1,))
+        n_threads = config['threads_per_job']
+        ds = problem['s%i/graph/edges' % (scale + 1,)]
+        ds.n_threads = n_threads
+        new_uv_ids = ds[:]
+        ds = problem['s%i/costs' % (scale + 1,)]
+        ds.n_threads = n_threads
+        new_costs = ds[:]
+        shape = problem['s%i/graph' % scale].attrs['shape']
+        serialize_reduced_subproblems(problem_path, new_uv_ids, new_costs, shape, scale,
+                                      config['block_shape'], n_threads,
+                                      config.get('roi_begin', None), config.get('roi_end', None))
+
+    fu.log_job_success(job_id)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1]
+    assert os.path.exists(path), path
+    job_id = int(os.path.split(path)[1].split('.')[0].split('_')[-1])
+    reduce_serialize_problem(job_id, path)
@@ -3,15 +3,22 @@
 import os
 import sys
 import json
+import time
+import hashlib
+from shutil import rmtree
 
+import numpy as np
 import luigi
 import vigra
 import nifty
+import nifty.tools as nt
+import nifty.ufd as nufd
+import nifty.graph.opt.multicut as nmc
 from elf.segmentation.multicut import get_multicut_solver
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 #
 # Multicut Tasks
@@ -31,6 +38,8 @@ class SolveGlobalBase(luigi.Task):
     assignment_path = luigi.Parameter()
     assignment_key = luigi.Parameter()
     scale = luigi.IntParameter()
+    # start from the node labeling of the sub-problems solved at this scale
+    warmstart = luigi.BoolParameter(default=False)
     #
     dependency = luigi.TaskParameter()
 
@@ -41,8 +50,11 @@ class SolveGlobalBase(luigi.Task):
     def default_task_config():
         # we use this to get also get the common default config
         config = LocalTask.default_task_config()
+        # if 'checkpoint_interval' (in seconds) is given, the solver runs in rounds and saves the
+        # best labeling to the problem after each round; a re-run of the task resumes from it
         config.update({'agglomerator': 'kernighan-lin',
-                       'time_limit_solver': None})
+                       'time_limit_solver': None,
+                       'checkpoint_interval': None})
         return config
 
     def run_impl(self):
@@ -56,7 +68,9 @@ class SolveGlobalBase(luigi.Task):
         # update the config with input and graph paths and keys
         # as well as block shape
         config.update({'assignment_path': self.assignment_path, 'assignment_key': self.assignment_key,
-                       'scale': self.scale, 'problem_path': self.problem_path})
+                       'scale': self.scale, 'problem_path': self.problem_path,
+                       'warmstart': self.warmstart, 'block_shape': block_shape,
+                       'roi_begin': roi_begin, 'roi_end': roi_end})
 
         # prime and run the job
         prefix = 's%i' % self.scale
@@ -79,6 +93,12 @@ class SolveGlobalLocal(SolveGlobalBase, LocalTask):
     pass
 
 
+class SolveGlobalLocalPool(SolveGlobalBase, LocalPoolTask):
+    """ SolveGlobal on local machine with persistent worker pool
+    """
+    pass
+
+
 class SolveGlobalSlurm(SolveGlobalBase, SlurmTask):
     """ SolveGlobal on slurm cluster
     """
@@ -96,6 +116,112 @@ class SolveGlobalLSF(SolveGlobalBase, LSFTask):
 #
 
 
+def _warmstart_labeling(problem, scale, uv_ids, n_nodes, initial_block_shape,
+                        roi_begin, roi_end):
+    # the node labeling implied by the sub-problem solutions at this scale,
+    # i.e. all edges that were not cut in any sub-problem are merged (see `ReduceProblem`)
+    shape = problem['s0/graph'].attrs['shape']
+    block_shape = [bs * 2**scale for bs in initial_block_shape]
+    blocking = nt.blocking([0, 0, 0], shape, block_shape)
+    block_list = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end)
+
+    ds = problem['s%i/sub_results/cut_edge_ids' % scale]
+    cut_edge_ids = [ds.read_chunk(blocking.blockGridPosition(block_id)) for block_id in block_list]
+    cut_edge_ids = [ids for ids in cut_edge_ids if ids is not None]
+
+    merge_edges = np.ones(len(uv_ids), dtype='bool')
+    if cut_edge_ids:
+        merge_edges[np.concatenate(cut_edge_ids)] = False
+    fu.log("warmstart: merging %i / %i edges" % (merge_edges.sum(), len(uv_ids)))
+
+    nodes = np.arange(n_nodes, dtype='uint64')
+    ufd = nufd.boost_ufd(nodes)
+    ufd.merge(uv_ids[merge_edges])
+    return ufd.find(nodes)
+
+
+def _problem_fingerprint(uv_ids, costs, config):
+    # the checkpoint is only valid for the same problem and solver
+    hash_ = hashlib.sha1(np.ascontiguousarray(uv_ids).tobytes())
+    hash_.update(np.ascontiguousarray(costs).tobytes())
+    solver_config = {'agglomerator': config['agglomerator'], 'warmstart': config.get('warmstart', False)}
+    hash_.update(json.dumps(solver_config, sort_keys=True).encode())
+    return hash_.hexdigest()
+
+
+def _load_checkpoint(problem_path, scale, fingerprint):
+    # returns the node labeling, energy and elapsed time of the checkpoint,
+    # or None if we don't have a (valid) checkpoint for this problem
+    key = 's%i/checkpoint' % scale
+    with vu.file_reader(problem_path, 'r') as f:
+        if key not in f:
+            return None
+        group = f[key]
+        attrs = group.attrs
+        valid = attrs.get('energy', None) is not None and attrs.get('fingerprint', None) == fingerprint
+        if valid:
+            return group['node_labeling'][:], attrs['energy'], attrs['elapsed']
+    # remove invalid checkpoints, e.g. from a previous problem or solver
+    fu.log("removing invalid checkpoint")
+    rmtree(os.path.join(problem_path, key))
+    return None
+
+
+def _save_checkpoint(problem, scale, node_labeling, energy, elapsed, fingerprint):
+    group = problem.require_group('s%i/checkpoint' % scale)
+    # invalidate the checkpoint while the labeling is written
+    group.attrs['energy'] = None
+    ds = group.require_dataset('node_labeling', shape=node_labeling.shape, dtype='uint64',
+                               chunks=(min(len(node_labeling), 524288),), compression='gzip')
+    ds[:] = node_labeling.astype('uint64')
+    group.attrs.update({'fingerprint': fingerprint, 'elapsed': elapsed})
+    group.attrs['energy'] = float(energy)
+
+
+def _solve_checkpointed(graph, costs, solver, node_labeling, time_limit,
+                        checkpoint_interval, checkpoint, elapsed, n_threads):
+    """ Solve the multicut in rounds of at most `checkpoint_interval` seconds.
+
+    If no initial node labeling is given, the first round runs the solver. The following rounds
+    refine the best labeling with kernighan-lin until the energy does not decrease any more or
+    the time limit is reached. The best labeling is checkpointed after each round that improved it.
+    """
+    objective = nmc.multicutObjective(graph, costs)
+    t0 = time.time() - elapsed
+
+    def _round_limit():
+        if time_limit is None:
+            return checkpoint_interval
+        remaining = time_limit - (time.time() - t0)
+        return remaining if checkpoint_interval is None else min(remaining, checkpoint_interval)
+
+    if node_labeling is None:
+        fu.log("start agglomeration")
+        node_labeling = solver(graph, costs, n_threads=n_threads, time_limit=_round_limit())
+    energy = objective.evalNodeLabels(node_labeling)
+    fu.log("initial energy %f" % energy)
+    checkpoint(node_labeling, energy, time.time() - t0)
+
+    while True:
+        round_limit = _round_limit()
+        if round_limit is not None and round_limit <= 0:
+            fu.log("reached time limit")
+            break
+        visitor = None if round_limit is None else\
+            objective.verboseVisitor(visitNth=1000000, timeLimitTotal=round_limit)
+        local_search = objective.kernighanLinFactory(warmStartGreedy=False).create(objective)
+        new_labeling = local_search.optimize(visitor=visitor, nodeLabels=node_labeling)
+        new_energy = objective.evalNodeLabels(new_labeling)
+        if new_energy >= energy:
+            fu.log("energy did not decrease any more")
+            break
+        node_labeling, energy = new_labeling, new_energy
+        fu.log("decreased energy to %f" % energy)
+        checkpoint(node_labeling, energy, time.time() - t0)
+
+    return node_labeling
+
+
 def solve_global(job_id, config_path):
 
     fu.log("start processing job %i" % job_id)
@@ -113,6 +239,8 @@ def solve_global(job_id, config_path):
     agglomerator_key = config['agglomerator']
     n_threads = config['threads_per_job']
     time_limit = config.get('time_limit_solver', None)
+    warmstart = config.get('warmstart', False)
+    checkpoint_interval = config.get('checkpoint_interval', None)
 
     fu.log("using solver %s" % agglomerator_key)
     if time_limit is None:
@@ -147,10 +275,32 @@ def solve_global(job_id, config_path):
     fu.log("creating graph with %i nodes an %i edges" % (n_nodes, len(uv_ids)))
     graph = nifty.graph.undirectedGraph(n_nodes)
     graph.insertEdges(uv_ids)
-    fu.log("start agglomeration")
-    node_labeling = solver(graph, costs,
-                           n_threads=n_threads,
-                           time_limit=time_limit)
+
+    if warmstart or checkpoint_interval is not None:
+        # resume from the checkpoint of a previous run, if we have one
+        fingerprint = _problem_fingerprint(uv_ids, costs, config)
+        checkpoint = _load_checkpoint(problem_path, scale, fingerprint)
+        with vu.file_reader(problem_path) as problem:
+            node_labeling, elapsed = None, 0.
+            if checkpoint is not None:
+                node_labeling, energy, elapsed = checkpoint
+                fu.log("resume from checkpoint with energy %f after %f s" % (energy, elapsed))
+            elif warmstart:
+                node_labeling = _warmstart_labeling(problem, scale, uv_ids, n_nodes, config['block_shape'],
+                                                    config.get('roi_begin', None), config.get('roi_end', None))
+
+            def _checkpoint(labeling, energy, elapsed):
+                if checkpoint_interval is not None:
+                    fu.log("save checkpoint with energy %f" % energy)
+                    _save_checkpoint(problem, scale, labeling, energy, elapsed, fingerprint)
+
+            node_labeling = _solve_checkpointed(graph, costs, solver, node_labeling, time_limit,
+                                                checkpoint_interval, _checkpoint, elapsed, n_threads)
+    else:
+        fu.log("start agglomeration")
+        node_labeling = solver(graph, costs,
+                               n_threads=n_threads,
+                               time_limit=time_limit)
     fu.log("finished agglomeration")
 
     # get the labeling of initial nodes
@@ -184,6 +334,9 @@ def solve_global(job_id, config_path):
     fu.log('saving results to %s:%s' % (assignment_path, assignment_key))
     fu.log_job_success(job_id)
 
+    # the checkpoint is not needed any more once the assignments are written
+    rmtree(os.path.join(problem_path, 's%i/checkpoint' % scale), ignore_errors=True)
+
 
 if __name__ == '__main__':
     path = sys.argv[1]
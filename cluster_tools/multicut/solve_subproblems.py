@@ -4,6 +4,8 @@ import os
 import sys
 import json
 from concurrent import futures
+from contextlib import contextmanager, nullcontext
+from multiprocessing import shared_memory
 
 import numpy as np
 import vigra
@@ -16,7 +18,8 @@ from elf.segmentation.multicut import get_multicut_solver
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
+from cluster_tools.multicut.extract_subproblems import read_block_nodes, read_block_problem
 
 
 #
@@ -34,6 +37,9 @@ class SolveSubproblemsBase(luigi.Task):
     # input volumes and graph
     problem_path = luigi.Parameter()
     scale = luigi.IntParameter()
+    # read the serialized block problems (see `ExtractSubproblems`)
+    # instead of loading the complete graph and costs in each job
+    local_subproblems = luigi.BoolParameter(default=False)
     #
     dependency = luigi.TaskParameter()
 
@@ -49,7 +55,9 @@ class SolveSubproblemsBase(luigi.Task):
         # we use this to get also get the common default config
         config = LocalTask.default_task_config()
         config.update({'agglomerator': 'kernighan-lin',
-                       'time_limit_solver': None})
+                       'time_limit_solver': None,
+                       # solve the block problems in a process pool instead of a thread pool
+                       'use_processes': False})
         return config
 
     def run_impl(self):
@@ -67,7 +75,7 @@ class SolveSubproblemsBase(luigi.Task):
         # as well as block shape
         config = self.get_task_config()
         config.update({'problem_path': self.problem_path, 'scale': self.scale,
-                       'block_shape': block_shape})
+                       'block_shape': block_shape, 'local_subproblems': self.local_subproblems})
 
         # make output datasets
         out_key = 's%i/sub_results' % self.scale
@@ -108,6 +116,12 @@ class SolveSubproblemsLocal(SolveSubproblemsBase, LocalTask):
     pass
 
 
+class SolveSubproblemsLocalPool(SolveSubproblemsBase, LocalPoolTask):
+    """ SolveSubproblems on local machine with persistent worker pool
+    """
+    pass
+
+
 class SolveSubproblemsSlurm(SolveSubproblemsBase, SlurmTask):
     """ SolveSubproblems on slurm cluster
     """
@@ -125,33 +139,85 @@ class SolveSubproblemsLSF(SolveSubproblemsBase, LSFTask):
 #
 
 
-def _solve_block_problem(block_id, graph, uv_ids, ds_nodes,
-                         costs, solver, ignore_label,
-                         blocking, out, time_limit):
+# the uv-ids and costs in shared memory, set in the worker processes by `_attach_shared_problem`
+_SHARED_PROBLEM = {}
+
+
+@contextmanager
+def _shared_array(data):
+    """ Copy the array to shared memory, yields the name, shape and dtype of the shared array.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+    try:
+        np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)[:] = data
+        yield shm.name, data.shape, data.dtype.str
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _attach_shared_problem(uv_ids, costs):
+    # initializer of the worker processes, the arrays are given as (name, shape, dtype)
+    for key, (name, shape, dtype) in (('uv_ids', uv_ids), ('costs', costs)):
+        shm = shared_memory.SharedMemory(name=name)
+        # we need to keep a reference to the shared memory, otherwise the buffer is released
+        _SHARED_PROBLEM[key + '_shm'] = shm
+        _SHARED_PROBLEM[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _solve_sub_problem(nodes, sub_uvs, sub_costs, agglomerator_key, time_limit):
+    """ Solve the multicut for the problem of a block.
+
+    Returns the node labeling and the mask of the cut edges.
+    """
+    # relabel the sub-nodes and associated uv-ids for more efficient processing
+    nodes_relabeled, max_id, mapping = vigra.analysis.relabelConsecutive(nodes,
+                                                                         start_label=0,
+                                                                         keep_zeros=False)
+    sub_uvs = nt.takeDict(mapping, sub_uvs)
+    n_local_nodes = max_id + 1
+    sub_graph = nifty.graph.undirectedGraph(n_local_nodes)
+    sub_graph.insertEdges(sub_uvs)
+
+    assert len(sub_costs) == sub_graph.numberOfEdges
+
+    # solve multicut
+    solver = get_multicut_solver(agglomerator_key)
+    sub_result = solver(sub_graph, sub_costs, time_limit=time_limit)
+    assert len(sub_result) == len(nodes), "%i, %i" % (len(sub_result), len(nodes))
+
+    sub_edgeresult = sub_result[sub_uvs[:, 0]] != sub_result[sub_uvs[:, 1]]
+    return sub_result, sub_edgeresult
+
+
+def _solve_shared_sub_problem(nodes, inner_edges, sub_problem, agglomerator_key, time_limit):
+    # runs in the worker processes, the block problem is either given (serialized block problems)
+    # or taken from the problem in shared memory
+    if sub_problem is None:
+        sub_problem = (_SHARED_PROBLEM['uv_ids'][inner_edges], _SHARED_PROBLEM['costs'][inner_edges])
+    return _solve_sub_problem(nodes, sub_problem[0], sub_problem[1], agglomerator_key, time_limit)
+
+
+def _solve_block_problem(block_id, graph, ds_nodes, ignore_label,
+                         blocking, out, solve, sub_graphs=None):
     fu.log("Start processing block %i" % block_id)
 
     # load the nodes in this sub-block and map them
     # to our current node-labeling
-    chunk_id = blocking.blockGridPosition(block_id)
-    nodes = ds_nodes.read_chunk(chunk_id)
+    nodes = read_block_nodes(ds_nodes, blocking, block_id, ignore_label)
     if nodes is None:
         fu.log_block_success(block_id)
         return
+    nodes, removed_ignore_label = nodes
 
-    # if we have an ignore label, remove zero from the nodes
-    # (nodes are sorted, so it will always be at pos 0)
-    if ignore_label and nodes[0] == 0:
-        nodes = nodes[1:]
-        removed_ignore_label = True
-        if len(nodes) == 0:
-            fu.log_block_success(block_id)
-            return
+    if sub_graphs is None:
+        # we allow for invalid nodes here,
+        # which can occur for un-connected graphs resulting from bad masks ...
+        inner_edges, outer_edges = graph.extractSubgraphFromNodes(nodes, allowInvalidNodes=True)
+        sub_problem = None
     else:
-        removed_ignore_label = False
-
-    # we allow for invalid nodes here,
-    # which can occur for un-connected graphs resulting from bad masks ...
-    inner_edges, outer_edges = graph.extractSubgraphFromNodes(nodes, allowInvalidNodes=True)
+        inner_edges, outer_edges, sub_uvs, sub_costs = read_block_problem(sub_graphs, blocking, block_id)
+        sub_problem = (sub_uvs, sub_costs)
 
     # if we only have no inner edges, return
     # the outer edges as cut edges
@@ -167,24 +233,7 @@ def _solve_block_problem(block_id, graph, uv_ids, ds_nodes,
         fu.log("Block %i: Solving sub-block with %i nodes and %i edges" % (block_id,
                                                                            len(nodes),
                                                                            len(inner_edges)))
-        sub_uvs = uv_ids[inner_edges]
-        # relabel the sub-nodes and associated uv-ids for more efficient processing
-        nodes_relabeled, max_id, mapping = vigra.analysis.relabelConsecutive(nodes,
-                                                                             start_label=0,
-                                                                             keep_zeros=False)
-        sub_uvs = nt.takeDict(mapping, sub_uvs)
-        n_local_nodes = max_id + 1
-        sub_graph = nifty.graph.undirectedGraph(n_local_nodes)
-        sub_graph.insertEdges(sub_uvs)
-
-        sub_costs = costs[inner_edges]
-        assert len(sub_costs) == sub_graph.numberOfEdges
-
-        # solve multicut and relabel the result
-        sub_result = solver(sub_graph, sub_costs, time_limit=time_limit)
-        assert len(sub_result) == len(nodes), "%i, %i" % (len(sub_result), len(nodes))
-
-        sub_edgeresult = sub_result[sub_uvs[:, 0]] != sub_result[sub_uvs[:, 1]]
+        sub_result, sub_edgeresult = solve(nodes, inner_edges, sub_problem)
         assert len(sub_edgeresult) == len(inner_edges)
         cut_edge_ids = inner_edges[sub_edgeresult]
         cut_edge_ids = np.concatenate([cut_edge_ids, outer_edges])
@@ -216,6 +265,46 @@ def _solve_block_problem(block_id, graph, uv_ids, ds_nodes,
     fu.log_block_success(block_id)
 
 
+def solve_block_problems(block_list, graph, uv_ids, costs, ds_nodes, ignore_label,
+                         blocking, out, agglomerator_key, time_limit,
+                         n_threads, use_processes=False, sub_graphs=None):
+    """ Solve the problems of the blocks in the block list.
+
+    The blocks are processed by a thread pool. If `use_processes` is set, the solvers run
+    in a process pool instead, the uv-ids and costs are copied to shared memory once
+    and the workers only return the node labelings and cut edge masks.
+    """
+
+    def _solve_blocks(solve):
+        with futures.ThreadPoolExecutor(n_threads) as tp:
+            tasks = [tp.submit(_solve_block_problem, block_id, graph, ds_nodes, ignore_label,
+                               blocking, out, solve, sub_graphs)
+                     for block_id in block_list]
+            [t.result() for t in tasks]
+
+    if not use_processes:
+        def _solve(nodes, inner_edges, sub_problem):
+            if sub_problem is None:
+                sub_problem = (uv_ids[inner_edges], costs[inner_edges])
+            return _solve_sub_problem(nodes, sub_problem[0], sub_problem[1],
+                                      agglomerator_key, time_limit)
+        _solve_blocks(_solve)
+        return
+
+    # the serialized block problems are passed to the workers directly
+    shared_uv_ids = nullcontext(None) if uv_ids is None else _shared_array(uv_ids)
+    shared_costs = nullcontext(None) if costs is None else _shared_array(costs)
+    with shared_uv_ids as uv_info, shared_costs as cost_info:
+        initializer = None if uv_info is None else _attach_shared_problem
+        with futures.ProcessPoolExecutor(n_threads, initializer=initializer,
+                                         initargs=(uv_info, cost_info)) as pp:
+
+            def _solve(nodes, inner_edges, sub_problem):
+                return pp.submit(_solve_shared_sub_problem, nodes, inner_edges, sub_problem,
+                                 agglomerator_key, time_limit).result()
+            _solve_blocks(_solve)
+
+
 def solve_subproblems(job_id, config_path):
 
     fu.log("start processing job %i" % job_id)
@@ -232,29 +321,37 @@ def solve_subproblems(job_id, config_path):
     n_threads = config['threads_per_job']
     agglomerator_key = config['agglomerator']
     time_limit = config.get('time_limit_solver', None)
+    local_subproblems = config.get('local_subproblems', False)
+    use_processes = config.get('use_processes', False)
 
     fu.log("reading problem from %s" % problem_path)
     problem = z5py.N5File(problem_path)
     shape = problem['s0/graph'].attrs['shape']
-
-    # load the costs
-    costs_key = 's%i/costs' % scale
-    fu.log("reading costs from path in problem: %s" % costs_key)
-    ds = problem[costs_key]
-    ds.n_threads = n_threads
-    costs = ds[:]
-
-    # load the graph
     graph_key = 's%i/graph' % scale
-    fu.log("reading graph from path in problem: %s" % graph_key)
-    graph = ndist.Graph(problem_path, graph_key, numberOfThreads=n_threads)
-    uv_ids = graph.uvIds()
+
+    if local_subproblems:
+        # the block problems are serialized, so we don't need the complete graph and costs
+        fu.log("reading the serialized block problems")
+        graph = uv_ids = costs = None
+        sub_graphs = problem['s%i/sub_graphs' % scale]
+    else:
+        # load the costs
+        costs_key = 's%i/costs' % scale
+        fu.log("reading costs from path in problem: %s" % costs_key)
+        ds = problem[costs_key]
+        ds.n_threads = n_threads
+        costs = ds[:]
+
+        # load the graph
+        fu.log("reading graph from path in problem: %s" % graph_key)
+        graph = ndist.Graph(problem_path, graph_key, numberOfThreads=n_threads)
+        uv_ids = graph.uvIds()
+        sub_graphs = None
     # check if the problem has an ignore-label
     ignore_label = problem[graph_key].attrs['ignore_label']
     fu.log("ignore label is %s" % ('true' if ignore_label else 'false'))
 
     fu.log("using solver %s" % agglomerator_key)
-    solver = get_multicut_solver(agglomerator_key)
 
     # the output group
     out = problem['s%i/sub_results' % scale]
@@ -264,13 +361,11 @@ def solve_subproblems(job_id, config_path):
 
     blocking = nt.blocking([0, 0, 0], shape, list(block_shape))
 
-    with futures.ThreadPoolExecutor(n_threads) as tp:
-        tasks = [tp.submit(_solve_block_problem,
-                           block_id, graph, uv_ids, ds_nodes,
-                           costs, solver, ignore_label,
-                           blocking, out, time_limit)
-                 for block_id in block_list]
-        [t.result() for t in tasks]
+    if use_processes:
+        fu.log("solving the block problems with %i processes" % n_threads)
+    solve_block_problems(block_list, graph, uv_ids, costs, ds_nodes, ignore_label,
+                         blocking, out, agglomerator_key, time_limit,
+                         n_threads, use_processes, sub_graphs)
 
     fu.log_job_success(job_id)
 
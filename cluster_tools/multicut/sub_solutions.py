@@ -13,7 +13,7 @@ import nifty.distributed as ndist
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -124,6 +124,12 @@ class SubSolutionsLocal(SubSolutionsBase, LocalTask):
     pass
 
 
+class SubSolutionsLocalPool(SubSolutionsBase, LocalPoolTask):
+    """ SubSolutions on local machine with persistent worker pool
+    """
+    pass
+
+
 class SubSolutionsSlurm(SubSolutionsBase, SlurmTask):
     """ SubSolutions on slurm cluster
     """
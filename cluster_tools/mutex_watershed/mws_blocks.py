@@ -12,7 +12,8 @@ from elf.segmentation.mutex_watershed import mutex_watershed
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+import cluster_tools.utils.cache_utils as cu
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -25,6 +26,9 @@ class MwsBlocksBase(luigi.Task):
 
     task_name = 'mws_blocks'
     src_file = os.path.abspath(__file__)
+    allow_block_queue = True
+    allow_chunk_cache = True
+    allow_incremental = True
 
     input_path = luigi.Parameter()
     input_key = luigi.Parameter()
@@ -47,6 +51,16 @@ class MwsBlocksBase(luigi.Task):
     def requires(self):
         return self.dependency
 
+    def get_block_weights(self, block_list):
+        # estimate the block cost from the mask if we don't have weights
+        weights = super().get_block_weights(block_list)
+        if weights is None and self.mask_path != '':
+            shape = vu.get_shape(self.input_path, self.input_key)[1:]
+            block_shape = self.global_config_values()[1]
+            weights = vu.mask_block_weights(self.mask_path, self.mask_key,
+                                            shape, block_shape, block_list)
+        return weights
+
     def run_impl(self):
         shebang, block_shape, roi_begin, roi_end, block_list_path\
             = self.global_config_values(with_block_list_path=True)
@@ -105,6 +119,13 @@ class MwsBlocksLocal(MwsBlocksBase, LocalTask):
     pass
 
 
+class MwsBlocksLocalPool(MwsBlocksBase, LocalPoolTask):
+    """
+    MwsBlocks on local machine with persistent worker pool
+    """
+    pass
+
+
 class MwsBlocksSlurm(MwsBlocksBase, SlurmTask):
     """
     MwsBlocks on slurm cluster
@@ -132,27 +153,39 @@ def _get_bbs(blocking, block_id, halo):
     return in_bb, out_bb, local_bb
 
 
-def _mws_block(block_id, blocking,
-               ds_in, ds_out,
-               mask, offsets,
-               strides, randomize_strides,
-               halo, noise_level):
-    fu.log("start processing block %i" % block_id)
-
+def _load_block(block_id, blocking, ds_in, mask, halo):
+    """ Read the affinities and mask for the block, returns None if the block is masked out or empty.
+    """
     in_bb, out_bb, local_bb = _get_bbs(blocking, block_id, halo)
     if mask is None:
         bb_mask = None
     else:
         bb_mask = mask[in_bb].astype('bool')
         if np.sum(bb_mask) == 0:
-            fu.log_block_success(block_id)
-            return
+            return None
 
     aff_bb = (slice(None),) + in_bb
     affs = ds_in[aff_bb]
     if affs.sum() == 0:
+        return None
+    return (out_bb, local_bb), affs, bb_mask
+
+
+def _write_block(ds_out, out_bb, seg, block_id):
+    ds_out[out_bb] = seg
+    # log block success
+    fu.log_block_success(block_id)
+
+
+def _mws_block(block_id, blocking, data,
+               ds_out, writer, offsets,
+               strides, randomize_strides,
+               noise_level):
+    fu.log("start processing block %i" % block_id)
+    if data is None:
         fu.log_block_success(block_id)
         return
+    (out_bb, local_bb), affs, bb_mask = data
 
     affs = vu.normalize(affs)
     seg = mutex_watershed(affs, offsets, strides=strides, mask=bb_mask,
@@ -164,10 +197,7 @@ def _mws_block(block_id, blocking,
     offset_id = max(block_id * int(np.prod(blocking.blockShape)), 1)
     assert offset_id < np.iinfo('uint64').max, "Id overflow"
     vigra.analysis.relabelConsecutive(seg, start_label=offset_id, keep_zeros=True, out=seg)
-    ds_out[out_bb] = seg
-
-    # log block success
-    fu.log_block_success(block_id)
+    writer.submit(_write_block, ds_out, out_bb, seg, block_id)
 
 
 def mws_blocks(job_id, config_path):
@@ -182,7 +212,7 @@ def mws_blocks(job_id, config_path):
     output_path = config['output_path']
     output_key = config['output_key']
     block_shape = config['block_shape']
-    block_list = config['block_list']
+    block_list = vu.job_blocks(config)
     offsets = config['offsets']
 
     strides = config['strides']
@@ -197,7 +227,10 @@ def mws_blocks(job_id, config_path):
     mask_path = config.get('mask_path', '')
     mask_key = config.get('mask_key', '')
 
-    with vu.file_reader(input_path, 'r') as f_in, vu.file_reader(output_path) as f_out:
+    # the halos of neighboring blocks overlap, so we read the input through the chunk cache if enabled
+    cache = cu.make_chunk_cache(config)
+
+    with vu.file_reader(input_path, 'r', cache=cache) as f_in, vu.file_reader(output_path) as f_out:
 
         ds_in = f_in[input_key]
         ds_out = f_out[output_key]
@@ -210,11 +243,18 @@ def mws_blocks(job_id, config_path):
         else:
             mask = None
 
-        [_mws_block(block_id, blocking,
-                    ds_in, ds_out,
-                    mask, offsets,
-                    strides, randomize_strides,
-                    halo, noise_level) for block_id in block_list]
+        def _load(block_id):
+            return _load_block(block_id, blocking, ds_in, mask, halo)
+
+        # read the next blocks and write the results in the background, if enabled
+        blocks = vu.prefetch_blocks(_load, block_list, config.get('prefetch_blocks', 0))
+        with vu.BlockWriter(config.get('write_behind', 0)) as writer:
+            for block_id, get_data in blocks:
+                _mws_block(block_id, blocking, get_data(),
+                           ds_out, writer, offsets,
+                           strides, randomize_strides,
+                           noise_level)
+    cu.save_cache_stats(cache, config, job_id)
     fu.log_job_success(job_id)
 
 
@@ -12,7 +12,7 @@ import numpy as np
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -65,6 +65,13 @@ class TwoPassAssignmentsLocal(TwoPassAssignmentsBase, LocalTask):
     pass
 
 
+class TwoPassAssignmentsLocalPool(TwoPassAssignmentsBase, LocalPoolTask):
+    """
+    TwoPassAssignments on local machine with persistent worker pool
+    """
+    pass
+
+
 class TwoPassAssignmentsSlurm(TwoPassAssignmentsBase, SlurmTask):
     """
     TwoPassAssignments on slurm cluster
@@ -13,7 +13,7 @@ from elf.segmentation.mutex_watershed import compute_grid_graph
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -116,6 +116,13 @@ class TwoPassMwsLocal(TwoPassMwsBase, LocalTask):
     pass
 
 
+class TwoPassMwsLocalPool(TwoPassMwsBase, LocalPoolTask):
+    """
+    TwoPassMws on local machine with persistent worker pool
+    """
+    pass
+
+
 class TwoPassMwsSlurm(TwoPassMwsBase, SlurmTask):
     """
     TwoPassMws on slurm cluster
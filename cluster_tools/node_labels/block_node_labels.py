@@ -13,7 +13,7 @@ from elf.io.label_multiset_wrapper import LabelMultisetWrapper
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -113,6 +113,12 @@ class BlockNodeLabelsLocal(BlockNodeLabelsBase, LocalTask):
     pass
 
 
+class BlockNodeLabelsLocalPool(BlockNodeLabelsBase, LocalPoolTask):
+    """ BlockNodeLabels on local machine with persistent worker pool
+    """
+    pass
+
+
 class BlockNodeLabelsSlurm(BlockNodeLabelsBase, SlurmTask):
     """ BlockNodeLabels on slurm cluster
     """
@@ -10,7 +10,7 @@ import nifty.distributed as ndist
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -101,6 +101,12 @@ class MergeNodeLabelsLocal(MergeNodeLabelsBase, LocalTask):
     pass
 
 
+class MergeNodeLabelsLocalPool(MergeNodeLabelsBase, LocalPoolTask):
+    """ MergeNodeLabels on local machine with persistent worker pool
+    """
+    pass
+
+
 class MergeNodeLabelsSlurm(MergeNodeLabelsBase, SlurmTask):
     """ MergeNodeLabels on slurm cluster
     """
@@ -9,7 +9,7 @@ import nifty.distributed as ndist
 
 import cluster_tools.utils.function_utils as fu
 import cluster_tools.utils.volume_utils as vu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class LabelBlockMappingBase(luigi.Task):
@@ -84,6 +84,13 @@ class LabelBlockMappingLocal(LabelBlockMappingBase, LocalTask):
     pass
 
 
+class LabelBlockMappingLocalPool(LabelBlockMappingBase, LocalPoolTask):
+    """
+    LabelBlockMapping on local machine with persistent worker pool
+    """
+    pass
+
+
 class LabelBlockMappingSlurm(LabelBlockMappingBase, SlurmTask):
     """
     LabelBlockMapping on slurm cluster
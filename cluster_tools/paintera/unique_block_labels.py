@@ -16,7 +16,7 @@ from elf.label_multiset import deserialize_multiset
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class UniqueBlockLabelsBase(luigi.Task):
@@ -104,6 +104,13 @@ class UniqueBlockLabelsLocal(UniqueBlockLabelsBase, LocalTask):
     pass
 
 
+class UniqueBlockLabelsLocalPool(UniqueBlockLabelsBase, LocalPoolTask):
+    """
+    UniqueBlockLabels on local machine with persistent worker pool
+    """
+    pass
+
+
 class UniqueBlockLabelsSlurm(UniqueBlockLabelsBase, SlurmTask):
     """
     UniqueBlockLabels on slurm cluster
@@ -10,7 +10,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class BackgroundSizeFilterBase(luigi.Task):
@@ -88,6 +88,13 @@ class BackgroundSizeFilterLocal(BackgroundSizeFilterBase, LocalTask):
     pass
 
 
+class BackgroundSizeFilterLocalPool(BackgroundSizeFilterBase, LocalPoolTask):
+    """
+    BackgroundSizeFilter on local machine with persistent worker pool
+    """
+    pass
+
+
 class BackgroundSizeFilterSlurm(BackgroundSizeFilterBase, SlurmTask):
     """
     BackgroundSizeFilter on slurm cluster
@@ -11,7 +11,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class FillingSizeFilterBase(luigi.Task):
@@ -90,6 +90,13 @@ class FillingSizeFilterLocal(FillingSizeFilterBase, LocalTask):
     pass
 
 
+class FillingSizeFilterLocalPool(FillingSizeFilterBase, LocalPoolTask):
+    """
+    FillingSizeFilter on local machine with persistent worker pool
+    """
+    pass
+
+
 class FillingSizeFilterSlurm(FillingSizeFilterBase, SlurmTask):
     """
     FillingSizeFilter on slurm cluster
@@ -10,7 +10,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -59,13 +59,18 @@ class FilterBlocksBase(luigi.Task):
         shape = vu.get_shape(self.input_path, self.input_key)
         chunks = tuple(min(bs // 2, sh) for bs, sh in zip(block_shape, shape))
         with vu.file_reader(self.output_path) as f:
+            new_output = self.output_key not in f
             f.require_dataset(self.output_key, shape=shape,
                               dtype='uint64', chunks=chunks,
                               compression='gzip')
+        if new_output and self.use_occupancy_index():
+            vu.init_occupancy(self.output_path, self.output_key)
 
         if self.n_retries == 0:
             block_list = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end,
-                                             block_list_path=block_list_path)
+                                             block_list_path=block_list_path,
+                                             skip_empty_in=self.skip_empty_in(self.input_path,
+                                                                              self.input_key))
         else:
             block_list = self.block_list
             self.clean_up_for_retry(block_list)
@@ -86,6 +91,12 @@ class FilterBlocksLocal(FilterBlocksBase, LocalTask):
     pass
 
 
+class FilterBlocksLocalPool(FilterBlocksBase, LocalPoolTask):
+    """ FilterBlocks on local machine with persistent worker pool
+    """
+    pass
+
+
 class FilterBlocksSlurm(FilterBlocksBase, SlurmTask):
     """ FilterBlocks on slurm cluster
     """
@@ -103,7 +114,8 @@ class FilterBlocksLSF(FilterBlocksBase, LSFTask):
 #
 
 def _filter_block(blocking, block_id,
-                  ds_in, ds_out, filter_ids):
+                  ds_in, ds_out, filter_ids,
+                  output_path, output_key):
     fu.log("start processing block %i" % block_id)
     # read labels and input in this block
     block = blocking.getBlock(block_id)
@@ -119,6 +131,7 @@ def _filter_block(blocking, block_id,
     # check for filter_ids
     filter_mask = np.in1d(seg, filter_ids).reshape(seg.shape)
     seg[filter_mask] = 0
+    vu.mark_occupied(output_path, output_key, bb)
     ds_out[bb] = seg
     fu.log_block_success(block_id)
 
@@ -196,7 +209,8 @@ def filter_blocks(job_id, config_path):
 
             for block_id in block_list:
                 _filter_block(blocking, block_id,
-                              ds_in, ds_out, filter_ids)
+                              ds_in, ds_out, filter_ids,
+                              output_path, output_key)
 
     fu.log_job_success(job_id)
 
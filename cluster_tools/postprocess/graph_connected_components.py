@@ -9,7 +9,7 @@ import vigra
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 PAINTERA_IGNORE_ID = 18446744073709551615
 
@@ -76,6 +76,12 @@ class GraphConnectedComponentsLocal(GraphConnectedComponentsBase, LocalTask):
     pass
 
 
+class GraphConnectedComponentsLocalPool(GraphConnectedComponentsBase, LocalPoolTask):
+    """ GraphConnectedComponents on local machine with persistent worker pool
+    """
+    pass
+
+
 class GraphConnectedComponentsSlurm(GraphConnectedComponentsBase, SlurmTask):
     """ GraphConnectedComponents on slurm cluster
     """
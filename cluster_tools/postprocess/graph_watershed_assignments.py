@@ -11,7 +11,7 @@ import nifty
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -80,6 +80,12 @@ class GraphWatershedAssignmentsLocal(GraphWatershedAssignmentsBase, LocalTask):
     pass
 
 
+class GraphWatershedAssignmentsLocalPool(GraphWatershedAssignmentsBase, LocalPoolTask):
+    """ GraphWatershedAssignments on local machine with persistent worker pool
+    """
+    pass
+
+
 class GraphWatershedAssignmentsSlurm(GraphWatershedAssignmentsBase, SlurmTask):
     """ GraphWatershedAssignments on slurm cluster
     """
@@ -8,7 +8,7 @@ import luigi
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -64,6 +64,12 @@ class IdFilterLocal(IdFilterBase, LocalTask):
     pass
 
 
+class IdFilterLocalPool(IdFilterBase, LocalPoolTask):
+    """ IdFilter on local machine with persistent worker pool
+    """
+    pass
+
+
 class IdFilterSlurm(IdFilterBase, SlurmTask):
     """ IdFilter on slurm cluster
     """
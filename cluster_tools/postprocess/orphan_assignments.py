@@ -12,7 +12,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -74,6 +74,12 @@ class OrphanAssignmentsLocal(OrphanAssignmentsBase, LocalTask):
     pass
 
 
+class OrphanAssignmentsLocalPool(OrphanAssignmentsBase, LocalPoolTask):
+    """ OrphanAssignments on local machine with persistent worker pool
+    """
+    pass
+
+
 class OrphanAssignmentsSlurm(OrphanAssignmentsBase, SlurmTask):
     """ OrphanAssignments on slurm cluster
     """
@@ -9,7 +9,7 @@ import numpy as np
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -70,6 +70,13 @@ class SizeFilterBlocksLocal(SizeFilterBlocksBase, LocalTask):
     pass
 
 
+class SizeFilterBlocksLocalPool(SizeFilterBlocksBase, LocalPoolTask):
+    """
+    SizeFilterBlocks on local machine with persistent worker pool
+    """
+    pass
+
+
 class SizeFilterBlocksSlurm(SizeFilterBlocksBase, SlurmTask):
     """
     SizeFilterBlocks on slurm cluster
@@ -16,7 +16,7 @@ from elf.io.label_multiset_wrapper import LabelMultisetWrapper
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class FindUniquesBase(luigi.Task):
@@ -76,6 +76,13 @@ class FindUniquesLocal(FindUniquesBase, LocalTask):
     pass
 
 
+class FindUniquesLocalPool(FindUniquesBase, LocalPoolTask):
+    """
+    FindUniques on local machine with persistent worker pool
+    """
+    pass
+
+
 class FindUniquesSlurm(FindUniquesBase, SlurmTask):
     """
     FindUniques on slurm cluster
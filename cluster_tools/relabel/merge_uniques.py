@@ -10,7 +10,7 @@ import numpy as np
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -67,6 +67,13 @@ class MergeUniquesLocal(MergeUniquesBase, LocalTask):
     pass
 
 
+class MergeUniquesLocalPool(MergeUniquesBase, LocalPoolTask):
+    """
+    MergeUniques on local machine with persistent worker pool
+    """
+    pass
+
+
 class MergeUniquesSlurm(MergeUniquesBase, SlurmTask):
     """
     MergeUniques on slurm cluster
@@ -10,7 +10,7 @@ import nifty.skeletons as nskel
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 from cluster_tools.utils.task_utils import DummyTask
 
 
@@ -74,6 +74,13 @@ class SkeletonEvaluationLocal(SkeletonEvaluationBase, LocalTask):
     pass
 
 
+class SkeletonEvaluationLocalPool(SkeletonEvaluationBase, LocalPoolTask):
+    """
+    skeleton_evaluation on local machine with persistent worker pool
+    """
+    pass
+
+
 class SkeletonEvaluationSlurm(SkeletonEvaluationBase, SlurmTask):
     """
     skeleton_evaluation on slurm cluster
@@ -12,7 +12,7 @@ from elf.skeleton import skeletonize as skel_impl, get_method_names
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 from cluster_tools.utils.task_utils import DummyTask
 
 
@@ -106,6 +106,13 @@ class SkeletonizeLocal(SkeletonizeBase, LocalTask):
     pass
 
 
+class SkeletonizeLocalPool(SkeletonizeBase, LocalPoolTask):
+    """
+    skeletonize on local machine with persistent worker pool
+    """
+    pass
+
+
 class SkeletonizeSlurm(SkeletonizeBase, SlurmTask):
     """
     skeletonize on slurm cluster
@@ -15,7 +15,7 @@ from scipy.ndimage.morphology import distance_transform_edt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -96,6 +96,13 @@ class UpsampleSkeletonsLocal(UpsampleSkeletonsBase, LocalTask):
     pass
 
 
+class UpsampleSkeletonsLocalPool(UpsampleSkeletonsBase, LocalPoolTask):
+    """
+    upsample_skeletons on local machine with persistent worker pool
+    """
+    pass
+
+
 class UpsampleSkeletonsSlurm(UpsampleSkeletonsBase, SlurmTask):
     """
     upsample_skeletons on slurm cluster
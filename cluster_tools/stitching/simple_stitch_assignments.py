@@ -10,7 +10,7 @@ import numpy as np
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -80,6 +80,13 @@ class SimpleStitchAssignmentsLocal(SimpleStitchAssignmentsBase, LocalTask):
     pass
 
 
+class SimpleStitchAssignmentsLocalPool(SimpleStitchAssignmentsBase, LocalPoolTask):
+    """
+    SimpleStitchAssignments on local machine with persistent worker pool
+    """
+    pass
+
+
 class SimpleStitchAssignmentsSlurm(SimpleStitchAssignmentsBase, SlurmTask):
     """
     SimpleStitchAssignments on slurm cluster
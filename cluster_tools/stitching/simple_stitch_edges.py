@@ -9,7 +9,7 @@ import nifty.distributed as ndist
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -75,6 +75,13 @@ class SimpleStitchEdgesLocal(SimpleStitchEdgesBase, LocalTask):
     pass
 
 
+class SimpleStitchEdgesLocalPool(SimpleStitchEdgesBase, LocalPoolTask):
+    """
+    SimpleStitchEdges on local machine with persistent worker pool
+    """
+    pass
+
+
 class SimpleStitchEdgesSlurm(SimpleStitchEdgesBase, SlurmTask):
     """
     SimpleStitchEdges on slurm cluster
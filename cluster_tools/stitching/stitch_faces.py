@@ -11,7 +11,7 @@ import nifty.ground_truth as ngt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -80,6 +80,13 @@ class StitchFacesLocal(StitchFacesBase, LocalTask):
     pass
 
 
+class StitchFacesLocalPool(StitchFacesBase, LocalPoolTask):
+    """
+    StitchFaces on local machine with persistent worker pool
+    """
+    pass
+
+
 class StitchFacesSlurm(StitchFacesBase, SlurmTask):
     """
     StitchFaces on slurm cluster
@@ -11,7 +11,7 @@ import vigra
 import cluster_tools.utils.function_utils as fu
 import cluster_tools.utils.volume_utils as vu
 from elf.segmentation.multicut import get_multicut_solver, transform_probabilities_to_costs
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 class StitchingMulticutBase(luigi.Task):
@@ -67,6 +67,10 @@ class StitchingMulticutLocal(StitchingMulticutBase, LocalTask):
     pass
 
 
+class StitchingMulticutLocalPool(StitchingMulticutBase, LocalPoolTask):
+    pass
+
+
 class StitchingMulticutSlurm(StitchingMulticutBase, SlurmTask):
     pass
 
@@ -11,7 +11,7 @@ from skimage.morphology import label
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -25,6 +25,7 @@ class BlockComponentsBase(luigi.Task):
     task_name = 'block_components'
     src_file = os.path.abspath(__file__)
     allow_retry = False
+    allow_incremental = True
 
     input_path = luigi.Parameter()
     input_key = luigi.Parameter()
@@ -126,6 +127,13 @@ class BlockComponentsLocal(BlockComponentsBase, LocalTask):
     pass
 
 
+class BlockComponentsLocalPool(BlockComponentsBase, LocalPoolTask):
+    """
+    BlockComponents on local machine with persistent worker pool
+    """
+    pass
+
+
 class BlockComponentsSlurm(BlockComponentsBase, SlurmTask):
     """
     BlockComponents on slurm cluster
@@ -140,13 +148,20 @@ class BlockComponentsLSF(BlockComponentsBase, LSFTask):
     pass
 
 
-def _cc_block(block_id, blocking,
-              ds_in, ds_out, threshold,
-              threshold_mode, channel, sigma):
-    fu.log("start processing block %i" % block_id)
+def _load_block(block_id, blocking, ds_in, mask, channel):
+    """ Read the input and mask for the block, returns None if the block is masked out.
+    """
     block = blocking.getBlock(block_id)
-
     bb = vu.block_to_bb(block)
+
+    # get the mask and check if we have any pixels
+    if mask is None:
+        in_mask = None
+    else:
+        in_mask = mask[bb].astype('bool')
+        if np.sum(in_mask) == 0:
+            return None
+
     if channel is None:
         input_ = ds_in[bb]
     else:
@@ -157,56 +172,21 @@ def _cc_block(block_id, blocking,
             bb_inp = (slice(chan, chan + 1),) + bb
             input_[chan_id] = ds_in[bb_inp].squeeze()
         input_ = np.mean(input_, axis=0)
+    return bb, input_, in_mask
 
-    input_ = vu.normalize(input_)
-    if sigma > 0:
-        input_ = vu.apply_filter(input_, 'gaussianSmoothing', sigma)
-        input_ = vu.normalize(input_)
-
-    if threshold_mode == 'greater':
-        input_ = input_ > threshold
-    elif threshold_mode == 'less':
-        input_ = input_ < threshold
-    elif threshold_mode == 'equal':
-        input_ = input_ == threshold
-    else:
-        raise RuntimeError("Thresholding Mode %s not supported" % threshold_mode)
 
-    if np.sum(input_) == 0:
-        fu.log_block_success(block_id)
-        return 0
-
-    components = label(input_)
+def _write_block(ds_out, bb, components, block_id):
     ds_out[bb] = components
     fu.log_block_success(block_id)
-    return int(components.max()) + 1
 
 
-def _cc_block_with_mask(block_id, blocking,
-                        ds_in, ds_out, threshold,
-                        threshold_mode, mask,
-                        channel, sigma):
+def _cc_block(block_id, data, ds_out, writer,
+              threshold, threshold_mode, sigma):
     fu.log("start processing block %i" % block_id)
-    block = blocking.getBlock(block_id)
-    bb = vu.block_to_bb(block)
-
-    # get the mask and check if we have any pixels
-    in_mask = mask[bb].astype('bool')
-    if np.sum(in_mask) == 0:
+    if data is None:
         fu.log_block_success(block_id)
         return 0
-
-    bb = vu.block_to_bb(block)
-    if channel is None:
-        input_ = ds_in[bb]
-    else:
-        channel_ = [channel] if isinstance(channel, int) else channel
-        in_shape = (len(channel_),) + tuple(b.stop - b.start for b in bb)
-        input_ = np.zeros(in_shape, dtype=ds_in.dtype)
-        for chan_id, chan in enumerate(channel_):
-            bb_inp = (slice(chan, chan + 1),) + bb
-            input_[chan_id] = ds_in[bb_inp].squeeze()
-        input_ = np.mean(input_, axis=0)
+    bb, input_, in_mask = data
 
     input_ = vu.normalize(input_)
     if sigma > 0:
@@ -222,14 +202,14 @@ def _cc_block_with_mask(block_id, blocking,
     else:
         raise RuntimeError("Thresholding Mode %s not supported" % threshold_mode)
 
-    input_[np.logical_not(in_mask)] = 0
+    if in_mask is not None:
+        input_[np.logical_not(in_mask)] = 0
     if np.sum(input_) == 0:
         fu.log_block_success(block_id)
         return 0
 
     components = label(input_)
-    ds_out[bb] = components
-    fu.log_block_success(block_id)
+    writer.submit(_write_block, ds_out, bb, components, block_id)
     return int(components.max()) + 1
 
 
@@ -271,17 +251,17 @@ def block_components(job_id, config_path):
 
         blocking = nt.blocking([0, 0, 0], list(shape), block_shape)
 
-        if mask_path != '':
-            mask = vu.load_mask(mask_path, mask_key, shape)
-            offsets = [_cc_block_with_mask(block_id, blocking,
-                                           ds_in, ds_out, threshold,
-                                           threshold_mode, mask, channel,
-                                           sigma) for block_id in block_list]
+        mask = vu.load_mask(mask_path, mask_key, shape) if mask_path != '' else None
 
-        else:
-            offsets = [_cc_block(block_id, blocking,
-                                 ds_in, ds_out, threshold,
-                                 threshold_mode, channel, sigma) for block_id in block_list]
+        def _load(block_id):
+            return _load_block(block_id, blocking, ds_in, mask, channel)
+
+        # read the next blocks and write the results in the background, if enabled
+        blocks = vu.prefetch_blocks(_load, block_list, config.get('prefetch_blocks', 0))
+        with vu.BlockWriter(config.get('write_behind', 0)) as writer:
+            offsets = [_cc_block(block_id, get_data(), ds_out, writer,
+                                 threshold, threshold_mode, sigma)
+                       for block_id, get_data in blocks]
 
     offset_dict = {block_id: off for block_id, off in zip(block_list, offsets)}
     save_path = os.path.join(tmp_folder,
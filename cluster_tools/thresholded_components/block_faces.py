@@ -11,7 +11,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -70,6 +70,13 @@ class BlockFacesLocal(BlockFacesBase, LocalTask):
     pass
 
 
+class BlockFacesLocalPool(BlockFacesBase, LocalPoolTask):
+    """
+    BlockFaces on local machine with persistent worker pool
+    """
+    pass
+
+
 class BlockFacesSlurm(BlockFacesBase, SlurmTask):
     """
     BlockFaces on slurm cluster
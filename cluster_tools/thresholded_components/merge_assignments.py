@@ -12,7 +12,7 @@ import nifty.ufd as nufd
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -71,6 +71,13 @@ class MergeAssignmentsLocal(MergeAssignmentsBase, LocalTask):
     pass
 
 
+class MergeAssignmentsLocalPool(MergeAssignmentsBase, LocalPoolTask):
+    """
+    MergeAssignments on local machine with persistent worker pool
+    """
+    pass
+
+
 class MergeAssignmentsSlurm(MergeAssignmentsBase, SlurmTask):
     """
     MergeAssignments on slurm cluster
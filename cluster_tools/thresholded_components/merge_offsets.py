@@ -12,7 +12,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -66,6 +66,13 @@ class MergeOffsetsLocal(MergeOffsetsBase, LocalTask):
     pass
 
 
+class MergeOffsetsLocalPool(MergeOffsetsBase, LocalPoolTask):
+    """
+    MergeOffsets on local machine with persistent worker pool
+    """
+    pass
+
+
 class MergeOffsetsSlurm(MergeOffsetsBase, SlurmTask):
     """
     MergeOffsets on slurm cluster
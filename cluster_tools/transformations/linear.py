@@ -9,7 +9,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 from cluster_tools.utils.task_utils import DummyTask
 
 
@@ -23,6 +23,7 @@ class LinearBase(luigi.Task):
 
     task_name = 'linear'
     src_file = os.path.abspath(__file__)
+    allow_block_queue = True
 
     # input and output volumes
     input_path = luigi.Parameter()
@@ -102,6 +103,13 @@ class LinearLocal(LinearBase, LocalTask):
     pass
 
 
+class LinearLocalPool(LinearBase, LocalPoolTask):
+    """
+    Linear intensity transform on local machine with persistent worker pool
+    """
+    pass
+
+
 class LinearSlurm(LinearBase, SlurmTask):
     """
     copy on slurm cluster
@@ -148,35 +156,55 @@ def _transform_data(data, a, b, mask=None):
     return data
 
 
-def _transform_block(ds_in, ds_out, transformation, blocking, block_id, mask=None):
-    fu.log("start processing block %i" % block_id)
+def _load_block(ds_in, blocking, block_id, mask=None):
+    """ Read the data and mask for the block, returns None if the block is masked out.
+    """
     block = blocking.getBlock(block_id)
 
     bb = vu.block_to_bb(block)
     if mask is not None:
         bb_mask = mask[bb].astype('bool')
         if bb_mask.sum() == 0:
-            fu.log_block_success(block_id)
-            return
+            return None
     else:
         bb_mask = None
+    return bb, ds_in[bb], bb_mask
+
+
+def _write_block(ds_out, bb, data, block_id):
+    ds_out[bb] = data
+    fu.log_block_success(block_id)
+
+
+def _transform_block(ds_out, transformation, blocking, block_id, data, writer):
+    fu.log("start processing block %i" % block_id)
+    if data is None:
+        fu.log_block_success(block_id)
+        return
+    bb, data, bb_mask = data
 
-    data = ds_in[bb]
     if len(transformation) == 2:
         data = _transform_data(data, transformation['a'], transformation['b'], bb_mask)
     else:
-        z_offset = block.begin[0]
+        z_offset = bb[0].start
         for z in range(data.shape[0]):
             trafo = transformation[z + z_offset]
-            data[z] = _transform_data(data[z], trafo['a'], trafo['b'], bb_mask[z])
+            data[z] = _transform_data(data[z], trafo['a'], trafo['b'],
+                                      None if bb_mask is None else bb_mask[z])
+
+    writer.submit(_write_block, ds_out, bb, data, block_id)
 
-    ds_out[bb] = data
-    fu.log_block_success(block_id)
 
+def _transform_linear(ds_in, ds_out, transformation, blocking, block_list, config, mask=None):
 
-def _transform_linear(ds_in, ds_out, transformation, blocking, block_list, mask=None):
-    for block_id in block_list:
-        _transform_block(ds_in, ds_out, transformation, blocking, block_id, mask)
+    def _load(block_id):
+        return _load_block(ds_in, blocking, block_id, mask)
+
+    # read the next blocks and write the results in the background, if enabled
+    blocks = vu.prefetch_blocks(_load, block_list, config.get('prefetch_blocks', 0))
+    with vu.BlockWriter(config.get('write_behind', 0)) as writer:
+        for block_id, get_data in blocks:
+            _transform_block(ds_out, transformation, blocking, block_id, get_data(), writer)
 
 
 def linear(job_id, config_path):
@@ -190,7 +218,7 @@ def linear(job_id, config_path):
     input_key = config['input_key']
 
     block_shape = list(config['block_shape'])
-    block_list = config['block_list']
+    block_list = vu.job_blocks(config)
 
     # read the output config and path to transformation
     output_path = config['output_path']
@@ -205,6 +233,8 @@ def linear(job_id, config_path):
         with vu.file_reader(input_path, 'r') as f:
             in_shape = f[input_key].shape
         mask = vu.load_mask(mask_path, mask_key, in_shape)
+    else:
+        mask = None
 
     same_file = input_path == output_path
     in_place = same_file and (input_key == output_key)
@@ -219,7 +249,7 @@ def linear(job_id, config_path):
             trafo = _load_transformation(trafo_file, shape)
 
             blocking = nt.blocking([0, 0, 0], shape, block_shape)
-            _transform_linear(ds_in, ds_out, trafo, blocking, block_list, mask)
+            _transform_linear(ds_in, ds_out, trafo, blocking, block_list, config, mask)
 
     else:
         with vu.file_reader(input_path, 'r') as f_in, vu.file_reader(output_path) as f_out:
@@ -230,7 +260,7 @@ def linear(job_id, config_path):
             trafo = _load_transformation(trafo_file, shape)
 
             blocking = nt.blocking([0, 0, 0], shape, block_shape)
-            _transform_linear(ds_in, ds_out, trafo, blocking, block_list, mask)
+            _transform_linear(ds_in, ds_out, trafo, blocking, block_list, config, mask)
 
     # log success
     fu.log_job_success(job_id)
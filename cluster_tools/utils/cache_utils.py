@@ -0,0 +1,299 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from itertools import product
+
+import numpy as np
+
+from .function_utils import log
+
+#
+# Chunk-level LRU cache for reading overlapping blocks, e.g. blocks with halo.
+#
+# The cache stores decompressed chunks of read-only datasets, so that chunks that are
+# shared by neighboring (outer) blocks are only read and decompressed once per job.
+# Optionally, the chunks are also stored as .npy files in a shared directory,
+# which should be on a node-local tmpfs (e.g. /dev/shm), so that the worker processes
+# on the same node can share them. The chunks of each task run are stored in a separate namespace
+# and the oldest chunks of all namespaces are evicted if the directory exceeds its size limit.
+#
+# NOTE the cache must only be used for datasets that are not written while it is in use.
+#
+
+
+def _chunk_bb(chunk_id, chunks, shape):
+    return tuple(slice(cid * ch, min((cid + 1) * ch, sh))
+                 for cid, ch, sh in zip(chunk_id, chunks, shape))
+
+
+class ChunkCache:
+    """ LRU cache for dataset chunks with eviction by the size in bytes.
+
+    Arguments:
+        max_bytes [int] - maximal size of the chunks held in memory
+        shared_dir [str] - directory to share chunks with other processes (default: None)
+        shared_max_bytes [int] - maximal size of the chunks in the shared directory (default: None)
+        namespace [str] - namespace of the chunks in the shared directory (default: 'default')
+    """
+    def __init__(self, max_bytes, shared_dir=None, shared_max_bytes=None, namespace='default'):
+        self.max_bytes = max_bytes
+        self.shared_dir = shared_dir
+        self.shared_max_bytes = shared_max_bytes
+        self.namespace = namespace
+        if shared_dir is not None:
+            os.makedirs(os.path.join(shared_dir, namespace), exist_ok=True)
+
+        self._chunks = OrderedDict()
+        self._n_bytes = 0
+        self._shared_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.shared_hits = self.evictions = 0
+
+    def _shared_path(self, ds_id, chunk_id):
+        return os.path.join(self.shared_dir, self.namespace, ds_id,
+                            '_'.join(map(str, chunk_id)) + '.npy')
+
+    def _load_shared(self, ds_id, chunk_id):
+        path = self._shared_path(ds_id, chunk_id)
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            return None
+
+    def _evict_shared(self):
+        files = []
+        for root, _, names in os.walk(self.shared_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.shared_max_bytes // 2:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self._shared_bytes = 0
+
+    def _store_shared(self, ds_id, chunk_id, data):
+        path = self._shared_path(ds_id, chunk_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to tmp file and move, so that other processes never see a partially written chunk
+        tmp_path = '%s.%i.tmp.npy' % (path[:-4], os.getpid())
+        try:
+            np.save(tmp_path, data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        self._shared_bytes += data.nbytes
+        # we only check the size of the shared directory once this process has written
+        # a sizeable fraction of it, in order to avoid listing the directory too often
+        if self.shared_max_bytes is not None and self._shared_bytes > self.shared_max_bytes // 4:
+            self._evict_shared()
+
+    def get(self, ds_id, chunk_id, load):
+        """ Get the chunk `chunk_id` of dataset `ds_id`, call `load()` if it is not cached.
+        """
+        key = (ds_id, chunk_id)
+        with self._lock:
+            data = self._chunks.get(key, None)
+            if data is not None:
+                self._chunks.move_to_end(key)
+                self.hits += 1
+                return data
+
+        data = None if self.shared_dir is None else self._load_shared(ds_id, chunk_id)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.shared_hits += 1
+        if data is None:
+            data = load()
+            if self.shared_dir is not None:
+                self._store_shared(ds_id, chunk_id, data)
+
+        # chunks that don't fit into the cache are not stored
+        if data.nbytes > self.max_bytes:
+            return data
+        with self._lock:
+            if key not in self._chunks:
+                self._chunks[key] = data
+                self._n_bytes += data.nbytes
+            while self._n_bytes > self.max_bytes:
+                _, evicted = self._chunks.popitem(last=False)
+                self._n_bytes -= evicted.nbytes
+                self.evictions += 1
+        return data
+
+    def wrap(self, ds, ds_id):
+        """ Wrap the dataset so that reads go through the cache.
+        """
+        return CachedDataset(ds, self, ds_id)
+
+    @property
+    def hit_rate(self):
+        return cache_hit_rate(self.stats())
+
+    def stats(self):
+        return {'hits': self.hits, 'shared_hits': self.shared_hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+
+class CachedDataset:
+    """ Read-only view of a chunked dataset that reads the chunks through a `ChunkCache`.
+
+    Requests that are not given as slices and integers are passed to the dataset.
+    """
+    def __init__(self, ds, cache, ds_id):
+        self._ds = ds
+        self._cache = cache
+        self._ds_id = ds_id
+
+    def __getattr__(self, name):
+        return getattr(self._ds, name)
+
+    def __setattr__(self, name, value):
+        # set attributes like `n_threads` on the wrapped dataset
+        if name.startswith('_'):
+            super().__setattr__(name, value)
+        else:
+            setattr(self._ds, name, value)
+
+    def _normalize_index(self, index):
+        if not isinstance(index, tuple):
+            index = (index,)
+        if len(index) > self._ds.ndim or any(ind is Ellipsis for ind in index):
+            return None
+        index = index + (slice(None),) * (self._ds.ndim - len(index))
+        bb, squeeze = [], []
+        for axis, (ind, sh) in enumerate(zip(index, self._ds.shape)):
+            if isinstance(ind, slice):
+                start, stop, step = ind.indices(sh)
+                if step != 1:
+                    return None
+                bb.append(slice(start, max(start, stop)))
+            elif isinstance(ind, (int, np.integer)):
+                ind = int(ind) + sh if ind < 0 else int(ind)
+                bb.append(slice(ind, ind + 1))
+                squeeze.append(axis)
+            else:
+                return None
+        return tuple(bb), tuple(squeeze)
+
+    def __getitem__(self, index):
+        chunks = self._ds.chunks
+        normalized = None if chunks is None else self._normalize_index(index)
+        if normalized is None:
+            return self._ds[index]
+        bb, squeeze = normalized
+
+        shape = self._ds.shape
+        out = np.empty(tuple(b.stop - b.start for b in bb), dtype=self._ds.dtype)
+        chunk_ranges = [range(b.start // ch, (b.stop - 1) // ch + 1) if b.stop > b.start else range(0)
+                        for b, ch in zip(bb, chunks)]
+        for chunk_id in product(*chunk_ranges):
+            chunk_bb = _chunk_bb(chunk_id, chunks, shape)
+            chunk = self._cache.get(self._ds_id, chunk_id,
+                                    lambda: np.asarray(self._ds[chunk_bb]))
+            # the overlap of the chunk with the requested bounding box
+            # in the coordinates of the chunk and of the output
+            ovlp = tuple(slice(max(b.start, cb.start), min(b.stop, cb.stop))
+                         for b, cb in zip(bb, chunk_bb))
+            out[tuple(slice(o.start - b.start, o.stop - b.start) for o, b in zip(ovlp, bb))] =\
+                chunk[tuple(slice(o.start - cb.start, o.stop - cb.start) for o, cb in zip(ovlp, chunk_bb))]
+        return out.squeeze(axis=squeeze) if squeeze else out
+
+    def __setitem__(self, index, value):
+        raise RuntimeError("Cached datasets are read-only")
+
+
+class CachedFile:
+    """ Wrapper around a file (or group) that returns cached datasets.
+    """
+    def __init__(self, f, cache, path, prefix=''):
+        self._f = f
+        self._cache = cache
+        self._path = path
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __contains__(self, key):
+        return key in self._f
+
+    def __getitem__(self, key):
+        obj = self._f[key]
+        full_key = '/'.join(filter(None, (self._prefix, key)))
+        if hasattr(obj, 'chunks') and hasattr(obj, 'dtype'):
+            ds_id = hashlib.md5(('%s:%s' % (os.path.abspath(self._path), full_key)).encode()).hexdigest()
+            return self._cache.wrap(obj, ds_id)
+        return CachedFile(obj, self._cache, self._path, full_key)
+
+    def __enter__(self):
+        self._f.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        return self._f.__exit__(*args)
+
+
+def make_chunk_cache(config):
+    """ Make the chunk cache from the `chunk_cache` entry of the job config, None if it is not enabled.
+    """
+    cache_config = config.get('chunk_cache', None)
+    if cache_config is None:
+        return None
+    return ChunkCache(cache_config['max_bytes'],
+                      shared_dir=cache_config.get('shared_dir', None),
+                      shared_max_bytes=cache_config.get('shared_max_bytes', None),
+                      namespace=cache_config.get('namespace', 'default'))
+
+
+def save_cache_stats(cache, config, job_id):
+    """ Save the cache statistics of the job, so that the task can report the hit rate.
+    """
+    if cache is None:
+        return None
+    stats = cache.stats()
+    log("chunk cache hit rate: %f (%s)" % (cache.hit_rate, json.dumps(stats)))
+    stats_prefix = config['chunk_cache'].get('stats_prefix', None)
+    if stats_prefix is not None:
+        with open('%s%i.json' % (stats_prefix, job_id), 'w') as f:
+            json.dump(stats, f)
+    return stats
+
+
+def cache_hit_rate(stats):
+    """ Compute the hit rate from the (accumulated) cache statistics.
+    """
+    n_reads = stats['hits'] + stats['shared_hits'] + stats['misses']
+    return (stats['hits'] + stats['shared_hits']) / n_reads if n_reads > 0 else 0.
+
+
+def zorder_blocks(shape, block_shape, block_list):
+    """ Sort the blocks in Z-order (Morton order) of their grid positions.
+
+    Consecutive blocks in Z-order are spatial neighbors most of the time,
+    which increases the chunk cache hits for blocks with halo.
+    """
+    grid_shape = tuple(sh // bs + int(sh % bs != 0) for sh, bs in zip(shape, block_shape))
+    positions = np.unravel_index(np.array(block_list, dtype='int64'), grid_shape)
+    n_bits = int(max(grid_shape) - 1).bit_length()
+    ndim = len(grid_shape)
+    codes = np.zeros(len(block_list), dtype='uint64')
+    for bit in range(n_bits):
+        for dim, pos in enumerate(positions):
+            bit_val = ((pos >> bit) & 1).astype('uint64')
+            codes |= bit_val << np.uint64(bit * ndim + (ndim - 1 - dim))
+    order = np.argsort(codes, kind='stable')
+    return [block_list[i] for i in order]
@@ -0,0 +1,119 @@
+import os
+import json
+import time
+
+#
+# Co-scheduling of single-job tasks in one allocation.
+#
+# A runner job is submitted to the scheduler once and executes the job scripts that are
+# dropped into its spool directory one after another, until it has been idle for a while.
+# This avoids waiting in the queue for each of the small reduce tasks of a workflow.
+# The job scripts write the same logs, ledgers and status files as the array jobs,
+# so checking for job success works as usual.
+#
+# Claiming a script is done by renaming it, which is atomic. Before the runner exits, it marks
+# the spool as closed and runs the remaining scripts; scripts that are dropped after this can
+# be reclaimed by the task (if the runner did not claim them) and are submitted to a new runner.
+#
+
+RUNNER_TEMPLATE = """#!/bin/bash
+SPOOL=%(spool)s
+IDLE_TIMEOUT=%(idle_timeout)i
+%(preamble)s
+date +%%s > $SPOOL/started
+
+run_next () {
+    for script in $(ls -1 $SPOOL/*.sh 2> /dev/null | sort); do
+        running=${script%%.sh}.running
+        # another runner may claim the script first
+        mv $script $running 2> /dev/null || continue
+        bash $running
+        mv $running ${script%%.sh}.finished
+        return 0
+    done
+    return 1
+}
+
+idle=0
+while [ $idle -lt $IDLE_TIMEOUT ]; do
+    touch $SPOOL/heartbeat
+    if run_next; then
+        idle=0
+    else
+        sleep 1
+        idle=$((idle + 1))
+    fi
+done
+
+# close the spool and run the scripts that were dropped in the meantime
+touch $SPOOL/closed
+while run_next; do :; done
+"""
+
+
+def runner_script(spool_dir, idle_timeout, preamble=''):
+    """ Get the shell script for the runner of the spool directory.
+    """
+    return RUNNER_TEMPLATE % {'spool': os.path.abspath(spool_dir),
+                              'idle_timeout': idle_timeout,
+                              'preamble': preamble}
+
+
+def load_runner(folder):
+    """ Load the state of the current runner, None if no runner was started yet.
+    """
+    path = os.path.join(folder, 'runner.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_runner(folder, runner):
+    path = os.path.join(folder, 'runner.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(runner, f)
+    os.replace(path + '.tmp', path)
+
+
+def remaining_time(runner):
+    """ Remaining run time of the runner in seconds.
+
+    The runner's time starts when the job starts, so a pending runner has its full time left.
+    """
+    started_path = os.path.join(runner['spool'], 'started')
+    total = 60 * runner['time_limit']
+    if not os.path.exists(started_path):
+        return total
+    with open(started_path) as f:
+        content = f.read().strip()
+    started = int(content) if content else time.time()
+    return total - (time.time() - started)
+
+
+def is_closed(runner):
+    return os.path.exists(os.path.join(runner['spool'], 'closed'))
+
+
+def drop_script(spool_dir, job_name, commands):
+    """ Write a job script to the spool directory, so that the runner executes it.
+
+    The scripts are executed in the order they were dropped.
+    """
+    script_path = os.path.join(spool_dir, '%i_%s.sh' % (time.time_ns(), job_name))
+    with open(script_path + '.tmp', 'w') as f:
+        f.write("#!/bin/bash\n" + commands)
+    os.replace(script_path + '.tmp', script_path)
+    return script_path
+
+
+def reclaim_script(script_path):
+    """ Take back a script that was not claimed by the runner.
+
+    Returns whether the script was reclaimed.
+    """
+    try:
+        os.rename(script_path, script_path[:-3] + '.reclaimed')
+    except OSError:
+        return False
+    return True
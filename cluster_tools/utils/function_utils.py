@@ -1,7 +1,211 @@
+import os
+import json
+import resource
+import struct
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from subprocess import check_output
 
 
+#
+# binary completion ledger
+#
+
+# the ledger is an append-only file per job, which records the processed blocks and jobs
+# as fixed size records (kind, id, unix-time), so that checking for success
+# does not require parsing the text logs.
+# the path is passed via this environment variable or set via `set_ledger`
+LEDGER_ENV_VAR = 'CLUSTER_TOOLS_LEDGER'
+LEDGER_RECORD_FORMAT = '<Bqd'
+LEDGER_JOB_START, LEDGER_BLOCK, LEDGER_JOB = 0, 1, 2
+
+_ledger_path = None
+_ledger_lock = threading.Lock()
+
+
+def _write_ledger_record(kind, record_id):
+    if _ledger_path is None:
+        return
+    record = struct.pack(LEDGER_RECORD_FORMAT, kind, record_id, time.time())
+    with _ledger_lock:
+        with open(_ledger_path, 'ab') as f:
+            f.write(record)
+
+
+def set_ledger(path):
+    """ Set the path of the ledger for the current job and mark the job start.
+    Set to None to disable the ledger.
+    """
+    global _ledger_path
+    _ledger_path = path
+    _write_ledger_record(LEDGER_JOB_START, -1)
+
+
+# jobs started in a new process get the ledger path from the environment
+if LEDGER_ENV_VAR in os.environ:
+    set_ledger(os.environ[LEDGER_ENV_VAR])
+
+
+#
+# per-block profiling
+#
+
+# if a profile path is set, the jobs record a json line per block with the total time,
+# the time and bytes of the sections (read, write, compute, ...) and the peak memory.
+# the path is passed via this environment variable or set via `set_profile`
+PROFILE_ENV_VAR = 'CLUSTER_TOOLS_PROFILE'
+
+_profile_path = None
+_profile_lock = threading.Lock()
+# the block that is currently profiled in this thread
+_profile_state = threading.local()
+
+
+def set_profile(path):
+    """ Set the path of the block profile for the current job.
+    Set to None to disable profiling.
+    """
+    global _profile_path
+    _profile_path = path
+
+
+if PROFILE_ENV_VAR in os.environ:
+    set_profile(os.environ[PROFILE_ENV_VAR])
+
+
+# ru_maxrss is the peak memory over the lifetime of the process, which is not a per job
+# value for the workers of the persistent local pool; on linux we read the resettable
+# peak resident memory (VmHWM) from procfs instead
+def can_reset_peak_rss():
+    """ Check whether the peak memory of the processes can be reset, without resetting it.
+    """
+    return os.access('/proc/self/clear_refs', os.W_OK)
+
+
+def reset_peak_rss():
+    """ Reset the peak memory of this process, returns whether this is supported.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss():
+    """ Peak resident memory of this process in bytes.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is given in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _current_profile():
+    return getattr(_profile_state, 'record', None)
+
+
+def start_block_profile(block_id, n_voxels=None):
+    """ Start the profile record for block `block_id`.
+
+    Use this together with `finish_block_profile` and the `record` arguments
+    if the block is processed by several threads (e.g. in a dask pipeline),
+    otherwise use the `profile_block` context.
+    Returns None if profiling is not enabled.
+    """
+    if _profile_path is None:
+        return None
+    return {'block_id': int(block_id), 'n_voxels': None if n_voxels is None else int(n_voxels),
+            'start': time.time(), 't0': time.perf_counter(), 'sections': {}}
+
+
+def finish_block_profile(record):
+    """ Finish the profile record and write it to the job profile.
+    """
+    if record is None:
+        return
+    record['time'] = time.perf_counter() - record.pop('t0')
+    record['max_rss'] = peak_rss()
+    line = json.dumps(record) + '\n'
+    with _profile_lock:
+        with open(_profile_path, 'a') as f:
+            f.write(line)
+
+
+@contextmanager
+def profile_block(block_id, n_voxels=None):
+    """ Profile processing of the block `block_id`.
+
+    The sections and byte counts recorded in this thread while the context is active
+    are attributed to this block. Does nothing if profiling is not enabled.
+    The record is not written if processing the block fails.
+    """
+    record = start_block_profile(block_id, n_voxels)
+    if record is None:
+        yield
+        return
+    _profile_state.record = record
+    try:
+        yield
+    finally:
+        _profile_state.record = None
+    finish_block_profile(record)
+
+
+def _add_to_section(record, name, seconds=0., n_bytes=0):
+    if record is None:
+        return
+    section = record['sections'].setdefault(name, {'time': 0., 'bytes': 0})
+    section['time'] += seconds
+    section['bytes'] += int(n_bytes)
+
+
+@contextmanager
+def profile_section(name, record=None):
+    """ Time a section of the block that is currently profiled, e.g. 'compute'.
+    """
+    record = _current_profile() if record is None else record
+    if record is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add_to_section(record, name, seconds=time.perf_counter() - t0)
+
+
+def profile_bytes(name, n_bytes, record=None):
+    """ Count bytes for a section of the block that is currently profiled.
+    """
+    _add_to_section(_current_profile() if record is None else record, name, n_bytes=n_bytes)
+
+
+def profiled_read(ds, bb, name='read', record=None):
+    """ Read `ds[bb]` and record time and bytes in the profile section `name`.
+    """
+    with profile_section(name, record):
+        data = ds[bb]
+    profile_bytes(name, getattr(data, 'nbytes', 0), record)
+    return data
+
+
+def profiled_write(ds, bb, data, name='write', record=None):
+    """ Write `ds[bb] = data` and record time and bytes in the profile section `name`.
+    """
+    with profile_section(name, record):
+        ds[bb] = data
+    profile_bytes(name, getattr(data, 'nbytes', 0), record)
+
+
 # TODO log-levels
 # stdout is always piped to file, sowe can use it as logging
 def log(msg):
@@ -9,10 +213,12 @@ def log(msg):
 
 
 def log_block_success(block_id):
+    _write_ledger_record(LEDGER_BLOCK, block_id)
     print("%s: processed block %i" % (str(datetime.now()), block_id))
 
 
 def log_job_success(job_id):
+    _write_ledger_record(LEDGER_JOB, job_id)
     print("%s: processed job %i" % (str(datetime.now()), job_id))
 
 
@@ -0,0 +1,174 @@
+import numpy as np
+
+#
+# Region graph and edge feature extraction from in-memory label blocks.
+#
+# The edge features follow the layout of the features accumulated by nifty for boundary maps:
+# mean, variance, min, 10%, 25%, 50%, 75% and 90% quantile, max and size,
+# where the values of both voxels of each pair of adjacent voxels with different labels
+# are accumulated and the size is the number of pairs.
+# In contrast to nifty, the quantiles are computed exactly and not from histograms.
+#
+
+N_EDGE_FEATURES = 10
+QUANTILES = (.1, .25, .5, .75, .9)
+
+
+def _select_pairs(labels_u, labels_v, values_u, values_v, ignore_label):
+    pair_mask = labels_u != labels_v
+    if ignore_label:
+        pair_mask = np.logical_and(pair_mask, labels_u != 0)
+        pair_mask = np.logical_and(pair_mask, labels_v != 0)
+    return (labels_u[pair_mask], labels_v[pair_mask],
+            values_u[pair_mask], values_v[pair_mask])
+
+
+def boundary_pairs(labels, values, ignore_label=True):
+    """ Find all pairs of adjacent voxels with different labels.
+
+    Arguments:
+        labels [np.ndarray] - the label volume
+        values [np.ndarray] - the values accumulated for the pairs, same shape as labels
+        ignore_label [bool] - whether to ignore pairs with label 0 (default: True)
+    Returns:
+        labels and values of the first and second voxel of all pairs
+    """
+    assert labels.shape == values.shape, "%s, %s" % (str(labels.shape), str(values.shape))
+    pairs = []
+    for axis in range(labels.ndim):
+        lower = tuple(slice(None, -1) if d == axis else slice(None) for d in range(labels.ndim))
+        upper = tuple(slice(1, None) if d == axis else slice(None) for d in range(labels.ndim))
+        pairs.append(_select_pairs(labels[lower], labels[upper],
+                                   values[lower], values[upper], ignore_label))
+    return tuple(np.concatenate([pair[i] for pair in pairs]) for i in range(4))
+
+
+def region_edges(labels, ignore_label=True):
+    """ Extract the edges of the region graph of a label block.
+
+    Returns:
+        np.ndarray - the edges, sorted lexicographically with u < v
+    """
+    edges = []
+    for axis in range(labels.ndim):
+        lower = tuple(slice(None, -1) if d == axis else slice(None) for d in range(labels.ndim))
+        upper = tuple(slice(1, None) if d == axis else slice(None) for d in range(labels.ndim))
+        labels_u, labels_v = labels[lower].ravel(), labels[upper].ravel()
+        pair_mask = labels_u != labels_v
+        if ignore_label:
+            pair_mask = np.logical_and(pair_mask, labels_u != 0)
+            pair_mask = np.logical_and(pair_mask, labels_v != 0)
+        labels_u, labels_v = labels_u[pair_mask], labels_v[pair_mask]
+        edges.append(np.stack([np.minimum(labels_u, labels_v), np.maximum(labels_u, labels_v)], axis=1))
+    edges = np.concatenate(edges, axis=0).astype('uint64')
+    if edges.size == 0:
+        return edges
+    return np.unique(edges, axis=0)
+
+
+def face_pairs(labels_a, labels_b, values_a, values_b, ignore_label=True):
+    """ Find the pairs of voxels with different labels across a face.
+
+    The two faces must have the same shape, voxels at the same position are adjacent.
+    """
+    assert labels_a.shape == labels_b.shape, "%s, %s" % (str(labels_a.shape), str(labels_b.shape))
+    return _select_pairs(labels_a.ravel(), labels_b.ravel(),
+                         values_a.ravel(), values_b.ravel(), ignore_label)
+
+
+def _accumulate(ids, values, n_edges):
+    # sort the values by edge and value, so that we can read off min, max and quantiles
+    order = np.lexsort((values, ids))
+    ids, values = ids[order], values[order]
+
+    sizes = np.bincount(ids, minlength=n_edges)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype('int64')
+    mean = np.bincount(ids, weights=values, minlength=n_edges) / sizes
+    variance = np.bincount(ids, weights=values ** 2, minlength=n_edges) / sizes - mean ** 2
+    variance = np.maximum(variance, 0.)
+
+    features = [mean, variance, values[starts]]
+    for q in QUANTILES:
+        pos = starts + q * (sizes - 1)
+        lower = np.floor(pos).astype('int64')
+        upper = np.ceil(pos).astype('int64')
+        features.append(values[lower] + (values[upper] - values[lower]) * (pos - lower))
+    # the size is the number of voxel pairs, i.e. half the number of accumulated values
+    features.extend([values[starts + sizes - 1], sizes / 2.])
+    return np.stack(features, axis=1)
+
+
+def edge_features(labels_u, labels_v, values_u, values_v):
+    """ Compute the edges and edge features from pairs of adjacent voxels.
+
+    Returns:
+        np.ndarray - the edges, sorted lexicographically with u < v
+        np.ndarray - the features, n_edges x N_EDGE_FEATURES
+    """
+    if labels_u.size == 0:
+        return np.zeros((0, 2), dtype='uint64'), np.zeros((0, N_EDGE_FEATURES), dtype='float64')
+    edges = np.stack([np.minimum(labels_u, labels_v), np.maximum(labels_u, labels_v)], axis=1)
+    edges, edge_ids = np.unique(edges.astype('uint64'), axis=0, return_inverse=True)
+    edge_ids = edge_ids.ravel()
+    ids = np.concatenate([edge_ids, edge_ids])
+    values = np.concatenate([values_u, values_v]).astype('float64')
+    return edges, _accumulate(ids, values, len(edges))
+
+
+def _merge_features(edge_ids, n_edges, features):
+    sizes = features[:, -1]
+
+    merged_sizes = np.bincount(edge_ids, weights=sizes, minlength=n_edges)
+    mean = np.bincount(edge_ids, weights=sizes * features[:, 0], minlength=n_edges) / merged_sizes
+    second_moment = features[:, 1] + features[:, 0] ** 2
+    variance = np.bincount(edge_ids, weights=sizes * second_moment, minlength=n_edges) / merged_sizes
+    variance = np.maximum(variance - mean ** 2, 0.)
+
+    min_ = np.full(n_edges, np.inf)
+    np.minimum.at(min_, edge_ids, features[:, 2])
+    max_ = np.full(n_edges, -np.inf)
+    np.maximum.at(max_, edge_ids, features[:, -2])
+    quantiles = [np.bincount(edge_ids, weights=sizes * features[:, 3 + i], minlength=n_edges) / merged_sizes
+                 for i in range(len(QUANTILES))]
+
+    return np.stack([mean, variance, min_] + quantiles + [max_, merged_sizes], axis=1)
+
+
+def merge_edge_features(edges, features):
+    """ Merge the features of duplicate edges.
+
+    Mean, variance, min, max and size are merged exactly, the quantiles
+    are approximated by the size-weighted mean, like nifty does when merging feature blocks.
+    """
+    edges, edge_ids = np.unique(edges, axis=0, return_inverse=True)
+    return edges, _merge_features(edge_ids.ravel(), len(edges), features)
+
+
+def merge_edge_id_features(edge_ids, features):
+    """ Merge the features of duplicate edge ids, see `merge_edge_features`.
+
+    Returns:
+        np.ndarray - the unique edge ids, sorted
+        np.ndarray - the merged features
+    """
+    edge_ids, inverse = np.unique(edge_ids, return_inverse=True)
+    return edge_ids, _merge_features(inverse.ravel(), len(edge_ids), features)
+
+
+def block_sub_graph(labels, values, ignore_label=True):
+    """ Extract the region graph and edge features of a label block.
+
+    Arguments:
+        labels [np.ndarray] - the label block
+        values [np.ndarray] - boundary map for the edge features, same shape as labels
+        ignore_label [bool] - whether to ignore label 0 (default: True)
+    Returns:
+        np.ndarray - the nodes
+        np.ndarray - the edges, sorted lexicographically with u < v
+        np.ndarray - the edge features, n_edges x N_EDGE_FEATURES
+    """
+    nodes = np.unique(labels).astype('uint64')
+    if ignore_label and nodes.size > 0 and nodes[0] == 0:
+        nodes = nodes[1:]
+    edges, features = edge_features(*boundary_pairs(labels, values, ignore_label))
+    return nodes, edges, features
@@ -0,0 +1,219 @@
+import os
+import json
+import hashlib
+import time
+
+import numpy as np
+
+#
+# Incremental re-execution of blockwise tasks.
+#
+# Each block is identified by a signature that combines the hash of the job config
+# with stamps of the chunks of the input datasets the block reads (including the halo).
+# The stamps are either the modification times and sizes of the chunk files ('mtime')
+# or checksums of their content ('checksum'). After a task has run successfully, the signatures
+# of the processed blocks and the stamps of their output chunks are stored in a manifest;
+# in the next run only the blocks whose signature or output changed are scheduled.
+# As tasks only rewrite the output chunks of dirty blocks, the dirty block set propagates
+# to the downstream tasks through the chunk stamps of their inputs.
+#
+# Chunk level stamps are only available for n5 and zarr containers, for other formats
+# (e.g. hdf5) all chunks of a dataset share the stamp of the file.
+#
+
+INCREMENTAL_MODES = ('mtime', 'checksum')
+
+# config values that only affect the scheduling and resources, but not the results
+SCHEDULING_KEYS = {'shebang', 'groupname', 'partition', 'max_num_retries', 'easybuild', 'qos',
+                   'block_queue', 'block_queue_batch_size', 'job_balancing', 'block_weights_path',
+                   'profile', 'occupancy_index', 'prefetch_blocks', 'write_behind',
+                   'chunk_cache', 'chunk_cache_mb', 'chunk_cache_shared_dir', 'chunk_cache_shared_mb',
+                   'max_array_size', 'poll_interval', 'max_poll_interval', 'poll_backoff',
+                   'accounting_grace_period',
+                   'incremental', 'threads_per_job', 'time_limit', 'mem_limit',
+                   'coschedule', 'coschedule_threads', 'coschedule_mem_limit', 'coschedule_time_limit',
+                   'coschedule_idle_timeout', 'resource_store', 'resource_safety_factor',
+                   'resource_max_time_limit', 'resource_max_threads', 'max_jobs', 'config_dir'}
+# config values that select the blocks, which are handled by the manifest
+BLOCK_KEYS = {'block_list', 'block_list_path', 'roi_begin', 'roi_end'}
+
+# (path, key) -> (dataset stamp, time of computation), cleared before a task runs;
+# the entries expire, so that the changes between subsequent builds in one process are detected
+_stamp_cache = {}
+STAMP_CACHE_EXPIRY = 10.
+
+
+def config_hash(*configs, exclude=SCHEDULING_KEYS):
+    """ Hash the configs, ignoring the values in `exclude`.
+    """
+    to_hash = [{k: v for k, v in config.items() if k not in exclude} for config in configs]
+    return hashlib.sha1(json.dumps(to_hash, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def clear_stamp_cache():
+    _stamp_cache.clear()
+
+
+def _file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 'missing'
+    return '%i:%i' % (stat.st_mtime_ns, stat.st_size)
+
+
+def _checksum(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return 'missing'
+
+
+class DatasetLayout:
+    """ Locate the chunk files of a dataset in a n5 or zarr container.
+    """
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.ds_dir = os.path.join(path, key)
+        self.shape = self.chunks = None
+        self._chunk_path = None
+
+        n5_attrs = os.path.join(self.ds_dir, 'attributes.json')
+        zarr_attrs = os.path.join(self.ds_dir, '.zarray')
+        if os.path.exists(zarr_attrs):
+            with open(zarr_attrs) as f:
+                attrs = json.load(f)
+            self.shape, self.chunks = tuple(attrs['shape']), tuple(attrs['chunks'])
+            sep = attrs.get('dimension_separator', '.')
+            self._chunk_path = lambda chunk_id: os.path.join(self.ds_dir, sep.join(map(str, chunk_id)))
+        elif os.path.exists(n5_attrs):
+            with open(n5_attrs) as f:
+                attrs = json.load(f)
+            if 'dimensions' in attrs:
+                # n5 stores the dimensions in reversed order
+                self.shape, self.chunks = tuple(attrs['dimensions'][::-1]), tuple(attrs['blockSize'][::-1])
+                self._chunk_path = lambda chunk_id: os.path.join(self.ds_dir, *map(str, chunk_id[::-1]))
+
+    @property
+    def chunked(self):
+        return self._chunk_path is not None
+
+    def chunk_paths(self, bb):
+        """ Get the paths of the chunks overlapping with the bounding box.
+
+        The bounding box can be given for the trailing dimensions only.
+        """
+        bb = (slice(None),) * (len(self.shape) - len(bb)) + tuple(bb)
+        ranges = []
+        for b, sh, ch in zip(bb, self.shape, self.chunks):
+            start, stop, _ = b.indices(sh)
+            ranges.append(np.arange(start // ch, (stop - 1) // ch + 1) if stop > start else np.arange(0))
+        grid = np.meshgrid(*ranges, indexing='ij')
+        chunk_ids = np.stack([g.ravel() for g in grid], axis=1)
+        return [self._chunk_path(tuple(int(c) for c in chunk_id)) for chunk_id in chunk_ids]
+
+
+class ChunkStamps:
+    """ Compute and memoize the stamps of the chunks of a dataset.
+    """
+    def __init__(self, path, key, mode):
+        assert mode in INCREMENTAL_MODES, mode
+        self.layout = DatasetLayout(path, key)
+        self._stamp = _checksum if mode == 'checksum' else _file_stamp
+        self._stamps = {}
+
+    def _get(self, path):
+        stamp = self._stamps.get(path, None)
+        if stamp is None:
+            stamp = self._stamp(path)
+            self._stamps[path] = stamp
+        return stamp
+
+    def __call__(self, bb):
+        if not self.layout.chunked:
+            # without chunk files, all blocks depend on the complete file
+            return [dataset_stamp(self.layout.path, self.layout.key)]
+        return [self._get(path) for path in self.layout.chunk_paths(bb)]
+
+
+def dataset_stamp(path, key):
+    """ Latest modification time of the dataset, i.e. of its chunk files for n5 and zarr.
+    """
+    cache_key = (path, key)
+    stamp, computed = _stamp_cache.get(cache_key, (None, 0.))
+    if time.time() - computed < STAMP_CACHE_EXPIRY:
+        return stamp
+    ds_dir = os.path.join(path, key)
+    if os.path.isdir(ds_dir):
+        stamp = 0.
+        for root, _, files in os.walk(ds_dir):
+            stamp = max(stamp, os.stat(root).st_mtime)
+            for name in files:
+                try:
+                    stamp = max(stamp, os.stat(os.path.join(root, name)).st_mtime)
+                except OSError:
+                    pass
+    else:
+        stamp = os.stat(path).st_mtime if os.path.exists(path) else time.time()
+    _stamp_cache[cache_key] = (stamp, time.time())
+    return stamp
+
+
+def _block_bbs(shape, block_shape, block_list, halo=None):
+    grid_shape = tuple(sh // bs + int(sh % bs != 0) for sh, bs in zip(shape, block_shape))
+    positions = np.array(np.unravel_index(np.array(block_list, dtype='int64'), grid_shape)).T
+    halo = [0] * len(shape) if halo is None else halo
+    bbs = []
+    for pos in positions:
+        bbs.append(tuple(slice(max(0, p * bs - ha), min(sh, (p + 1) * bs + ha))
+                         for p, bs, ha, sh in zip(pos, block_shape, halo, shape)))
+    return bbs
+
+
+def block_signatures(inputs, shape, block_shape, block_list, config_hash_, mode, halo=None):
+    """ Compute the signatures of the blocks from the job config hash and their input chunks.
+
+    Arguments:
+        inputs [list[tuple]] - paths and keys of the input datasets
+        shape [tuple] - shape of the volume
+        block_shape [tuple] - shape of the blocks
+        block_list [list[int]] - ids of the blocks
+        config_hash_ [str] - hash of the job config
+        mode [str] - 'mtime' or 'checksum'
+        halo [list[int]] - halo of the blocks (default: None)
+    """
+    stamps = [ChunkStamps(path, key, mode) for path, key in inputs]
+    signatures = {}
+    for block_id, bb in zip(block_list, _block_bbs(shape, block_shape, block_list, halo)):
+        to_hash = [config_hash_] + [stamp(bb) for stamp in stamps]
+        signatures[int(block_id)] = hashlib.sha1(json.dumps(to_hash).encode()).hexdigest()
+    return signatures
+
+
+def output_signatures(outputs, shape, block_shape, block_list, mode):
+    """ Compute the signatures of the output chunks of the blocks.
+    """
+    return block_signatures(outputs, shape, block_shape, block_list, '', mode)
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {int(block_id): tuple(sigs) for block_id, sigs in json.load(f).items()}
+
+
+def save_manifest(path, manifest):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({str(block_id): list(sigs) for block_id, sigs in manifest.items()}, f)
+    os.replace(tmp_path, path)
+
+
+def dirty_blocks(manifest, block_list, signatures, out_signatures):
+    """ Get the blocks whose inputs, config or outputs changed since they were last computed.
+    """
+    return [block_id for block_id in block_list
+            if manifest.get(block_id, None) != (signatures[block_id], out_signatures[block_id])]
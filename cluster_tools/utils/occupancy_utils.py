@@ -0,0 +1,199 @@
+import os
+import socket
+import threading
+from concurrent import futures
+from itertools import product
+
+import numpy as np
+from elf.io import open_file
+
+#
+# Persistent sparse occupancy index for datasets.
+#
+# The index stores for each chunk of a dataset whether it (potentially) contains data,
+# so that empty blocks can be skipped before scheduling them.
+# It is stored next to the container in '<path>.occupancy/<key>/':
+# 'index.npz' contains the occupancy of all chunks and '*.updates' contain the ids
+# of chunks that were marked as occupied by jobs afterwards (as int64).
+# The updates are appended before the data is written, so the index is conservative,
+# even if a job fails.
+#
+# NOTE the index is only valid as long as the dataset is only written by tasks that
+# update it. If the dataset is changed otherwise, call `compute_occupancy` again.
+#
+
+_update_lock = threading.Lock()
+# (path, key) -> (index mtime, spatial shape, chunks)
+_meta_cache = {}
+
+
+def occupancy_folder(path, key):
+    return os.path.join(path.rstrip(os.sep) + '.occupancy', key)
+
+
+def _index_path(path, key):
+    return os.path.join(occupancy_folder(path, key), 'index.npz')
+
+
+def _dataset_meta(path, key):
+    with open_file(path, 'r') as f:
+        ds = f[key]
+        shape = tuple(ds.shape)
+        chunks = shape if ds.chunks is None else tuple(ds.chunks)
+    # we only keep track of the spatial occupancy for data with channels
+    if len(shape) == 4:
+        shape, chunks = shape[1:], chunks[1:]
+    return shape, chunks
+
+
+def _grid_shape(shape, chunks):
+    return tuple(sh // ch + int(sh % ch != 0) for sh, ch in zip(shape, chunks))
+
+
+def init_occupancy(path, key, occupied=None):
+    """ Write a new occupancy index for the dataset; all chunks are empty if `occupied` is not given.
+    """
+    shape, chunks = _dataset_meta(path, key)
+    grid_shape = _grid_shape(shape, chunks)
+    if occupied is None:
+        occupied = np.zeros(grid_shape, dtype='bool')
+    assert occupied.shape == grid_shape, "%s, %s" % (str(occupied.shape), str(grid_shape))
+
+    folder = occupancy_folder(path, key)
+    os.makedirs(folder, exist_ok=True)
+    for name in os.listdir(folder):
+        if name.endswith('.updates'):
+            os.remove(os.path.join(folder, name))
+    # write to tmp file and move, so that jobs never see a partially written index
+    index_path = _index_path(path, key)
+    tmp_path = index_path + '.tmp.npz'
+    np.savez_compressed(tmp_path, shape=np.array(shape), chunks=np.array(chunks), occupied=occupied)
+    os.replace(tmp_path, index_path)
+
+
+def load_occupancy(path, key):
+    """ Load the occupancy of all chunks in the dataset.
+
+    Returns the occupancy and the chunk shape or None if there is no valid index.
+    """
+    index_path = _index_path(path, key)
+    if not os.path.exists(index_path):
+        return None
+    with np.load(index_path) as f:
+        shape, chunks, occupied = tuple(f['shape']), tuple(f['chunks']), f['occupied']
+    # the dataset was re-created since the index was written
+    if (shape, chunks) != _dataset_meta(path, key):
+        return None
+
+    folder = occupancy_folder(path, key)
+    for name in os.listdir(folder):
+        if not name.endswith('.updates'):
+            continue
+        update_path = os.path.join(folder, name)
+        # a job that was killed while writing might leave an incomplete record
+        n_ids = os.path.getsize(update_path) // 8
+        chunk_ids = np.fromfile(update_path, dtype='int64', count=n_ids)
+        occupied.flat[chunk_ids] = True
+    return occupied, chunks
+
+
+def compute_occupancy(path, key, n_threads=1):
+    """ Compute and store the occupancy index for the dataset.
+
+    Uses the chunk existence if the dataset supports it (n5 / zarr via z5py),
+    otherwise the chunks are read and checked for non-zero values.
+    """
+    shape, chunks = _dataset_meta(path, key)
+    grid_shape = _grid_shape(shape, chunks)
+    with open_file(path, 'r') as f:
+        ds = f[key]
+        n_channel_chunks = 1
+        if ds.ndim == 4:
+            n_channel_chunks = ds.shape[0] // ds.chunks[0] + int(ds.shape[0] % ds.chunks[0] != 0)
+
+        def _check_chunk(chunk_id):
+            if hasattr(ds, 'chunk_exists'):
+                if ds.ndim == 4:
+                    return any(ds.chunk_exists((c,) + chunk_id) for c in range(n_channel_chunks))
+                return ds.chunk_exists(chunk_id)
+            bb = tuple(slice(cid * ch, min((cid + 1) * ch, sh))
+                       for cid, ch, sh in zip(chunk_id, chunks, shape))
+            if ds.ndim == 4:
+                bb = (slice(None),) + bb
+            return bool(np.any(ds[bb]))
+
+        chunk_ids = list(product(*[range(gs) for gs in grid_shape]))
+        with futures.ThreadPoolExecutor(n_threads) as tp:
+            occupied = np.array(list(tp.map(_check_chunk, chunk_ids)), dtype='bool').reshape(grid_shape)
+    init_occupancy(path, key, occupied)
+    return occupied, chunks
+
+
+def _chunk_ranges(begin, end, chunks, grid_shape):
+    return tuple(slice(min(beg // ch, gs), min((en - 1) // ch + 1, gs))
+                 for beg, en, ch, gs in zip(begin, end, chunks, grid_shape))
+
+
+def mark_occupied(path, key, bb):
+    """ Mark the chunks overlapping with the bounding box as occupied.
+
+    Does nothing if the dataset does not have an index. Call this before writing the data.
+    """
+    index_path = _index_path(path, key)
+    try:
+        mtime = os.path.getmtime(index_path)
+    except OSError:
+        return
+    meta = _meta_cache.get((path, key), None)
+    if meta is None or meta[0] != mtime:
+        with np.load(index_path) as f:
+            meta = (mtime, tuple(f['shape']), tuple(f['chunks']))
+        _meta_cache[(path, key)] = meta
+    _, shape, chunks = meta
+    grid_shape = _grid_shape(shape, chunks)
+
+    # remove the channel axis
+    if len(bb) == 4:
+        bb = bb[1:]
+    bb = tuple(slice(*b.indices(sh)[:2]) for b, sh in zip(bb, shape))
+    ranges = _chunk_ranges([b.start for b in bb], [b.stop for b in bb], chunks, grid_shape)
+    chunk_ids = np.ravel_multi_index(tuple(np.mgrid[ranges].reshape((len(ranges), -1))), grid_shape)
+
+    update_path = os.path.join(occupancy_folder(path, key),
+                               '%s_%i.updates' % (socket.gethostname(), os.getpid()))
+    with _update_lock:
+        with open(update_path, 'ab') as f:
+            f.write(chunk_ids.astype('int64').tobytes())
+
+
+def filter_empty_blocks(path, key, blocking, block_list, halo=None, scale_factor=None):
+    """ Remove the blocks that don't overlap with any occupied chunk of the dataset.
+
+    Returns the unchanged block list if the dataset does not have an index.
+
+    Arguments:
+        path [str] - path to the container
+        key [str] - key of the dataset
+        blocking [nifty.tools.blocking] - the blocking
+        block_list [list] - the block ids
+        halo [listlike] - halo that is added to the blocks (default: None)
+        scale_factor [int or listlike] - factor to map block coordinates
+            to the coordinates of the dataset, e.g. for downscaling (default: None)
+    """
+    occupancy = load_occupancy(path, key)
+    if occupancy is None:
+        return block_list
+    occupied, chunks = occupancy
+    if scale_factor is not None and not isinstance(scale_factor, (list, tuple)):
+        scale_factor = [scale_factor] * len(chunks)
+
+    def _has_data(block_id):
+        block = blocking.getBlock(block_id) if halo is None else\
+            blocking.getBlockWithHalo(block_id, list(halo)).outerBlock
+        begin, end = block.begin, block.end
+        if scale_factor is not None:
+            begin = [int(np.floor(beg * sf)) for beg, sf in zip(begin, scale_factor)]
+            end = [int(np.ceil(en * sf)) for en, sf in zip(end, scale_factor)]
+        return occupied[_chunk_ranges(begin, end, chunks, occupied.shape)].any()
+
+    return [block_id for block_id in block_list if _has_data(block_id)]
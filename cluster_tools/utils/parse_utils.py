@@ -1,9 +1,110 @@
 import os
+import json
 import datetime
 from subprocess import CalledProcessError
 
 import numpy as np
-from .function_utils import tail
+from .function_utils import (tail, LEDGER_RECORD_FORMAT,
+                             LEDGER_JOB_START, LEDGER_BLOCK, LEDGER_JOB)
+
+
+########################
+# Read completion ledger
+########################
+
+# numpy equivalent of `LEDGER_RECORD_FORMAT`
+LEDGER_DTYPE = np.dtype([('kind', '<u1'), ('id', '<i8'), ('time', '<f8')])
+
+
+def ledger_path(log_file):
+    """ Get the path to the ledger corresponding to a job log file:
+        'tmp_folder/logs/<job>.log' -> 'tmp_folder/ledgers/<job>.ledger'
+    """
+    log_folder, log_name = os.path.split(log_file)
+    return os.path.join(os.path.split(log_folder)[0], 'ledgers',
+                        os.path.splitext(log_name)[0] + '.ledger')
+
+
+def read_ledger(path):
+    """ Read all records from a job ledger.
+
+    Returns None if the ledger does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    # a job that was killed while writing might leave an incomplete record
+    n_records = os.path.getsize(path) // LEDGER_DTYPE.itemsize
+    return np.fromfile(path, dtype=LEDGER_DTYPE, count=n_records)
+
+
+#######################
+# Read block profiles
+#######################
+
+
+def read_profile(path):
+    """ Read the per-block records from a job profile.
+    """
+    records = []
+    with open(path) as f:
+        for line in f:
+            # a job that was killed while writing might leave an incomplete record
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def summarize_profile(records, n_slowest=5):
+    """ Summarize per-block profile records.
+
+    Returns the number of blocks, the block time percentiles, the throughput in voxels / s,
+    the time, MB and MB / s for each section, the peak memory and the slowest blocks.
+    """
+    times = np.array([rec['time'] for rec in records], dtype='float64')
+    total_time = float(times.sum())
+    n_voxels = sum(rec['n_voxels'] for rec in records if rec['n_voxels'] is not None)
+
+    sections = {}
+    for rec in records:
+        for name, section in rec['sections'].items():
+            summary = sections.setdefault(name, {'time': 0., 'mb': 0.})
+            summary['time'] += section['time']
+            summary['mb'] += section['bytes'] / 1.e6
+    for summary in sections.values():
+        summary['fraction'] = summary['time'] / total_time if total_time > 0 else 0.
+        summary['mb_per_s'] = summary['mb'] / summary['time'] if summary['time'] > 0 else None
+
+    percentiles = {'p%i' % q: float(val)
+                   for q, val in zip((50, 90, 99, 100), np.percentile(times, (50, 90, 99, 100)))}\
+        if len(times) > 0 else {}
+    slowest = sorted(records, key=lambda rec: rec['time'], reverse=True)[:n_slowest]
+    return {'n_blocks': len(records), 'time': total_time, 'block_time': percentiles,
+            'voxels_per_s': n_voxels / total_time if total_time > 0 and n_voxels > 0 else None,
+            'sections': sections,
+            'max_rss_mb': max((rec['max_rss'] for rec in records), default=0) / 1.e6,
+            'slowest_blocks': [(rec['block_id'], rec['time']) for rec in slowest]}
+
+
+def profile_report(tmp_folder, n_slowest=5):
+    """ Summarize the block profiles of all tasks in tmp_folder.
+
+    The jobs are grouped by task (or rather job name, i.e. including the job prefix).
+    """
+    profile_folder = os.path.join(tmp_folder, 'profiles')
+    if not os.path.exists(profile_folder):
+        return {}
+    task_records = {}
+    for name in sorted(os.listdir(profile_folder)):
+        if not name.endswith('.profile'):
+            continue
+        # 'tmp_folder/profiles/<job_name>_<job_id>.profile'
+        job_name = os.path.splitext(name)[0].rsplit('_', 1)[0]
+        records = read_profile(os.path.join(profile_folder, name))
+        task_records.setdefault(job_name, []).extend(records)
+    return {job_name: summarize_profile(records, n_slowest)
+            for job_name, records in task_records.items() if records}
 
 
 ################
@@ -14,6 +115,13 @@ from .function_utils import tail
 def parse_runtime(log_file):
     """ Parse the job run-time from a log-file
     """
+    # if we have a ledger, we can get the times from it
+    records = read_ledger(ledger_path(log_file))
+    if records is not None:
+        start = records['time'][records['kind'] == LEDGER_JOB_START]
+        if len(start) > 0 and len(records) > 1:
+            return float(records['time'][-1] - start[0])
+
     with open(log_file, 'r') as f:
         for ii, line in enumerate(f):
             if ii == 0:
@@ -54,7 +162,7 @@ def parse_runtime_task(log_prefix, max_jobs, return_summary=True):
     runtimes = []
     for job_id in range(max_jobs):
         path = log_prefix + '%i.log' % job_id
-        if not os.path.exists(path):
+        if not os.path.exists(path) and not os.path.exists(ledger_path(path)):
             break
         runtimes.append(parse_runtime(path))
     if return_summary:
@@ -73,10 +181,19 @@ def parse_runtime_segmentation_workflow():
 ######################
 
 
+def _ledger_has_job(records, job_id):
+    return bool(np.any((records['kind'] == LEDGER_JOB) & (records['id'] == job_id)))
+
+
 def parse_job(log_file, job_id):
     """ Parse log file to check whether the corresponding
         job was finished successfully
     """
+    # check the ledger if we have it
+    records = read_ledger(ledger_path(log_file))
+    if records is not None:
+        return _ledger_has_job(records, job_id)
+
     # read the last line from the log file and check
     # whether it contains the "processed job" message
     try:
@@ -97,6 +214,11 @@ def parse_job_lsf(log_file, job_id):
     """ Parse lsf log file to check whether the corresponding
         job was finished successfully
     """
+    # check the ledger if we have it
+    records = read_ledger(ledger_path(log_file))
+    if records is not None:
+        return _ledger_has_job(records, job_id)
+
     with open(log_file, 'r') as f:
         for ll in f:
             ll = ll.rstrip()
@@ -124,6 +246,11 @@ def parse_blocks(log_file):
     """ Parse log file to return the blocks that were
         marked as processed
     """
+    # check the ledger if we have it
+    records = read_ledger(ledger_path(log_file))
+    if records is not None:
+        return records['id'][records['kind'] == LEDGER_BLOCK].tolist()
+
     blocks = []
     with open(log_file, 'r') as f:
         for line in f:
@@ -147,7 +274,7 @@ def parse_blocks_task(log_prefix, max_jobs, complete_job_list=[]):
 
         log_file = log_prefix + '%i.log' % job_id
         # log might not exist, even if this is not the last job
-        if not os.path.exists(log_file):
+        if not os.path.exists(log_file) and not os.path.exists(ledger_path(log_file)):
             continue
         blocks.extend(parse_blocks(log_file))
 
@@ -0,0 +1,59 @@
+import os
+import json
+import heapq
+import numpy as np
+
+
+def load_block_weights(path, block_list):
+    """ Load per-block weights from json file.
+
+    The file can either contain a list of weights indexed by block id
+    or a dict mapping block ids to weights.
+    Blocks without weight get the mean weight.
+    """
+    assert os.path.exists(path), path
+    with open(path) as f:
+        weights = json.load(f)
+    if isinstance(weights, list):
+        weights = {block_id: weight for block_id, weight in enumerate(weights)}
+    else:
+        # json always casts keys to str, so we reverse this here
+        weights = {int(k): v for k, v in weights.items()}
+    mean_weight = np.mean(list(weights.values())) if weights else 1.
+    return [weights.get(block_id, mean_weight) for block_id in block_list]
+
+
+def partition_blocks(block_list, weights, n_jobs, method='lpt'):
+    """ Partition blocks to jobs such that the summed weights per job are balanced.
+
+    Arguments:
+        block_list [list] - ids of the blocks to distribute
+        weights [listlike] - cost estimate for each block in block_list
+        n_jobs [int] - number of jobs
+        method [str] - partitioning method, 'lpt' assigns the blocks in order of decreasing weights
+            to the job with the smallest load (longest processing time first),
+            'greedy' does the same in the order of block_list, which keeps
+            neighboring blocks in the same job more often.
+    Returns:
+        list of block lists for the individual jobs
+    """
+    assert len(block_list) == len(weights), "%i, %i" % (len(block_list), len(weights))
+    assert method in ('lpt', 'greedy'), method
+    weights = np.array(weights, dtype='float64')
+    if method == 'lpt':
+        # stable sort, so that blocks with the same weight stay in order
+        order = np.argsort(-weights, kind='stable')
+    else:
+        order = np.arange(len(block_list))
+
+    # heap of (load, job_id), we pop the job with the smallest load
+    loads = [(0., job_id) for job_id in range(n_jobs)]
+    job_blocks = [[] for _ in range(n_jobs)]
+    for block_index in order:
+        load, job_id = heapq.heappop(loads)
+        job_blocks[job_id].append(block_list[block_index])
+        heapq.heappush(loads, (load + weights[block_index], job_id))
+
+    # keep the blocks in the order of the block list within each job
+    block_pos = {block_id: pos for pos, block_id in enumerate(block_list)}
+    return [sorted(blocks, key=block_pos.__getitem__) for blocks in job_blocks]
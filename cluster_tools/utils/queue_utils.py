@@ -0,0 +1,61 @@
+import os
+import fcntl
+import numpy as np
+
+#
+# File based block queue for dynamic scheduling of blocks to jobs.
+#
+# The queue file stores the position of the next unclaimed block
+# followed by the ids of all blocks (both as int64).
+# Jobs claim batches of blocks by advancing the position under a posix lock,
+# which is also supported on NFS (unlike flock).
+#
+
+_HEADER_SIZE = 8
+
+
+def write_block_queue(path, block_list):
+    """ Write a new block queue with all blocks in `block_list`.
+    """
+    blocks = np.array(block_list, dtype='int64')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(np.array([0], dtype='int64').tobytes())
+        f.write(blocks.tobytes())
+    # move to make sure jobs never see a partially written queue
+    os.replace(tmp_path, path)
+
+
+def claim_blocks(path, n_blocks):
+    """ Claim the next `n_blocks` blocks from the queue.
+
+    Returns an empty list once the queue is exhausted.
+    """
+    with open(path, 'r+b') as f:
+        fcntl.lockf(f, fcntl.LOCK_EX)
+        try:
+            n_total = (os.fstat(f.fileno()).st_size - _HEADER_SIZE) // 8
+            pos = int(np.frombuffer(f.read(_HEADER_SIZE), dtype='int64')[0])
+            next_pos = min(pos + n_blocks, n_total)
+            if next_pos > pos:
+                f.seek(0)
+                f.write(np.array([next_pos], dtype='int64').tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            fcntl.lockf(f, fcntl.LOCK_UN)
+        # the block ids are never changed, so we can read them without the lock
+        f.seek(_HEADER_SIZE + 8 * pos)
+        blocks = np.frombuffer(f.read(8 * (next_pos - pos)), dtype='int64')
+    return blocks.tolist()
+
+
+def iterate_block_queue(path, batch_size=1):
+    """ Iterate over blocks claimed from the queue until it is exhausted.
+    """
+    while True:
+        blocks = claim_blocks(path, batch_size)
+        if not blocks:
+            return
+        for block_id in blocks:
+            yield block_id
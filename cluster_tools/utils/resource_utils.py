@@ -0,0 +1,154 @@
+import os
+import json
+import time
+from math import ceil
+
+import numpy as np
+
+from .parse_utils import read_profile
+
+#
+# Persistent store of the resources used by the jobs of a task, to estimate the
+# time and memory limits of later submissions.
+#
+# For each successful job, the block profiles (see `function_utils.profile_block`) are summarized
+# to an observation of the peak memory, the block size and the cpu time per voxel,
+# which is appended to '<store>/<task_name>.jsonl'.
+# The memory is modeled as a linear function of the block size, the time is proportional
+# to the number of voxels processed by a job, both are scaled by a safety factor.
+#
+
+# only the most recent observations are used for the estimates
+MAX_OBSERVATIONS = 200
+# minimal limits, to account for the startup of the jobs
+MIN_MEM_LIMIT = 0.25
+MIN_TIME_LIMIT = 1
+
+
+def _store_path(store, task_name):
+    return os.path.join(store, '%s.jsonl' % task_name)
+
+
+def dataset_dtype(path, key):
+    """ Read the dtype of a n5 or zarr dataset from its metadata, None if it is not available.
+    """
+    ds_dir = os.path.join(path, key)
+    for attrs_file, dtype_key in (('attributes.json', 'dataType'), ('.zarray', 'dtype')):
+        attrs_path = os.path.join(ds_dir, attrs_file)
+        if os.path.exists(attrs_path):
+            with open(attrs_path) as f:
+                dtype = json.load(f).get(dtype_key, None)
+            return None if dtype is None else str(np.dtype(dtype))
+    return None
+
+
+def _block_parallelism(records):
+    """ Number of blocks that were processed in parallel to each block, measured at its midpoint.
+    """
+    if any('start' not in rec for rec in records):
+        return np.ones(len(records))
+    starts = np.array([rec['start'] for rec in records], dtype='float64')
+    ends = starts + np.array([rec['time'] for rec in records], dtype='float64')
+    mids = (starts + ends) / 2
+    running = np.searchsorted(np.sort(starts), mids, side='right') -\
+        np.searchsorted(np.sort(ends), mids, side='left')
+    return np.maximum(running, 1).astype('float64')
+
+
+def summarize_job(profile_path, threads, dtype=None):
+    """ Summarize the block profiles of a job to a resource observation.
+
+    If the blocks of the job were processed in parallel, the threads of the job
+    are shared by the blocks running at the same time.
+    Returns None if the job did not record any blocks.
+    """
+    if not os.path.exists(profile_path):
+        return None
+    records = [rec for rec in read_profile(profile_path) if rec.get('n_voxels', None)]
+    if not records:
+        return None
+    voxels = np.array([rec['n_voxels'] for rec in records], dtype='float64')
+    times = np.array([rec['time'] for rec in records], dtype='float64')
+    block_threads = threads / np.minimum(_block_parallelism(records), threads)
+    return {'time': time.time(), 'dtype': dtype, 'threads': threads,
+            'n_blocks': len(records), 'block_voxels': float(voxels.mean()),
+            # we use the 90th percentile, so that a few slow blocks are accounted for
+            'cpu_time_per_voxel': float(np.percentile(times * block_threads / voxels, 90)),
+            'max_rss': max(rec['max_rss'] for rec in records)}
+
+
+def record_observations(store, task_name, observations):
+    """ Append the observations of a task to the store.
+    """
+    os.makedirs(store, exist_ok=True)
+    lines = ''.join(json.dumps(obs) + '\n' for obs in observations)
+    with open(_store_path(store, task_name), 'a') as f:
+        f.write(lines)
+
+
+def load_observations(store, task_name, dtype=None):
+    """ Load the most recent observations of a task from the store.
+
+    If observations for the dtype exist, only those are returned.
+    """
+    path = _store_path(store, task_name)
+    if not os.path.exists(path):
+        return []
+    observations = []
+    with open(path) as f:
+        for line in f:
+            # the store might contain incomplete lines if a write was interrupted
+            try:
+                observations.append(json.loads(line))
+            except ValueError:
+                continue
+    observations = observations[-MAX_OBSERVATIONS:]
+    matching = [obs for obs in observations if obs.get('dtype', None) == dtype]
+    return matching if matching else observations
+
+
+def estimate_resources(observations, block_voxels, n_blocks, threads, safety_factor=1.5,
+                       max_time_limit=None, max_threads=None):
+    """ Estimate the resources of a job from previous observations.
+
+    Arguments:
+        observations [list[dict]] - observations for the task, see `summarize_job`
+        block_voxels [int] - number of voxels per block
+        n_blocks [int] - number of blocks per job
+        threads [int] - number of threads per job
+        safety_factor [float] - factor to scale the estimates (default: 1.5)
+        max_time_limit [int] - if given, the threads are increased to stay below this time (default: None)
+        max_threads [int] - maximal number of threads (default: None)
+    Returns:
+        dict - threads_per_job, mem_limit in GB and time_limit in minutes
+    """
+    voxels = np.array([obs['block_voxels'] for obs in observations], dtype='float64')
+    rss = np.array([obs['max_rss'] for obs in observations], dtype='float64')
+
+    # the memory is modeled as base + slope * voxels, if we have observations for
+    # different block sizes; otherwise we scale the peak memory to larger blocks
+    if len(np.unique(voxels)) > 1:
+        slope, base = np.polyfit(voxels, rss, 1)
+        slope, base = max(slope, 0.), max(base, 0.)
+        # the fit must be conservative w.r.t. the observations
+        base += max(0., (rss - (base + slope * voxels)).max())
+        peak_rss = base + slope * block_voxels
+    else:
+        peak_rss = rss.max() * max(1., block_voxels / voxels[0])
+    mem_limit = max(MIN_MEM_LIMIT, safety_factor * peak_rss / 1.e9)
+
+    cpu_time_per_voxel = max(obs['cpu_time_per_voxel'] for obs in observations)
+    cpu_time = cpu_time_per_voxel * block_voxels * n_blocks
+
+    def _time_limit(n_threads):
+        return max(MIN_TIME_LIMIT, int(ceil(safety_factor * cpu_time / n_threads / 60.)))
+
+    time_limit = _time_limit(threads)
+    if max_time_limit is not None and time_limit > max_time_limit:
+        new_threads = int(ceil(threads * time_limit / max_time_limit))
+        new_threads = new_threads if max_threads is None else min(new_threads, max_threads)
+        # more threads process more blocks in parallel, so we scale the memory accordingly
+        mem_limit = max(mem_limit, mem_limit * new_threads / threads)
+        threads = new_threads
+        time_limit = _time_limit(threads)
+    return {'threads_per_job': int(threads), 'mem_limit': float(mem_limit), 'time_limit': time_limit}
@@ -1,5 +1,9 @@
 import os
 import json
+import threading
+from collections import deque
+from concurrent import futures
+from functools import partial
 from itertools import product
 
 import elf.io
@@ -10,6 +14,12 @@ from elf.wrapper.resized_volume import ResizedVolume
 from scipy.ndimage.morphology import binary_erosion
 from nifty.tools import blocking
 
+from .cache_utils import CachedFile
+from .function_utils import profile_section
+from .queue_utils import iterate_block_queue
+from .occupancy_utils import (init_occupancy, load_occupancy, compute_occupancy,
+                              mark_occupied, filter_empty_blocks)
+
 # use vigra filters as fallback if we don't have
 # fastfilters available
 try:
@@ -18,8 +28,16 @@ except ImportError:
     import vigra.filters as ff
 
 
-def file_reader(path, mode='a'):
-    return elf.io.open_file(path, mode=mode)
+def file_reader(path, mode='a', cache=None):
+    """ Open the file at path.
+
+    If a `cache_utils.ChunkCache` is given, the datasets of the file are read through the cache;
+    this is only supported for files opened in read-only mode.
+    """
+    if cache is None:
+        return elf.io.open_file(path, mode=mode)
+    assert mode == 'r', "The chunk cache can only be used in read-only mode, got %s" % mode
+    return CachedFile(elf.io.open_file(path, mode=mode), cache, path)
 
 
 def get_shape(path, key):
@@ -30,7 +48,19 @@ def get_shape(path, key):
 
 def blocks_in_volume(shape, block_shape,
                      roi_begin=None, roi_end=None,
-                     block_list_path=None, return_blocking=False):
+                     block_list_path=None, return_blocking=False,
+                     skip_empty_in=None):
+    """ Get the blocks in the volume, restricted to the roi and the blocks in block_list_path.
+
+    If `skip_empty_in` is given as (path, key) of a dataset with occupancy index,
+    the blocks that don't contain any data in this dataset are removed.
+    """
+    if skip_empty_in is not None:
+        block_list, blocking_ = blocks_in_volume(shape, block_shape, roi_begin, roi_end,
+                                                 block_list_path, return_blocking=True)
+        block_list = filter_empty_blocks(skip_empty_in[0], skip_empty_in[1], blocking_, block_list)
+        return (block_list, blocking_) if return_blocking else block_list
+
     assert len(shape) == len(block_shape), '%i; %i' % (len(shape), len(block_shape))
     assert (roi_begin is None) == (roi_end is None)
     have_roi = roi_begin is not None
@@ -73,6 +103,158 @@ def blocks_in_volume(shape, block_shape,
         return block_list
 
 
+def job_blocks(config):
+    """ Get the blocks that should be processed by a job.
+
+    This is the static `block_list` from the job config, or, if the task was run with
+    the block queue, an iterator that claims blocks from the queue until all blocks are processed.
+    """
+    queue_path = config.get('block_queue', None)
+    if queue_path is None:
+        return config['block_list']
+    return iterate_block_queue(queue_path, config.get('block_queue_batch_size', 1))
+
+
+def map_blocks(func, blocks, n_threads=1):
+    """ Apply `func` to all blocks with `n_threads` threads.
+
+    In contrast to submitting all blocks to a thread pool, the blocks are consumed lazily,
+    so that the block queue (see `job_blocks`) is not drained at once.
+    """
+    if n_threads <= 1:
+        return [func(block_id) for block_id in blocks]
+
+    blocks = iter(blocks)
+    lock = threading.Lock()
+
+    def _worker():
+        results = []
+        while True:
+            with lock:
+                block_id = next(blocks, None)
+            if block_id is None:
+                return results
+            results.append(func(block_id))
+
+    with futures.ThreadPoolExecutor(n_threads) as tp:
+        tasks = [tp.submit(_worker) for _ in range(n_threads)]
+        return [res for t in tasks for res in t.result()]
+
+
+def prefetch_blocks(load, blocks, n_prefetch=0):
+    """ Iterate over the blocks, reading the data of the next blocks in background threads.
+
+    `load(block_id)` is called for the next `n_prefetch` blocks while the current block
+    is processed, so that reading (including halo and mask) overlaps with computation.
+    The blocks are consumed lazily, so this can be used with the block queue (see `job_blocks`).
+    The data of at most `n_prefetch + 1` blocks is held in memory.
+
+    Yields the block id and a function that returns the data of the block.
+    If `n_prefetch` is 0, this function loads the data, otherwise it waits for the
+    data to be loaded; call it inside of `fu.profile_block` to attribute the time to the block:
+
+    for block_id, get_data in prefetch_blocks(load, blocks, n_prefetch=2):
+        with fu.profile_block(block_id):
+            data = get_data()
+    """
+    if n_prefetch <= 0:
+        for block_id in blocks:
+            yield block_id, partial(load, block_id)
+        return
+
+    def _getter(future):
+        def _get():
+            # the time waiting for the data shows how much reading still stalls the computation
+            with profile_section('wait_read'):
+                return future.result()
+        return _get
+
+    blocks = iter(blocks)
+    pending = deque()
+    with futures.ThreadPoolExecutor(n_prefetch) as tp:
+        try:
+            for block_id in blocks:
+                pending.append((block_id, tp.submit(load, block_id)))
+                if len(pending) > n_prefetch:
+                    block_id, future = pending.popleft()
+                    yield block_id, _getter(future)
+            while pending:
+                block_id, future = pending.popleft()
+                yield block_id, _getter(future)
+        finally:
+            # don't start loading blocks that will not be processed anymore,
+            # e.g. because processing a block failed
+            for _, future in pending:
+                future.cancel()
+
+
+class BlockWriter:
+    """ Run the writes of blocks asynchronously in background threads.
+
+    At most `max_pending` writes are queued or running; `submit` blocks if this bound is reached,
+    so the memory used by the data that is waiting to be written is limited.
+    If `max_pending` is 0, the writes are run immediately in the calling thread.
+    Errors are raised by the next call to `submit` or when closing the writer.
+
+    The write functions should log the block success after writing,
+    so that blocks whose write failed are processed again on retry.
+    Use as context manager:
+
+    with BlockWriter(max_pending=2) as writer:
+        for block_id in blocks:
+            writer.submit(write_block, block_id, data)
+    """
+    def __init__(self, max_pending=0, n_threads=1):
+        self.max_pending = max_pending
+        if max_pending > 0:
+            self._tp = futures.ThreadPoolExecutor(n_threads)
+            self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _check_errors(self):
+        with self._lock:
+            done = [fut for fut in self._pending if fut.done()]
+            self._pending.difference_update(done)
+        for fut in done:
+            fut.result()
+
+    def _release(self, fut):
+        self._slots.release()
+
+    def submit(self, func, *args, **kwargs):
+        if self.max_pending <= 0:
+            return func(*args, **kwargs)
+        self._check_errors()
+        self._slots.acquire()
+        try:
+            fut = self._tp.submit(func, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        fut.add_done_callback(self._release)
+        with self._lock:
+            self._pending.add(fut)
+
+    def close(self):
+        """ Wait for all pending writes, raises the first error.
+        """
+        if self.max_pending <= 0:
+            return
+        self._tp.shutdown(wait=True)
+        self._check_errors()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self.max_pending > 0:
+            # we are failing anyway, but still need to wait for the running writes
+            self._tp.shutdown(wait=True)
+
+
 def block_to_bb(block):
     return tuple(slice(beg, end) for beg, end in zip(block.begin, block.end))
 
@@ -105,70 +287,80 @@ def normalize(input_, min_val=None, max_val=None):
     return input_
 
 
-def _make_checkerboard(blocking):
-    blocks_a = [0]
-    blocks_b = []
-    all_blocks = [0]
-
-    def recurse(current_block, insert_list):
-        other_list = blocks_a if insert_list is blocks_b else blocks_b
-        for dim in range(3):
-            ngb_id = blocking.getNeighborId(current_block, dim, False)
-            if ngb_id != -1:
-                if ngb_id not in all_blocks:
-                    insert_list.append(ngb_id)
-                    all_blocks.append(ngb_id)
-                    recurse(ngb_id, other_list)
-
-    recurse(0, blocks_b)
-    all_blocks = blocks_a + blocks_b
-    expected = set(range(blocking.numberOfBlocks))
-    assert len(all_blocks) == len(expected), "%i, %i" % (len(all_blocks), len(expected))
-    assert len(set(all_blocks) - expected) == 0
-    assert len(blocks_a) == len(blocks_b), "%i, %i" % (len(blocks_a), len(blocks_b))
-    return blocks_a, blocks_b
-
-
-def _make_checkerboard_with_roi(blocking, roi_begin, roi_end):
-
-    # find the smallest roi coordinate
-    block0 = blocking.coordinatesToBlockId(roi_begin)
-
-    blocks_a = [block0]
-    blocks_b = []
-    all_blocks = [block0]
-
-    blocks_in_roi = blocking.getBlockIdsOverlappingBoundingBox(roi_begin, roi_end)
-    assert block0 in blocks_in_roi
-
-    def recurse(current_block, insert_list):
-        other_list = blocks_a if insert_list is blocks_b else blocks_b
-        for dim in range(3):
-            ngb_id = blocking.getNeighborId(current_block, dim, False)
-            if ngb_id != -1:
-                #  check if this block is overlapping the roi
-                if ngb_id not in blocks_in_roi:
-                    continue
-                if ngb_id not in all_blocks:
-                    insert_list.append(ngb_id)
-                    all_blocks.append(ngb_id)
-                    recurse(ngb_id, other_list)
-
-    recurse(block0, blocks_b)
-    all_blocks = blocks_a + blocks_b
-    expected = set(blocks_in_roi)
-    assert len(all_blocks) == len(expected), "%i, %i" % (len(all_blocks), len(expected))
-    assert len(set(all_blocks) - expected) == 0
-    assert len(blocks_a) == len(blocks_b), "%i, %i" % (len(blocks_a), len(blocks_b))
-    return blocks_a, blocks_b
+def make_checkerboard_block_lists(blocking, roi_begin=None, roi_end=None, n_colors=2):
+    """ Colour the blocks of the blocking, so that blocks of the same colour are not direct neighbors.
 
+    The colours are derived from the block grid coordinates relative to the first block (in the roi):
+    for 2 colours, the parity of the coordinate sum (checkerboard); for 2 ** ndim colours (8 in 3d),
+    the parity per axis. In the latter case, blocks of the same colour are at least one block apart
+    along each axis, so their halos don't overlap as long as the halo is smaller than the block shape.
 
-def make_checkerboard_block_lists(blocking, roi_begin=None, roi_end=None):
+    Arguments:
+        blocking [nifty.tools.blocking] - the blocking
+        roi_begin [list] - begin of the roi (default: None)
+        roi_end [list] - end of the roi (default: None)
+        n_colors [int] - number of colours, 2 or 2 ** ndim (default: 2)
+    Returns:
+        list[list[int]] - block ids per colour; colours without blocks are omitted
+    """
     assert (roi_begin is None) == (roi_end is None)
+    grid_shape = tuple(blocking.blocksPerAxis)
+    ndim = len(grid_shape)
+    assert n_colors in (2, 2 ** ndim), "Invalid number of colours %i" % n_colors
+
     if roi_begin is None:
-        return _make_checkerboard(blocking)
+        block_ids = np.arange(blocking.numberOfBlocks, dtype='int64')
     else:
-        return _make_checkerboard_with_roi(blocking, roi_begin, roi_end)
+        block_ids = np.array(blocking.getBlockIdsOverlappingBoundingBox(list(roi_begin), list(roi_end)),
+                             dtype='int64')
+        block_ids.sort()
+    if block_ids.size == 0:
+        return []
+
+    # grid positions relative to the first block, so that it always has colour 0
+    positions = np.array(np.unravel_index(block_ids, grid_shape))
+    positions -= positions.min(axis=1, keepdims=True)
+    if n_colors == 2:
+        colors = positions.sum(axis=0) % 2
+    else:
+        colors = sum((positions[dim] % 2) << (ndim - 1 - dim) for dim in range(ndim))
+
+    return [block_ids[colors == color].tolist() for color in range(n_colors)
+            if (colors == color).any()]
+
+
+def merge_tree_block_shapes(shape, block_shape, fan_in):
+    """ Get the block shapes of the levels of a merge tree.
+
+    The blocks of each level merge up to `fan_in` blocks per axis of the previous level,
+    starting from blocks of `block_shape`. Levels are added until the blocks of the last level
+    fit into `fan_in` blocks per axis, which are then merged into the root.
+
+    Returns:
+        list[list[int]] - the block shapes of the levels, empty if no level is needed
+    """
+    assert fan_in > 1, "Invalid fan-in %i" % fan_in
+    block_shapes = []
+    block_shape = list(block_shape)
+    while any((sh + bs - 1) // bs > fan_in for sh, bs in zip(shape, block_shape)):
+        block_shape = [bs * fan_in for bs in block_shape]
+        block_shapes.append(block_shape)
+    return block_shapes
+
+
+def sub_blocks_in_block(blocking, sub_blocking, block_id, sub_block_set=None):
+    """ Get the blocks of `sub_blocking` that are contained in a block of `blocking`.
+
+    The block shape of `blocking` must be a multiple of the block shape of `sub_blocking`.
+    If `sub_block_set` is given, only blocks in this set are returned.
+    """
+    block = blocking.getBlock(block_id)
+    sub_block_ids = sub_blocking.getBlockIdsInBoundingBox(roiBegin=block.begin, roiEnd=block.end,
+                                                          blockHalo=[0] * len(block.begin))
+    sub_block_ids = [int(sub_block_id) for sub_block_id in sub_block_ids]
+    if sub_block_set is not None:
+        sub_block_ids = [sub_block_id for sub_block_id in sub_block_ids if sub_block_id in sub_block_set]
+    return sub_block_ids
 
 
 def load_mask(mask_path, mask_key, shape):
@@ -184,6 +376,69 @@ def load_mask(mask_path, mask_key, shape):
     return mask
 
 
+def _mask_scale_key(f, mask_key, shape, block_shape):
+    """ Get the key of the coarsest scale level of the mask that still resolves the block grid.
+
+    The scale levels are expected to be stored as 's0', 's1', ... in the same group,
+    see `DownscalingWorkflow`. Returns `mask_key` if there are no scale levels.
+    """
+    group_key, level_key = os.path.split(mask_key)
+    if not (level_key.startswith('s') and level_key[1:].isdigit()):
+        return mask_key
+    grid_shape = [sh // bs + int(sh % bs != 0) for sh, bs in zip(shape, block_shape)]
+    scale_key, level = mask_key, int(level_key[1:]) + 1
+    while True:
+        key = os.path.join(group_key, 's%i' % level)
+        if key not in f or any(msh < gsh for msh, gsh in zip(f[key].shape, grid_shape)):
+            return scale_key
+        scale_key, level = key, level + 1
+
+
+def _sample_bb(block, chunks):
+    """ Bounding box of the chunk at the center of the block, so that a single chunk is read.
+    """
+    if chunks is None:
+        return block_to_bb(block)
+    bb = []
+    for beg, end, ch in zip(block.begin, block.end, chunks):
+        center = (beg + end) // 2
+        chunk_beg = max(beg, center // ch * ch)
+        bb.append(slice(chunk_beg, min(end, chunk_beg + ch)))
+    return tuple(bb)
+
+
+def mask_block_weights(mask_path, mask_key, shape, block_shape, block_list,
+                       min_weight=0.05, n_threads=1):
+    """ Estimate the cost of the blocks from the foreground fraction in the mask.
+
+    If the mask has a lower resolution scale level (or is stored at a lower resolution),
+    it is loaded completely and the block bounding boxes are mapped to its resolution,
+    so the prepass is cheap. Otherwise, the fraction is estimated from the chunk at the
+    center of each block.
+    Blocks without foreground still get `min_weight`, because they need to be loaded.
+    """
+    blocking_ = blocking([0] * len(shape), list(shape), list(block_shape))
+    with file_reader(mask_path, 'r') as f:
+        ds = f[_mask_scale_key(f, mask_key, shape, block_shape)]
+        mshape = ds.shape
+        full_res = tuple(mshape) == tuple(shape)
+        mask = None if full_res else ds[:].astype('bool')
+        scale = [float(msh) / sh for msh, sh in zip(mshape, shape)]
+        chunks = getattr(ds, 'chunks', None)
+
+        def _fraction(block_id):
+            block = blocking_.getBlock(block_id)
+            if full_res:
+                return block_id, ds[_sample_bb(block, chunks)].astype('bool').mean()
+            bb = tuple(slice(int(np.floor(beg * sc)), max(int(np.ceil(end * sc)), int(np.floor(beg * sc)) + 1))
+                       for beg, end, sc in zip(block.begin, block.end, scale))
+            return block_id, mask[bb].mean()
+
+        # map_blocks does not preserve the order for multiple threads
+        fractions = dict(map_blocks(_fraction, block_list, n_threads if full_res else 1))
+    return [min_weight + float(fractions[block_id]) for block_id in block_list]
+
+
 def get_face(blocking, block_id, ngb_id, axis, halo=[1, 1, 1]):
     # get the two block coordinates
     block_a = blocking.getBlock(block_id)
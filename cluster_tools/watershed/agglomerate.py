@@ -15,7 +15,7 @@ from elf.segmentation.clustering import mala_clustering, agglomerative_clusterin
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -108,6 +108,13 @@ class AgglomerateLocal(AgglomerateBase, LocalTask):
     pass
 
 
+class AgglomerateLocalPool(AgglomerateBase, LocalPoolTask):
+    """
+    Agglomerate on local machine with persistent worker pool
+    """
+    pass
+
+
 class AgglomerateSlurm(AgglomerateBase, SlurmTask):
     """
     Agglomerate on slurm cluster
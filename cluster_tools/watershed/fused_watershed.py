@@ -0,0 +1,281 @@
+#! /bin/python
+
+import os
+import sys
+import json
+
+# this is a task called by multiple processes,
+# so we need to restrict the number of threads used by numpy
+from elf.util import set_numpy_threads
+set_numpy_threads(1)
+import numpy as np
+
+import luigi
+import nifty.tools as nt
+
+import cluster_tools.utils.volume_utils as vu
+import cluster_tools.utils.function_utils as fu
+import cluster_tools.utils.graph_utils as gu
+import cluster_tools.utils.cache_utils as cu
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
+from cluster_tools.utils.task_utils import DummyTask
+from cluster_tools.watershed.watershed import WatershedBase, _get_bbs, _segment_block, _split_threads
+
+
+#
+# Fused Watershed Tasks
+#
+
+class FusedWatershedBase(WatershedBase):
+    """ Fused watershed base class
+
+    Computes the watershed for each block and extracts the region graph and
+    boundary map edge features of the block from the in-memory arrays.
+    The sub-graphs and features only contain the edges inside of the blocks;
+    the edges across block faces are added by `FaceSubGraphs` after relabeling.
+    Compared to `BlockEdgeFeatures`, the mean, variance, max and size features are the same,
+    but the min and quantile features differ: the min values agree with the nifty rag features,
+    which is not the case for `BlockEdgeFeatures`, and the quantiles are computed exactly
+    from the boundary values of the edges instead of from histograms.
+    """
+
+    task_name = 'fused_watershed'
+    src_file = os.path.abspath(__file__)
+
+    # path to save the sub-graphs and features
+    problem_path = luigi.Parameter()
+    dependency = luigi.TaskParameter(default=DummyTask())
+
+    # hard-coded keys
+    subgraph_key = 's0/inner_sub_graphs'
+    subfeat_key = 's0/inner_sub_features'
+
+    def requires(self):
+        return self.dependency
+
+    def incremental_datasets(self, config):
+        # the sub-graphs and features are written blockwise as well,
+        # so blocks with missing or changed graph chunks need to be recomputed
+        inputs, outputs = super().incremental_datasets(config)
+        problem_path = config['problem_path']
+        outputs += [(problem_path, config['subgraph_key'] + '/nodes'),
+                    (problem_path, config['subgraph_key'] + '/edges'),
+                    (problem_path, config['subfeat_key'])]
+        return inputs, outputs
+
+    @staticmethod
+    def default_task_config():
+        # we use this to get also get the common default config
+        config = WatershedBase.default_task_config()
+        config.update({'ignore_label': True})
+        return config
+
+    def run_impl(self):
+        # get the global config and init configs
+        shebang, block_shape, roi_begin, roi_end, block_list_path = self.global_config_values(True)
+        self.init(shebang)
+
+        # get shape and make block config
+        shape = vu.get_shape(self.input_path, self.input_key)
+        assert len(shape) == 3, "Fused watershed only supports 3d boundary maps"
+        assert self.downscaled_input_path == '', "Fused watershed does not support downscaled seeds"
+
+        # load the watershed config
+        ws_config = self.get_task_config()
+
+        # require output dataset
+        # TODO read chunks from config
+        chunks = tuple(bs // 2 for bs in block_shape)
+        with vu.file_reader(self.output_path) as f:
+            new_output = self.output_key not in f
+            f.require_dataset(self.output_key, shape=shape, chunks=chunks,
+                              compression='gzip', dtype='uint64')
+        if new_output and self.use_occupancy_index():
+            vu.init_occupancy(self.output_path, self.output_key)
+
+        # require the datasets for the inner sub-graphs and features
+        with vu.file_reader(self.problem_path) as f:
+            g = f.require_group(self.subgraph_key)
+            g.attrs['shape'] = tuple(shape)
+            g.attrs['ignore_label'] = ws_config['ignore_label']
+            g.require_dataset('nodes', shape=shape, chunks=tuple(block_shape),
+                              compression='gzip', dtype='uint64')
+            g.require_dataset('edges', shape=shape, chunks=tuple(block_shape),
+                              compression='gzip', dtype='uint64')
+            f.require_dataset(self.subfeat_key, shape=shape, chunks=tuple(block_shape),
+                              compression='gzip', dtype='float64')
+
+        # update the config with input and output paths and keys
+        # as well as block shape
+        ws_config.update({'input_path': self.input_path, 'input_key': self.input_key,
+                          'output_path': self.output_path, 'output_key': self.output_key,
+                          'problem_path': self.problem_path, 'subgraph_key': self.subgraph_key,
+                          'subfeat_key': self.subfeat_key, 'block_shape': block_shape})
+        if self.mask_path != '':
+            assert self.mask_key != ''
+            ws_config.update({'mask_path': self.mask_path, 'mask_key': self.mask_key})
+
+        if self.n_retries == 0:
+            block_list = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end,
+                                             block_list_path=block_list_path)
+        else:
+            block_list = self.block_list
+            self.clean_up_for_retry(block_list)
+        self._write_log('scheduling %i blocks to be processed' % len(block_list))
+        n_jobs = min(len(block_list), self.max_jobs)
+
+        # prime and run the jobs
+        self.prepare_jobs(n_jobs, block_list, ws_config)
+        self.submit_jobs(n_jobs)
+
+        # wait till jobs finish and check for job success
+        self.wait_for_jobs()
+        self.check_jobs(n_jobs)
+
+
+class FusedWatershedLocal(FusedWatershedBase, LocalTask):
+    """
+    FusedWatershed on local machine
+    """
+    pass
+
+
+class FusedWatershedLocalPool(FusedWatershedBase, LocalPoolTask):
+    """
+    FusedWatershed on local machine with persistent worker pool
+    """
+    pass
+
+
+class FusedWatershedSlurm(FusedWatershedBase, SlurmTask):
+    """
+    FusedWatershed on slurm cluster
+    """
+    pass
+
+
+class FusedWatershedLSF(FusedWatershedBase, LSFTask):
+    """
+    FusedWatershed on lsf cluster
+    """
+    pass
+
+
+#
+# Implementation
+#
+
+def feature_values(input_):
+    """ Convert the boundary map to the value range used for the edge features.
+    """
+    if input_.dtype == np.dtype('uint8'):
+        return input_.astype('float32') / 255.
+    return input_.astype('float32')
+
+
+def _fused_block(blocking, block_id, ds_in, ds_out, mask,
+                 ds_nodes, ds_edges, ds_feats, config, n_threads=1):
+    fu.log("start processing block %i" % block_id)
+    input_bb, inner_bb, output_bb = _get_bbs(blocking, block_id, config)
+    # get the mask and check if we have any pixels
+    if mask is None:
+        in_mask = None
+    else:
+        in_mask = fu.profiled_read(mask, input_bb, 'read_mask').astype('bool')
+        if np.sum(in_mask[inner_bb]) == 0:
+            fu.log_block_success(block_id)
+            return
+
+    # read the input, we keep the raw input for the edge features
+    raw = fu.profiled_read(ds_in, input_bb)
+    input_ = vu.normalize(raw)
+    if config.get('invert_inputs', False):
+        input_ = 1. - input_
+    ws = _segment_block(blocking, block_id, input_, in_mask,
+                        (input_bb, inner_bb, output_bb), config, n_threads)
+
+    vu.mark_occupied(config['output_path'], config['output_key'], output_bb)
+    fu.profiled_write(ds_out, output_bb, ws)
+
+    # extract the sub-graph and features of this block from the in-memory arrays
+    with fu.profile_section('graph'):
+        nodes, edges, features = gu.block_sub_graph(ws, feature_values(raw[inner_bb]),
+                                                    config.get('ignore_label', True))
+
+    chunk_pos = blocking.blockGridPosition(block_id)
+    with fu.profile_section('write_graph'):
+        ds_nodes.write_chunk(chunk_pos, nodes, True)
+        if edges.size > 0:
+            ds_edges.write_chunk(chunk_pos, edges.flatten(), True)
+            ds_feats.write_chunk(chunk_pos, features.flatten(), True)
+    fu.profile_bytes('write_graph', nodes.nbytes + edges.nbytes + features.nbytes)
+    fu.log("block %i has %i nodes and %i inner edges" % (block_id, len(nodes), len(edges)))
+    fu.log_block_success(block_id)
+
+
+def fused_watershed(job_id, config_path):
+    fu.log("start processing job %i" % job_id)
+    fu.log("reading config from %s" % config_path)
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+
+    # read the input cofig
+    input_path = config['input_path']
+    input_key = config['input_key']
+    shape = list(vu.get_shape(input_path, input_key))
+
+    block_shape = list(config['block_shape'])
+    block_list = vu.job_blocks(config)
+    block_threads, slice_threads = _split_threads(config.get('threads_per_job', 1), block_list, config)
+    fu.log("processing blocks with %i threads and slices with %i threads" % (block_threads, slice_threads))
+
+    # read the output config
+    output_path = config['output_path']
+    output_key = config['output_key']
+    problem_path = config['problem_path']
+    subgraph_key = config['subgraph_key']
+    subfeat_key = config['subfeat_key']
+
+    # get the blocking
+    blocking = nt.blocking([0, 0, 0], shape, block_shape)
+
+    # the halos of neighboring blocks overlap, so we read the input through the chunk cache if enabled
+    cache = cu.make_chunk_cache(config)
+
+    # submit blocks
+    with vu.file_reader(input_path, 'r', cache=cache) as f_in, vu.file_reader(output_path) as f_out,\
+            vu.file_reader(problem_path) as f_problem:
+        ds_in = f_in[input_key]
+        assert ds_in.ndim == 3
+        ds_out = f_out[output_key]
+        assert ds_out.ndim == 3
+
+        ds_nodes = f_problem[subgraph_key]['nodes']
+        ds_edges = f_problem[subgraph_key]['edges']
+        ds_feats = f_problem[subfeat_key]
+
+        if 'mask_path' in config:
+            mask_path = config['mask_path']
+            mask_key = config['mask_key']
+            mask = vu.load_mask(mask_path, mask_key, shape)
+        else:
+            mask = None
+
+        def _process(block_id):
+            n_voxels = int(np.prod(blocking.getBlock(block_id).shape))
+            with fu.profile_block(block_id, n_voxels):
+                _fused_block(blocking, block_id, ds_in, ds_out, mask,
+                             ds_nodes, ds_edges, ds_feats, config, slice_threads)
+
+        vu.map_blocks(_process, block_list, block_threads)
+
+    cu.save_cache_stats(cache, config, job_id)
+    # log success
+    fu.log_job_success(job_id)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1]
+    assert os.path.exists(path), path
+    job_id = int(os.path.split(path)[1].split('.')[0].split('_')[-1])
+    fused_watershed(job_id, path)
@@ -17,7 +17,7 @@ from elf.segmentation.watershed import watershed as run_watershed
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 from cluster_tools.watershed.watershed import _ws_block, _get_bbs, _read_data, _apply_dt, _make_seeds, _make_hmap
 
 
@@ -51,7 +51,8 @@ class TwoPassWatershedBase(luigi.Task):
                        'sigma_weights': 2., 'halo': [0, 0, 0],
                        'channel_begin': 0, 'channel_end': None,
                        'agglomerate_channels': 'mean', 'alpha': 0.8,
-                       'invert_inputs': False, 'non_maximum_suppression': True})
+                       'invert_inputs': False, 'non_maximum_suppression': True,
+                       'n_colors': 2})
         return config
 
     def _ws_pass(self, block_list, config, prefix):
@@ -92,8 +93,12 @@ class TwoPassWatershedBase(luigi.Task):
             assert self.mask_key != ''
             ws_config.update({'mask_path': self.mask_path, 'mask_key': self.mask_key})
 
+        # the first pass segments the blocks of the first colour independently,
+        # the following passes grow them into the other blocks; with 8 colours the halos
+        # of blocks in the same pass don't overlap and the passes are smaller
+        n_colors = ws_config.pop('n_colors', 2)
         blocking = nt.blocking([0, 0, 0], list(shape), list(block_shape))
-        block_lists = vu.make_checkerboard_block_lists(blocking, roi_begin, roi_end)
+        block_lists = vu.make_checkerboard_block_lists(blocking, roi_begin, roi_end, n_colors)
         for pass_id, block_list in enumerate(block_lists):
             ws_config['pass'] = pass_id
             self._ws_pass(block_list, ws_config, 'pass_%i' % pass_id)
@@ -106,6 +111,13 @@ class TwoPassWatershedLocal(TwoPassWatershedBase, LocalTask):
     pass
 
 
+class TwoPassWatershedLocalPool(TwoPassWatershedBase, LocalPoolTask):
+    """
+    TwoPassWatershed on local machine with persistent worker pool
+    """
+    pass
+
+
 class TwoPassWatershedSlurm(TwoPassWatershedBase, SlurmTask):
     """
     TwoPassWatershed on slurm cluster
@@ -3,6 +3,10 @@
 import os
 import sys
 import json
+import threading
+from math import ceil
+from contextlib import ExitStack
+from concurrent import futures
 
 # this is a task called by multiple processes,
 # so we need to restrict the number of threads used by numpy
@@ -25,7 +29,12 @@ except ImportError:
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+import cluster_tools.utils.cache_utils as cu
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
+
+
+# prefix of the files with the number of ids per block in dense id mode, see `MergeOffsets`
+OFFSETS_PREFIX = 'watershed_offsets'
 
 
 #
@@ -38,6 +47,8 @@ class WatershedBase(luigi.Task):
 
     task_name = 'watershed'
     src_file = os.path.abspath(__file__)
+    allow_block_queue = True
+    allow_chunk_cache = True
 
     # input and output volumes
     input_path = luigi.Parameter()
@@ -46,6 +57,19 @@ class WatershedBase(luigi.Task):
     output_key = luigi.Parameter()
     mask_path = luigi.Parameter(default='')
     mask_key = luigi.Parameter(default='')
+    # write consecutive ids per block and save the number of ids of each block,
+    # the block offsets are then computed by `MergeOffsets` and applied by `Write`
+    dense_ids = luigi.BoolParameter(default=False)
+    # downscaled input (e.g. a scale level of `DownscalingWorkflow`), if given the
+    # distance transform and seeds are computed at this resolution and only the
+    # watershed is computed at full resolution
+    downscaled_input_path = luigi.Parameter(default='')
+    downscaled_input_key = luigi.Parameter(default='')
+
+    @property
+    def allow_incremental(self):
+        # the dense ids of a block depend on all previous blocks
+        return not self.dense_ids
 
     @staticmethod
     def default_task_config():
@@ -64,6 +88,18 @@ class WatershedBase(luigi.Task):
         super().clean_up_for_retry(block_list)
         # TODO remove any output of failed blocks because it might be corrupted
 
+    def get_block_weights(self, block_list):
+        # estimate the block cost from the mask if we don't have weights
+        weights = super().get_block_weights(block_list)
+        if weights is None and self.mask_path != '':
+            shape = vu.get_shape(self.input_path, self.input_key)
+            if len(shape) == 4:
+                shape = shape[1:]
+            block_shape = self.global_config_values()[1]
+            weights = vu.mask_block_weights(self.mask_path, self.mask_key,
+                                            shape, block_shape, block_list)
+        return weights
+
     def run_impl(self):
         # get the global config and init configs
         shebang, block_shape, roi_begin, roi_end, block_list_path = self.global_config_values(True)
@@ -81,8 +117,11 @@ class WatershedBase(luigi.Task):
         # TODO read chunks from config
         chunks = tuple(bs // 2 for bs in block_shape)
         with vu.file_reader(self.output_path) as f:
+            new_output = self.output_key not in f
             f.require_dataset(self.output_key, shape=shape, chunks=chunks,
                               compression='gzip', dtype='uint64')
+        if new_output and self.use_occupancy_index():
+            vu.init_occupancy(self.output_path, self.output_key)
 
         # update the config with input and output paths and keys
         # as well as block shape
@@ -92,10 +131,22 @@ class WatershedBase(luigi.Task):
         if self.mask_path != '':
             assert self.mask_key != ''
             ws_config.update({'mask_path': self.mask_path, 'mask_key': self.mask_key})
+        if self.dense_ids:
+            # the offsets are merged for the blocks of the volume and applied by block id,
+            # so all blocks need to be processed
+            assert block_list_path is None, "Dense ids are not supported for a block list"
+            assert roi_begin is None and roi_end is None, "Dense ids are not supported for a roi"
+            ws_config.update({'dense_ids': True, 'tmp_folder': self.tmp_folder})
+        if self.downscaled_input_path != '':
+            assert self.downscaled_input_key != ''
+            ws_config.update({'downscaled_input_path': self.downscaled_input_path,
+                              'downscaled_input_key': self.downscaled_input_key})
 
         if self.n_retries == 0:
             block_list = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end,
                                              block_list_path=block_list_path)
+            if self.dense_ids:
+                self._clean_up_offsets()
         else:
             block_list = self.block_list
             self.clean_up_for_retry(block_list)
@@ -110,6 +161,33 @@ class WatershedBase(luigi.Task):
         self.wait_for_jobs()
         self.check_jobs(n_jobs)
 
+        if self.dense_ids:
+            self._merge_offset_records(shape, block_shape)
+
+    def _clean_up_offsets(self):
+        # remove the block offsets of a previous run that did not finish
+        for name in os.listdir(self.tmp_folder):
+            if name.startswith(OFFSETS_PREFIX) and name.endswith(('.json', '.records')):
+                os.remove(os.path.join(self.tmp_folder, name))
+
+    def _merge_offset_records(self, shape, block_shape):
+        # the number of ids of the blocks are recorded per job when the blocks are done,
+        # so the blocks that were done by a failed job are kept for the retries.
+        # we save them for `MergeOffsets`, which expects a file for each job of the first run
+        n_blocks = len(vu.blocks_in_volume(shape, block_shape))
+        for job_id in range(min(n_blocks, self.max_jobs)):
+            record_path = _offset_records_path(self.tmp_folder, job_id)
+            offsets = {}
+            if os.path.exists(record_path):
+                with open(record_path) as f:
+                    for line in f:
+                        block_id, max_id = line.split()
+                        offsets[block_id] = int(max_id)
+            with open(os.path.join(self.tmp_folder, '%s_%i.json' % (OFFSETS_PREFIX, job_id)), 'w') as f:
+                json.dump(offsets, f)
+            if os.path.exists(record_path):
+                os.remove(record_path)
+
 
 class WatershedLocal(WatershedBase, LocalTask):
     """
@@ -118,6 +196,13 @@ class WatershedLocal(WatershedBase, LocalTask):
     pass
 
 
+class WatershedLocalPool(WatershedBase, LocalPoolTask):
+    """
+    Watershed on local machine with persistent worker pool
+    """
+    pass
+
+
 class WatershedSlurm(WatershedBase, SlurmTask):
     """
     Watershed on slurm cluster
@@ -136,8 +221,15 @@ class WatershedLSF(WatershedBase, LSFTask):
 # Implementation
 #
 
+def _map_slices(func, n_slices, n_threads=1):
+    if n_threads <= 1:
+        return [func(z) for z in range(n_slices)]
+    with futures.ThreadPoolExecutor(n_threads) as tp:
+        return list(tp.map(func, range(n_slices)))
+
+
 # apply the distance transform to the input
-def _apply_dt(input_, config):
+def _apply_dt(input_, config, n_threads=1):
     # threshold the input before distance transform
     threshold = config.get('threshold', .5)
     threshd = (input_ > threshold).astype('uint32')
@@ -151,8 +243,10 @@ def _apply_dt(input_, config):
     if apply_2d:
         assert pixel_pitch is None
         dt = np.zeros_like(threshd, dtype='float32')
-        for z in range(dt.shape[0]):
+
+        def _dt_slice(z):
             dt[z] = vigra.filters.distanceTransform(threshd[z])
+        _map_slices(_dt_slice, dt.shape[0], n_threads)
 
     else:
         dt = vigra.filters.distanceTransform(threshd) if pixel_pitch is None else\
@@ -208,8 +302,8 @@ def _make_seeds(dt, config):
     return seeds
 
 
-# apply watershed
-def _apply_watershed(input_, dt, config, mask=None):
+# apply watershed, computes the seeds from the distance transform if they are not given
+def _apply_watershed(input_, dt, config, mask=None, n_threads=1, seeds=None):
     apply_2d = config.get('apply_ws_2d', True)
     sigma_weights = config.get('sigma_weights', 2.)
     size_filter = config.get('size_filter', 25)
@@ -218,30 +312,36 @@ def _apply_watershed(input_, dt, config, mask=None):
     # apply the watersheds in 2d
     if apply_2d:
         ws = np.zeros_like(input_, dtype='uint32')
-        offset = 0
-        for z in range(ws.shape[0]):
+
+        def _ws_slice(z):
             # run watershed for this slice
             dtz = dt[z]
-            seeds = _make_seeds(dtz, config)
+            seedsz = _make_seeds(dtz, config) if seeds is None else seeds[z]
             hmap = _make_hmap(input_[z], dtz, alpha, sigma_weights)
-            wsz, max_id = run_watershed(hmap, seeds=seeds, size_filter=size_filter)
+            wsz, max_id = run_watershed(hmap, seeds=seedsz, size_filter=size_filter)
 
             # mask seeds if we have a mask
-            if mask is None:
-                wsz += offset
-            else:
+            if mask is not None:
                 maskz = mask[z]
                 wsz[np.logical_not(maskz)] = 0
                 # NOTE we might have no pixels in the mask for this slice
                 max_id = int(wsz[maskz].max()) if maskz.sum() > 0 else 0
-                wsz[maskz] += offset
 
             ws[z] = wsz
-            offset += max_id
+            return int(max_id)
+
+        # the slices are segmented independently, so we make the ids unique afterwards
+        # by offsetting each slice with the number of ids in the previous slices
+        max_ids = _map_slices(_ws_slice, ws.shape[0], n_threads)
+        offsets = np.cumsum([0] + max_ids[:-1], dtype='uint64').astype(ws.dtype)[:, None, None]
+        if mask is None:
+            ws += offsets
+        else:
+            ws[mask] += np.broadcast_to(offsets, ws.shape)[mask]
 
     # apply the watersheds in 3d
     else:
-        seeds = _make_seeds(dt, config)
+        seeds = _make_seeds(dt, config) if seeds is None else seeds
         hmap = _make_hmap(input_, dt, alpha, sigma_weights)
         ws, max_id = run_watershed(hmap, seeds, size_filter=size_filter)
         # check if we have a mask
@@ -250,6 +350,45 @@ def _apply_watershed(input_, dt, config, mask=None):
     return ws
 
 
+def _downscaled_bb(bb, scale, low_shape):
+    # the bounding box in the downscaled volume that covers bb
+    return tuple(slice(int(b.start * sc), min(int(ceil(b.stop * sc)), lsh))
+                 for b, sc, lsh in zip(bb, scale, low_shape))
+
+
+def _upsample(data, bb, low_bb, scale):
+    # nearest neighbor upsampling of the data in low_bb to bb
+    index = np.ix_(*[np.minimum((np.arange(b.start, b.stop) * sc).astype('int64') - lb.start,
+                                lb.stop - lb.start - 1)
+                     for b, lb, sc in zip(bb, low_bb, scale)])
+    return data[index]
+
+
+def _downscaled_seeds(low_input, input_bb, low_bb, scale, config, mask=None, n_threads=1):
+    """ Compute the distance transform and seeds from the downscaled input.
+
+    Returns seeds and distance transform upsampled to the input bounding box,
+    or None if the downscaled input has no values above the threshold.
+    In 2d mode, the seed ids are consecutive per slice, as for the full resolution seeds.
+    """
+    dt = _apply_dt(low_input, config, n_threads)
+    if dt is None:
+        return None
+    if config.get('apply_ws_2d', True):
+        seeds = np.zeros(dt.shape, dtype='uint32')
+
+        def _seeds_slice(z):
+            seeds[z] = _make_seeds(dt[z], config)
+        _map_slices(_seeds_slice, dt.shape[0], n_threads)
+    else:
+        seeds = _make_seeds(dt, config)
+
+    seeds, dt = _upsample(seeds, input_bb, low_bb, scale), _upsample(dt, input_bb, low_bb, scale)
+    if mask is not None:
+        seeds[np.logical_not(mask)] = 0
+    return seeds, dt
+
+
 def _get_bbs(blocking, block_id, config):
     # read the input config
     halo = list(config.get('halo', [0, 0, 0]))
@@ -271,59 +410,61 @@ def _read_data(ds_in, input_bb, config):
         channel_begin = config.get('channel_begin', 0)
         channel_end = config.get('channel_end', None)
         input_bb = (slice(channel_begin, channel_end),) + input_bb
-        input_ = vu.normalize(ds_in[input_bb])
+        input_ = vu.normalize(fu.profiled_read(ds_in, input_bb))
         agglomerate = config.get('agglomerate_channels', 'mean')
         assert agglomerate in ('mean', 'max', 'min')
         input_ = getattr(np, agglomerate)(input_, axis=0)
     else:
-        input_ = vu.normalize(ds_in[input_bb])
+        input_ = vu.normalize(fu.profiled_read(ds_in, input_bb))
     # check if we need to invert the input
     if config.get('invert_inputs', False):
         input_ = 1. - input_
     return input_
 
 
-def _ws_block(blocking, block_id, ds_in, ds_out, mask, config):
-    fu.log("start processing block %i" % block_id)
-    input_bb, inner_bb, output_bb = _get_bbs(blocking, block_id,
-                                             config)
-    # get the mask and check if we have any pixels
-    if mask is None:
-        in_mask = None
-    else:
-        in_mask = mask[input_bb].astype('bool')
-        out_mask = in_mask[inner_bb]
-        if np.sum(out_mask) == 0:
-            fu.log_block_success(block_id)
-            return
+def _segment_block(blocking, block_id, input_, in_mask, bbs, config, n_threads=1, low_data=None):
+    """ Compute the watershed for the output bounding box of the block.
 
-    # read the input
-    input_ = _read_data(ds_in, input_bb, config)
+    In 2d mode, the slices are processed with `n_threads` threads.
+    If `low_data` is given (see `_load_block`), the distance transform and seeds
+    are computed from the downscaled input.
+    Returns the watershed with the id offset of this block applied; in dense id mode
+    the ids of the block are consecutive, starting at 1, instead.
+    """
+    input_bb, inner_bb, output_bb = bbs
     if in_mask is not None:
         # mask the input
         input_[np.logical_not(in_mask)] = 1
 
     # get offset to make new seeds unique between blocks
     # (we need to relabel later to make processing efficient !)
-    offset = block_id * int(np.prod(blocking.blockShape))
+    dense_ids = config.get('dense_ids', False)
+    offset = 0 if dense_ids else block_id * int(np.prod(blocking.blockShape))
     assert offset < np.iinfo('uint64').max, "Id overflow"
 
     # apply distance transform
-    dt = _apply_dt(input_, config)
+    seeds = None
+    with fu.profile_section('distance_transform'):
+        if low_data is None:
+            dt = _apply_dt(input_, config, n_threads)
+        else:
+            low_input, low_bb, scale = low_data
+            dt = _downscaled_seeds(low_input, input_bb, low_bb, scale, config, in_mask, n_threads)
+            if dt is not None:
+                seeds, dt = dt
     # check if input was valid
     if dt is None:
-        # if the input is not valid, we just write the offset
+        # if the input is not valid, we just return the offset
         # (potentially corrected for the mask)
         out_shape = tuple(obb.stop - obb.start for obb in output_bb)
-        ws = offset * np.ones(out_shape, dtype='uint64')
-        if mask is not None:
-            ws[np.logical_not(out_mask)] = 0
-        ds_out[output_bb] = ws
-        fu.log_block_success(block_id)
-        return
+        ws = (1 if dense_ids else offset) * np.ones(out_shape, dtype='uint64')
+        if in_mask is not None:
+            ws[np.logical_not(in_mask[inner_bb])] = 0
+        return ws
 
-    # -> apply ws and write the results to the inner volume
-    ws = _apply_watershed(input_, dt, config, in_mask)
+    # -> apply ws and cut out the inner volume
+    with fu.profile_section('watershed'):
+        ws = _apply_watershed(input_, dt, config, in_mask, n_threads, seeds)
 
     # if we have a halo, we need to run connected components
     if output_bb != input_bb:
@@ -333,17 +474,109 @@ def _ws_block(blocking, block_id, ds_in, ds_out, mask, config):
             in_mask = in_mask[inner_bb]
     ws = ws.astype('uint64')
 
+    if dense_ids:
+        ws, _, _ = vigra.analysis.relabelConsecutive(ws, start_label=1, keep_zeros=True)
+        return ws
+
     # apply offset to the watershed
     if in_mask is None:
         ws += offset
     else:
         ws[in_mask] += offset
+    return ws
+
+
+def _load_block(blocking, block_id, ds_in, mask, config, ds_low=None):
+    """ Read the input and mask for the block, returns None if the block is masked out.
+
+    If the downscaled input `ds_low` is given, the corresponding part of it is read as well.
+    """
+    input_bb, inner_bb, output_bb = _get_bbs(blocking, block_id,
+                                             config)
+    # get the mask and check if we have any pixels
+    if mask is None:
+        in_mask = None
+    else:
+        in_mask = fu.profiled_read(mask, input_bb, 'read_mask').astype('bool')
+        out_mask = in_mask[inner_bb]
+        if np.sum(out_mask) == 0:
+            return None
+
+    # read the input
+    input_ = _read_data(ds_in, input_bb, config)
+
+    low_data = None
+    if ds_low is not None:
+        low_shape = ds_low.shape[-3:]
+        scale = [float(lsh) / sh for lsh, sh in zip(low_shape, blocking.roiEnd)]
+        low_bb = _downscaled_bb(input_bb, scale, low_shape)
+        low_data = (_read_data(ds_low, low_bb, config), low_bb, scale)
+    return (input_bb, inner_bb, output_bb), input_, in_mask, low_data
 
-    # write result and log block success
-    ds_out[output_bb] = ws
+
+def _write_block(ds_out, output_bb, ws, block_id, config, max_id=0):
+    vu.mark_occupied(config['output_path'], config['output_key'], output_bb)
+    fu.profiled_write(ds_out, output_bb, ws)
+    _record_offset(config, block_id, max_id)
     fu.log_block_success(block_id)
 
 
+def _process_block(blocking, block_id, data, ds_out, writer, config, n_threads=1):
+    """ Segment and write the block, returns the max id of the block.
+    """
+    fu.log("start processing block %i" % block_id)
+    if data is None:
+        _record_offset(config, block_id, 0)
+        fu.log_block_success(block_id)
+        return 0
+    bbs, input_, in_mask, low_data = data
+    ws = _segment_block(blocking, block_id, input_, in_mask, bbs, config, n_threads, low_data)
+    max_id = int(ws.max())
+    writer.submit(_write_block, ds_out, bbs[2], ws, block_id, config, max_id)
+    return max_id
+
+
+def _ws_block(blocking, block_id, ds_in, ds_out, mask, config):
+    data = _load_block(blocking, block_id, ds_in, mask, config)
+    _process_block(blocking, block_id, data, ds_out, vu.BlockWriter(), config)
+
+
+def _offset_records_path(tmp_folder, job_id):
+    return os.path.join(tmp_folder, '%s_%i.records' % (OFFSETS_PREFIX, job_id))
+
+
+_offset_records_lock = threading.Lock()
+
+
+def _record_offset(config, block_id, max_id):
+    """ Record the number of ids of the block for `MergeOffsets` in dense id mode.
+
+    The record is written before the block is logged as done, so that it is available
+    if the job fails and only the remaining blocks are retried.
+    """
+    record_path = config.get('offset_records_path', None)
+    if record_path is None:
+        return
+    with _offset_records_lock:
+        with open(record_path, 'a') as f:
+            f.write('%i %i\n' % (block_id, max_id))
+
+
+def _split_threads(n_threads, block_list, config):
+    """ Split the threads of a job into threads for blocks and threads for the slices of a block.
+
+    The blocks are processed in parallel; if the job has fewer blocks than threads
+    the remaining threads are used for the slices in 2d mode.
+    """
+    # we don't know the number of blocks in advance if they come from the block queue
+    if not isinstance(block_list, list):
+        return n_threads, 1
+    block_threads = max(1, min(n_threads, len(block_list)))
+    apply_2d = config.get('apply_dt_2d', True) or config.get('apply_ws_2d', True)
+    slice_threads = max(1, n_threads // block_threads) if apply_2d else 1
+    return block_threads, slice_threads
+
+
 def watershed(job_id, config_path):
     fu.log("start processing job %i" % job_id)
     fu.log("reading config from %s" % config_path)
@@ -358,7 +591,11 @@ def watershed(job_id, config_path):
         shape = shape[1:]
 
     block_shape = list(config['block_shape'])
-    block_list = config['block_list']
+    block_list = vu.job_blocks(config)
+    block_threads, slice_threads = _split_threads(config.get('threads_per_job', 1), block_list, config)
+    fu.log("processing blocks with %i threads and slices with %i threads" % (block_threads, slice_threads))
+    if config.get('dense_ids', False):
+        config['offset_records_path'] = _offset_records_path(config['tmp_folder'], job_id)
 
     # read the output config
     output_path = config['output_path']
@@ -367,8 +604,13 @@ def watershed(job_id, config_path):
     # get the blocking
     blocking = nt.blocking([0, 0, 0], shape, block_shape)
 
+    # the halos of neighboring blocks overlap, so we read the input through the chunk cache if enabled
+    cache = cu.make_chunk_cache(config)
+
     # submit blocks
-    with vu.file_reader(input_path, 'r') as f_in, vu.file_reader(output_path) as f_out:
+    with ExitStack() as stack:
+        f_in = stack.enter_context(vu.file_reader(input_path, 'r', cache=cache))
+        f_out = stack.enter_context(vu.file_reader(output_path))
         ds_in = f_in[input_key]
         assert ds_in.ndim in (3, 4)
         ds_out = f_out[output_key]
@@ -380,9 +622,31 @@ def watershed(job_id, config_path):
             mask = vu.load_mask(mask_path, mask_key, shape)
         else:
             mask = None
-        for block_id in block_list:
-            _ws_block(blocking, block_id, ds_in, ds_out, mask, config)
 
+        if 'downscaled_input_path' in config:
+            f_low = stack.enter_context(vu.file_reader(config['downscaled_input_path'], 'r', cache=cache))
+            ds_low = f_low[config['downscaled_input_key']]
+            assert ds_low.ndim == ds_in.ndim
+        else:
+            ds_low = None
+
+        def _load(block_id):
+            return _load_block(blocking, block_id, ds_in, mask, config, ds_low)
+
+        # read the next blocks and write the results in the background, if enabled
+        blocks = vu.prefetch_blocks(_load, block_list, config.get('prefetch_blocks', 0))
+        with vu.BlockWriter(config.get('write_behind', 0)) as writer:
+
+            def _process(block):
+                block_id, get_data = block
+                n_voxels = int(np.prod(blocking.getBlock(block_id).shape))
+                with fu.profile_block(block_id, n_voxels):
+                    _process_block(blocking, block_id, get_data(), ds_out,
+                                   writer, config, slice_threads)
+
+            vu.map_blocks(_process, blocks, block_threads)
+
+    cu.save_cache_stats(cache, config, job_id)
     # log success
     fu.log_job_success(job_id)
 
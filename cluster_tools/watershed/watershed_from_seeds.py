@@ -10,7 +10,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 from cluster_tools.utils.task_utils import DummyTask
 
 
@@ -107,6 +107,13 @@ class WatershedFromSeedsLocal(WatershedFromSeedsBase, LocalTask):
     pass
 
 
+class WatershedFromSeedsLocalPool(WatershedFromSeedsBase, LocalPoolTask):
+    """
+    WatershedFromSeeds on local machine with persistent worker pool
+    """
+    pass
+
+
 class WatershedFromSeedsSlurm(WatershedFromSeedsBase, SlurmTask):
     """
     WatershedFromSeeds on slurm cluster
@@ -1,10 +1,14 @@
+import os
 import luigi
 
 from ..cluster_tasks import WorkflowBase
+from ..utils import volume_utils as vu
 from . import watershed as watershed_tasks
 from . import two_pass_watershed as two_pass_tasks
 from . import agglomerate as agglomerate_tasks
 from ..relabel import RelabelWorkflow
+from .. import write as write_tasks
+from ..thresholded_components import merge_offsets as offset_tasks
 
 
 class WatershedWorkflow(WorkflowBase):
@@ -16,14 +20,57 @@ class WatershedWorkflow(WorkflowBase):
     mask_key = luigi.Parameter(default='')
     two_pass = luigi.BoolParameter(default=False)
     agglomeration = luigi.BoolParameter(default=False)
+    # compute consecutive ids from the number of ids per block instead of relabeling the watershed,
+    # this is not supported if a block list or roi is given in the global config
+    dense_ids = luigi.BoolParameter(default=False)
+    # compute the distance transform and seeds from a downscaled input, e.g. a scale
+    # level of `DownscalingWorkflow`, and only the watershed at full resolution
+    downscaled_input_path = luigi.Parameter(default='')
+    downscaled_input_key = luigi.Parameter(default='')
+
+    def _apply_offsets(self, dep):
+        offset_task = getattr(offset_tasks,
+                              self._get_task_name('MergeOffsets'))
+        write_task = getattr(write_tasks,
+                             self._get_task_name('Write'))
+        shape = vu.get_shape(self.input_path, self.input_key)
+        if len(shape) == 4:
+            shape = shape[1:]
+        offset_path = os.path.join(self.tmp_folder, 'watershed_offsets.json')
+        dep = offset_task(tmp_folder=self.tmp_folder,
+                          max_jobs=self.max_jobs,
+                          config_dir=self.config_dir,
+                          shape=list(shape), save_path=offset_path,
+                          save_prefix=watershed_tasks.OFFSETS_PREFIX,
+                          dependency=dep)
+        # we only need to add the offsets to the blocks, so we write in-place without assignments
+        dep = write_task(tmp_folder=self.tmp_folder,
+                         max_jobs=self.max_jobs,
+                         config_dir=self.config_dir,
+                         input_path=self.output_path,
+                         input_key=self.output_key,
+                         output_path=self.output_path,
+                         output_key=self.output_key,
+                         assignment_path='',
+                         offset_path=offset_path,
+                         identifier='watershed_offsets',
+                         dependency=dep)
+        return dep
 
     def requires(self):
         if self.two_pass:
+            assert not self.dense_ids, "Dense ids are not supported for the two-pass watershed"
+            assert self.downscaled_input_path == '',\
+                "Downscaled seeds are not supported for the two-pass watershed"
             ws_task = getattr(two_pass_tasks,
                               self._get_task_name('TwoPassWatershed'))
+            ws_kwargs = {}
         else:
             ws_task = getattr(watershed_tasks,
                               self._get_task_name('Watershed'))
+            ws_kwargs = {'dense_ids': self.dense_ids,
+                         'downscaled_input_path': self.downscaled_input_path,
+                         'downscaled_input_key': self.downscaled_input_key}
         dep = ws_task(tmp_folder=self.tmp_folder,
                       max_jobs=self.max_jobs,
                       config_dir=self.config_dir,
@@ -32,7 +79,10 @@ class WatershedWorkflow(WorkflowBase):
                       output_path=self.output_path,
                       output_key=self.output_key,
                       mask_path=self.mask_path,
-                      mask_key=self.mask_key)
+                      mask_key=self.mask_key,
+                      **ws_kwargs)
+        if self.dense_ids:
+            dep = self._apply_offsets(dep)
 
         # run post-ws agglomeration if specified
         if self.agglomeration:
@@ -48,6 +98,10 @@ class WatershedWorkflow(WorkflowBase):
                                    output_key=self.output_key,
                                    have_ignore_label=self.mask_path != '')
 
+        # the dense ids are consecutive already, unless they were agglomerated
+        if self.dense_ids and not self.agglomeration:
+            return dep
+
         dep = RelabelWorkflow(tmp_folder=self.tmp_folder,
                               max_jobs=self.max_jobs,
                               config_dir=self.config_dir,
@@ -65,5 +119,6 @@ class WatershedWorkflow(WorkflowBase):
         configs.update({'watershed': watershed_tasks.WatershedLocal.default_task_config(),
                         'two_pass_watershed': two_pass_tasks.TwoPassWatershedLocal.default_task_config(),
                         'agglomerate': agglomerate_tasks.AgglomerateLocal.default_task_config(),
+                        'merge_offsets': offset_tasks.MergeOffsetsLocal.default_task_config(),
                         **RelabelWorkflow.get_config()})
         return configs
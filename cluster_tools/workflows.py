@@ -15,6 +15,12 @@ from .lifted_multicut import LiftedMulticutWorkflow
 
 from .debugging import CheckSubGraphsWorkflow
 from . import write as write_tasks
+from .relabel import RelabelWorkflow
+from .watershed import fused_watershed as fused_tasks
+from .graph import face_sub_graphs as face_tasks
+from .graph import merge_sub_graphs as merge_graph_tasks
+from .graph import map_edge_ids as map_tasks
+from .features import merge_edge_features as merge_feat_tasks
 
 #
 from .agglomerative_clustering import agglomerative_clustering as agglomerate_tasks
@@ -107,6 +113,128 @@ class ProblemWorkflow(WorkflowBase):
         return config
 
 
+# Computes the watershed, graph and edge features like `WatershedWorkflow` + `ProblemWorkflow`,
+# but extracts the sub-graphs and edge features inside of the blocks from the in-memory watershed blocks,
+# so that the watershed volume is not read again for the initial sub-graphs and block features.
+# The watershed is still relabeled by `RelabelWorkflow` and `FaceSubGraphs` reads the block faces
+# of the relabeled watershed and boundary map to add the edges across blocks.
+# Only supports boundary maps and always uses the default boundary map features.
+# Compared to `ProblemWorkflow`, the graph and the mean, variance, max and size features are the same;
+# the min and quantile features differ, see `FusedWatershedBase`.
+class FusedProblemWorkflow(WorkflowBase):
+    input_path = luigi.Parameter()
+    input_key = luigi.Parameter()
+    ws_path = luigi.Parameter()
+    ws_key = luigi.Parameter()
+    problem_path = luigi.Parameter()
+    mask_path = luigi.Parameter(default='')
+    mask_key = luigi.Parameter(default='')
+
+    # optional params for costs
+    rf_path = luigi.Parameter(default='')
+    node_label_dict = luigi.DictParameter(default={})
+
+    max_jobs_merge = luigi.IntParameter(default=1)
+    # do we compte costs
+    compute_costs = luigi.BoolParameter(default=True)
+
+    # hard-coded keys
+    graph_key = 's0/graph'
+    features_key = 'features'
+    costs_key = 's0/costs'
+    assignment_key = 'relabel_watershed'
+
+    def requires(self):
+        fused_task = getattr(fused_tasks, self._get_task_name('FusedWatershed'))
+        dep = fused_task(tmp_folder=self.tmp_folder,
+                         max_jobs=self.max_jobs,
+                         config_dir=self.config_dir,
+                         dependency=self.dependency,
+                         input_path=self.input_path,
+                         input_key=self.input_key,
+                         output_path=self.ws_path,
+                         output_key=self.ws_key,
+                         mask_path=self.mask_path,
+                         mask_key=self.mask_key,
+                         problem_path=self.problem_path)
+        dep = RelabelWorkflow(tmp_folder=self.tmp_folder,
+                              max_jobs=self.max_jobs,
+                              config_dir=self.config_dir,
+                              target=self.target,
+                              input_path=self.ws_path,
+                              input_key=self.ws_key,
+                              assignment_path=self.ws_path,
+                              assignment_key=self.assignment_key,
+                              dependency=dep)
+
+        face_task = getattr(face_tasks, self._get_task_name('FaceSubGraphs'))
+        dep = face_task(tmp_folder=self.tmp_folder,
+                        max_jobs=self.max_jobs,
+                        config_dir=self.config_dir,
+                        dependency=dep,
+                        input_path=self.input_path,
+                        input_key=self.input_key,
+                        ws_path=self.ws_path,
+                        ws_key=self.ws_key,
+                        graph_path=self.problem_path,
+                        assignment_path=self.ws_path,
+                        assignment_key=self.assignment_key)
+
+        merge_task = getattr(merge_graph_tasks, self._get_task_name('MergeSubGraphs'))
+        dep = merge_task(tmp_folder=self.tmp_folder,
+                         max_jobs=self.max_jobs,
+                         config_dir=self.config_dir,
+                         graph_path=self.problem_path,
+                         output_key=self.graph_key,
+                         scale=0,
+                         merge_complete_graph=True,
+                         dependency=dep)
+        map_task = getattr(map_tasks, self._get_task_name('MapEdgeIds'))
+        dep = map_task(tmp_folder=self.tmp_folder,
+                       max_jobs=self.max_jobs,
+                       config_dir=self.config_dir,
+                       graph_path=self.problem_path,
+                       input_key=self.graph_key,
+                       scale=0,
+                       dependency=dep)
+
+        merge_feat_task = getattr(merge_feat_tasks, self._get_task_name('MergeEdgeFeatures'))
+        dep = merge_feat_task(tmp_folder=self.tmp_folder,
+                              max_jobs=self.max_jobs_merge,
+                              config_dir=self.config_dir,
+                              graph_path=self.problem_path,
+                              graph_key=self.graph_key,
+                              output_path=self.problem_path,
+                              output_key=self.features_key,
+                              dependency=dep)
+        if self.compute_costs:
+            dep = EdgeCostsWorkflow(tmp_folder=self.tmp_folder,
+                                    max_jobs=self.max_jobs,
+                                    config_dir=self.config_dir,
+                                    target=self.target,
+                                    dependency=dep,
+                                    features_path=self.problem_path,
+                                    features_key=self.features_key,
+                                    output_path=self.problem_path,
+                                    output_key=self.costs_key,
+                                    node_label_dict=self.node_label_dict,
+                                    seg_path=self.ws_path, seg_key=self.ws_key,
+                                    rf_path=self.rf_path)
+        return dep
+
+    @staticmethod
+    def get_config():
+        configs = super(FusedProblemWorkflow, FusedProblemWorkflow).get_config()
+        configs.update({'fused_watershed': fused_tasks.FusedWatershedLocal.default_task_config(),
+                        'face_sub_graphs': face_tasks.FaceSubGraphsLocal.default_task_config(),
+                        'merge_sub_graphs': merge_graph_tasks.MergeSubGraphsLocal.default_task_config(),
+                        'map_edge_ids': map_tasks.MapEdgeIdsLocal.default_task_config(),
+                        'merge_edge_features': merge_feat_tasks.MergeEdgeFeaturesLocal.default_task_config(),
+                        **RelabelWorkflow.get_config(),
+                        **EdgeCostsWorkflow.get_config()})
+        return configs
+
+
 class SegmentationWorkflowBase(WorkflowBase):
     input_path = luigi.Parameter()
     input_key = luigi.Parameter()
@@ -137,6 +265,12 @@ class SegmentationWorkflowBase(WorkflowBase):
     agglomerate_ws = luigi.BoolParameter(default=False)
     # run two-pass watershed
     two_pass_ws = luigi.BoolParameter(default=False)
+    # compute consecutive watershed ids from the block offsets instead of relabeling
+    dense_ws_ids = luigi.BoolParameter(default=False)
+    # compute the watershed, graph and features with the fused blockwise tasks;
+    # the fused tasks compute exact quantile features, which differ slightly from
+    # the histogram-based quantiles of the default feature computation
+    fused_ws = luigi.BoolParameter(default=False)
     # run some sanity checks for intermediate results
     sanity_checks = luigi.BoolParameter(default=False)
 
@@ -146,6 +280,11 @@ class SegmentationWorkflowBase(WorkflowBase):
     costs_key = 's0/costs'
 
     def _watershed_tasks(self):
+        # the fused tasks compute the watershed together with the problem
+        if self.fused_ws:
+            assert not (self.skip_ws or self.two_pass_ws or self.agglomerate_ws),\
+                "Fused watershed does not support skip_ws, two_pass_ws or agglomerate_ws"
+            return self.dependency
         if self.skip_ws:
             assert os.path.exists(os.path.join(self.ws_path, self.ws_key)), "%s:%s" % (self.ws_path,
                                                                                        self.ws_key)
@@ -163,10 +302,23 @@ class SegmentationWorkflowBase(WorkflowBase):
                                     mask_path=self.mask_path,
                                     mask_key=self.mask_key,
                                     two_pass=self.two_pass_ws,
-                                    agglomeration=self.agglomerate_ws)
+                                    agglomeration=self.agglomerate_ws,
+                                    dense_ids=self.dense_ws_ids)
             return dep
 
     def _problem_tasks(self, dep, compute_costs):
+        if self.fused_ws:
+            assert not self.sanity_checks, "Sanity checks are not supported for fused watershed"
+            dep = FusedProblemWorkflow(tmp_folder=self.tmp_folder, config_dir=self.config_dir,
+                                       max_jobs=self.max_jobs, target=self.target, dependency=dep,
+                                       input_path=self.input_path, input_key=self.input_key,
+                                       ws_path=self.ws_path, ws_key=self.ws_key,
+                                       mask_path=self.mask_path, mask_key=self.mask_key,
+                                       problem_path=self.problem_path, rf_path=self.rf_path,
+                                       node_label_dict=self.node_label_dict,
+                                       max_jobs_merge=self.max_jobs_merge,
+                                       compute_costs=compute_costs)
+            return dep
         dep = ProblemWorkflow(tmp_folder=self.tmp_folder, config_dir=self.config_dir,
                               max_jobs=self.max_jobs, target=self.target, dependency=dep,
                               input_path=self.input_path, input_key=self.input_key,
@@ -196,7 +348,8 @@ class SegmentationWorkflowBase(WorkflowBase):
 
     @staticmethod
     def get_config():
-        config = {**WatershedWorkflow.get_config(), **ProblemWorkflow.get_config()}
+        config = {**WatershedWorkflow.get_config(), **ProblemWorkflow.get_config(),
+                  **FusedProblemWorkflow.get_config()}
         return config
 
 
@@ -205,6 +358,12 @@ class MulticutSegmentationWorkflow(SegmentationWorkflowBase):
     max_jobs_multicut = luigi.IntParameter(default=1)
     # number of scales
     n_scales = luigi.IntParameter()
+    # serialize the block problems for the sub multicuts, see `MulticutWorkflow`
+    local_subproblems = luigi.BoolParameter(default=False)
+    # reduce the problems with the blockwise reduce tasks, see `MulticutWorkflow`
+    blockwise_reduce = luigi.BoolParameter(default=False)
+    # start the global solver from the solution of the last scale, see `MulticutWorkflow`
+    warmstart_global = luigi.BoolParameter(default=False)
 
     def _multicut_tasks(self, dep):
         dep = MulticutWorkflow(tmp_folder=self.tmp_folder,
@@ -214,6 +373,9 @@ class MulticutSegmentationWorkflow(SegmentationWorkflowBase):
                                dependency=dep,
                                problem_path=self.problem_path,
                                n_scales=self.n_scales,
+                               local_subproblems=self.local_subproblems,
+                               blockwise_reduce=self.blockwise_reduce,
+                               warmstart_global=self.warmstart_global,
                                assignment_path=self.output_path,
                                assignment_key=self.node_labels_key)
         return dep
@@ -4,7 +4,6 @@ import os
 import sys
 import json
 import pickle
-from concurrent import futures
 
 # this is a task called by multiple processes,
 # so we need to restrict the number of threads used by numpy
@@ -19,7 +18,7 @@ import nifty.tools as nt
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
 from cluster_tools.utils.task_utils import DummyTask
-from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LSFTask
+from cluster_tools.cluster_tasks import SlurmTask, LocalTask, LocalPoolTask, LSFTask
 
 
 #
@@ -32,6 +31,7 @@ class WriteBase(luigi.Task):
     """
     task_name = 'write'
     src_file = os.path.abspath(__file__)
+    allow_block_queue = True
 
     # path adn key to input and output datasets
     input_path = luigi.Parameter()
@@ -41,7 +41,8 @@ class WriteBase(luigi.Task):
     # path to the node assignments
     # the key is optional, because the assignment can either be a
     # dense assignment table stored as n5 dataset
-    # or a sparse table stored as pickled python map
+    # or a sparse table stored as pickled python map;
+    # if the path is empty, only the block offsets from `offset_path` are applied
     assignment_path = luigi.Parameter()
     assignment_key = luigi.Parameter(default=None)
     # the task we depend on
@@ -87,13 +88,18 @@ class WriteBase(luigi.Task):
                 chunks = f[self.output_key].chunks
             assert all(bs % ch == 0 for bs, ch in zip(block_shape, chunks)), "%s, %s" % (str(block_shape),
                                                                                          str(chunks))
+            new_output = self.output_key not in f
             f.require_dataset(self.output_key, shape=shape, chunks=chunks,
                               compression='gzip', dtype='uint64')
+        if new_output and self.use_occupancy_index():
+            vu.init_occupancy(self.output_path, self.output_key)
 
         # check if input and output datasets are identical
         in_place = (self.input_path == self.output_path) and (self.input_key == self.output_key)
 
-        if self.assignment_key is None:
+        if self.assignment_path == '':
+            assert self.offset_path != '', "Need either assignments or offsets"
+        elif self.assignment_key is None:
             assert os.path.splitext(self.assignment_path)[-1] == '.pkl',\
                 "Assignments need to be pickled map if no key is given"
 
@@ -103,6 +109,14 @@ class WriteBase(luigi.Task):
                        'assignment_path': self.assignment_path, 'assignment_key': self.assignment_key})
         if self.offset_path != '':
             config.update({'offset_path': self.offset_path})
+        # sparse assignment tables are sorted once here and memory-mapped by the jobs
+        if self._have_sparse_assignments():
+            cache_prefix = os.path.join(self.tmp_folder, 'assignments_%s' % self.identifier)
+            if self.n_retries == 0 or not os.path.exists(cache_prefix + '_values.npy'):
+                node_labels = _load_assignments(self.assignment_path, self.assignment_key,
+                                                config.get('threads_per_job', 1))
+                _save_assignments(node_labels, cache_prefix)
+            config.update({'assignment_cache': cache_prefix})
         # we only add output path and key if we do not write in place
         if not in_place:
             config.update({'output_path': self.output_path, 'output_key': self.output_key})
@@ -110,7 +124,9 @@ class WriteBase(luigi.Task):
         # get block list and jobs
         if self.n_retries == 0:
             block_list = vu.blocks_in_volume(shape, block_shape, roi_begin, roi_end,
-                                             block_list_path=block_list_path)
+                                             block_list_path=block_list_path,
+                                             skip_empty_in=self.skip_empty_in(self.input_path,
+                                                                              self.input_key))
         else:
             block_list = self.block_list
             self.clean_up_for_retry(block_list, self.identifier)
@@ -126,6 +142,13 @@ class WriteBase(luigi.Task):
         self.wait_for_jobs(self.identifier)
         self.check_jobs(n_jobs, self.identifier)
 
+    def _have_sparse_assignments(self):
+        if self.assignment_path == '':
+            return False
+        if self.assignment_key is None:
+            return True
+        return len(vu.get_shape(self.assignment_path, self.assignment_key)) == 2
+
     def output(self):
         return luigi.LocalTarget(os.path.join(self.tmp_folder, '%s_%s.log' % (self.task_name,
                                                                               self.identifier)))
@@ -137,6 +160,12 @@ class WriteLocal(WriteBase, LocalTask):
     pass
 
 
+class WriteLocalPool(WriteBase, LocalPoolTask):
+    """ Write on local machine with persistent worker pool
+    """
+    pass
+
+
 class WriteSlurm(WriteBase, SlurmTask):
     """ Write on slurm cluster
     """
@@ -154,41 +183,87 @@ class WriteLSF(WriteBase, LSFTask):
 #
 
 
+# Node labels are either a dense lookup table, i.e. a 1d array that maps id to label,
+# or a sparse assignment table given by the sorted ids and the corresponding labels.
+
+def _sorted_assignments(ids, labels):
+    """ Make the assignments from the ids and labels of an assignment table.
+
+    Returns a dense lookup table if the ids are consecutive, starting at 0,
+    otherwise the sorted ids and labels. For duplicate ids the last label is used.
+    """
+    ids, labels = np.asarray(ids, dtype='uint64'), np.asarray(labels, dtype='uint64')
+    assert ids.shape == labels.shape
+    if ids.size > 1 and not (ids[1:] >= ids[:-1]).all():
+        order = np.argsort(ids, kind='stable')
+        ids, labels = ids[order], labels[order]
+    if ids.size > 1:
+        last = np.append(ids[1:] != ids[:-1], True)
+        if not last.all():
+            ids, labels = ids[last], labels[last]
+    if ids.size > 0 and ids[0] == 0 and ids[-1] == ids.size - 1:
+        return labels
+    return ids, labels
+
+
+def _lookup(ids, node_labels):
+    # look up the labels of the ids in the sorted assignment table,
+    # returns the labels and a mask for the ids that are in the table
+    keys, labels = node_labels
+    if keys.size == 0:
+        return np.zeros(ids.shape, dtype='uint64'), np.zeros(ids.shape, dtype='bool')
+    pos = np.minimum(np.searchsorted(keys, ids), keys.size - 1)
+    return labels[pos], keys[pos] == ids
+
+
+def _missing_ids_error(ids):
+    return KeyError("%i ids are not in the assignment table, e.g. %s" % (len(ids), str(ids[:10].tolist())))
+
+
 def _apply_node_labels(seg, node_labels, allow_empty_assignments):
-    # choose the appropriate mapping:
-    # - 1d np.array -> just apply it
-    # - 2d np.array -> extract the local dict and apply
-    # - dict -> extract the local dict and apply
-    apply_array = False if isinstance(node_labels, dict) else (True if node_labels.ndim == 1 else False)
-    if apply_array:
+    # dense lookup table -> just apply it
+    if isinstance(node_labels, np.ndarray):
         assert seg.max() < len(node_labels), "Max id %i exceeds number of node labels %i" % (seg.max(),
                                                                                              len(node_labels))
-        seg = nt.take(node_labels, seg)
-    else:
-        # this copys the dict and hence is extremely RAM hungry
-        # so we make the dict as small as possible
-        this_labels = np.unique(seg)
-        if isinstance(node_labels, dict):
-            # do we allow for assignments that are not in the assignment table?
-            if allow_empty_assignments:
-                this_assignment = {label: node_labels.get(label, label) for label in this_labels}
-            else:
-                this_assignment = {label: node_labels[label] for label in this_labels}
-        else:
-            this_assignment = node_labels[:, 1][np.in1d(node_labels[:, 0], this_labels)]
-            this_assignment = {label: this_assignment[ii] for ii, label in enumerate(this_labels)}
-        # FIXME this casts to uint32 which can lead to nasty over-flows
-        seg = nt.takeDict(this_assignment, seg)
-    return seg
+        return nt.take(node_labels, seg)
+
+    # sparse assignment table -> look up the ids of this block
+    min_id, max_id = int(seg.min()), int(seg.max())
+    # the ids of a block are usually in a small range (e.g. for watersheds with block offsets),
+    # then we look up the range and apply it as dense lookup table, otherwise we look up the unique ids
+    if max_id - min_id < seg.size:
+        ids = np.arange(min_id, max_id + 1, dtype='uint64')
+        labels, found = _lookup(ids, node_labels)
+        local_ids = (seg - np.uint64(min_id)).astype('uint64')
+        if not found.all():
+            missing = np.logical_not(found)
+            if not allow_empty_assignments and missing[local_ids].any():
+                raise _missing_ids_error(np.intersect1d(ids[missing], seg))
+            labels[missing] = ids[missing]
+        return labels[local_ids]
+
+    ids, inverse = np.unique(seg, return_inverse=True)
+    labels, found = _lookup(ids, node_labels)
+    if not found.all():
+        missing = np.logical_not(found)
+        if not allow_empty_assignments:
+            raise _missing_ids_error(ids[missing])
+        labels[missing] = ids[missing]
+    return labels[inverse].reshape(seg.shape)
 
 
 def _write_block_with_offsets(ds_in, ds_out, blocking, block_id,
-                              node_labels, offsets, allow_empty_assignments):
+                              node_labels, offsets, allow_empty_assignments,
+                              output_path=None, output_key=None):
     fu.log("start processing block %i" % block_id)
     off = offsets[block_id]
+    # nothing to do if we only apply the offsets in-place and the offset is zero
+    if off == 0 and node_labels is None and ds_in is ds_out:
+        fu.log_block_success(block_id)
+        return
     block = blocking.getBlock(block_id)
     bb = vu.block_to_bb(block)
-    seg = ds_in[bb]
+    seg = fu.profiled_read(ds_in, bb)
 
     # check if this block is empty and don't write if it is
     mask = seg != 0
@@ -197,14 +272,18 @@ def _write_block_with_offsets(ds_in, ds_out, blocking, block_id,
         return
 
     seg[mask] += off
-    seg = _apply_node_labels(seg, node_labels, allow_empty_assignments)
-    ds_out[bb] = seg
+    if node_labels is not None:
+        with fu.profile_section('relabel'):
+            seg = _apply_node_labels(seg, node_labels, allow_empty_assignments)
+    if output_path is not None:
+        vu.mark_occupied(output_path, output_key, bb)
+    fu.profiled_write(ds_out, bb, seg)
     fu.log_block_success(block_id)
 
 
 def _write_with_offsets(ds_in, ds_out, blocking, block_list,
                         n_threads, node_labels, offset_path,
-                        allow_empty_assignments):
+                        allow_empty_assignments, output_path=None, output_key=None):
 
     fu.log("loading offsets from %s" % offset_path)
     with open(offset_path) as f:
@@ -212,77 +291,120 @@ def _write_with_offsets(ds_in, ds_out, blocking, block_list,
         offsets = offset_config['offsets']
         empty_blocks = offset_config['empty_blocks']
 
-    with futures.ThreadPoolExecutor(n_threads) as tp:
-        tasks = [tp.submit(_write_block_with_offsets, ds_in, ds_out,
-                           blocking, block_id, node_labels, offsets,
-                           allow_empty_assignments)
-                 for block_id in block_list if block_id not in empty_blocks]
-        [t.result() for t in tasks]
+    def _write_block_id(block_id):
+        n_voxels = int(np.prod(blocking.getBlock(block_id).shape))
+        with fu.profile_block(block_id, n_voxels):
+            _write_block_with_offsets(ds_in, ds_out, blocking, block_id, node_labels, offsets,
+                                      allow_empty_assignments, output_path, output_key)
+
+    empty_blocks = set(empty_blocks)
+    vu.map_blocks(_write_block_id,
+                  (block_id for block_id in block_list if block_id not in empty_blocks),
+                  n_threads)
 
 
 def _write_block(ds_in, ds_out, blocking, block_id, node_labels,
-                 allow_empty_assignments):
+                 allow_empty_assignments, output_path=None, output_key=None):
     fu.log("start processing block %i" % block_id)
     block = blocking.getBlock(block_id)
     bb = vu.block_to_bb(block)
-    seg = ds_in[bb]
+    seg = fu.profiled_read(ds_in, bb)
     # check if this block is empty and don't write if it is
     if np.sum(seg != 0) == 0:
         fu.log_block_success(block_id)
         return
 
-    seg = _apply_node_labels(seg, node_labels, allow_empty_assignments)
-    ds_out[bb] = seg
+    with fu.profile_section('relabel'):
+        seg = _apply_node_labels(seg, node_labels, allow_empty_assignments)
+    if output_path is not None:
+        vu.mark_occupied(output_path, output_key, bb)
+    fu.profiled_write(ds_out, bb, seg)
     fu.log_block_success(block_id)
 
 
 def _write(ds_in, ds_out, blocking, block_list,
-           n_threads, node_labels, allow_empty_assignments):
-    with futures.ThreadPoolExecutor(n_threads) as tp:
-        tasks = [tp.submit(_write_block, ds_in, ds_out,
-                           blocking, block_id, node_labels,
-                           allow_empty_assignments)
-                 for block_id in block_list]
-        [t.result() for t in tasks]
+           n_threads, node_labels, allow_empty_assignments,
+           output_path=None, output_key=None):
+    def _write_block_id(block_id):
+        n_voxels = int(np.prod(blocking.getBlock(block_id).shape))
+        with fu.profile_block(block_id, n_voxels):
+            _write_block(ds_in, ds_out, blocking, block_id, node_labels,
+                         allow_empty_assignments, output_path, output_key)
+
+    vu.map_blocks(_write_block_id, block_list, n_threads)
 
 
 def _load_assignments(path, key, n_threads):
+    """ Load the node labels as dense lookup table or sorted assignment table.
+    """
     # if we have no key, this is a pickle file
     if key is None:
         assert os.path.split(path)[1].split('.')[-1] == 'pkl'
         with open(path, 'rb') as f:
             node_labels = pickle.load(f)
         assert isinstance(node_labels, dict)
-    else:
-        with vu.file_reader(path, 'r') as f:
-            ds = f[key]
-            assert ds.ndim in (1, 2)
-            ds.n_threads = n_threads
-            node_labels = ds[:]
-
-            # this can happen if we only have a single label.
-            # for some reason z5 returns this as int, not as array
-            if isinstance(node_labels, int):
-                node_labels = np.array([node_labels], dtype='uint64')
-
-            # if we have 2d node_labels, these correspond to an assignment table
-            # and we turn them into a dict for efficient downstream processing
-            if node_labels.ndim == 2:
-                if node_labels.shape[1] == 2:
-                    node_labels = dict(zip(node_labels[:, 0], node_labels[:, 1]))
-                elif node_labels.shape[0] == 2:
-                    node_labels = dict(zip(node_labels[0, :], node_labels[1, :]))
-                else:
-                    raise ValueError("Invalid shape for 2d node labels")
-
+        return _sorted_assignments(np.fromiter(node_labels.keys(), dtype='uint64', count=len(node_labels)),
+                                   np.fromiter(node_labels.values(), dtype='uint64', count=len(node_labels)))
+
+    with vu.file_reader(path, 'r') as f:
+        ds = f[key]
+        assert ds.ndim in (1, 2)
+        ds.n_threads = n_threads
+        node_labels = ds[:]
+
+    # this can happen if we only have a single label.
+    # for some reason z5 returns this as int, not as array
+    if isinstance(node_labels, int):
+        node_labels = np.array([node_labels], dtype='uint64')
+
+    # if we have 2d node_labels, these correspond to an assignment table
+    if node_labels.ndim == 2:
+        if node_labels.shape[1] == 2:
+            node_labels = _sorted_assignments(node_labels[:, 0], node_labels[:, 1])
+        elif node_labels.shape[0] == 2:
+            node_labels = _sorted_assignments(node_labels[0, :], node_labels[1, :])
+        else:
+            raise ValueError("Invalid shape for 2d node labels")
     return node_labels
 
 
-def _write_maxlabel(output_path, output_key, node_labels):
+def _save_array(path, data):
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, data)
+    os.replace(path + '.tmp', path)
+
+
+def _save_assignments(node_labels, prefix):
+    """ Save the node labels as npy files, so that the jobs can memory-map them.
+    """
     if isinstance(node_labels, np.ndarray):
+        ids_path = prefix + '_ids.npy'
+        if os.path.exists(ids_path):
+            os.remove(ids_path)
+        labels = node_labels
+    else:
+        ids, labels = node_labels
+        _save_array(prefix + '_ids.npy', ids)
+    _save_array(prefix + '_values.npy', labels)
+
+
+def _load_cached_assignments(prefix):
+    labels = np.load(prefix + '_values.npy', mmap_mode='r')
+    ids_path = prefix + '_ids.npy'
+    if os.path.exists(ids_path):
+        return np.load(ids_path, mmap_mode='r'), labels
+    return labels
+
+
+def _write_maxlabel(output_path, output_key, node_labels, offset_path=None):
+    if node_labels is None:
+        # the ids are consecutive after applying the offsets
+        with open(offset_path) as f:
+            max_id = int(json.load(f)['n_labels']) - 1
+    elif isinstance(node_labels, np.ndarray):
         max_id = int(node_labels.max())
-    elif isinstance(node_labels, dict):
-        max_id = int(np.max(list(node_labels.values())))
+    elif isinstance(node_labels, tuple):
+        max_id = int(node_labels[1].max()) if node_labels[1].size > 0 else 0
     else:
         raise AttributeError("Invalide type %s" % type(node_labels))
     with vu.file_reader(output_path) as f:
@@ -308,17 +430,23 @@ def write(job_id, config_path):
         in_place = True
 
     block_shape = config['block_shape']
-    block_list = config['block_list']
+    block_list = vu.job_blocks(config)
     n_threads = config.get('threads_per_job', 1)
     allow_empty_assignments = config.get('allow_empty_assignments', False)
 
     # read node assignments
     assignment_path = config['assignment_path']
     assignment_key = config.get('assignment_key', None)
-    fu.log("loading node labels from %s" % assignment_path)
-    node_labels = _load_assignments(assignment_path, assignment_key, n_threads)
-
     offset_path = config.get('offset_path', None)
+    if assignment_path == '':
+        assert offset_path is not None
+        node_labels = None
+    elif 'assignment_cache' in config:
+        fu.log("memory-mapping node labels from %s" % config['assignment_cache'])
+        node_labels = _load_cached_assignments(config['assignment_cache'])
+    else:
+        fu.log("loading node labels from %s" % assignment_path)
+        node_labels = _load_assignments(assignment_path, assignment_key, n_threads)
 
     # if we write in-place, we only need to open one file and one dataset
     if in_place:
@@ -339,7 +467,7 @@ def write(job_id, config_path):
         # write the max-label
         # for job 0
         if job_id == 0:
-            _write_maxlabel(input_path, input_key, node_labels)
+            _write_maxlabel(input_path, input_key, node_labels, offset_path)
 
     else:
         # even if we do not write in-place, we might still write to the same output_file,
@@ -357,11 +485,11 @@ def write(job_id, config_path):
 
                 if offset_path is None:
                     _write(ds_in, ds_out, blocking, block_list, n_threads, node_labels,
-                           allow_empty_assignments)
+                           allow_empty_assignments, output_path, output_key)
                 else:
                     _write_with_offsets(ds_in, ds_out, blocking, block_list,
                                         n_threads, node_labels, offset_path,
-                                        allow_empty_assignments)
+                                        allow_empty_assignments, output_path, output_key)
         else:
             with vu.file_reader(input_path, 'r') as f_in, vu.file_reader(output_path) as f_out:
                 ds_in = f_in[input_key]
@@ -374,15 +502,15 @@ def write(job_id, config_path):
 
                 if offset_path is None:
                     _write(ds_in, ds_out, blocking, block_list, n_threads, node_labels,
-                           allow_empty_assignments)
+                           allow_empty_assignments, output_path, output_key)
                 else:
                     _write_with_offsets(ds_in, ds_out, blocking, block_list,
                                         n_threads, node_labels, offset_path,
-                                        allow_empty_assignments)
+                                        allow_empty_assignments, output_path, output_key)
         # write the max-label
         # for job 0
         if job_id == 0:
-            _write_maxlabel(output_path, output_key, node_labels)
+            _write_maxlabel(output_path, output_key, node_labels, offset_path)
 
     fu.log_job_success(job_id)
 
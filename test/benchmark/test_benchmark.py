@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+
+
+class TestBenchmark(unittest.TestCase):
+    shape = (16, 64, 64)
+
+    def test_synthetic_labels(self):
+        from cluster_tools.benchmark.synthetic import synthetic_labels, oversegmentation
+        labels = synthetic_labels(self.shape, mean_size=(4, 16, 16))
+        self.assertEqual(labels.shape, self.shape)
+        ids = np.unique(labels)
+        self.assertGreater(len(ids), 20)
+        self.assertTrue(np.array_equal(ids, np.arange(1, len(ids) + 1)))
+        # the generator is deterministic
+        self.assertTrue(np.array_equal(labels, synthetic_labels(self.shape, mean_size=(4, 16, 16))))
+
+        sparse = synthetic_labels(self.shape, mean_size=(4, 16, 16), sparsity=.5)
+        sparse_ids = np.unique(sparse)
+        self.assertEqual(sparse_ids[0], 0)
+        self.assertTrue(np.array_equal(sparse_ids, np.arange(len(sparse_ids))))
+
+        # the over-segmentation respects the boundaries of the labels
+        ws = oversegmentation(sparse, mean_size=(2, 8, 8))
+        self.assertGreater(ws.max(), sparse.max())
+        self.assertTrue(np.array_equal(ws == 0, sparse == 0))
+        pairs = np.unique(np.stack([ws.ravel(), sparse.ravel()], axis=1), axis=0)
+        self.assertEqual(len(pairs), len(np.unique(ws)))
+
+    def test_boundaries_and_mask(self):
+        from cluster_tools.benchmark.synthetic import (synthetic_labels, boundary_map,
+                                                       affinities, synthetic_mask)
+        labels = synthetic_labels(self.shape, mean_size=(4, 16, 16))
+        bd = boundary_map(labels, noise=0.)
+        self.assertEqual(bd.dtype, np.dtype('float32'))
+        self.assertGreaterEqual(bd.min(), 0.)
+        self.assertLessEqual(bd.max(), 1.)
+        inner = labels == np.roll(labels, 1, axis=2)
+        inner &= labels == np.roll(labels, -1, axis=2)
+        self.assertGreater(bd[~inner].mean(), bd[inner].mean())
+
+        affs = affinities(labels, noise=0.)
+        self.assertEqual(affs.shape, (3,) + self.shape)
+        self.assertTrue(np.array_equal(affs[2, :, :, 1:] > 0, labels[:, :, 1:] != labels[:, :, :-1]))
+
+        mask = synthetic_mask(self.shape, sparsity=.3, mean_size=(8, 32, 32))
+        self.assertTrue(0.1 < 1. - mask.mean() < 0.5)
+
+    def test_compare_results(self):
+        from cluster_tools.benchmark.results import compare_results
+        params = {'shape': [32, 32, 32]}
+        baseline = {'results': [{'name': 'a', 'params': params, 'min': 1.},
+                                {'name': 'b', 'params': params, 'min': 1.}]}
+        current = {'results': [{'name': 'a', 'params': params, 'min': 1.05},
+                               {'name': 'b', 'params': params, 'min': 2.},
+                               {'name': 'b', 'params': {'shape': [64, 64, 64]}, 'min': 8.}]}
+        comparison = compare_results(baseline, current, tolerance=.1)
+        self.assertEqual(len(comparison), 2)
+        self.assertFalse(comparison[0]['regression'])
+        self.assertTrue(comparison[1]['regression'])
+        self.assertAlmostEqual(comparison[1]['ratio'], 2.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -137,6 +137,63 @@ class TestGraph(BaseTest):
         self.check_subresults(self.input_key)
         self.check_result(self.input_key)
 
+    def test_graph_batched(self):
+        from cluster_tools.graph import GraphWorkflow
+        task = GraphWorkflow
+
+        task_config = GraphWorkflow.get_config()['initial_sub_graphs']
+        task_config.update({'ignore_label': False, 'threads_per_job': 4,
+                            'blocks_per_batch': [1, 2, 2]})
+        with open(os.path.join(self.config_folder, 'initial_sub_graphs.config'),
+                  'w') as f:
+            json.dump(task_config, f)
+
+        ret = luigi.build([task(input_path=self.input_path,
+                                input_key=self.input_key,
+                                graph_path=self.output_path,
+                                output_key=self.output_key,
+                                n_scales=1,
+                                config_dir=self.config_folder,
+                                tmp_folder=self.tmp_folder,
+                                target=self.target,
+                                max_jobs=self.max_jobs)], local_scheduler=True)
+        self.assertTrue(ret)
+        self.check_subresults(self.input_key)
+        self.check_result(self.input_key)
+
+    def test_graph_merge_tree(self):
+        from cluster_tools.graph import GraphWorkflow
+        task = GraphWorkflow
+
+        task_config = GraphWorkflow.get_config()['initial_sub_graphs']
+        task_config['ignore_label'] = False
+        with open(os.path.join(self.config_folder, 'initial_sub_graphs.config'),
+                  'w') as f:
+            json.dump(task_config, f)
+
+        task_config = GraphWorkflow.get_config()['merge_sub_graphs']
+        task_config['merge_fan_in'] = 2
+        with open(os.path.join(self.config_folder, 'merge_sub_graphs.config'),
+                  'w') as f:
+            json.dump(task_config, f)
+
+        ret = luigi.build([task(input_path=self.input_path,
+                                input_key=self.input_key,
+                                graph_path=self.output_path,
+                                output_key=self.output_key,
+                                n_scales=1,
+                                config_dir=self.config_folder,
+                                tmp_folder=self.tmp_folder,
+                                target=self.target,
+                                max_jobs=self.max_jobs)], local_scheduler=True)
+        self.assertTrue(ret)
+        # the levels of the merge tree are removed after the complete graph was merged
+        from cluster_tools.graph.merge_sub_graphs import MERGE_TREE_KEY
+        with z5py.File(self.output_path, 'r') as f:
+            self.assertNotIn(MERGE_TREE_KEY % self.output_key, f)
+        self.check_subresults(self.input_key)
+        self.check_result(self.input_key)
+
     def test_graph_label_multiset(self):
         from cluster_tools.graph import GraphWorkflow
         task = GraphWorkflow
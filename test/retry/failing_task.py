@@ -9,7 +9,7 @@ import nifty.tools as nt
 
 import cluster_tools.utils.volume_utils as vu
 import cluster_tools.utils.function_utils as fu
-from cluster_tools.cluster_tasks import LocalTask
+from cluster_tools.cluster_tasks import LocalTask, LocalPoolTask, SlurmTask, LSFTask
 
 
 #
@@ -69,6 +69,24 @@ class FailingTaskLocal(FailingTaskBase, LocalTask):
     pass
 
 
+class FailingTaskLocalPool(FailingTaskBase, LocalPoolTask):
+    """ FailingTask on local machine with persistent worker pool
+    """
+    pass
+
+
+class FailingTaskSlurm(FailingTaskBase, SlurmTask):
+    """ FailingTask on slurm cluster
+    """
+    pass
+
+
+class FailingTaskLSF(FailingTaskBase, LSFTask):
+    """ FailingTask on lsf cluster
+    """
+    pass
+
+
 def _failing_block(block_id, blocking, ds, n_retries):
     # fail for odd block ids if we are in the first try
     if n_retries == 0 and block_id % 2 == 1:
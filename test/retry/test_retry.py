@@ -15,9 +15,9 @@ except ValueError:
 
 
 try:
-    from .failing_task import FailingTaskLocal
+    from .failing_task import FailingTaskLocal, FailingTaskLocalPool
 except ImportError:
-    from failing_task import FailingTaskLocal
+    from failing_task import FailingTaskLocal, FailingTaskLocalPool
 
 
 class TestRetry(BaseTest):
@@ -33,8 +33,7 @@ class TestRetry(BaseTest):
         with open(conf_path, 'w') as f:
             json.dump(global_config, f)
 
-    def test_retry(self):
-        task = FailingTaskLocal
+    def _test_retry(self, task):
         ret = luigi.build([task(output_path=self.output_path,
                                 output_key=self.output_key,
                                 shape=self.shape,
@@ -46,6 +45,12 @@ class TestRetry(BaseTest):
             data = f[self.output_key][:]
         self.assertTrue(np.allclose(data, 1))
 
+    def test_retry(self):
+        self._test_retry(FailingTaskLocal)
+
+    def test_retry_local_pool(self):
+        self._test_retry(FailingTaskLocalPool)
+
 
 if __name__ == '__main__':
     unittest.main()
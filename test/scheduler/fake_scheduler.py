@@ -0,0 +1,173 @@
+#! /usr/bin/env python
+""" Stand-in for the slurm (sbatch, sacct) and lsf (bsub, bjobs) commands,
+so that the job array submission can be tested without a cluster.
+
+The command is selected by the name the script is called with, see the symlinks in `bin`.
+Submitted arrays are run in a background process, one array job after the other.
+The state of the jobs is stored in FAKE_SCHEDULER_DIR.
+If FAKE_SCHEDULER_ACCOUNTING_DELAY is set, sacct and bjobs only list the jobs
+this many seconds after submission, like a scheduler with accounting lag.
+"""
+
+import os
+import sys
+import json
+import time
+import subprocess
+
+STATE_DIR = os.environ.get('FAKE_SCHEDULER_DIR', '/tmp/fake_scheduler')
+ACCOUNTING_DELAY = float(os.environ.get('FAKE_SCHEDULER_ACCOUNTING_DELAY', 0))
+
+
+def _next_job_id():
+    os.makedirs(STATE_DIR, exist_ok=True)
+    counter_file = os.path.join(STATE_DIR, 'counter')
+    job_id = 1000
+    if os.path.exists(counter_file):
+        with open(counter_file) as f:
+            job_id = int(f.read()) + 1
+    with open(counter_file, 'w') as f:
+        f.write(str(job_id))
+    return job_id
+
+
+def _state_path(job_id, index):
+    return os.path.join(STATE_DIR, '%i_%i.state' % (job_id, index))
+
+
+def _set_state(job_id, index, state):
+    with open(_state_path(job_id, index), 'w') as f:
+        f.write(state)
+
+
+def _get_states(job_id):
+    job_file = os.path.join(STATE_DIR, '%i.json' % job_id)
+    if not os.path.exists(job_file):
+        return None
+    with open(job_file) as f:
+        job = json.load(f)
+    if time.time() - job['submit_time'] < ACCOUNTING_DELAY:
+        return None
+    states = []
+    for index in job['indices']:
+        with open(_state_path(job_id, index)) as f:
+            states.append(f.read())
+    return states
+
+
+def _submit(job):
+    job_id = _next_job_id()
+    job['job_id'] = job_id
+    job['submit_time'] = time.time()
+    with open(os.path.join(STATE_DIR, '%i.json' % job_id), 'w') as f:
+        json.dump(job, f)
+    for index in job['indices']:
+        _set_state(job_id, index, job['states']['pending'])
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), '--run', str(job_id)],
+                     start_new_session=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return job_id
+
+
+def _run(job_id):
+    with open(os.path.join(STATE_DIR, '%s.json' % job_id)) as f:
+        job = json.load(f)
+    job_id = int(job_id)
+    states = job['states']
+    for index in job['indices']:
+        _set_state(job_id, index, states['running'])
+        env = dict(os.environ)
+        env.update({var: str(index) for var in job['index_vars']})
+        env.update({var: str(job_id) for var in job['id_vars']})
+        out_file = job['out'].replace('%A', str(job_id)).replace('%J', str(job_id))
+        out_file = out_file.replace('%a', str(index)).replace('%I', str(index))
+        with open(out_file, 'w') as f:
+            ret = subprocess.call(job['command'], env=env, stdout=f, stderr=f)
+        _set_state(job_id, index, states['done'] if ret == 0 else states['failed'])
+
+
+def sbatch(args):
+    array, out, script_args = None, 'slurm-%A_%a.out', []
+    ii = 0
+    while ii < len(args):
+        arg = args[ii]
+        if arg.startswith('--array='):
+            array = arg.split('=')[1]
+        elif arg == '-o':
+            ii += 1
+            out = args[ii]
+        elif arg in ('-e', '-J', '-N', '-c', '--mem', '-t', '-A', '-p', '-C'):
+            ii += 1
+        elif arg.startswith('--qos='):
+            pass
+        else:
+            script_args.append(arg)
+        ii += 1
+    begin, end = (array or '0-0').split('-')
+    job = {'indices': list(range(int(begin), int(end) + 1)), 'out': out,
+           'command': ['bash'] + script_args,
+           'index_vars': ['SLURM_ARRAY_TASK_ID'], 'id_vars': ['SLURM_ARRAY_JOB_ID', 'SLURM_JOB_ID'],
+           'states': {'pending': 'PENDING', 'running': 'RUNNING', 'done': 'COMPLETED', 'failed': 'FAILED'}}
+    print("Submitted batch job %i" % _submit(job))
+
+
+def sacct(args):
+    job_ids = args[args.index('-j') + 1].split(',')
+    with_id = 'JobID' in args[args.index('-o') + 1]
+    for job_id in job_ids:
+        for index, state in enumerate(_get_states(int(job_id)) or []):
+            print('%s_%i|%s' % (job_id, index, state) if with_id else state)
+
+
+def bsub(args):
+    name, out, mem = None, None, None
+    ii = 0
+    while ii < len(args) - 1:
+        arg = args[ii]
+        if arg == '-J':
+            ii += 1
+            name = args[ii]
+        elif arg == '-o':
+            ii += 1
+            out = args[ii]
+        elif arg == '-M':
+            ii += 1
+            mem = args[ii]
+        ii += 1
+    indices = [1]
+    if name is not None and '[' in name:
+        begin, end = name[name.index('[') + 1:-1].split('-')
+        indices = list(range(int(begin), int(end) + 1))
+    job = {'indices': indices, 'out': out or os.devnull,
+           'command': ['bash', '-c', args[-1]],
+           'index_vars': ['LSB_JOBINDEX'], 'id_vars': ['LSB_JOBID'], 'mem': mem,
+           'states': {'pending': 'PEND', 'running': 'RUN', 'done': 'DONE', 'failed': 'EXIT'}}
+    print("Job <%i> is submitted to default queue <normal>." % _submit(job))
+
+
+def bjobs(args):
+    job_ids = [arg for arg in args if arg.isdigit()]
+    with_id = 'jobid' in args[args.index('-o') + 1]
+    not_found = False
+    for job_id in job_ids:
+        states = _get_states(int(job_id))
+        if states is None:
+            print("Job <%s> is not found" % job_id)
+            not_found = True
+            continue
+        for state in states:
+            print('%s %s' % (job_id, state) if with_id else state)
+    if not_found:
+        sys.exit(255)
+
+
+def main():
+    if sys.argv[1:2] == ['--run']:
+        _run(sys.argv[2])
+        return
+    commands = {'sbatch': sbatch, 'sacct': sacct, 'bsub': bsub, 'bjobs': bjobs}
+    command = os.path.basename(sys.argv[0])
+    commands[command](sys.argv[1:])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#! /bin/python
+
+import os
+import sys
+import json
+
+import luigi
+
+import cluster_tools.utils.function_utils as fu
+from cluster_tools.cluster_tasks import LocalTask, SlurmTask, LSFTask
+from cluster_tools.utils.task_utils import DummyTask
+
+
+#
+# Single-job task that increments a counter, to test the co-scheduling of reduce tasks
+#
+
+class ReduceTaskBase(luigi.Task):
+    """ ReduceTask base class
+    """
+
+    task_name = 'reduce_task'
+    src_file = os.path.abspath(__file__)
+
+    output_path = luigi.Parameter()
+    # prefix to run the task multiple times in the same tmp folder
+    prefix = luigi.Parameter()
+    dependency = luigi.TaskParameter(default=DummyTask())
+
+    def requires(self):
+        return self.dependency
+
+    def run_impl(self):
+        shebang = self.global_config_values()[0]
+        self.init(shebang)
+
+        config = self.get_task_config()
+        config.update({'output_path': self.output_path})
+
+        # prime and run the job
+        self.prepare_jobs(1, None, config, self.prefix)
+        self.submit_jobs(1, self.prefix)
+
+        # wait till the job finishes and check for job success
+        self.wait_for_jobs(self.prefix)
+        self.check_jobs(1, self.prefix)
+
+    def output(self):
+        return luigi.LocalTarget(os.path.join(self.tmp_folder,
+                                              '%s_%s.log' % (self.task_name, self.prefix)))
+
+
+class ReduceTaskLocal(ReduceTaskBase, LocalTask):
+    """ ReduceTask on local machine
+    """
+    pass
+
+
+class ReduceTaskSlurm(ReduceTaskBase, SlurmTask):
+    """ ReduceTask on slurm cluster
+    """
+    pass
+
+
+class ReduceTaskLSF(ReduceTaskBase, LSFTask):
+    """ ReduceTask on lsf cluster
+    """
+    pass
+
+
+def reduce_task(job_id, config_path):
+    fu.log("start processing job %i" % job_id)
+    with open(config_path) as f:
+        config = json.load(f)
+    output_path = config['output_path']
+
+    count = 0
+    if os.path.exists(output_path):
+        with open(output_path) as f:
+            count = json.load(f)
+    with open(output_path, 'w') as f:
+        json.dump(count + 1, f)
+    fu.log_job_success(job_id)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1]
+    assert os.path.exists(path), path
+    job_id = int(os.path.split(path)[1].split('.')[0].split('_')[-1])
+    reduce_task(job_id, path)
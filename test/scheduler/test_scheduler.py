@@ -0,0 +1,123 @@
+import os
+import json
+import unittest
+import sys
+
+import numpy as np
+import luigi
+import z5py
+from cluster_tools.utils.task_utils import DummyTask
+
+try:
+    from ..base import BaseTest
+except ValueError:
+    sys.path.append('..')
+    from base import BaseTest
+
+try:
+    from ..retry.failing_task import FailingTaskSlurm, FailingTaskLSF
+except (ImportError, ValueError):
+    sys.path.append('../retry')
+    from failing_task import FailingTaskSlurm, FailingTaskLSF
+
+try:
+    from .reduce_task import ReduceTaskSlurm, ReduceTaskLSF
+except ImportError:
+    from reduce_task import ReduceTaskSlurm, ReduceTaskLSF
+
+
+class TestScheduler(BaseTest):
+    """ Test the job array submission with a fake scheduler,
+    see `fake_scheduler.py`.
+    """
+    output_key = 'data'
+    shape = (100, 1024, 1024)
+    fake_bin = os.path.join(os.path.split(os.path.abspath(__file__))[0], 'bin')
+    state_dir = './tmp/fake_scheduler'
+
+    def setUp(self):
+        super().setUp()
+        conf_path = os.path.join(self.config_folder, 'global.config')
+        with open(conf_path) as f:
+            global_config = json.load(f)
+        # small array size to test submission of multiple arrays
+        global_config.update({'max_num_retries': 2, 'easybuild': False,
+                              'max_array_size': 3, 'poll_interval': 1})
+        with open(conf_path, 'w') as f:
+            json.dump(global_config, f)
+        self.env = dict(os.environ)
+        os.environ['PATH'] = self.fake_bin + os.pathsep + os.environ['PATH']
+        os.environ['FAKE_SCHEDULER_DIR'] = os.path.abspath(self.state_dir)
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.env)
+        super().tearDown()
+
+    def _test_scheduler(self, task):
+        ret = luigi.build([task(output_path=self.output_path,
+                                output_key=self.output_key,
+                                shape=self.shape,
+                                config_dir=self.config_folder,
+                                tmp_folder=self.tmp_folder,
+                                max_jobs=8)], local_scheduler=True)
+        self.assertTrue(ret)
+        with z5py.File(self.output_path) as f:
+            data = f[self.output_key][:]
+        self.assertTrue(np.allclose(data, 1))
+
+    def test_slurm(self):
+        self._test_scheduler(FailingTaskSlurm)
+
+    def test_lsf(self):
+        self._test_scheduler(FailingTaskLSF)
+        # the memory limit of the task config is passed to bsub
+        jobs = [name for name in os.listdir(self.state_dir) if name.endswith('.json')]
+        self.assertGreater(len(jobs), 0)
+        for name in jobs:
+            with open(os.path.join(self.state_dir, name)) as f:
+                self.assertEqual(json.load(f)['mem'], '1000MB')
+
+    def _test_accounting_delay(self, task):
+        # the jobs are only listed by the scheduler some time after the submission
+        os.environ['FAKE_SCHEDULER_ACCOUNTING_DELAY'] = '3'
+        self._test_scheduler(task)
+
+    def test_slurm_accounting_delay(self):
+        self._test_accounting_delay(FailingTaskSlurm)
+
+    def test_lsf_accounting_delay(self):
+        self._test_accounting_delay(FailingTaskLSF)
+
+    def _test_coschedule(self, task):
+        conf_path = os.path.join(self.config_folder, 'global.config')
+        with open(conf_path) as f:
+            global_config = json.load(f)
+        global_config.update({'coschedule': True, 'coschedule_idle_timeout': 5})
+        with open(conf_path, 'w') as f:
+            json.dump(global_config, f)
+
+        # chain of single-job tasks that should all run in the same allocation
+        output_path = os.path.join(self.tmp_folder, 'count.json')
+        n_tasks = 3
+        chain = DummyTask()
+        for ii in range(n_tasks):
+            chain = task(output_path=output_path, prefix='t%i' % ii, dependency=chain,
+                         config_dir=self.config_folder, tmp_folder=self.tmp_folder, max_jobs=1)
+        self.assertTrue(luigi.build([chain], local_scheduler=True))
+
+        with open(output_path) as f:
+            self.assertEqual(json.load(f), n_tasks)
+        runners = [name for name in os.listdir(os.path.join(self.tmp_folder, 'coschedule'))
+                   if name.endswith('.sh')]
+        self.assertEqual(len(runners), 1)
+
+    def test_coschedule_slurm(self):
+        self._test_coschedule(ReduceTaskSlurm)
+
+    def test_coschedule_lsf(self):
+        self._test_coschedule(ReduceTaskLSF)
+
+
+if __name__ == '__main__':
+    unittest.main()
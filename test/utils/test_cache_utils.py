@@ -0,0 +1,102 @@
+import os
+import unittest
+from shutil import rmtree
+
+import numpy as np
+
+
+class ArrayDataset:
+    """ Minimal chunked dataset backed by a numpy array that counts the reads.
+    """
+    def __init__(self, data, chunks):
+        self.data = data
+        self.chunks = chunks
+        self.n_reads = 0
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def ndim(self):
+        return self.data.ndim
+
+    def __getitem__(self, index):
+        self.n_reads += 1
+        return self.data[index]
+
+
+class TestCacheUtils(unittest.TestCase):
+    tmp_folder = './tmp'
+
+    def tearDown(self):
+        try:
+            rmtree(self.tmp_folder)
+        except OSError:
+            pass
+
+    def _make_dataset(self):
+        data = np.random.rand(40, 50, 60).astype('float32')
+        return ArrayDataset(data, chunks=(10, 16, 16))
+
+    def test_cached_dataset(self):
+        from cluster_tools.utils.cache_utils import ChunkCache
+        ds = self._make_dataset()
+        cache = ChunkCache(max_bytes=int(1e8))
+        cached = cache.wrap(ds, 'ds')
+
+        bbs = [np.s_[:], np.s_[5:25, 3:47, 17:60], np.s_[7, 10:20], np.s_[-5:, :, -1],
+               np.s_[:, :, :0], (slice(0, 40, 2),)]
+        for bb in bbs:
+            out = cached[bb]
+            self.assertEqual(out.shape, ds.data[bb].shape)
+            self.assertTrue(np.array_equal(out, ds.data[bb]))
+
+        # the second read of the full volume only hits the cache
+        n_reads = ds.n_reads
+        self.assertTrue(np.array_equal(cached[:], ds.data))
+        self.assertEqual(ds.n_reads, n_reads)
+        self.assertGreater(cache.hit_rate, 0.)
+
+    def test_eviction(self):
+        from cluster_tools.utils.cache_utils import ChunkCache
+        ds = self._make_dataset()
+        chunk_bytes = 10 * 16 * 16 * 4
+        cache = ChunkCache(max_bytes=4 * chunk_bytes)
+        cached = cache.wrap(ds, 'ds')
+        self.assertTrue(np.array_equal(cached[:], ds.data))
+        self.assertLessEqual(cache._n_bytes, 4 * chunk_bytes)
+        self.assertGreater(cache.evictions, 0)
+
+    def test_shared_cache(self):
+        from cluster_tools.utils.cache_utils import ChunkCache
+        ds = self._make_dataset()
+        shared_dir = os.path.join(self.tmp_folder, 'shared')
+        cache_a = ChunkCache(max_bytes=int(1e8), shared_dir=shared_dir)
+        self.assertTrue(np.array_equal(cache_a.wrap(ds, 'ds')[:], ds.data))
+
+        # a second cache (i.e. another process) can read the chunks from the shared directory
+        n_reads = ds.n_reads
+        cache_b = ChunkCache(max_bytes=int(1e8), shared_dir=shared_dir)
+        self.assertTrue(np.array_equal(cache_b.wrap(ds, 'ds')[:], ds.data))
+        self.assertEqual(ds.n_reads, n_reads)
+        self.assertEqual(cache_b.misses, 0)
+        self.assertEqual(cache_b.shared_hits, cache_a.misses)
+
+    def test_zorder_blocks(self):
+        from cluster_tools.utils.cache_utils import zorder_blocks
+        shape, block_shape = (40, 40, 40), (10, 10, 10)
+        block_list = list(range(64))
+        ordered = zorder_blocks(shape, block_shape, block_list)
+        self.assertEqual(sorted(ordered), block_list)
+        # the first 8 blocks form a 2 x 2 x 2 cube
+        positions = np.array(np.unravel_index(ordered[:8], (4, 4, 4))).T
+        self.assertTrue(np.array_equal(positions.max(axis=0), [1, 1, 1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -34,6 +34,74 @@ class TestFunctionUtils(unittest.TestCase):
         for li, lo in zip(lines[1:], out_lines):
             self.assertEqual(li, lo)
 
+    def test_ledger(self):
+        from cluster_tools.utils import function_utils as fu
+        from cluster_tools.utils import parse_utils as pu
+        log_dir = os.path.join(self.tmp_dir, 'logs')
+        os.makedirs(log_dir)
+        os.makedirs(os.path.join(self.tmp_dir, 'ledgers'))
+
+        log_path = os.path.join(log_dir, 'task_0.log')
+        ledger_path = pu.ledger_path(log_path)
+        self.assertEqual(ledger_path, os.path.join(self.tmp_dir, 'ledgers', 'task_0.ledger'))
+
+        block_ids = [3, 7, 11]
+        fu.set_ledger(ledger_path)
+        for block_id in block_ids:
+            fu.log_block_success(block_id)
+        self.assertFalse(pu.parse_job(log_path, 0))
+        fu.log_job_success(0)
+        fu.set_ledger(None)
+
+        self.assertEqual(pu.parse_blocks(log_path), block_ids)
+        self.assertTrue(pu.parse_job(log_path, 0))
+        self.assertFalse(pu.parse_job(log_path, 1))
+        self.assertGreaterEqual(pu.parse_runtime(log_path), 0)
+
+    def test_profile(self):
+        import numpy as np
+        from cluster_tools.utils import function_utils as fu
+        from cluster_tools.utils import parse_utils as pu
+        profile_dir = os.path.join(self.tmp_dir, 'profiles')
+        os.makedirs(profile_dir)
+
+        data = np.zeros((10, 10, 10), dtype='float32')
+        out = np.zeros_like(data)
+        bb = np.s_[:5, :5, :5]
+        block_ids = [0, 1, 2]
+        for job_id in range(2):
+            fu.set_profile(os.path.join(profile_dir, 'task_%i.profile' % job_id))
+            for block_id in block_ids:
+                with fu.profile_block(block_id, n_voxels=125):
+                    block_data = fu.profiled_read(data, bb)
+                    with fu.profile_section('compute'):
+                        block_data = block_data + 1
+                    fu.profiled_write(out, bb, block_data)
+            fu.set_profile(None)
+
+        report = pu.profile_report(self.tmp_dir, n_slowest=2)
+        self.assertEqual(list(report.keys()), ['task'])
+        summary = report['task']
+        self.assertEqual(summary['n_blocks'], 2 * len(block_ids))
+        self.assertEqual(set(summary['sections'].keys()), {'read', 'compute', 'write'})
+        expected_mb = 2 * len(block_ids) * 125 * 4 / 1.e6
+        self.assertAlmostEqual(summary['sections']['read']['mb'], expected_mb)
+        self.assertAlmostEqual(summary['sections']['write']['mb'], expected_mb)
+        self.assertEqual(len(summary['slowest_blocks']), 2)
+        self.assertTrue((out[bb] == 1).all())
+
+    def test_peak_rss(self):
+        import numpy as np
+        from cluster_tools.utils import function_utils as fu
+        data = np.ones(int(1e8) // 8)
+        data_peak = fu.peak_rss()
+        self.assertGreater(data_peak, data.nbytes)
+        del data
+        if not fu.can_reset_peak_rss():
+            self.skipTest("resetting the peak memory is not supported")
+        self.assertTrue(fu.reset_peak_rss())
+        self.assertLess(fu.peak_rss(), data_peak)
+
 
 if __name__ == '__main__':
     unittest.main()
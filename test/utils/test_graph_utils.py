@@ -0,0 +1,96 @@
+import unittest
+
+import numpy as np
+
+
+class TestGraphUtils(unittest.TestCase):
+    shape = (8, 9, 10)
+
+    def _make_data(self, ignore_label):
+        np.random.seed(42)
+        labels = np.random.randint(0, 6, size=self.shape).astype('uint64')
+        # make the labels more blob-like, so that we also have inner voxels
+        labels = np.repeat(labels[:, :, ::2], 2, axis=2)
+        if not ignore_label:
+            labels += 1
+        values = np.random.rand(*self.shape).astype('float32')
+        return labels, values
+
+    def _brute_force(self, labels, values, ignore_label):
+        edge_values = {}
+        for axis in range(labels.ndim):
+            for coord in np.ndindex(*labels.shape):
+                ngb = list(coord)
+                ngb[axis] += 1
+                if ngb[axis] == labels.shape[axis]:
+                    continue
+                ngb = tuple(ngb)
+                u, v = labels[coord], labels[ngb]
+                if u == v or (ignore_label and 0 in (u, v)):
+                    continue
+                edge = (min(u, v), max(u, v))
+                edge_values.setdefault(edge, []).extend([values[coord], values[ngb]])
+        edges = sorted(edge_values.keys())
+        features = [[np.mean(edge_values[edge]), np.var(edge_values[edge]),
+                     np.min(edge_values[edge])] +
+                    [np.quantile(edge_values[edge], q) for q in (.1, .25, .5, .75, .9)] +
+                    [np.max(edge_values[edge]), len(edge_values[edge]) // 2]
+                    for edge in edges]
+        return np.array(edges, dtype='uint64'), np.array(features)
+
+    def test_block_sub_graph(self):
+        from cluster_tools.utils.graph_utils import block_sub_graph
+        for ignore_label in (True, False):
+            labels, values = self._make_data(ignore_label)
+            nodes, edges, features = block_sub_graph(labels, values, ignore_label)
+
+            exp_nodes = np.unique(labels)
+            if ignore_label:
+                exp_nodes = exp_nodes[1:]
+            self.assertTrue(np.array_equal(nodes, exp_nodes))
+
+            exp_edges, exp_features = self._brute_force(labels, values, ignore_label)
+            self.assertTrue(np.array_equal(edges, exp_edges))
+            self.assertTrue(np.allclose(features, exp_features, atol=1e-6))
+
+    def test_region_edges(self):
+        from cluster_tools.utils.graph_utils import region_edges
+        for ignore_label in (True, False):
+            labels, values = self._make_data(ignore_label)
+            edges = region_edges(labels, ignore_label)
+            exp_edges, _ = self._brute_force(labels, values, ignore_label)
+            self.assertTrue(np.array_equal(edges, exp_edges))
+        self.assertEqual(region_edges(np.ones(self.shape, dtype='uint64')).shape, (0, 2))
+
+    def test_faces(self):
+        from cluster_tools.utils.graph_utils import (block_sub_graph, edge_features,
+                                                     face_pairs, merge_edge_features)
+        labels, values = self._make_data(ignore_label=True)
+        _, exp_edges, exp_features = block_sub_graph(labels, values)
+
+        # split the volume in two blocks along each axis and combine
+        # the inner edges of the blocks with the edges across the face
+        for axis in range(3):
+            split = self.shape[axis] // 2
+            lower = tuple(slice(0, split) if dim == axis else slice(None) for dim in range(3))
+            upper = tuple(slice(split, None) if dim == axis else slice(None) for dim in range(3))
+            face_a = tuple(split - 1 if dim == axis else slice(None) for dim in range(3))
+            face_b = tuple(split if dim == axis else slice(None) for dim in range(3))
+
+            _, edges_a, features_a = block_sub_graph(labels[lower], values[lower])
+            _, edges_b, features_b = block_sub_graph(labels[upper], values[upper])
+            face_edges, face_features = edge_features(*face_pairs(labels[face_a], labels[face_b],
+                                                                  values[face_a], values[face_b]))
+
+            edges, features = merge_edge_features(np.concatenate([edges_a, edges_b, face_edges]),
+                                                  np.concatenate([features_a, features_b, face_features]))
+            self.assertTrue(np.array_equal(edges, exp_edges))
+            # mean, variance, min, max and size are merged exactly, quantiles are approximated
+            exact = [0, 1, 2, 8, 9]
+            self.assertTrue(np.allclose(features[:, exact], exp_features[:, exact]))
+            self.assertTrue(np.all(features[:, 3:8] >= features[:, 2:3] - 1e-6))
+            self.assertTrue(np.all(features[:, 3:8] <= features[:, 8:9] + 1e-6))
+
+
+if __name__ == '__main__':
+    unittest.main()
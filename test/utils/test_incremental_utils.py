@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import unittest
+from shutil import rmtree
+
+
+class TestIncrementalUtils(unittest.TestCase):
+    tmp_folder = './tmp'
+    shape = (20, 20, 20)
+    chunks = (10, 10, 10)
+
+    def _make_n5(self, key):
+        # write the metadata and chunk files of a n5 dataset
+        path = os.path.join(self.tmp_folder, 'data.n5')
+        ds_dir = os.path.join(path, key)
+        os.makedirs(ds_dir, exist_ok=True)
+        with open(os.path.join(ds_dir, 'attributes.json'), 'w') as f:
+            json.dump({'dimensions': self.shape[::-1], 'blockSize': self.chunks[::-1],
+                       'dataType': 'uint8', 'compression': {'type': 'raw'}}, f)
+        for chunk_id in range(8):
+            self._write_chunk(path, key, chunk_id, b'abc')
+        return path
+
+    def _chunk_path(self, path, key, chunk_id):
+        pos = [chunk_id // 4, (chunk_id // 2) % 2, chunk_id % 2]
+        return os.path.join(path, key, *map(str, pos[::-1]))
+
+    def _write_chunk(self, path, key, chunk_id, content):
+        chunk_path = self._chunk_path(path, key, chunk_id)
+        os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+        with open(chunk_path, 'wb') as f:
+            f.write(content)
+
+    def tearDown(self):
+        try:
+            rmtree(self.tmp_folder)
+        except OSError:
+            pass
+
+    def test_layout(self):
+        from cluster_tools.utils.incremental_utils import DatasetLayout
+        path = self._make_n5('data')
+        layout = DatasetLayout(path, 'data')
+        self.assertTrue(layout.chunked)
+        self.assertEqual(layout.shape, self.shape)
+        paths = layout.chunk_paths((slice(5, 15), slice(0, 10), slice(10, 20)))
+        expected = [self._chunk_path(path, 'data', chunk_id) for chunk_id in (1, 5)]
+        self.assertEqual(sorted(paths), sorted(expected))
+
+    def test_dirty_blocks(self):
+        from cluster_tools.utils.incremental_utils import (block_signatures, config_hash,
+                                                           dirty_blocks, output_signatures)
+        for mode in ('mtime', 'checksum'):
+            path = self._make_n5('in')
+            self._make_n5('out')
+            block_list = list(range(8))
+            conf_hash = config_hash({'threshold': .5})
+
+            def _signatures():
+                return (block_signatures([(path, 'in')], self.shape, self.chunks,
+                                         block_list, conf_hash, mode),
+                        output_signatures([(path, 'out')], self.shape, self.chunks, block_list, mode))
+
+            sigs, out_sigs = _signatures()
+            manifest = {block_id: (sigs[block_id], out_sigs[block_id]) for block_id in block_list}
+            self.assertEqual(dirty_blocks(manifest, block_list, *_signatures()), [])
+
+            # change one input chunk and one output chunk
+            time.sleep(0.01)
+            self._write_chunk(path, 'in', 3, b'abcd')
+            self._write_chunk(path, 'out', 6, b'abcd')
+            self.assertEqual(dirty_blocks(manifest, block_list, *_signatures()), [3, 6])
+
+            # blocks that are not in the manifest are dirty
+            self.assertEqual(dirty_blocks({}, block_list, *_signatures()), block_list)
+            rmtree(self.tmp_folder)
+
+    def test_halo(self):
+        from cluster_tools.utils.incremental_utils import block_signatures
+        path = self._make_n5('in')
+        sigs = block_signatures([(path, 'in')], self.shape, self.chunks, [0, 7], '', 'mtime', halo=[1, 1, 1])
+        time.sleep(0.01)
+        # with the halo, a change in the last chunk also affects the first block
+        self._write_chunk(path, 'in', 7, b'abcd')
+        new_sigs = block_signatures([(path, 'in')], self.shape, self.chunks, [0, 7], '', 'mtime', halo=[1, 1, 1])
+        self.assertNotEqual(sigs[0], new_sigs[0])
+        self.assertNotEqual(sigs[7], new_sigs[7])
+
+    def test_config_hash(self):
+        from cluster_tools.utils.incremental_utils import config_hash
+        config = {'threshold': .5, 'threads_per_job': 1}
+        self.assertEqual(config_hash(config), config_hash({'threshold': .5, 'threads_per_job': 8}))
+        self.assertNotEqual(config_hash(config), config_hash({'threshold': .6, 'threads_per_job': 1}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import unittest
+from shutil import rmtree
+
+import numpy as np
+
+
+class TestOccupancyUtils(unittest.TestCase):
+    tmp_dir = './tmp'
+    shape = (64, 64, 64)
+    chunks = (16, 16, 16)
+    block_shape = (32, 32, 32)
+
+    def setUp(self):
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def tearDown(self):
+        try:
+            rmtree(self.tmp_dir)
+        except OSError:
+            pass
+
+    def _make_data(self, path, key):
+        from cluster_tools.utils.volume_utils import file_reader
+        with file_reader(path) as f:
+            ds = f.create_dataset(key, shape=self.shape, chunks=self.chunks, dtype='uint64')
+            # write data to the first block and the last chunk
+            ds[:32, :32, :32] = 1
+            ds[48:, 48:, 48:] = 1
+
+    def test_compute_occupancy(self):
+        import nifty.tools as nt
+        from cluster_tools.utils import occupancy_utils as ou
+        path = os.path.join(self.tmp_dir, 'data.n5')
+        key = 'data'
+        self._make_data(path, key)
+
+        occupied, chunks = ou.compute_occupancy(path, key)
+        self.assertEqual(tuple(chunks), self.chunks)
+        self.assertEqual(occupied.shape, (4, 4, 4))
+        self.assertEqual(occupied.sum(), 9)
+        self.assertTrue(occupied[:2, :2, :2].all())
+        self.assertTrue(occupied[3, 3, 3])
+
+        # the index must be persistent
+        occupied_loaded, _ = ou.load_occupancy(path, key)
+        self.assertTrue(np.array_equal(occupied, occupied_loaded))
+
+        blocking = nt.blocking([0, 0, 0], list(self.shape), list(self.block_shape))
+        block_list = list(range(blocking.numberOfBlocks))
+        blocks = ou.filter_empty_blocks(path, key, blocking, block_list)
+        self.assertEqual(blocks, [0, blocking.numberOfBlocks - 1])
+
+        # with a halo, the neighbors of the first block also overlap the data
+        blocks = ou.filter_empty_blocks(path, key, blocking, block_list, halo=[4, 4, 4])
+        self.assertGreater(len(blocks), 2)
+
+        # blocks of a downscaled volume
+        blocking_ds = nt.blocking([0, 0, 0], [32, 32, 32], list(self.chunks))
+        blocks = ou.filter_empty_blocks(path, key, blocking_ds, list(range(blocking_ds.numberOfBlocks)),
+                                        scale_factor=2)
+        self.assertEqual(blocks, [0, blocking_ds.numberOfBlocks - 1])
+
+    def test_mark_occupied(self):
+        from cluster_tools.utils.volume_utils import file_reader
+        from cluster_tools.utils import occupancy_utils as ou
+        path = os.path.join(self.tmp_dir, 'data.n5')
+        key = 'data'
+        with file_reader(path) as f:
+            f.create_dataset(key, shape=self.shape, chunks=self.chunks, dtype='uint64')
+
+        # no index -> nothing happens
+        ou.mark_occupied(path, key, np.s_[0:16, 0:16, 0:16])
+        self.assertIsNone(ou.load_occupancy(path, key))
+
+        ou.init_occupancy(path, key)
+        occupied, _ = ou.load_occupancy(path, key)
+        self.assertEqual(occupied.sum(), 0)
+
+        ou.mark_occupied(path, key, np.s_[0:16, 0:16, 0:16])
+        ou.mark_occupied(path, key, np.s_[20:40, 0:16, 60:64])
+        occupied, _ = ou.load_occupancy(path, key)
+        self.assertEqual(occupied.sum(), 3)
+        self.assertTrue(occupied[0, 0, 0])
+        self.assertTrue(occupied[1, 0, 3])
+        self.assertTrue(occupied[2, 0, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+import numpy as np
+
+
+class TestPartitionUtils(unittest.TestCase):
+
+    def _check_partition(self, block_list, weights, n_jobs, method):
+        from cluster_tools.utils.partition_utils import partition_blocks
+        job_blocks = partition_blocks(block_list, weights, n_jobs, method)
+        self.assertEqual(len(job_blocks), n_jobs)
+        # each block must be assigned exactly once
+        self.assertEqual(sorted(block_id for blocks in job_blocks for block_id in blocks),
+                         sorted(block_list))
+        block_weights = dict(zip(block_list, weights))
+        return [sum(block_weights[block_id] for block_id in blocks) for blocks in job_blocks]
+
+    def test_partition_lpt(self):
+        np.random.seed(42)
+        block_list = list(range(100))
+        # very imbalanced weights, e.g. from a mask with few foreground blocks
+        weights = np.random.exponential(size=100) ** 2
+        n_jobs = 8
+        loads = self._check_partition(block_list, weights, n_jobs, 'lpt')
+        # lpt guarantees a makespan within 4 / 3 of the optimum,
+        # which is bounded from below by the mean load and the max weight
+        lower_bound = max(weights.sum() / n_jobs, weights.max())
+        self.assertLessEqual(max(loads), 4. / 3. * lower_bound)
+
+        # compare to the round-robin assignment
+        rr_loads = [weights[job_id::n_jobs].sum() for job_id in range(n_jobs)]
+        self.assertLessEqual(max(loads), max(rr_loads))
+
+    def test_partition_greedy(self):
+        block_list = [3, 5, 7, 11, 13, 17]
+        weights = [1., 1., 1., 1., 1., 1.]
+        loads = self._check_partition(block_list, weights, 3, 'greedy')
+        self.assertEqual(loads, [2., 2., 2.])
+
+
+if __name__ == '__main__':
+    unittest.main()
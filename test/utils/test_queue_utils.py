@@ -0,0 +1,47 @@
+import os
+import unittest
+from concurrent import futures
+from shutil import rmtree
+
+
+def _claim_all(path, batch_size):
+    from cluster_tools.utils.queue_utils import iterate_block_queue
+    return list(iterate_block_queue(path, batch_size))
+
+
+class TestQueueUtils(unittest.TestCase):
+    tmp_dir = './tmp'
+
+    def setUp(self):
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def tearDown(self):
+        try:
+            rmtree(self.tmp_dir)
+        except OSError:
+            pass
+
+    def test_claim_blocks(self):
+        from cluster_tools.utils.queue_utils import write_block_queue, claim_blocks
+        path = os.path.join(self.tmp_dir, 'task.queue')
+        block_list = [4, 8, 15, 16, 23, 42]
+        write_block_queue(path, block_list)
+        self.assertEqual(claim_blocks(path, 4), block_list[:4])
+        self.assertEqual(claim_blocks(path, 4), block_list[4:])
+        self.assertEqual(claim_blocks(path, 4), [])
+
+    def test_concurrent_claims(self):
+        from cluster_tools.utils.queue_utils import write_block_queue
+        path = os.path.join(self.tmp_dir, 'task.queue')
+        block_list = list(range(1000))
+        write_block_queue(path, block_list)
+        n_jobs = 8
+        with futures.ProcessPoolExecutor(n_jobs) as pp:
+            tasks = [pp.submit(_claim_all, path, 3) for _ in range(n_jobs)]
+            claimed = [block_id for t in tasks for block_id in t.result()]
+        # each block must be claimed exactly once
+        self.assertEqual(sorted(claimed), block_list)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import json
+import unittest
+from shutil import rmtree
+
+
+class TestResourceUtils(unittest.TestCase):
+    tmp_folder = './tmp'
+
+    def setUp(self):
+        os.makedirs(self.tmp_folder, exist_ok=True)
+
+    def tearDown(self):
+        try:
+            rmtree(self.tmp_folder)
+        except OSError:
+            pass
+
+    def _write_profile(self, path, n_voxels, block_time, max_rss, n_blocks=10, n_parallel=1):
+        with open(path, 'w') as f:
+            for block_id in range(n_blocks):
+                start = (block_id // n_parallel) * block_time
+                f.write(json.dumps({'block_id': block_id, 'n_voxels': n_voxels, 'time': block_time,
+                                    'start': start, 'max_rss': max_rss, 'sections': {}}) + '\n')
+
+    def test_store(self):
+        from cluster_tools.utils.resource_utils import (load_observations, record_observations,
+                                                        summarize_job)
+        profile_path = os.path.join(self.tmp_folder, 'job_0.profile')
+        self._write_profile(profile_path, 1000, 2., int(1e9))
+        obs = summarize_job(profile_path, threads=2, dtype='uint8')
+        self.assertEqual(obs['n_blocks'], 10)
+        self.assertAlmostEqual(obs['cpu_time_per_voxel'], 4. / 1000)
+        self.assertIsNone(summarize_job(os.path.join(self.tmp_folder, 'missing.profile'), 1))
+
+        # the threads are shared by the blocks processed in parallel
+        parallel_path = os.path.join(self.tmp_folder, 'job_1.profile')
+        self._write_profile(parallel_path, 1000, 2., int(1e9), n_parallel=2)
+        obs_parallel = summarize_job(parallel_path, threads=2, dtype='uint8')
+        self.assertAlmostEqual(obs_parallel['cpu_time_per_voxel'], 2. / 1000)
+
+        store = os.path.join(self.tmp_folder, 'store')
+        record_observations(store, 'task', [obs])
+        record_observations(store, 'task', [dict(obs, dtype='float32')])
+        self.assertEqual(len(load_observations(store, 'task', 'uint8')), 1)
+        self.assertEqual(len(load_observations(store, 'task', 'uint16')), 2)
+        self.assertEqual(load_observations(store, 'other_task'), [])
+
+    def test_estimate_resources(self):
+        from cluster_tools.utils.resource_utils import estimate_resources
+        # the memory is 0.5 GB + 1 KB per voxel
+        observations = [{'block_voxels': voxels, 'max_rss': 5e8 + 1e3 * voxels,
+                         'cpu_time_per_voxel': 1e-5} for voxels in (1e5, 2e5, 4e5)]
+        resources = estimate_resources(observations, block_voxels=1e6, n_blocks=60,
+                                       threads=1, safety_factor=1.)
+        self.assertAlmostEqual(resources['mem_limit'], 1.5, places=3)
+        self.assertEqual(resources['time_limit'], 10)
+        self.assertEqual(resources['threads_per_job'], 1)
+
+        # the safety factor scales the estimates
+        resources = estimate_resources(observations, block_voxels=1e6, n_blocks=60,
+                                       threads=1, safety_factor=2.)
+        self.assertAlmostEqual(resources['mem_limit'], 3., places=3)
+        self.assertEqual(resources['time_limit'], 20)
+
+        # more threads to stay below the maximal time limit
+        resources = estimate_resources(observations, block_voxels=1e6, n_blocks=60,
+                                       threads=1, safety_factor=1., max_time_limit=4)
+        self.assertEqual(resources['threads_per_job'], 3)
+        self.assertLessEqual(resources['time_limit'], 4)
+        # and more memory for the blocks processed in parallel
+        self.assertAlmostEqual(resources['mem_limit'], 4.5, places=3)
+
+        # a single block size is scaled conservatively
+        resources = estimate_resources(observations[:1], block_voxels=2e5, n_blocks=1,
+                                       threads=1, safety_factor=1.)
+        self.assertGreaterEqual(resources['mem_limit'], 1.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -94,6 +94,140 @@ class TestVolumeUtils(unittest.TestCase):
             bb = tuple(slice(rb, re) for rb, re in zip(roi_begin, roi_end))
             check_block_list(blocking, block_list, ds, bb)
 
+    def test_prefetch_blocks(self):
+        import threading
+        from cluster_tools.utils.volume_utils import prefetch_blocks
+
+        loaded = []
+        lock = threading.Lock()
+
+        def _load(block_id):
+            with lock:
+                loaded.append(block_id)
+            return np.full((4, 4), block_id)
+
+        block_list = list(range(10))
+        for n_prefetch in (0, 1, 3):
+            loaded.clear()
+            blocks = []
+            for block_id, get_data in prefetch_blocks(_load, iter(block_list), n_prefetch):
+                data = get_data()
+                self.assertTrue(np.array_equal(data, np.full((4, 4), block_id)))
+                # we never load more than n_prefetch blocks ahead
+                self.assertLessEqual(len(loaded), len(blocks) + 1 + n_prefetch)
+                blocks.append(block_id)
+            self.assertEqual(blocks, block_list)
+            self.assertEqual(sorted(loaded), block_list)
+
+        # errors are raised when the data of the block is requested
+        def _load_fail(block_id):
+            if block_id == 3:
+                raise RuntimeError("Failed")
+            return block_id
+
+        with self.assertRaises(RuntimeError):
+            for block_id, get_data in prefetch_blocks(_load_fail, block_list, 2):
+                self.assertNotEqual(get_data(), 3)
+
+    def test_block_writer(self):
+        import time
+        import threading
+        from cluster_tools.utils.volume_utils import BlockWriter
+
+        out = np.zeros(20, dtype='int64')
+        n_running = [0, 0]
+        lock = threading.Lock()
+
+        def _write(block_id):
+            with lock:
+                n_running[0] += 1
+                n_running[1] = max(n_running)
+            time.sleep(0.01)
+            out[block_id] = block_id + 1
+            with lock:
+                n_running[0] -= 1
+
+        for max_pending in (0, 2):
+            out[:] = 0
+            with BlockWriter(max_pending, n_threads=2) as writer:
+                for block_id in range(20):
+                    writer.submit(_write, block_id)
+            self.assertTrue(np.array_equal(out, np.arange(1, 21)))
+        self.assertLessEqual(n_running[1], 2)
+
+        def _write_fail(block_id):
+            if block_id == 3:
+                raise RuntimeError("Failed")
+
+        with self.assertRaises(RuntimeError):
+            with BlockWriter(2) as writer:
+                for block_id in range(10):
+                    writer.submit(_write_fail, block_id)
+
+    def _check_colouring(self, blocking, block_lists, expected_ids, separate_diagonal):
+        all_ids = [block_id for block_list in block_lists for block_id in block_list]
+        self.assertEqual(len(all_ids), len(expected_ids))
+        self.assertEqual(set(all_ids), set(expected_ids))
+        grid_shape = tuple(blocking.blocksPerAxis)
+        for block_list in block_lists:
+            pos = np.array(np.unravel_index(block_list, grid_shape)).T
+            dist = np.abs(pos[:, None] - pos[None])
+            # blocks of the same colour must not be direct neighbors,
+            # or not be neighbors at all if we separate the diagonal neighbors
+            dist = dist.max(axis=2) if separate_diagonal else dist.sum(axis=2)
+            self.assertTrue((dist[~np.eye(len(pos), dtype='bool')] >= 2).all())
+
+    def test_checkerboard_block_lists(self):
+        from nifty.tools import blocking
+        from cluster_tools.utils.volume_utils import make_checkerboard_block_lists
+
+        shape = (50, 75, 33)
+        block_shape = (10, 10, 10)
+        blocking_ = blocking([0, 0, 0], list(shape), list(block_shape))
+        all_ids = list(range(blocking_.numberOfBlocks))
+
+        block_lists = make_checkerboard_block_lists(blocking_)
+        self.assertEqual(len(block_lists), 2)
+        self.assertIn(0, block_lists[0])
+        self._check_colouring(blocking_, block_lists, all_ids, False)
+
+        block_lists = make_checkerboard_block_lists(blocking_, n_colors=8)
+        self.assertEqual(len(block_lists), 8)
+        self._check_colouring(blocking_, block_lists, all_ids, True)
+
+        roi_begin, roi_end = [12, 25, 3], [41, 70, 30]
+        roi_ids = blocking_.getBlockIdsOverlappingBoundingBox(roi_begin, roi_end).tolist()
+        for n_colors, separate_diagonal in ((2, False), (8, True)):
+            block_lists = make_checkerboard_block_lists(blocking_, roi_begin, roi_end, n_colors)
+            self.assertIn(min(roi_ids), block_lists[0])
+            self._check_colouring(blocking_, block_lists, roi_ids, separate_diagonal)
+
+        # large grids are no problem for the vectorized colouring
+        blocking_ = blocking([0, 0, 0], [1000, 1000, 1000], [10, 10, 10])
+        block_lists = make_checkerboard_block_lists(blocking_)
+        self.assertEqual(sum(len(bl) for bl in block_lists), 10 ** 6)
+
+    def test_merge_tree(self):
+        from cluster_tools.utils.volume_utils import merge_tree_block_shapes, sub_blocks_in_block
+        from nifty.tools import blocking
+        shape, block_shape = [20, 33, 30], [4, 5, 6]
+        self.assertEqual(merge_tree_block_shapes(shape, block_shape, 2), [[8, 10, 12], [16, 20, 24]])
+        self.assertEqual(merge_tree_block_shapes(shape, block_shape, 3), [[12, 15, 18]])
+        self.assertEqual(merge_tree_block_shapes(shape, block_shape, 7), [])
+
+        # the blocks of each level are covered exactly once by the blocks of the next level
+        previous = blocking([0, 0, 0], shape, block_shape)
+        for level_block_shape in merge_tree_block_shapes(shape, block_shape, 2):
+            blocking_ = blocking([0, 0, 0], shape, level_block_shape)
+            sub_blocks = [sub_block_id for block_id in range(blocking_.numberOfBlocks)
+                          for sub_block_id in sub_blocks_in_block(blocking_, previous, block_id)]
+            self.assertEqual(sorted(sub_blocks), list(range(previous.numberOfBlocks)))
+            previous = blocking_
+
+        blocking_ = blocking([0, 0, 0], shape, [8, 10, 12])
+        previous = blocking([0, 0, 0], shape, block_shape)
+        self.assertEqual(sub_blocks_in_block(blocking_, previous, 0, {0, 1, 100}), [0, 1])
+
 
 if __name__ == '__main__':
     unittest.main()
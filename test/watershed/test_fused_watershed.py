@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import unittest
+
+import numpy as np
+import luigi
+import z5py
+
+import nifty.graph.rag as nrag
+import nifty.distributed as ndist
+
+try:
+    from ..base import BaseTest
+except ValueError:
+    sys.path.append('..')
+    from base import BaseTest
+
+
+class TestFusedWatershed(BaseTest):
+    ws_out_key = 'watershed'
+
+    def _run_fused(self):
+        from cluster_tools.workflows import FusedProblemWorkflow
+        config = FusedProblemWorkflow.get_config()['fused_watershed']
+        config['threshold'] = 0.25
+        config['sigma_weights'] = 0.
+        with open(os.path.join(self.config_folder, 'fused_watershed.config'), 'w') as f:
+            json.dump(config, f)
+
+        task = FusedProblemWorkflow(input_path=self.input_path,
+                                    input_key=self.boundary_key,
+                                    ws_path=self.output_path,
+                                    ws_key=self.ws_out_key,
+                                    problem_path=self.output_path,
+                                    compute_costs=False,
+                                    config_dir=self.config_folder,
+                                    tmp_folder=self.tmp_folder,
+                                    target=self.target,
+                                    max_jobs=self.max_jobs)
+        ret = luigi.build([task], local_scheduler=True)
+        self.assertTrue(ret)
+
+    def test_fused_watershed(self):
+        from cluster_tools.watershed.fused_watershed import feature_values
+        self._run_fused()
+
+        with z5py.File(self.output_path, 'r') as f:
+            ds = f[self.ws_out_key]
+            ds.n_threads = self.max_jobs
+            ws = ds[:]
+            features = f['features'][:]
+        with z5py.File(self.input_path, 'r') as f:
+            ds = f[self.boundary_key]
+            ds.n_threads = self.max_jobs
+            boundaries = feature_values(ds[:])
+
+        # the graph must agree with the region adjacency graph of the watershed
+        rag = nrag.gridRag(ws, numberOfLabels=int(ws.max()) + 1)
+        graph = ndist.Graph(self.output_path, 's0/graph')
+        edges = graph.uvIds()
+        self.assertTrue(np.array_equal(edges, rag.uvIds()))
+
+        # we can only check mean, min, max and size exactly
+        features_nifty = nrag.accumulateEdgeStandartFeatures(rag, boundaries,
+                                                             0., 1.)
+        len_nifty = nrag.accumulateEdgeMeanAndLength(rag, boundaries)[:, 1]
+        self.assertTrue(np.allclose(features_nifty[:, 0], features[:, 0]))
+        self.assertTrue(np.allclose(features_nifty[:, 2], features[:, 2]))
+        self.assertTrue(np.allclose(features_nifty[:, 8], features[:, 8]))
+        self.assertTrue(np.allclose(len_nifty, features[:, -1]))
+
+    def _run_unfused(self, problem_path):
+        from cluster_tools.workflows import ProblemWorkflow
+        config = ProblemWorkflow.get_config()['initial_sub_graphs']
+        config['ignore_label'] = True
+        with open(os.path.join(self.config_folder, 'initial_sub_graphs.config'), 'w') as f:
+            json.dump(config, f)
+
+        # the tasks need a separate tmp folder, otherwise the shared tasks would be considered done
+        task = ProblemWorkflow(input_path=self.input_path,
+                               input_key=self.boundary_key,
+                               ws_path=self.output_path,
+                               ws_key=self.ws_out_key,
+                               problem_path=problem_path,
+                               compute_costs=False,
+                               config_dir=self.config_folder,
+                               tmp_folder=os.path.join(self.tmp_folder, 'unfused'),
+                               target=self.target,
+                               max_jobs=self.max_jobs)
+        ret = luigi.build([task], local_scheduler=True)
+        self.assertTrue(ret)
+
+    def test_fused_vs_unfused(self):
+        self._run_fused()
+        problem_path = os.path.join(self.tmp_folder, 'unfused.n5')
+        self._run_unfused(problem_path)
+
+        with z5py.File(self.output_path, 'r') as f:
+            features = f['features'][:]
+        with z5py.File(problem_path, 'r') as f:
+            features_unfused = f['features'][:]
+
+        # the graphs are the same
+        edges = ndist.Graph(self.output_path, 's0/graph').uvIds()
+        edges_unfused = ndist.Graph(problem_path, 's0/graph').uvIds()
+        self.assertTrue(np.array_equal(edges, edges_unfused))
+        self.assertEqual(features.shape, features_unfused.shape)
+
+        # mean, variance, max and size agree
+        same = [0, 1, 8, 9]
+        self.assertTrue(np.allclose(features[:, same], features_unfused[:, same]))
+
+        # the min values differ: the fused min agrees with nifty (see `test_fused_watershed`),
+        # the block features don't (see the FIXME in `test/features/test_edge_features.py`).
+        # the quantiles differ: the fused quantiles are exact, the block feature quantiles
+        # are computed from histograms; we only check that they are ordered and in range.
+        quantiles = features[:, 3:8]
+        self.assertTrue(np.all(np.diff(quantiles, axis=1) >= -1e-6))
+        self.assertTrue(np.all(quantiles >= features[:, 2:3] - 1e-6))
+        self.assertTrue(np.all(quantiles <= features[:, 8:9] + 1e-6))
+
+
+if __name__ == '__main__':
+    unittest.main()
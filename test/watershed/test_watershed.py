@@ -41,7 +41,7 @@ class TestWatershed(BaseTest):
         ids1 = np.unique(res_cc)
         self.assertEqual(len(ids0), len(ids1))
 
-    def _run_ws(self, with_mask, two_pass):
+    def _run_ws(self, with_mask, two_pass, dense_ids=False, **kwargs):
         from cluster_tools.watershed import WatershedWorkflow
         if with_mask:
             mask_path = self.input_path
@@ -58,7 +58,9 @@ class TestWatershed(BaseTest):
                                  tmp_folder=self.tmp_folder,
                                  target=self.target,
                                  max_jobs=self.max_jobs,
-                                 two_pass=two_pass)
+                                 two_pass=two_pass,
+                                 dense_ids=dense_ids,
+                                 **kwargs)
         ret = luigi.build([task], local_scheduler=True)
         return ret
 
@@ -123,6 +125,80 @@ class TestWatershed(BaseTest):
     def test_no_mask_2d(self):
         self._test_ws_2d(with_mask=False, two_pass=False)
 
+    def test_ws_dense_ids(self):
+        ret = self._run_ws(with_mask=True, two_pass=False, dense_ids=True)
+        self.assertTrue(ret)
+        self._check_result(with_mask=True)
+        # the ids must be consecutive without relabeling
+        with z5py.File(self.output_path) as f:
+            ds = f[self.output_key]
+            ds.n_threads = self.max_jobs
+            ids = np.unique(ds[:])
+            max_id = ds.attrs['maxId']
+        self.assertEqual(ids[-1], max_id)
+        self.assertTrue(np.array_equal(ids, np.arange(1, max_id + 1)))
+
+    def test_ws_downscaled_seeds(self):
+        with z5py.File(self.input_path) as f:
+            ds = f[self.input_key]
+            ds.n_threads = self.max_jobs
+            affs = ds[:]
+        # downscale the affinities by 2 in-plane
+        shape = tuple(sh // 2 * 2 for sh in affs.shape[2:])
+        affs = affs[:, :, :shape[0], :shape[1]]
+        affs = affs.reshape(affs.shape[:2] + (shape[0] // 2, 2, shape[1] // 2, 2)).mean(axis=(3, 5))
+        with z5py.File(self.output_path) as f:
+            f.create_dataset('downscaled', data=affs.astype('float32'), chunks=(1, 25, 128, 128))
+
+        ret = self._run_ws(with_mask=True, two_pass=False,
+                           downscaled_input_path=self.output_path,
+                           downscaled_input_key='downscaled')
+        self.assertTrue(ret)
+        self._check_result(with_mask=True)
+
+    def test_downscaled_seeds(self):
+        from cluster_tools.benchmark.synthetic import synthetic_labels, boundary_map
+        from cluster_tools.watershed.watershed import (WatershedBase, _apply_dt, _make_seeds,
+                                                       _downscaled_bb, _downscaled_seeds)
+        config = WatershedBase.default_task_config()
+        shape = (8, 128, 128)
+        input_ = boundary_map(synthetic_labels(shape))
+        bb = np.s_[2:6, 10:100, 0:128]
+
+        # without downscaling we must get the full resolution seeds
+        low_bb = _downscaled_bb(bb, [1., 1., 1.], shape)
+        self.assertEqual(low_bb, bb)
+        seeds, dt = _downscaled_seeds(input_[bb], bb, low_bb, [1., 1., 1.], config)
+        exp_dt = _apply_dt(input_[bb], config)
+        self.assertTrue(np.array_equal(dt, exp_dt))
+        for z in range(seeds.shape[0]):
+            self.assertTrue(np.array_equal(seeds[z], _make_seeds(exp_dt[z], config)))
+
+        # with downscaling the seeds are upsampled to the bounding box
+        low_input = input_[:, ::2, ::2]
+        scale = [1., .5, .5]
+        low_bb = _downscaled_bb(bb, scale, low_input.shape)
+        self.assertEqual(low_bb, np.s_[2:6, 5:50, 0:64])
+        seeds, dt = _downscaled_seeds(low_input[low_bb], bb, low_bb, scale, config)
+        self.assertEqual(seeds.shape, input_[bb].shape)
+        self.assertEqual(dt.shape, input_[bb].shape)
+        self.assertTrue(np.array_equal(seeds[:, ::2, ::2], seeds[:, 1::2, 1::2]))
+
+    def test_apply_watershed_threads(self):
+        from cluster_tools.benchmark.synthetic import synthetic_labels, boundary_map, synthetic_mask
+        from cluster_tools.watershed.watershed import WatershedBase, _apply_dt, _apply_watershed
+        config = WatershedBase.default_task_config()
+        shape = (16, 128, 128)
+        input_ = boundary_map(synthetic_labels(shape))
+        mask = synthetic_mask(shape).astype('bool')
+        dt = _apply_dt(input_, config)
+        self.assertTrue(np.array_equal(dt, _apply_dt(input_, config, n_threads=4)))
+        # the slices segmented in parallel must get the same ids as in the serial watershed
+        for this_mask in (None, mask):
+            exp = _apply_watershed(input_, dt, config, this_mask)
+            res = _apply_watershed(input_, dt, config, this_mask, n_threads=4)
+            self.assertTrue(np.array_equal(res, exp))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,6 @@
+import os
 import sys
+import json
 import unittest
 
 import numpy as np
@@ -27,20 +29,65 @@ class TestMulticutWorkflow(BaseTest):
         self.assertTrue(np.allclose(unique_nodes, unique_segments))
         self.assertGreater(len(unique_nodes), 20)
 
-    def test_workflow(self):
+    def _run_workflow(self, n_scales=1, local_subproblems=False, blockwise_reduce=False, **kwargs):
         from cluster_tools import MulticutSegmentationWorkflow
         task = MulticutSegmentationWorkflow
         t = task(input_path=self.input_path, input_key=self.input_key,
                  ws_path=self.input_path, ws_key=self.ws_key,
                  problem_path=self.output_path, node_labels_key='node_labels',
                  output_path=self.output_path, output_key='volumes/multicut',
-                 n_scales=1, skip_ws=True,
+                 n_scales=n_scales, skip_ws=True, local_subproblems=local_subproblems,
+                 blockwise_reduce=blockwise_reduce, **kwargs,
                  config_dir=self.config_folder, tmp_folder=self.tmp_folder,
                  target=self.target, max_jobs=self.max_jobs)
         ret = luigi.build([t], local_scheduler=True)
         self.assertTrue(ret)
         self._check_result()
 
+    def test_workflow(self):
+        self._run_workflow()
+
+    def test_workflow_local_subproblems(self):
+        self._run_workflow(n_scales=2, local_subproblems=True)
+        # the sub-problems must be serialized for both scales
+        with z5py.File(self.output_path, 'r') as f:
+            for scale in range(2):
+                self.assertIn('s%i/sub_graphs/inner_edge_ids' % scale, f)
+
+    def test_workflow_blockwise_reduce(self):
+        self._run_workflow(n_scales=2, blockwise_reduce=True)
+        with z5py.File(self.output_path, 'r') as f:
+            for scale in range(1, 3):
+                g = f['s%i/graph' % scale]
+                n_nodes = g.attrs['numberOfNodes']
+                uv_ids = g['edges'][:]
+                self.assertEqual(len(uv_ids), g.attrs['numberOfEdges'])
+                self.assertEqual(len(uv_ids), f['s%i/costs' % scale].shape[0])
+                # the new edges are unique and sorted
+                self.assertTrue((uv_ids[:, 0] < uv_ids[:, 1]).all())
+                self.assertEqual(len(np.unique(uv_ids, axis=0)), len(uv_ids))
+                self.assertLess(uv_ids.max(), n_nodes)
+
+    def test_workflow_warmstart_checkpoint(self):
+        from cluster_tools import MulticutSegmentationWorkflow
+        config = MulticutSegmentationWorkflow.get_config()['solve_global']
+        config.update({'checkpoint_interval': 5, 'time_limit_solver': 60})
+        with open(os.path.join(self.config_folder, 'solve_global.config'), 'w') as f:
+            json.dump(config, f)
+        self._run_workflow(n_scales=1, warmstart_global=True)
+        with z5py.File(self.output_path, 'r') as f:
+            self.assertIn('s1/sub_results/node_result', f)
+            # the checkpoint is removed after the assignments are written
+            self.assertNotIn('s1/checkpoint', f)
+
+    def test_workflow_processes(self):
+        from cluster_tools import MulticutSegmentationWorkflow
+        config = MulticutSegmentationWorkflow.get_config()['solve_subproblems']
+        config.update({'use_processes': True, 'threads_per_job': 4})
+        with open(os.path.join(self.config_folder, 'solve_subproblems.config'), 'w') as f:
+            json.dump(config, f)
+        self._run_workflow(n_scales=2)
+
 
 if __name__ == '__main__':
     unittest.main()
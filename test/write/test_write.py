@@ -39,7 +39,7 @@ class TestWrite(BaseTest):
             res = ds[:]
 
         with z5py.File(self.input_path) as f:
-            ds = f[self.input_path]
+            ds = f[self.input_key]
             ds.n_threads = 8
             exp = ds[:]
             exp = nt.take(node_labels, exp)
@@ -59,6 +59,52 @@ class TestWrite(BaseTest):
         ret = luigi.build([t], local_scheduler=True)
         self.assertTrue(ret)
 
+    def test_write_assignment_table(self):
+        from cluster_tools.write import WriteLocal
+        # the same assignments as shuffled assignment table
+        ids = np.random.permutation(len(self.node_labels))
+        table = np.concatenate([ids[:, None], self.node_labels[ids][:, None]], axis=1).astype('uint64')
+        with z5py.File(self.output_path) as f:
+            f.create_dataset('assignment_table', data=table, chunks=table.shape)
+
+        t = WriteLocal(config_dir=self.config_folder, tmp_folder=self.tmp_folder,
+                       max_jobs=self.max_jobs, identifier='test_table',
+                       input_path=self.input_path, input_key=self.input_key,
+                       output_path=self.output_path, output_key=self.output_key,
+                       assignment_path=self.output_path, assignment_key='assignment_table')
+        ret = luigi.build([t], local_scheduler=True)
+        self.assertTrue(ret)
+        self.check_result(self.node_labels)
+
+    def test_apply_node_labels(self):
+        from cluster_tools.write.write import _apply_node_labels, _sorted_assignments
+        seg = np.random.randint(0, 100, size=(8, 16, 16)).astype('uint64')
+
+        # consecutive ids -> dense lookup table
+        labels = np.random.randint(0, 10, size=100).astype('uint64')
+        node_labels = _sorted_assignments(np.arange(100)[::-1], labels[::-1])
+        self.assertIsInstance(node_labels, np.ndarray)
+        self.assertTrue(np.array_equal(_apply_node_labels(seg, node_labels, False), labels[seg]))
+
+        # ids with gaps -> sorted table, for ids in a small and a large range
+        ids = np.cumsum(np.random.randint(1, 4, size=100)).astype('uint64')
+        node_labels = _sorted_assignments(ids[::-1], labels[::-1])
+        self.assertIsInstance(node_labels, tuple)
+        sparse_ids = (ids * 1000000).astype('uint64')
+        sparse_labels = _sorted_assignments(sparse_ids, labels)
+        for this_ids, this_labels in ((ids, node_labels), (sparse_ids, sparse_labels)):
+            res = _apply_node_labels(this_ids[seg], this_labels, False)
+            self.assertTrue(np.array_equal(res, labels[seg]))
+
+        # ids that are not in the table
+        missing = ids[seg]
+        missing[0, 0, 0] = 2 * ids.max() + 1
+        with self.assertRaises(KeyError):
+            _apply_node_labels(missing, node_labels, False)
+        res = _apply_node_labels(missing, node_labels, True)
+        self.assertEqual(res[0, 0, 0], missing[0, 0, 0])
+        self.assertTrue(np.array_equal(res.ravel()[1:], labels[seg].ravel()[1:]))
+
 
 if __name__ == '__main__':
     unittest.main()